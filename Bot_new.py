@@ -8,6 +8,7 @@ import asyncio
 import json
 import secrets
 import html
+import contextlib
 import re
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update, ForceReply, Message, User, InputMediaPhoto, LabeledPrice
 from telegram.error import BadRequest, Forbidden, RetryAfter, TimedOut, NetworkError
@@ -20,14 +21,18 @@ from telegram.ext import (
     ConversationHandler,
     MessageHandler,
     PreCheckoutQueryHandler,
-    ApplicationHandlerStop,
     TypeHandler,
     filters,
 )
 import core.database as db
+import core.db_async as adb
+import core.update_context as uctx
+from core.auto_search_engine import AutoSearchEngine
+from core.auto_search_scheduler import auto_search_scheduler
+from modules.plantation.reminders import plantation_reminders
 from core.database import SessionLocal, Player
 from sqlalchemy import func
-from collections import defaultdict, OrderedDict
+from collections import defaultdict, deque, OrderedDict
 import core.config as config
 from typing import Any, Dict
 from modules.casino.casino_logic import (
@@ -103,6 +108,14 @@ from core.constants import (
     TG_PREMIUM_DURATION_SEC,
     ADMIN_USERNAMES,
     AUTO_SEARCH_DAILY_LIMIT,
+    AUTO_SEARCH_TICK_SEC,
+    AUTO_DELETE_SWEEP_SEC,
+    BROADCAST_RATE_PER_SEC,
+    LEADERBOARD_SYNC_SEC,
+    YOUTUBE_CACHE_DIR,
+    YOUTUBE_CACHE_MAX_MB,
+    YOUTUBE_DOWNLOAD_MAX_PENDING,
+    YOUTUBE_DOWNLOAD_WORKERS,
     CASINO_WIN_PROB,
     CASINO_MAX_BET,
     CASINO_MIN_BET,
@@ -122,8 +135,6 @@ from core.constants import (
     MINES_MIN_COUNT,
     MINES_MAX_COUNT,
     MINES_DEFAULT_COUNT,
-    CRASH_UPDATE_INTERVAL,
-    CRASH_GROWTH_RATE,
     CRASH_MAX_MULTIPLIER,
     PLANTATION_FERTILIZER_MAX_PER_BED,
     PLANTATION_NEG_EVENT_INTERVAL_SEC,
@@ -139,16 +150,16 @@ from modules.youtube.youtube_downloader import (
     FfmpegNotFoundError,
     UnsupportedYoutubeUrlError,
     YoutubeAudioDownloadError,
-    cleanup_downloaded_audio,
-    download_youtube_audio_async,
     extract_first_youtube_url,
 )
+from modules.youtube.download_service import YoutubeDownloadBusyError, YoutubeDownloadService
 from modules.admin.admin_permissions import (
     get_effective_admin_level,
     has_admin_level,
     has_admin_panel_access,
     has_creator_panel_access,
-    get_required_level_for_callback,
+    ADMIN_CALLBACK_LEVELS,
+    ADMIN_CALLBACK_PREFIX_LEVELS,
     ADMIN_TEXT_ACTION_LEVELS,
     CREATOR_TEXT_ACTION_LEVELS,
 )
@@ -163,6 +174,12 @@ from reload_bot.modules import promo as promo_module
 from reload_bot.modules import receiver as receiver_module
 from reload_bot.modules import swaga as swaga_module
 from reload_bot.modules import user_settings as user_settings_module
+from reload_bot.action_log import action_log_writer
+from reload_bot.auto_delete import auto_delete_sweeper
+from reload_bot.ban_guard import make_ban_guard
+from reload_bot.broadcast import BroadcastEngine, BroadcastTasks, TokenBucket
+from reload_bot.crash_engine import CrashEngine, CrashGame
+from reload_bot.callback_router import CallbackRouter
 from reload_bot.runtime import BotRuntime
 from core.utils import (
     _parse_duration_to_seconds,
@@ -205,7 +222,7 @@ SEED_COUPON_PAGE_SIZE = 6
 
 
 def _get_access_profile(user, player=None) -> dict:
-    return db.get_access_profile(
+    return uctx.get_access_profile(
         int(getattr(user, 'id', 0) or 0),
         username=getattr(user, 'username', None),
         player=player,
@@ -887,9 +904,6 @@ PENDING_ADDITIONS: dict[int, dict] = {}
 NEXT_PENDING_ID = 1
 
 
-# --- Система автоудаления сообщений для групп (ключ = message_id) ---
-AUTO_DELETE_MESSAGES: Dict[str, dict] = {}
-
 # --- Ожидание причины отклонения (ключ = (chat_id, prompt_message_id)) ---
 REJECT_PROMPTS: Dict[tuple[int, int], dict] = {}
 
@@ -905,9 +919,7 @@ BLACKJACK_GAMES: Dict[int, dict] = {}
 # MINES_GAMES[user_id] = { 'bet': int, 'mines_count': int, 'grid': list, 'revealed': set, 'status': str, 'multiplier': float }
 MINES_GAMES: Dict[int, dict] = {}
 
-# --- Краш: активные игры ---
-# CRASH_GAMES[user_id] = { 'bet': int, 'multiplier': float, 'crash_point': float, 'status': str, 'task': asyncio.Task }
-CRASH_GAMES: Dict[int, dict] = {}
+# --- Краш: активные игры живут в _crash_engine (reload_bot/crash_engine.py) ---
 
 TEXTS = {
     'menu_title': {
@@ -1381,6 +1393,7 @@ def build_bot_runtime() -> BotRuntime:
         plantation_neg_event_duration_sec_default=PLANTATION_NEG_EVENT_DURATION_SEC,
         handlers={},
         helpers={},
+        update_context=uctx,
     )
 
 
@@ -1519,7 +1532,7 @@ async def handle_modular_admin_action(
 async def show_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает главное меню. УМЕЕТ ОБРАБАТЫВАТЬ ВОЗВРАТ С ФОТО."""
     user = update.effective_user
-    player = db.get_or_create_player(user.id, username=getattr(user, 'username', None), display_name=(getattr(user, 'full_name', None) or getattr(user, 'first_name', None)))
+    player = uctx.get_or_create_player(user.id, username=getattr(user, 'username', None), display_name=(getattr(user, 'full_name', None) or getattr(user, 'first_name', None)))
 
     access = _get_access_profile(user, player=player)
     search_cd = _effective_search_cooldown(access)
@@ -1655,8 +1668,8 @@ async def show_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # --- Админ панель для Создателя ---
 # Функции прав (get_effective_admin_level, has_admin_level, has_admin_panel_access,
-# has_creator_panel_access, get_required_level_for_callback) и словари
-# (ADMIN_TEXT_ACTION_LEVELS, CREATOR_TEXT_ACTION_LEVELS) импортируются
+# has_creator_panel_access) и словари (ADMIN_CALLBACK_LEVELS, ADMIN_CALLBACK_PREFIX_LEVELS,
+# ADMIN_TEXT_ACTION_LEVELS, CREATOR_TEXT_ACTION_LEVELS) импортируются
 # из admin_permissions.py (см. строки 118-126).
 
 
@@ -2811,7 +2824,7 @@ async def handle_vip_plus_remove(update: Update, context: ContextTypes.DEFAULT_T
 
 
 async def handle_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE, text_input: str):
-    """Обрабатывает рассылку сообщений."""
+    """Обрабатывает рассылку сообщений: создаёт задание и сразу возвращает управление."""
     keyboard = [[InlineKeyboardButton("⚙️ Админ панель", callback_data='creator_panel')]]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
@@ -2820,58 +2833,134 @@ async def handle_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE, t
         await update.message.reply_html(response, reply_markup=reply_markup)
         return
     
-    # Получаем список всех пользователей
-    user_ids = db.get_all_users_for_broadcast()
-    total = len(user_ids)
-    
-    await update.message.reply_html(
-        f"📢 <b>Начинаю рассылку...</b>\n\n"
-        f"Всего пользователей: {total}\n"
-        f"Это может занять некоторое время.",
-        reply_markup=reply_markup
+    await _start_broadcast(update, context, 'text', text_input)
+
+
+# --- Рассылки: фоновые задания ---
+
+# Общий лимит скорости на все рассылки процесса: RetryAfter касается всего бота
+_broadcast_bucket = TokenBucket(BROADCAST_RATE_PER_SEC)
+_broadcast_tasks = BroadcastTasks()
+
+_BROADCAST_STATUS_TITLES = {
+    'running': "📢 <b>Рассылка идёт</b>",
+    'done': "✅ <b>Рассылка завершена!</b>",
+    'cancelled': "⛔ <b>Рассылка остановлена</b>",
+}
+
+
+def _format_broadcast_progress(job: dict) -> str:
+    processed = job['sent'] + job['failed'] + job['blocked']
+    total = max(job['total'], processed)
+    percent = int(processed * 100 / total) if total else 100
+    title = _BROADCAST_STATUS_TITLES.get(job['status'], _BROADCAST_STATUS_TITLES['running'])
+    kind = "🎵 аудио" if job['kind'] == 'audio' else "📝 текст"
+    return (
+        f"{title} #{job['id']} ({kind})\n\n"
+        f"📊 Обработано: <b>{processed}</b> / {total} ({percent}%)\n"
+        f"📨 Отправлено: <b>{job['sent']}</b>\n"
+        f"🚫 Заблокировали бота: <b>{job['blocked']}</b>\n"
+        f"❌ Не отправлено: <b>{job['failed']}</b>"
     )
-    
-    # Отправляем сообщения
-    success_count = 0
-    fail_count = 0
-    
-    for user_id in user_ids:
+
+
+def _broadcast_progress_markup(job: dict) -> InlineKeyboardMarkup:
+    if job['status'] == 'running':
+        button = InlineKeyboardButton("⛔ Остановить", callback_data=f"admin_broadcast_cancel:{job['id']}")
+    else:
+        button = InlineKeyboardButton("⚙️ Админ панель", callback_data='creator_panel')
+    return InlineKeyboardMarkup([[button]])
+
+
+async def _edit_broadcast_progress(bot, job: dict) -> None:
+    if not job.get('progress_message_id') or not job.get('admin_chat_id'):
+        return
+    try:
+        await bot.edit_message_text(
+            chat_id=job['admin_chat_id'],
+            message_id=job['progress_message_id'],
+            text=_format_broadcast_progress(job),
+            reply_markup=_broadcast_progress_markup(job),
+            parse_mode='HTML',
+        )
+    except BadRequest:
+        # "message is not modified" или сообщение удалено — прогресс не критичен
+        pass
+
+
+async def _run_broadcast_job(bot, job_id: int) -> None:
+    engine = BroadcastEngine(bot, bucket=_broadcast_bucket)
+    try:
+        job = await engine.run(job_id, on_progress=lambda j: _edit_broadcast_progress(bot, j))
+    except Exception:
+        logger.exception(f"[BROADCAST] Задание #{job_id} прервано ошибкой")
+        return
+    if job and job['status'] != 'running':
+        logger.info(
+            f"[BROADCAST] #{job_id} {job['status']}: sent={job['sent']} failed={job['failed']} blocked={job['blocked']}"
+        )
         try:
-            await context.bot.send_message(
-                chat_id=user_id,
-                text=text_input,
-                parse_mode='HTML'
+            await adb.log_action(
+                job['created_by'], None, 'admin_action',
+                f"broadcast#{job_id} {job['kind']} {job['status']}: ok={job['sent']}, fail={job['failed']}, blocked={job['blocked']}",
+                success=True,
             )
-            success_count += 1
-            # ~25 msg/sec — безопасно в пределах лимита Telegram (30 msg/sec)
-            await asyncio.sleep(0.04)
-        except RetryAfter as e:
-            # Telegram просит подождать — уважаем лимит
-            wait_time = int(getattr(e, 'retry_after', 5)) + 1
-            logger.warning(f"FloodWait при рассылке: ожидание {wait_time}s")
-            await asyncio.sleep(wait_time)
-            try:
-                await context.bot.send_message(
-                    chat_id=user_id,
-                    text=text_input,
-                    parse_mode='HTML'
-                )
-                success_count += 1
-            except Exception:
-                fail_count += 1
-        except Exception as e:
-            fail_count += 1
-            logger.warning(f"Не удалось отправить сообщение пользователю {user_id}: {e}")
-    
-    # Отчёт
-    response = (
-        f"✅ <b>Рассылка завершена!</b>\n\n"
-        f"📨 Отправлено: <b>{success_count}</b>\n"
-        f"❌ Не отправлено: <b>{fail_count}</b>\n"
-        f"📊 Всего: <b>{total}</b>"
-    )
-    
-    await update.message.reply_html(response, reply_markup=reply_markup)
+        except Exception:
+            pass
+
+
+def _launch_broadcast_job(application, job_id: int) -> bool:
+    """Запускает задание в фоне, если оно ещё не выполняется в этом процессе."""
+    return _broadcast_tasks.launch(job_id, lambda: _run_broadcast_job(application.bot, job_id))
+
+
+async def _start_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE, kind: str,
+                           text_input: str | None, file_id: str | None = None) -> None:
+    user = update.effective_user
+    job, created = await adb.create_broadcast_job(user.id, update.effective_chat.id, kind, text_input, file_id)
+    if not created:
+        state = "ещё идёт" if job['status'] == 'running' else "уже была отправлена недавно"
+        await update.message.reply_html(
+            f"⚠️ Такая рассылка {state} (#{job['id']}). Повтор не запущен.",
+            reply_markup=_broadcast_progress_markup(job),
+        )
+        return
+    msg = await update.message.reply_html(_format_broadcast_progress(job), reply_markup=_broadcast_progress_markup(job))
+    await adb.call_write(db.set_broadcast_progress_message, job['id'], msg.message_id)
+    _launch_broadcast_job(context.application, job['id'])
+
+
+async def admin_broadcast_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Останавливает рассылку по кнопке в сообщении с прогрессом."""
+    query = update.callback_query
+    user = query.from_user
+    if not has_creator_panel_access(user.id, user.username):
+        await query.answer("⛔ Доступ запрещён!", show_alert=True)
+        return
+    try:
+        job_id = int((query.data or '').split(':', 1)[1])
+    except (IndexError, ValueError):
+        await query.answer("❌ Некорректная рассылка", show_alert=True)
+        return
+    if await adb.call_write(db.cancel_broadcast_job, job_id):
+        await query.answer("⛔ Рассылка будет остановлена")
+        job = await adb.get_broadcast_job(job_id)
+        if job and job_id not in _broadcast_tasks:
+            await _edit_broadcast_progress(context.bot, job)
+    else:
+        await query.answer("Рассылка уже завершена")
+
+
+async def resume_broadcasts_on_startup(context: ContextTypes.DEFAULT_TYPE):
+    """Продолжает незавершённые рассылки с сохранённого курсора после рестарта."""
+    try:
+        jobs = await adb.get_running_broadcast_jobs()
+    except Exception:
+        logger.exception("[BROADCAST] Не удалось загрузить незавершённые рассылки")
+        return
+    for job in jobs:
+        if _launch_broadcast_job(context.application, job['id']):
+            logger.info(f"[BROADCAST] Продолжаю рассылку #{job['id']} с user_id>{job['cursor_user_id']}")
 
 
 # --- Управление админами ---
@@ -3043,11 +3132,12 @@ async def show_bot_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.answer("⛔ Доступ запрещён!", show_alert=True)
         return
     
-    # Получаем статистику
-    stats = db.get_bot_statistics()
+    # Получаем статистику (снимок с TTL, см. db.get_bot_statistics)
+    stats = await adb.get_bot_statistics()
     
     text = (
-        "📈 <b>Статистика бота</b>\n\n"
+        "📈 <b>Статистика бота</b>\n"
+        f"🕒 Данные на {safe_format_timestamp(stats.get('generated_at'), '%H:%M:%S') or '—'}\n\n"
         "<b>👥 Пользователи:</b>\n"
         f"• Всего: {stats.get('total_users', 0)}\n"
         f"• Активны сегодня: {stats.get('active_today', 0)}\n"
@@ -3530,6 +3620,11 @@ async def admin_player_logs_show(update: Update, context: ContextTypes.DEFAULT_T
             return
         
         username_display = f"@{esc(player.username)}" if player.username else f"ID: {player.user_id}"
+        try:
+            # Журнал пишется через буфер: дописываем его через очередь записей перед выборкой
+            await adb.flush_action_log()
+        except Exception as e:
+            logger.warning(f"[ADMIN_LOGS] Failed to flush action log buffer: {e}")
         logs = db.get_user_logs(player_id, limit=15)
         
         text = f"📝 <b>Логи игрока {esc(username_display)}</b>\n\n"
@@ -3771,16 +3866,28 @@ async def show_admin_broadcast_menu(update: Update, context: ContextTypes.DEFAUL
         return
     
     total_users = db.get_total_users_count()
+    recipients = db.count_broadcast_recipients()
+    running = db.get_running_broadcast_jobs()
     
     keyboard = [
         [InlineKeyboardButton("📢 Начать рассылку", callback_data='admin_broadcast_start')],
-        [InlineKeyboardButton("🔙 Админ панель", callback_data='creator_panel')],
     ]
+    for job in running:
+        keyboard.append([InlineKeyboardButton(f"⛔ Остановить #{job['id']}", callback_data=f"admin_broadcast_cancel:{job['id']}")])
+    keyboard.append([InlineKeyboardButton("🔙 Админ панель", callback_data='creator_panel')])
     reply_markup = InlineKeyboardMarkup(keyboard)
     
     text = (
         "📢 <b>Рассылка сообщений</b>\n\n"
-        f"👥 Всего пользователей: <b>{total_users}</b>\n\n"
+        f"👥 Всего пользователей: <b>{total_users}</b>\n"
+        f"📨 Получат рассылку: <b>{recipients}</b> (остальные заблокировали бота)\n\n"
+    )
+    for job in running:
+        processed = job['sent'] + job['failed'] + job['blocked']
+        text += f"⏳ Идёт рассылка #{job['id']}: {processed} / {job['total']}\n"
+    if running:
+        text += "\n"
+    text += (
         "⚠️ <b>Внимание!</b>\n"
         "Рассылка отправит сообщение всем пользователям бота.\n"
         "Используйте эту функцию осторожно!\n\n"
@@ -4004,36 +4111,35 @@ async def show_admin_analytics(update: Update, context: ContextTypes.DEFAULT_TYP
         return
     
     try:
-        # Получаем полную статистику
-        stats = db.get_bot_statistics()
-        boost_stats = db.get_boost_statistics()
+        # Получаем полную статистику одним снимком: все счётчики, бусты, промо и баны
+        stats = await adb.get_bot_statistics()
         
         # Основная статистика
-        total_users = stats.get('total_users', db.get_total_users_count())
-        total_drinks = stats.get('total_drinks', db.get_total_drinks_count())
-        total_items_in_inventories = stats.get('total_inventory_items', db.get_total_inventory_items())
-        total_coins = stats.get('total_coins', db.get_total_coins_in_system())
+        total_users = stats.get('total_users', 0)
+        total_drinks = stats.get('total_drinks', 0)
+        total_items_in_inventories = stats.get('total_inventory_items', 0)
+        total_coins = stats.get('total_coins', 0)
         
         # VIP статистика
-        active_vip = stats.get('active_vip', db.get_active_vip_count())
-        active_vip_plus = stats.get('active_vip_plus', db.get_active_vip_plus_count())
+        active_vip = stats.get('active_vip', 0)
+        active_vip_plus = stats.get('active_vip_plus', 0)
         
         # Активность
-        active_today = stats.get('active_today', db.get_active_users_today())
-        active_week = stats.get('active_week', db.get_active_users_week())
+        active_today = stats.get('active_today', 0)
+        active_week = stats.get('active_week', 0)
         
         # Покупки
         total_purchases = stats.get('total_purchases', 0)
         purchases_today = stats.get('purchases_today', 0)
         
         # Бусты
-        active_boosts = boost_stats.get('active_boosts', 0)
-        expired_boosts = boost_stats.get('expired_boosts', 0)
-        avg_boost_count = boost_stats.get('average_boost_count', 0)
+        active_boosts = stats.get('active_boosts', 0)
+        expired_boosts = stats.get('expired_boosts', 0)
+        avg_boost_count = stats.get('average_boost_count', 0)
         
         # Дополнительная статистика
-        active_promo = db.get_active_promo_count()
-        banned_users = db.get_banned_users_count()
+        active_promo = stats.get('active_promo', 0)
+        banned_users = stats.get('banned_users', 0)
         active_events = db.get_active_events_count()
         
         # Экономика
@@ -4047,7 +4153,8 @@ async def show_admin_analytics(update: Update, context: ContextTypes.DEFAULT_TYP
         
         # Формируем текст с расширенной аналитикой
         text = (
-            "📊 <b>Расширенная аналитика</b>\n\n"
+            "📊 <b>Расширенная аналитика</b>\n"
+            f"🕒 Данные на {safe_format_timestamp(stats.get('generated_at'), '%H:%M:%S') or '—'}\n\n"
             
             "👥 <b>Пользователи:</b>\n"
             f"├ Всего пользователей: <b>{total_users:,}</b>\n"
@@ -4122,36 +4229,35 @@ async def export_admin_analytics(update: Update, context: ContextTypes.DEFAULT_T
         from datetime import datetime
         import time
         
-        # Получаем статистику
-        stats = db.get_bot_statistics()
-        boost_stats = db.get_boost_statistics()
+        # Получаем статистику одним снимком: все счётчики, бусты, промо и баны
+        stats = await adb.get_bot_statistics()
         
         # Основная статистика
-        total_users = stats.get('total_users', db.get_total_users_count())
-        total_drinks = stats.get('total_drinks', db.get_total_drinks_count())
-        total_items_in_inventories = stats.get('total_inventory_items', db.get_total_inventory_items())
-        total_coins = stats.get('total_coins', db.get_total_coins_in_system())
+        total_users = stats.get('total_users', 0)
+        total_drinks = stats.get('total_drinks', 0)
+        total_items_in_inventories = stats.get('total_inventory_items', 0)
+        total_coins = stats.get('total_coins', 0)
         
         # VIP статистика
-        active_vip = stats.get('active_vip', db.get_active_vip_count())
-        active_vip_plus = stats.get('active_vip_plus', db.get_active_vip_plus_count())
+        active_vip = stats.get('active_vip', 0)
+        active_vip_plus = stats.get('active_vip_plus', 0)
         
         # Активность
-        active_today = stats.get('active_today', db.get_active_users_today())
-        active_week = stats.get('active_week', db.get_active_users_week())
+        active_today = stats.get('active_today', 0)
+        active_week = stats.get('active_week', 0)
         
         # Покупки
         total_purchases = stats.get('total_purchases', 0)
         purchases_today = stats.get('purchases_today', 0)
         
         # Бусты
-        active_boosts = boost_stats.get('active_boosts', 0)
-        expired_boosts = boost_stats.get('expired_boosts', 0)
-        avg_boost_count = boost_stats.get('average_boost_count', 0)
+        active_boosts = stats.get('active_boosts', 0)
+        expired_boosts = stats.get('expired_boosts', 0)
+        avg_boost_count = stats.get('average_boost_count', 0)
         
         # Дополнительная статистика
-        active_promo = db.get_active_promo_count()
-        banned_users = db.get_banned_users_count()
+        active_promo = stats.get('active_promo', 0)
+        banned_users = stats.get('banned_users', 0)
         active_events = db.get_active_events_count()
         
         # Экономика
@@ -5234,22 +5340,7 @@ async def handle_admin_broadcast(update: Update, context: ContextTypes.DEFAULT_T
     user = update.effective_user
     if not has_creator_panel_access(user.id, user.username):
         return
-    recipients = db.get_all_users_for_broadcast()
-    total = len(recipients)
-    ok = 0
-    fail = 0
-    for uid in recipients:
-        try:
-            await context.bot.send_message(chat_id=uid, text=text_input, parse_mode='HTML')
-            ok += 1
-        except Exception:
-            fail += 1
-        await asyncio.sleep(0.05)
-    try:
-        db.log_action(user.id, user.username, 'admin_action', f'broadcast: ok={ok}, fail={fail}', success=True)
-    except Exception:
-        pass
-    await update.message.reply_html(f"📢 Рассылка завершена. Успешно: <b>{ok}</b> / Не доставлено: <b>{fail}</b> (всего: {total})")
+    await _start_broadcast(update, context, 'text', text_input)
 
 async def handle_admin_broadcast_audio(update: Update, context: ContextTypes.DEFAULT_TYPE, caption_input: str):
     user = update.effective_user
@@ -5259,28 +5350,7 @@ async def handle_admin_broadcast_audio(update: Update, context: ContextTypes.DEF
     if not audio:
         await update.message.reply_html("❌ Пришлите аудио-файл (музыку) или отправьте текстовый пост.")
         return
-    file_id = audio.file_id
-    recipients = db.get_all_users_for_broadcast()
-    total = len(recipients)
-    ok = 0
-    fail = 0
-    for uid in recipients:
-        try:
-            await context.bot.send_audio(
-                chat_id=uid,
-                audio=file_id,
-                caption=caption_input if caption_input else None,
-                parse_mode='HTML' if caption_input else None,
-            )
-            ok += 1
-            await asyncio.sleep(0.05)
-        except Exception:
-            fail += 1
-    try:
-        db.log_action(user.id, user.username, 'admin_action', f'broadcast_audio: ok={ok}, fail={fail}', success=True)
-    except Exception:
-        pass
-    await update.message.reply_html(f"🎵 Рассылка аудио завершена. Успешно: <b>{ok}</b> / Не доставлено: <b>{fail}</b> (всего: {total})")
+    await _start_broadcast(update, context, 'audio', caption_input or None, audio.file_id)
 
 async def show_admin_promo_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает меню управления промокодами."""
@@ -5416,18 +5486,29 @@ async def search_reminder_job(context: ContextTypes.DEFAULT_TYPE):
     except Exception as ex:
         logger.warning(f"Не удалось отправить напоминание (job): {ex}")
 
-async def plantation_water_reminder_job(context: ContextTypes.DEFAULT_TYPE):
-    """JobQueue: напоминание о возможности полива грядки."""
+async def plantation_reminder_tick_job(context: ContextTypes.DEFAULT_TYPE):
+    """JobQueue: единый тик напоминаний о поливе — отправляет пачку созревших напоминаний.
+    На первом тике сервис восстанавливает сроки из БД после рестарта.
+    """
+    async def run_batch(beds: list[tuple[int, int]]):
+        await asyncio.gather(
+            *(plantation_water_reminder(context.bot, user_id, bed_index) for user_id, bed_index in beds),
+            return_exceptions=True,
+        )
+
     try:
-        if not hasattr(context, 'job') or not context.job:
-            return
-        user_id = context.job.chat_id
-        bed_index = context.job.data.get('bed_index', 0)
+        await plantation_reminders.tick(run_batch)
+    except Exception:
+        logger.exception("[PLANTATION] Ошибка в тике напоминаний о поливе")
 
-        auto_res = db.try_farmer_autowater(user_id, bed_index)
+
+async def plantation_water_reminder(bot, user_id: int, bed_index: int):
+    """Напоминание о возможности полива грядки (срабатывает из plantation_reminder_tick_job)."""
+    try:
+        auto_res = await adb.call_write(db.try_farmer_autowater, user_id, bed_index)
         player = None
         try:
-            player = db.get_player(user_id)
+            player = await adb.get_player(user_id)
         except Exception:
             player = None
         silent_farmer = bool(getattr(player, 'farmer_silent', False)) if player else False
@@ -5440,24 +5521,18 @@ async def plantation_water_reminder_job(context: ContextTypes.DEFAULT_TYPE):
 
         if auto_res.get('ok'):
             try:
-                db.try_farmer_auto_fertilize(user_id)
+                await adb.call_write(db.try_farmer_auto_fertilize, user_id)
             except Exception:
                 pass
             if not silent_farmer:
-                await context.bot.send_message(
+                await bot.send_message(
                     chat_id=user_id,
                     text=f"👨‍🌾 Селюк фермер полил грядку {bed_index} (−{auto_res.get('cost', 50)} септимов с его баланса).",
                     reply_markup=reply_markup
                 )
             # Планируем следующий полив
             water_interval = auto_res.get('water_interval_sec', 1800)
-            context.job_queue.run_once(
-                plantation_water_reminder_job,
-                when=water_interval,
-                chat_id=user_id,
-                data={'bed_index': bed_index},
-                name=f"plantation_water_reminder_{user_id}_{bed_index}"
-            )
+            plantation_reminders.schedule_in(user_id, bed_index, water_interval)
             return
 
         reason = auto_res.get('reason') if isinstance(auto_res, dict) else None
@@ -5465,20 +5540,12 @@ async def plantation_water_reminder_job(context: ContextTypes.DEFAULT_TYPE):
         if reason == 'too_early_to_water':
             nxt = int(auto_res.get('next_water_in') or 0)
             if nxt > 0:
-                try:
-                    context.job_queue.run_once(
-                        plantation_water_reminder_job,
-                        when=nxt,
-                        chat_id=user_id,
-                        data={'bed_index': bed_index},
-                        name=f"plantation_water_reminder_{user_id}_{bed_index}"
-                    )
-                except Exception:
-                    pass
+                plantation_reminders.schedule_in(user_id, bed_index, nxt)
             return
         
         # Если грядка пустая или удалена - прекращаем напоминания
         if reason in ('no_seed', 'no_bed', 'no_such_bed'):
+            plantation_reminders.cancel(user_id, bed_index)
             return
         if reason == 'not_growing':
             try:
@@ -5486,6 +5553,7 @@ async def plantation_water_reminder_job(context: ContextTypes.DEFAULT_TYPE):
             except Exception:
                 bed_state = ''
             if bed_state in ('empty', 'withered', 'ready'):
+                plantation_reminders.cancel(user_id, bed_index)
                 return
 
         if reason == 'remind_disabled':
@@ -5527,7 +5595,7 @@ async def plantation_water_reminder_job(context: ContextTypes.DEFAULT_TYPE):
         else:
             text = f"💧 Грядка {bed_index} готова к поливу!"
 
-        await context.bot.send_message(
+        await bot.send_message(
             chat_id=user_id,
             text=text,
             reply_markup=reply_markup
@@ -5589,39 +5657,13 @@ async def global_farmer_harvest_job(context: ContextTypes.DEFAULT_TYPE):
                             except Exception:
                                 pass
 
-                        try:
-                            jq = None
-                            if hasattr(context, 'job_queue') and context.job_queue:
-                                jq = context.job_queue
-                            elif context.application and context.application.job_queue:
-                                jq = context.application.job_queue
-                            if jq:
-                                for p in planted:
-                                    try:
-                                        bed_idx = int(p.get('bed_index') or 0)
-                                    except Exception:
-                                        bed_idx = 0
-                                    if bed_idx <= 0:
-                                        continue
-                                    try:
-                                        current_jobs = jq.get_jobs_by_name(f"plantation_water_reminder_{user_id}_{bed_idx}")
-                                        for job in current_jobs:
-                                            job.schedule_removal()
-                                    except Exception:
-                                        pass
-
-                                    try:
-                                        jq.run_once(
-                                            plantation_water_reminder_job,
-                                            when=1,
-                                            chat_id=int(user_id),
-                                            data={'bed_index': bed_idx},
-                                            name=f"plantation_water_reminder_{user_id}_{bed_idx}",
-                                        )
-                                    except Exception as ex:
-                                        logger.warning(f"Не удалось запланировать автополив после автопосадки для user {user_id}, bed {bed_idx}: {ex}")
-                        except Exception as ex:
-                            logger.warning(f"Не удалось обработать планирование автополива после автопосадки для user {user_id}: {ex}")
+                        for p in planted:
+                            try:
+                                bed_idx = int(p.get('bed_index') or 0)
+                            except Exception:
+                                bed_idx = 0
+                            if bed_idx > 0:
+                                plantation_reminders.schedule_in(int(user_id), bed_idx, 1)
                 except Exception as e:
                     logger.warning(f"Ошибка автопосадки для user {user_id}: {e}")
     except Exception as ex:
@@ -5748,18 +5790,7 @@ async def snooze_reminder_handler(update: Update, context: ContextTypes.DEFAULT_
     delay_sec = 600
     
     try:
-        # Удаляем старые (на всякий случай)
-        current_jobs = context.application.job_queue.get_jobs_by_name(f"plantation_water_reminder_{user_id}_{bed_index}")
-        for job in current_jobs:
-            job.schedule_removal()
-            
-        context.application.job_queue.run_once(
-            plantation_water_reminder_job,
-            when=delay_sec,
-            chat_id=user_id,
-            data={'bed_index': bed_index},
-            name=f"plantation_water_reminder_{user_id}_{bed_index}",
-        )
+        plantation_reminders.schedule_in(user_id, bed_index, delay_sec)
         
         await query.edit_message_text(
             text=f"💤 Напоминание отложено на 10 минут.",
@@ -5770,7 +5801,7 @@ async def snooze_reminder_handler(update: Update, context: ContextTypes.DEFAULT_
         await query.answer("Ошибка", show_alert=True)
 
 
-async def _send_auto_search_summary(user_id: int, player: Player, context: ContextTypes.DEFAULT_TYPE, reason: str = 'limit'):
+async def _send_auto_search_summary(user_id: int, player: Player | None, context: ContextTypes.DEFAULT_TYPE, reason: str = 'limit'):
     """Отправляет сводный отчет по автопоиску (для тихого режима)."""
     try:
         stats = db.consume_auto_search_session_stats(user_id)
@@ -5809,19 +5840,9 @@ MAX_AUTO_SEARCH_RETRIES = 5
 
 
 def _reschedule_auto_search(context, user_id: int, delay: float):
-    """Безопасно перепланирует auto_search_job (удаляет старые задачи перед созданием новой)."""
-    try:
-        for job in context.application.job_queue.get_jobs_by_name(f"auto_search_{user_id}"):
-            job.schedule_removal()
-    except Exception:
-        pass
+    """Переносит следующий автопоиск пользователя в едином планировщике (старый срок заменяется)."""
     try:
-        context.application.job_queue.run_once(
-            auto_search_job,
-            when=max(1.0, delay),
-            chat_id=user_id,
-            name=f"auto_search_{user_id}",
-        )
+        auto_search_scheduler.schedule_in(user_id, delay)
     except Exception as e:
         logger.warning(f"[AUTO] Не удалось перепланировать auto_search для {user_id}: {e}")
 
@@ -5843,6 +5864,7 @@ async def _schedule_auto_search_retry(
             f"Причина: {reason}. Отключаю автопоиск."
         )
         db.update_player(user_id, auto_search_enabled=False)
+        auto_search_scheduler.cancel(user_id)
         context.bot_data.pop(retry_key, None)
         if notify_on_disable:
             try:
@@ -5865,337 +5887,215 @@ async def _schedule_auto_search_retry(
     _reschedule_auto_search(context, user_id, delay)
 
 
-def _restore_auto_search_jobs(application, *, only_missing: bool = False) -> int:
-    """Восстанавливает задачи автопоиска для включённых пользователей."""
+def _restore_auto_search_schedule() -> int:
+    """Подгружает в планировщик сохранённые сроки автопоиска, наступающие в ближайшем горизонте."""
     try:
-        players = db.get_players_with_auto_search_enabled()
+        return auto_search_scheduler.refill()
     except Exception as e:
-        logger.warning(f"[AUTO] Не удалось получить список игроков для восстановления автопоиска: {e}")
+        logger.warning(f"[AUTO] Не удалось восстановить расписание автопоиска: {e}")
         return 0
 
-    restored = 0
-    now_ts = time.time()
-    for idx, p in enumerate(players):
-        try:
-            user_id = p.get('user_id')
-            if not user_id:
-                continue
 
-            job_name = f"auto_search_{user_id}"
-            if only_missing:
-                try:
-                    if application.job_queue.get_jobs_by_name(job_name):
-                        continue
-                except Exception:
-                    pass
+def _auto_search_swaga_weights() -> dict | None:
+    """Веса свага-карточек для автопоиска — из того же источника, что и ручной поиск."""
+    try:
+        from constants import SWAGA_RARITIES
+        return dict(SWAGA_RARITIES)
+    except Exception:
+        return None
 
-            access = db.get_access_profile(int(user_id), username=p.get('username'))
-            if not access.get('acts_like_vip'):
-                try:
-                    db.update_player(user_id, auto_search_enabled=False)
-                except Exception:
-                    pass
-                continue
 
-            eff_search_cd = _effective_search_cooldown(access)
-            last_search_ts = float(p.get('last_search', 0) or 0.0)
-            time_since_last = max(0.0, now_ts - last_search_ts)
-            delay = eff_search_cd - time_since_last
+_AUTO_SEARCH_ENGINE = AutoSearchEngine(
+    rarity_weights=lambda rating: _rarity_weights_with_rating(RARITIES, rating, 0.10),
+    swaga_weights=_auto_search_swaga_weights(),
+)
 
-            # Линейный рассев по индексу для более ровной нагрузки.
-            base_stagger = 5.0 + float(idx) * 2.0
-            when_delay = max(base_stagger, delay, 1.0)
+# Очередь уведомлений автопоиска: тик только считает и пишет в БД,
+# отправкой в Telegram занимается отдельная задача auto_search_notify_job.
+AUTO_SEARCH_NOTIFY_PER_TICK = 25
+_auto_search_outbox: deque = deque()
 
-            application.job_queue.run_once(
-                auto_search_job,
-                when=when_delay,
-                chat_id=user_id,
-                name=job_name,
-            )
-            restored += 1
-        except Exception:
-            logger.exception("[AUTO] Ошибка при попытке восстановить автопоиск пользователя")
-            continue
 
-    return restored
+def _queue_auto_search_notice(user_id: int, kind: str, payload=None) -> None:
+    """kind: 'result' (dict результата поиска), 'text' (строка), 'summary' (причина сводки)."""
+    _auto_search_outbox.append((int(user_id), kind, payload))
 
 
-async def auto_search_watchdog_job(context: ContextTypes.DEFAULT_TYPE):
-    """Поднимает обратно задачи автопоиска, если флаг включён, а JobQueue-задача пропала."""
-    application = getattr(context, 'application', None)
-    if not application or not application.job_queue:
-        return
+async def auto_search_tick_job(context: ContextTypes.DEFAULT_TYPE):
+    """JobQueue: единый тик автопоиска — запускает пачку пользователей, у которых подошёл срок.
+    Заодно раз в AUTO_SEARCH_REFILL_SEC подхватывает из БД сроки, потерянные в памяти (бывший watchdog).
+    """
+    async def run_batch(user_ids: list[int]):
+        await _run_auto_search_batch(context, user_ids)
 
-    restored = _restore_auto_search_jobs(application, only_missing=True)
-    if restored:
-        logger.info(f"[AUTO] Watchdog восстановил задач автопоиска: {restored}")
+    try:
+        await auto_search_scheduler.tick(run_batch)
+    except Exception:
+        logger.exception("[AUTO] Ошибка в тике планировщика автопоиска")
 
 
-async def auto_search_job(context: ContextTypes.DEFAULT_TYPE):
-    """JobQueue: периодически выполняет автопоиск для VIP-пользователей.
-    Самопереназначается с интервалом, равным оставшемуся кулдауну.
-    Останавливается при исчерпании лимита/окончании VIP/выключении пользователем.
+async def _run_auto_search_batch(context: ContextTypes.DEFAULT_TYPE, user_ids: list[int]):
+    """Выполняет автопоиск пачки пользователей: одно чтение, расчёт в памяти, одна запись.
+    Переназначает каждого пользователя через оставшийся кулдаун.
+    Останавливает автопоиск при исчерпании лимита/окончании VIP/выключении пользователем.
     """
-    try:
-        # Безопасное получение user_id
-        if not hasattr(context, 'job') or not context.job:
-            logger.warning("[AUTO] context.job отсутствует в auto_search_job")
-            return
-        user_id = context.job.chat_id
-        if not user_id:
-            logger.warning("[AUTO] user_id отсутствует в auto_search_job")
-            return
+    ready = []
+    for user_id in user_ids:
+        # Параллельно идёт ручной поиск — попробуем позже
+        if _get_lock(f"user:{user_id}:search").locked():
+            _reschedule_auto_search(context, user_id, 5)
+        else:
+            ready.append(user_id)
+    if not ready:
+        return
 
-        # Сброс retry-счётчика при успешном старте
-        retry_key = f"auto_search_retries_{user_id}"
+    try:
+        results = await adb.call_write(_AUTO_SEARCH_ENGINE.run, ready)
+    except Exception:
+        logger.exception(f"[AUTO] Ошибка пакетного автопоиска ({len(ready)} польз.)")
+        results = {user_id: {'status': 'error'} for user_id in ready}
 
-        player = db.get_or_create_player(user_id, str(user_id))
+    for user_id in ready:
+        try:
+            await _handle_auto_search_result(context, user_id, results.get(user_id) or {'status': 'error'})
+        except Exception:
+            logger.exception(f"[AUTO] Ошибка обработки результата автопоиска для {user_id}")
+            await _schedule_auto_search_retry(context, user_id, reason='job_exception')
 
-        # Если пользователь успел выключить автопоиск — выходим (не переназначаем)
-        if not getattr(player, 'auto_search_enabled', False):
-            # Если был тихий режим и есть статистика — отправим отчет
-            if getattr(player, 'auto_search_silent', False):
-                await _send_auto_search_summary(user_id, player, context, reason='disabled')
-            context.bot_data.pop(retry_key, None)
-            return
 
-        access = db.get_access_profile(user_id, username=getattr(player, 'username', None), player=player)
-        if not access.get('acts_like_vip'):
-            # Если был тихий режим — отчет
-            if getattr(player, 'auto_search_silent', False):
-                await _send_auto_search_summary(user_id, player, context, reason='vip_expired')
-                
-            db.update_player(user_id, auto_search_enabled=False)
-            lang = player.language
-            try:
-                await context.bot.send_message(chat_id=user_id, text=t(lang, 'auto_vip_expired'))
-            except Exception:
-                pass
-            context.bot_data.pop(retry_key, None)
-            return
+async def _handle_auto_search_result(context: ContextTypes.DEFAULT_TYPE, user_id: int, result: dict):
+    retry_key = f"auto_search_retries_{user_id}"
+    status = result.get('status')
+    lang = result.get('language') or 'ru'
+    silent = bool(result.get('silent'))
 
-        # Сброс дневного счётчика при наступлении reset_ts или если он не установлен
-        now_ts = int(time.time())
-        reset_ts = int(getattr(player, 'auto_search_reset_ts', 0) or 0)
-        count = int(getattr(player, 'auto_search_count', 0) or 0)
-        if reset_ts == 0 or now_ts >= reset_ts:
-            count = 0
-            reset_ts = now_ts + 24*60*60
-            db.update_player(user_id, auto_search_count=count, auto_search_reset_ts=reset_ts)
-
-        # Лимит в сутки (с учётом возможного буста)
-        daily_limit = db.get_auto_search_daily_limit(user_id, username=getattr(player, 'username', None))
-        if count >= daily_limit:
-            # Если был тихий режим — отчет
-            if getattr(player, 'auto_search_silent', False):
-                await _send_auto_search_summary(user_id, player, context, reason='limit')
-                
-            db.update_player(user_id, auto_search_enabled=False)
-            lang = player.language
+    if status == 'ok':
+        # Сбрасываем retry-счётчик при успехе
+        context.bot_data.pop(retry_key, None)
+        eff_search_cd = float(result.get('cooldown') or SEARCH_COOLDOWN)
+        if result.get('remind') and context.application and context.application.job_queue:
             try:
-                await context.bot.send_message(chat_id=user_id, text=t(lang, 'auto_limit_reached'))
-            except Exception:
-                pass
-            context.bot_data.pop(retry_key, None)
-            return
-
-        eff_search_cd = _effective_search_cooldown(access)
-        time_since_last = time.time() - float(getattr(player, 'last_search', 0) or 0.0)
-        if time_since_last < eff_search_cd:
-            delay = max(1.0, eff_search_cd - time_since_last)
-            _reschedule_auto_search(context, user_id, delay)
-            return
-
-        # Анти-гонки: используем общий локер для поиска
-        lock = _get_lock(f"user:{user_id}:search")
-        if lock.locked():
-            # Если параллельно идёт ручной поиск — попробуем позже
-            _reschedule_auto_search(context, user_id, 5)
+                context.application.job_queue.run_once(
+                    search_reminder_job,
+                    when=eff_search_cd,
+                    chat_id=user_id,
+                    name=f"search_reminder_{user_id}_{int(time.time())}",
+                )
+            except Exception as ex:
+                logger.warning(f"Не удалось запланировать напоминание: {ex}")
+        if not silent:
+            _queue_auto_search_notice(user_id, 'result', result)
+        if result.get('limit_reached'):
+            if silent:
+                _queue_auto_search_notice(user_id, 'summary', 'limit')
+            _queue_auto_search_notice(user_id, 'text', t(lang, 'auto_limit_reached'))
             return
+        # Назначаем следующий запуск после полного КД
+        _reschedule_auto_search(context, user_id, eff_search_cd)
+        return
 
-        async with lock:
-            player = db.get_or_create_player(user_id, player.username or str(user_id))
-            if not getattr(player, 'auto_search_enabled', False):
-                if getattr(player, 'auto_search_silent', False):
-                    await _send_auto_search_summary(user_id, player, context, reason='disabled')
-                context.bot_data.pop(retry_key, None)
-                return
-
-            access = db.get_access_profile(user_id, username=getattr(player, 'username', None), player=player)
-            daily_limit = db.get_auto_search_daily_limit(user_id, username=getattr(player, 'username', None))
-            result = await _perform_energy_search(
-                user_id,
-                player.username or str(user_id),
-                context,
-                auto_search=True,
-                auto_search_daily_limit=daily_limit,
-            )
-
-            if result.get('status') == 'ok':
-                # Атомарный инкремент счётчика (SEC-01 fix)
-                count = int(result.get('auto_search_count', count) or count)
-                if False:
-                    logger.warning(f"[AUTO] Не удалось инкрементировать auto_search_count для {user_id}")
-
-        # Сбрасываем retry-счётчик при успехе
+    if status == 'cooldown':
+        _reschedule_auto_search(context, user_id, max(1.0, float(result.get('time_left', 5))))
+    elif status == 'disabled':
+        if silent:
+            _queue_auto_search_notice(user_id, 'summary', 'disabled')
         context.bot_data.pop(retry_key, None)
+    elif status in ('limit', 'vip_expired'):
+        if silent:
+            _queue_auto_search_notice(user_id, 'summary', status)
+        text_key = 'auto_limit_reached' if status == 'limit' else 'auto_vip_expired'
+        _queue_auto_search_notice(user_id, 'text', t(lang, text_key))
+        context.bot_data.pop(retry_key, None)
+    elif status == 'no_drinks':
+        # Сообщим и попробуем через 10 минут
+        _queue_auto_search_notice(user_id, 'text', "В базе данных пока нет энергетиков для автопоиска.")
+        _reschedule_auto_search(context, user_id, 600)
+    elif status == 'missing':
+        logger.warning(f"[AUTO] Игрок {user_id} не найден, автопоиск снят с расписания")
+    else:
+        logger.warning(f"[AUTO] Автопоиск вернул status={status} для user {user_id}")
+        await _schedule_auto_search_retry(context, user_id, reason=f"status:{status}")
 
-        if result.get('status') == 'ok':
-            # Перечитываем player для актуальных данных
-            player = db.get_or_create_player(user_id, player.username or str(user_id))
 
-            # Проверяем режим (тихий или обычный)
-            is_silent = getattr(player, 'auto_search_silent', False)
-            logger.info(f"[AUTO] User {user_id} silent mode: {is_silent}")
-            
-            if is_silent:
-                # Накапливаем статистику
-                try:
-                    stats_json = getattr(player, 'auto_search_session_stats', '{}') or '{}'
-                    try:
-                        stats = json.loads(stats_json)
-                    except Exception:
-                        stats = {}
-                    
-                    # Обновляем данные
-                    found_count = int(result.get('found_count', 1) or 1)
-                    stats['total_found'] = stats.get('total_found', 0) + found_count
-                    
-                    earned_coins = result.get('earned_coins', 0)
-                    stats['total_coins'] = stats.get('total_coins', 0) + earned_coins
-                    
-                    rarities = result.get('rarities')
-                    if not rarities:
-                        rarity_one = result.get('rarity')
-                        rarities = [rarity_one] if rarity_one else []
-                    if 'rarities' not in stats:
-                        stats['rarities'] = {}
-                    for rarity in rarities:
-                        if not rarity:
-                            continue
-                        stats['rarities'][rarity] = stats['rarities'].get(rarity, 0) + 1
-                    
-                    db.append_auto_search_session_stats(
-                        user_id,
-                        found_count=found_count,
-                        earned_coins=earned_coins,
-                        rarities=rarities,
-                    )
-                    logger.debug(f"[AUTO] Silent search stats updated for {user_id}")
-                except Exception as e:
-                    logger.error(f"[AUTO] Failed to update silent stats: {e}")
+async def auto_search_notify_job(context: ContextTypes.DEFAULT_TYPE):
+    """JobQueue: отправляет накопленные уведомления автопоиска, не больше AUTO_SEARCH_NOTIFY_PER_TICK за раз."""
+    for _ in range(min(AUTO_SEARCH_NOTIFY_PER_TICK, len(_auto_search_outbox))):
+        user_id, kind, payload = _auto_search_outbox.popleft()
+        try:
+            if kind == 'result':
+                await _send_auto_search_result(context, user_id, payload)
+            elif kind == 'summary':
+                await _send_auto_search_summary(user_id, None, context, reason=payload)
             else:
-                # Отправим пользователю уведомление с найденным предметом (как раньше)
-                try:
-                    img_paths = result.get("image_paths") or []
-                    existing = [p for p in img_paths if p and os.path.exists(p) and os.path.getsize(p) > 0]
-                    found_count = int(result.get('found_count', 1) or 1)
-                    caption = result.get("caption")
-                    if found_count >= 2 and len(existing) >= 2:
-                        f1 = None
-                        f2 = None
-                        try:
-                            f1 = open(existing[0], 'rb')
-                            f2 = open(existing[1], 'rb')
-                            await _send_media_group_or_text_fallback(
-                                context.bot,
-                                chat_id=user_id,
-                                photos=[f1, f2],
-                                caption=caption,
-                                parse_mode='HTML',
-                            )
-                        finally:
-                            try:
-                                if f1:
-                                    f1.close()
-                            except Exception:
-                                pass
-                            try:
-                                if f2:
-                                    f2.close()
-                            except Exception:
-                                pass
-                    elif existing:
-                        with open(existing[0], 'rb') as photo:
-                            await _send_photo_or_text_fallback(
-                                context.bot,
-                                chat_id=user_id,
-                                photo=photo,
-                                caption=caption,
-                                reply_markup=result.get("reply_markup"),
-                                parse_mode='HTML',
-                            )
-                    else:
-                        await context.bot.send_message(
-                            chat_id=user_id,
-                            text=(caption or '')[:4096],
-                            reply_markup=result.get("reply_markup"),
-                            parse_mode='HTML'
-                        )
-                except Exception as e:
-                    logger.warning(f"[AUTO] Не удалось отправить результат поиска user {user_id}: {e}")
-
-            # Если достигнут лимит — отключаем и уведомляем
-            daily_limit = db.get_auto_search_daily_limit(user_id, username=getattr(player, 'username', None))
-            if count >= daily_limit:
-                # Если был тихий режим — отчет
-                if is_silent:
-                    await _send_auto_search_summary(user_id, player, context, reason='limit')
-                    
-                db.update_player(user_id, auto_search_enabled=False)
-                lang = player.language
-                try:
-                    await context.bot.send_message(chat_id=user_id, text=t(lang, 'auto_limit_reached'))
-                except Exception:
-                    pass
-                return
+                await context.bot.send_message(chat_id=user_id, text=str(payload)[:4096])
+        except Exception as e:
+            logger.warning(f"[AUTO] Не удалось отправить уведомление автопоиска user {user_id}: {e}")
 
-            # Назначаем следующий запуск после полного КД
-            _reschedule_auto_search(context, user_id, eff_search_cd)
-            logger.debug(f"[AUTO] Запланирован следующий автопоиск для {user_id} через {eff_search_cd} сек")
-            return
 
-        elif result.get('status') == 'cooldown':
-            delay = max(1.0, float(result.get('time_left', 5)))
-            _reschedule_auto_search(context, user_id, delay)
-            return
-        elif result.get('status') == 'disabled':
-            if getattr(player, 'auto_search_silent', False):
-                await _send_auto_search_summary(user_id, player, context, reason='disabled')
-            return
-        elif result.get('status') == 'limit':
-            if getattr(player, 'auto_search_silent', False):
-                await _send_auto_search_summary(user_id, player, context, reason='limit')
-            db.update_player(user_id, auto_search_enabled=False)
+async def _send_auto_search_result(context: ContextTypes.DEFAULT_TYPE, user_id: int, result: dict):
+    """Отправляет пользователю найденное автопоиском (как при ручном поиске)."""
+    drops = result.get('drops') or []
+    found_count = int(result.get('found_count', 1) or 1)
+    caption = _format_search_result_caption(
+        lang=result.get('language') or 'ru',
+        access=result.get('access') or {},
+        drops=drops,
+        found_count=found_count,
+        septims_reward=int(result.get('septims_reward', 0) or 0),
+        total_autosell_payout=int(result.get('total_autosell_payout', 0) or 0),
+        coins_after=int(result.get('coins_after', 0) or 0),
+        new_rating=result.get('new_rating'),
+        swaga_cards_found=result.get('swaga_cards_found') or [],
+        swaga_cards_total=int(result.get('swaga_cards_total', 0) or 0),
+        used_luck_coupon=bool(result.get('used_luck_coupon')),
+        luck_charges_left=int(result.get('luck_charges_left', 0) or 0),
+    )
+    img_paths = []
+    for d in drops:
+        p = getattr(d['drink'], 'image_path', None)
+        img_paths.append(os.path.join(ENERGY_IMAGES_DIR, p) if p else None)
+    existing = [p for p in img_paths if p and os.path.exists(p) and os.path.getsize(p) > 0]
+    if found_count >= 2 and len(existing) >= 2:
+        f1 = None
+        f2 = None
+        try:
+            f1 = open(existing[0], 'rb')
+            f2 = open(existing[1], 'rb')
+            await _send_media_group_or_text_fallback(
+                context.bot,
+                chat_id=user_id,
+                photos=[f1, f2],
+                caption=caption,
+                parse_mode='HTML',
+            )
+        finally:
             try:
-                await context.bot.send_message(chat_id=user_id, text=t(player.language, 'auto_limit_reached'))
+                if f1:
+                    f1.close()
             except Exception:
                 pass
-            return
-        elif result.get('status') == 'no_drinks':
-            # Сообщим один раз и попробуем через 10 минут
             try:
-                await context.bot.send_message(chat_id=user_id, text="В базе данных пока нет энергетиков для автопоиска.")
+                if f2:
+                    f2.close()
             except Exception:
                 pass
-            _reschedule_auto_search(context, user_id, 600)
-            return
-        elif result.get('status') == 'error':
-            logger.warning(f"[AUTO] _perform_energy_search вернул status=error для user {user_id}: {result}")
-            await _schedule_auto_search_retry(context, user_id, reason='perform_search_error')
-            return
-        else:
-            logger.warning(f"[AUTO] Неожиданный статус автопоиска для user {user_id}: {result}")
-            await _schedule_auto_search_retry(context, user_id, reason=f"unexpected_status:{result.get('status')}")
-            return
-    except Exception:
-        logger.exception("[AUTO] Ошибка в auto_search_job")
-        try:
-            if hasattr(context, 'job') and context.job and context.job.chat_id:
-                user_id = context.job.chat_id
-                await _schedule_auto_search_retry(context, user_id, reason='job_exception')
-        except Exception as e:
-            logger.warning(f"[AUTO] Не удалось перезапустить auto_search_job после ошибки: {e}")
+    elif existing:
+        with open(existing[0], 'rb') as photo:
+            await _send_photo_or_text_fallback(
+                context.bot,
+                chat_id=user_id,
+                photo=photo,
+                caption=caption,
+                reply_markup=_search_result_reply_markup(),
+                parse_mode='HTML',
+            )
+    else:
+        await context.bot.send_message(
+            chat_id=user_id,
+            text=(caption or '')[:4096],
+            reply_markup=_search_result_reply_markup(),
+            parse_mode='HTML'
+        )
 
 
 async def silk_harvest_reminder_job(context: ContextTypes.DEFAULT_TYPE):
@@ -6280,8 +6180,8 @@ async def _perform_energy_search(
     Ядро логики поиска энергетика. Проверяет кулдаун, ищет напиток,
     обновляет БД и возвращает результат в виде словаря.
     """
-    player = db.get_or_create_player(user_id, username)
-    access = db.get_access_profile(user_id, username=username, player=player)
+    player = await adb.call(uctx.get_or_create_player, user_id, username)
+    access = await adb.call(uctx.get_access_profile, user_id, username=username, player=player)
     lang = getattr(player, 'language', 'ru') or 'ru'
     rating_value = int(getattr(player, 'rating', 0) or 0)
 
@@ -6291,14 +6191,14 @@ async def _perform_energy_search(
         time_left = eff_search_cd - (current_time - player.last_search)
         return {"status": "cooldown", "time_left": time_left}
 
-    # Выбираем случайный энергетик с учетом системы "горячих" и "холодных" напитков
-    weighted_drinks = db.get_weighted_drinks_list()
-    if not weighted_drinks:
+    # Выбираем случайный энергетик с учетом системы "горячих" и "холодных" напитков.
+    # Каталог и выборка живут в памяти процесса; вызов через шлюз только на случай перечитки каталога.
+    if not await adb.count_search_drinks():
         return {"status": "no_drinks"}
 
     favorite_drink_ids: set[int] = set()
     try:
-        favorite_drink_ids = db.get_player_favorite_drink_ids(user_id)
+        favorite_drink_ids = await adb.get_player_favorite_drink_ids(user_id)
     except Exception:
         favorite_drink_ids = set()
 
@@ -6330,11 +6230,9 @@ async def _perform_energy_search(
     total_autosell_payout = 0
 
     for _ in range(found_count):
-        if favorite_drink_ids:
-            weights = [FAVORITE_DRINK_WEIGHT_MULT if int(getattr(d, 'id', 0) or 0) in favorite_drink_ids else 1.0 for d in weighted_drinks]
-            found_drink = random.choices(weighted_drinks, weights=weights, k=1)[0]
-        else:
-            found_drink = random.choice(weighted_drinks)
+        found_drink = db.pick_search_drink(favorite_drink_ids, FAVORITE_DRINK_WEIGHT_MULT)
+        if found_drink is None:
+            return {"status": "no_drinks"}
 
         # Определяем "температуру" найденного напитка ДО записи находки
         drink_temp = db.get_drink_temperature(found_drink.id)
@@ -6405,7 +6303,7 @@ async def _perform_energy_search(
     # Обновляем игрока: фиксируем время поиска и рейтинг.
     # Баланс обновляем атомарно через increment_coins, чтобы не перезаписать
     # параллельные изменения от других обработчиков (казино, подарки, админ).
-    apply_result = db.apply_energy_search_outcome_atomic(
+    apply_result = await adb.apply_energy_search_outcome_atomic(
         user_id=user_id,
         username=username,
         search_ts=int(current_time),
@@ -6506,7 +6404,7 @@ async def find_energy(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     async with lock:
         # Предварительная проверка кулдауна для быстрого ответа
-        player = db.get_or_create_player(user.id, user.username or user.first_name)
+        player = await adb.call(uctx.get_or_create_player, user.id, user.username or user.first_name)
         access = _get_access_profile(user, player=player)
         lang = getattr(player, 'language', 'ru') or 'ru'
         eff_search_cd = _effective_search_cooldown(access)
@@ -6678,7 +6576,7 @@ async def show_daily_bonus_info(update: Update, context: ContextTypes.DEFAULT_TY
         await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(
+    player = uctx.get_or_create_player(
         user.id,
         username=getattr(user, 'username', None),
         display_name=(getattr(user, 'full_name', None) or getattr(user, 'first_name', None)),
@@ -6812,7 +6710,7 @@ async def claim_daily_bonus(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.answer("Запрос бонуса уже обрабатывается…", show_alert=True)
         return
     async with lock:
-        player = db.get_or_create_player(
+        player = uctx.get_or_create_player(
             user.id,
             username=getattr(user, 'username', None),
             display_name=(getattr(user, 'full_name', None) or getattr(user, 'first_name', None)),
@@ -7019,8 +6917,6 @@ async def show_inventory(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
 
     user_id = query.from_user.id
-    inventory_items = db.get_player_inventory_with_details(user_id)
-    sorted_items = []
 
     # Определяем страницу из callback_data: inventory_p{num}
     page = 1
@@ -7032,27 +6928,19 @@ async def show_inventory(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if page < 1:
         page = 1
 
+    # Сортировка и пагинация выполняются в SQL, страницы кэшируются до записи в инвентарь
+    inventory_page = await adb.get_inventory_page(user_id, page, ITEMS_PER_PAGE)
+
     # Если пусто
-    if not inventory_items:
+    if not inventory_page['total']:
         inventory_text = "Твой инвентарь пуст. Пора на поиски!"
         keyboard_rows = []
         total_pages = 1
     else:
-        # Сортировка и пагинация
-        sorted_items = sorted(
-            inventory_items,
-            key=lambda i: (
-                RARITY_ORDER.index(i.rarity) if i.rarity in RARITY_ORDER else len(RARITY_ORDER),
-                i.drink.name.lower(),
-            )
-        )
-        total_items = len(sorted_items)
-        total_pages = max(1, (total_items + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE)
-        if page > total_pages:
-            page = total_pages
-        start_idx = (page - 1) * ITEMS_PER_PAGE
-        end_idx = start_idx + ITEMS_PER_PAGE
-        page_items = sorted_items[start_idx:end_idx]
+        total_items = inventory_page['total']
+        total_pages = inventory_page['total_pages']
+        page = inventory_page['page']
+        page_items = inventory_page['items']
 
         # Текст с учетом страницы
         inventory_text = (
@@ -7065,14 +6953,14 @@ async def show_inventory(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 rarity_emoji = COLOR_EMOJIS.get(item.rarity, '⚫')
                 inventory_text += f"\n<b>{rarity_emoji} {item.rarity}</b>\n"
                 current_rarity = item.rarity
-            display_name = item.drink.name or ("Плантационный энергетик" if getattr(getattr(item, 'drink', None), 'is_plantation', False) else "Энергетик")
+            display_name = item.name or ("Плантационный энергетик" if item.is_plantation else "Энергетик")
             inventory_text += f"• {esc(display_name)} — <b>{item.quantity} шт.</b>\n"
 
         # Клавиатура с кнопками предметов (2 в строке)
         keyboard_rows = []
         current_row = []
         for item in page_items:
-            display_name = item.drink.name or ("Плантационный энергетик" if getattr(getattr(item, 'drink', None), 'is_plantation', False) else "Энергетик")
+            display_name = item.name or ("Плантационный энергетик" if item.is_plantation else "Энергетик")
             btn_text = f"{COLOR_EMOJIS.get(item.rarity,'⚫')} {esc(display_name)}"
             callback = f"view_{item.id}_p{page}"
             current_row.append(InlineKeyboardButton(btn_text, callback_data=callback))
@@ -7160,14 +7048,6 @@ async def start_inventory_search(update: Update, context: ContextTypes.DEFAULT_T
 async def show_inventory_search_results(update: Update, context: ContextTypes.DEFAULT_TYPE, search_query: str, page: int = 1):
     """Показывает результаты поиска по инвентарю с пагинацией."""
     user_id = update.effective_user.id
-    inventory_items = db.get_player_inventory_with_details(user_id)
-    
-    # Фильтруем по поисковому запросу (нечувствительно к регистру)
-    search_lower = search_query.lower()
-    filtered_items = [
-        item for item in inventory_items
-        if search_lower in item.drink.name.lower()
-    ]
     
     # Сохраняем поисковый запрос в context для пагинации
     context.user_data['last_inventory_search'] = search_query
@@ -7175,8 +7055,11 @@ async def show_inventory_search_results(update: Update, context: ContextTypes.DE
     if page < 1:
         page = 1
     
+    # Фильтр по названию (нечувствительно к регистру), сортировка и страница — в SQL
+    inventory_page = await adb.get_inventory_page(user_id, page, ITEMS_PER_PAGE, name_query=search_query)
+    
     # Если ничего не найдено
-    if not filtered_items:
+    if not inventory_page['total']:
         search_text = (
             f"🔎 <b>Результаты поиска: \"{search_query}\"</b>\n\n"
             "❌ Ничего не найдено в вашем инвентаре.\n"
@@ -7204,23 +7087,10 @@ async def show_inventory_search_results(update: Update, context: ContextTypes.DE
             await message.reply_text(search_text, reply_markup=reply_markup, parse_mode='HTML')
         return
     
-    # Сортировка по редкости
-    sorted_items = sorted(
-        filtered_items,
-        key=lambda i: (
-            RARITY_ORDER.index(i.rarity) if i.rarity in RARITY_ORDER else len(RARITY_ORDER),
-            i.drink.name.lower(),
-        )
-    )
-    
-    total_items = len(sorted_items)
-    total_pages = max(1, (total_items + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE)
-    if page > total_pages:
-        page = total_pages
-    
-    start_idx = (page - 1) * ITEMS_PER_PAGE
-    end_idx = start_idx + ITEMS_PER_PAGE
-    page_items = sorted_items[start_idx:end_idx]
+    total_items = inventory_page['total']
+    total_pages = inventory_page['total_pages']
+    page = inventory_page['page']
+    page_items = inventory_page['items']
     
     # Формируем текст результатов
     search_text = (
@@ -7235,14 +7105,14 @@ async def show_inventory_search_results(update: Update, context: ContextTypes.DE
             rarity_emoji = COLOR_EMOJIS.get(item.rarity, '⚫')
             search_text += f"\n<b>{rarity_emoji} {item.rarity}</b>\n"
             current_rarity = item.rarity
-        display_name = item.drink.name or ("Плантационный энергетик" if getattr(getattr(item, 'drink', None), 'is_plantation', False) else "Энергетик")
+        display_name = item.name or ("Плантационный энергетик" if item.is_plantation else "Энергетик")
         search_text += f"• {esc(display_name)} — <b>{item.quantity} шт.</b>\n"
     
     # Клавиатура с кнопками предметов (2 в строке)
     keyboard_rows = []
     current_row = []
     for item in page_items:
-        display_name = item.drink.name or ("Плантационный энергетик" if getattr(getattr(item, 'drink', None), 'is_plantation', False) else "Энергетик")
+        display_name = item.name or ("Плантационный энергетик" if item.is_plantation else "Энергетик")
         btn_text = f"{COLOR_EMOJIS.get(item.rarity,'⚫')} {esc(display_name)}"
         callback = f"view_{item.id}_sp{page}"
         current_row.append(InlineKeyboardButton(btn_text, callback_data=callback))
@@ -7308,7 +7178,7 @@ async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     user = query.from_user
     user_id = user.id
-    player = db.get_or_create_player(user_id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user_id, user.username or user.first_name)
     lang = player.language
 
     rating_value = int(getattr(player, 'rating', 0) or 0)
@@ -7570,7 +7440,7 @@ async def show_my_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     user = query.from_user
     user_id = user.id
-    player = db.get_or_create_player(user_id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user_id, user.username or user.first_name)
     lang = player.language
 
     username_display = f"@{esc(user.username)}" if user.username else user.first_name
@@ -7717,7 +7587,7 @@ async def show_profile_favorite_track(update: Update, context: ContextTypes.DEFA
 
     user = query.from_user
     user_id = int(user.id)
-    player = db.get_or_create_player(user_id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user_id, user.username or user.first_name)
     lang = getattr(player, 'language', 'ru') or 'ru'
 
     fav_id = int(getattr(player, 'favorite_swaga_track_id', 0) or 0)
@@ -7789,7 +7659,7 @@ async def show_favorite_track_pick(update: Update, context: ContextTypes.DEFAULT
 
     user = query.from_user
     user_id = int(user.id)
-    player = db.get_or_create_player(user_id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user_id, user.username or user.first_name)
     lang = getattr(player, 'language', 'ru') or 'ru'
 
     try:
@@ -7859,7 +7729,7 @@ async def show_profile_friends(update: Update, context: ContextTypes.DEFAULT_TYP
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     lang = player.language
 
     # сбрасываем режимы ожидания ввода в разделе друзей
@@ -7924,7 +7794,7 @@ async def friends_add_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     lang = player.language
 
     context.user_data['awaiting_friend_username_search'] = True
@@ -7949,7 +7819,7 @@ async def friends_search_results(update: Update, context: ContextTypes.DEFAULT_T
     else:
         user = update.effective_user
 
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     lang = player.language
 
     # Используем существующую систему поиска игроков
@@ -8034,7 +7904,7 @@ async def friends_add_pick(update: Update, context: ContextTypes.DEFAULT_TYPE, t
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     lang = player.language
 
     try:
@@ -8086,7 +7956,7 @@ async def friends_requests_menu(update: Update, context: ContextTypes.DEFAULT_TY
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     lang = player.language
 
     res = db.list_pending_incoming_friend_requests(user.id, page=page, per_page=6)
@@ -8127,7 +7997,7 @@ async def friends_outgoing_menu(update: Update, context: ContextTypes.DEFAULT_TY
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     lang = player.language
 
     res = db.list_pending_outgoing_friend_requests(user.id, page=page, per_page=6)
@@ -8166,7 +8036,7 @@ async def friends_outgoing_open(update: Update, context: ContextTypes.DEFAULT_TY
     query = update.callback_query
     await query.answer()
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     lang = player.language
 
     res = db.list_pending_outgoing_friend_requests(user.id, page=0, per_page=50)
@@ -8208,7 +8078,7 @@ async def friends_req_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE,
     query = update.callback_query
     await query.answer()
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     lang = player.language
 
     lookup = db.list_pending_outgoing_friend_requests(user.id, page=0, per_page=50)
@@ -8238,7 +8108,7 @@ async def friends_open_menu(update: Update, context: ContextTypes.DEFAULT_TYPE,
     else:
         user = update.effective_user
 
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     lang = player.language
 
     if not db.are_friends(user.id, int(friend_user_id)):
@@ -8323,7 +8193,7 @@ async def friends_remove_confirm(update: Update, context: ContextTypes.DEFAULT_T
     query = update.callback_query
     await query.answer()
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     lang = player.language
     text = (
         "🗑️ <b>Удалить друга?</b>\n\nПосле подтверждения дружба будет удалена."
@@ -8344,7 +8214,7 @@ async def friends_remove_do(update: Update, context: ContextTypes.DEFAULT_TYPE,
     query = update.callback_query
     await query.answer()
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     lang = player.language
     res = db.remove_friend(user.id, int(friend_user_id))
     if not res or not res.get('ok'):
@@ -8367,7 +8237,7 @@ async def friends_start_transfer(update: Update, context: ContextTypes.DEFAULT_T
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     lang = player.language
 
     context.user_data['awaiting_friend_transfer'] = {"kind": str(kind), "to_user_id": int(to_user_id)}
@@ -8391,7 +8261,7 @@ async def friends_request_open(update: Update, context: ContextTypes.DEFAULT_TYP
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     lang = player.language
 
     res = db.list_pending_incoming_friend_requests(user.id, page=0, per_page=50)
@@ -8429,7 +8299,7 @@ async def friends_req_accept(update: Update, context: ContextTypes.DEFAULT_TYPE,
     query = update.callback_query
     await query.answer()
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     lang = player.language
 
     res = db.accept_friend_request(user.id, int(request_id))
@@ -8452,7 +8322,7 @@ async def friends_req_reject(update: Update, context: ContextTypes.DEFAULT_TYPE,
     query = update.callback_query
     await query.answer()
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     lang = player.language
 
     res = db.reject_friend_request(user.id, int(request_id))
@@ -8476,7 +8346,7 @@ async def friends_list_menu(update: Update, context: ContextTypes.DEFAULT_TYPE,
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     lang = player.language
 
     res = db.list_friends(user.id, page=page, per_page=8)
@@ -8524,7 +8394,7 @@ async def show_selyuk_farmer_fert_priority(update: Update, context: ContextTypes
     query = update.callback_query
     await query.answer()
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     prio_ids = _farmer_fert_priority_from_player(player)
     inv = db.get_fertilizer_inventory(user.id) or []
 
@@ -8583,7 +8453,7 @@ async def show_profile_boosts(update: Update, context: ContextTypes.DEFAULT_TYPE
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     lang = player.language
 
     title = "🚀 <b>Бусты и купоны</b>" if lang == 'ru' else "🚀 <b>Boosts & coupons</b>"
@@ -8672,7 +8542,7 @@ async def show_profile_boosts(update: Update, context: ContextTypes.DEFAULT_TYPE
 async def toggle_luck_coupon_auto_use(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     current = bool(getattr(player, 'luck_coupon_auto_use', True))
     db.update_player(user.id, luck_coupon_auto_use=(not current))
     await show_profile_boosts(update, context)
@@ -8684,8 +8554,6 @@ async def show_inventory_by_quantity(update: Update, context: ContextTypes.DEFAU
     await query.answer()
 
     user_id = query.from_user.id
-    inventory_items = db.get_player_inventory_with_details(user_id)
-    sorted_items = []
 
     # Определяем страницу из callback_data: receiver_qty_p{num}
     page = 1
@@ -8697,24 +8565,18 @@ async def show_inventory_by_quantity(update: Update, context: ContextTypes.DEFAU
     if page < 1:
         page = 1
 
+    # Сначала по количеству (убывание), потом по имени — сортировка и страница в SQL
+    inventory_page = await adb.get_inventory_page(user_id, page, ITEMS_PER_PAGE, order='quantity')
+
     # Если пусто
-    if not inventory_items:
+    if not inventory_page['total']:
         inventory_text = "Твой инвентарь пуст. Пора на поиски!"
         keyboard_rows = []
         total_pages = 1
     else:
-        # Сортировка по количеству (от большего к меньшему) и пагинация
-        sorted_items = sorted(
-            inventory_items,
-            key=lambda i: (-i.quantity, i.drink.name.lower()),  # Сначала по количеству (убывание), потом по имени
-        )
-        total_items = len(sorted_items)
-        total_pages = max(1, (total_items + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE)
-        if page > total_pages:
-            page = total_pages
-        start_idx = (page - 1) * ITEMS_PER_PAGE
-        end_idx = start_idx + ITEMS_PER_PAGE
-        page_items = sorted_items[start_idx:end_idx]
+        total_pages = inventory_page['total_pages']
+        page = inventory_page['page']
+        page_items = inventory_page['items']
 
         # Текст с учетом страницы
         inventory_text = (
@@ -8728,13 +8590,13 @@ async def show_inventory_by_quantity(update: Update, context: ContextTypes.DEFAU
             # Вычисляем стоимость продажи с учётом рейтинга
             unit_payout = int(db.get_receiver_unit_payout_for_user(user_id, item.rarity) or 0)
             total_value = unit_payout * item.quantity
-            inventory_text += f"{rarity_emoji} <b>{item.drink.name}</b> — {item.quantity} шт. (~{total_value} монет)\n"
+            inventory_text += f"{rarity_emoji} <b>{item.name}</b> — {item.quantity} шт. (~{total_value} монет)\n"
 
         # Клавиатура с кнопками предметов (2 в строке)
         keyboard_rows = []
         current_row = []
         for item in page_items:
-            btn_text = f"{COLOR_EMOJIS.get(item.rarity,'⚫')} {item.drink.name} ({item.quantity})"
+            btn_text = f"{COLOR_EMOJIS.get(item.rarity,'⚫')} {item.name} ({item.quantity})"
             callback = f"view_{item.id}_rp{page}"
             current_row.append(InlineKeyboardButton(btn_text, callback_data=callback))
             if len(current_row) == 2:
@@ -8757,9 +8619,9 @@ async def show_inventory_by_quantity(update: Update, context: ContextTypes.DEFAU
         ])
 
     # Кнопка массовой продажи - показываем только если есть предметы для продажи
-    if sorted_items:
+    if inventory_page['total']:
         # Проверяем, есть ли что продавать (предметы с количеством > 1)
-        has_items_to_sell = any(item.quantity > 1 for item in sorted_items)
+        has_items_to_sell = inventory_page['max_quantity'] > 1
         if has_items_to_sell:
             keyboard_rows.append([
                 InlineKeyboardButton(
@@ -8874,7 +8736,7 @@ async def view_inventory_item(update: Update, context: ContextTypes.DEFAULT_TYPE
             ])
     
     # Интеграция Избранного и Дарения
-    player = db.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
+    player = uctx.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
     is_favorite = False
     for i in (1, 2, 3):
         slot_item_id = int(getattr(player, f'favorite_drink_{i}', 0) or 0)
@@ -8952,7 +8814,7 @@ async def show_profile_favorites(update: Update, context: ContextTypes.DEFAULT_T
     await query.answer()
 
     user_id = query.from_user.id
-    player = db.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
+    player = uctx.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
     lang = getattr(player, 'language', 'ru') or 'ru'
 
     title = t(lang, 'favorites_title')
@@ -9001,7 +8863,7 @@ async def show_favorites_pick_inventory(update: Update, context: ContextTypes.DE
     await query.answer()
 
     user_id = query.from_user.id
-    player = db.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
+    player = uctx.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
     lang = getattr(player, 'language', 'ru') or 'ru'
 
     slot = int(slot or 0)
@@ -9009,30 +8871,17 @@ async def show_favorites_pick_inventory(update: Update, context: ContextTypes.DE
         await query.answer("Ошибка", show_alert=True)
         return
 
-    inventory_items = db.get_player_inventory_with_details(user_id)
-    if not inventory_items:
+    inventory_page = await adb.get_inventory_page(user_id, page, ITEMS_PER_PAGE)
+    if not inventory_page['total']:
         await query.answer(t(lang, 'favorites_pick_empty_inventory'), show_alert=True)
         await show_profile_favorites(update, context)
         return
 
     # Сортировка как в show_inventory
-    sorted_items = sorted(
-        inventory_items,
-        key=lambda i: (
-            RARITY_ORDER.index(i.rarity) if i.rarity in RARITY_ORDER else len(RARITY_ORDER),
-            i.drink.name.lower(),
-        )
-    )
-
-    total_items = len(sorted_items)
-    total_pages = max(1, (total_items + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE)
-    if page < 1:
-        page = 1
-    if page > total_pages:
-        page = total_pages
-    start_idx = (page - 1) * ITEMS_PER_PAGE
-    end_idx = start_idx + ITEMS_PER_PAGE
-    page_items = sorted_items[start_idx:end_idx]
+    total_items = inventory_page['total']
+    total_pages = inventory_page['total_pages']
+    page = inventory_page['page']
+    page_items = inventory_page['items']
 
     text = (
         f"{t(lang, 'favorites_pick_title').format(n=slot)}\n"
@@ -9044,7 +8893,7 @@ async def show_favorites_pick_inventory(update: Update, context: ContextTypes.DE
     keyboard_rows = []
     current_row = []
     for item in page_items:
-        display_name = item.drink.name or ("Плантационный энергетик" if getattr(getattr(item, 'drink', None), 'is_plantation', False) else "Энергетик")
+        display_name = item.name or ("Плантационный энергетик" if item.is_plantation else "Энергетик")
         btn_text = f"{COLOR_EMOJIS.get(item.rarity,'⚫')} {esc(display_name)}"
         callback = f"fav_pick_{slot}_{item.id}_p{page}"
         current_row.append(InlineKeyboardButton(btn_text, callback_data=callback))
@@ -9086,7 +8935,7 @@ async def show_profile_favorites_v2(update: Update, context: ContextTypes.DEFAUL
     await query.answer()
 
     user_id = query.from_user.id
-    player = db.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
+    player = uctx.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
     lang = getattr(player, 'language', 'ru') or 'ru'
 
     context.user_data.pop('awaiting_favorites_search', None)
@@ -9160,7 +9009,7 @@ async def show_favorites_pick_inventory_v2(update: Update, context: ContextTypes
     await query.answer()
 
     user_id = query.from_user.id
-    player = db.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
+    player = uctx.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
     lang = getattr(player, 'language', 'ru') or 'ru'
 
     slot = int(slot or 0)
@@ -9168,29 +9017,16 @@ async def show_favorites_pick_inventory_v2(update: Update, context: ContextTypes
         await query.answer("Ошибка" if lang == 'ru' else "Error", show_alert=True)
         return
 
-    inventory_items = db.get_player_inventory_with_details(user_id)
-    if not inventory_items:
+    inventory_page = await adb.get_inventory_page(user_id, page, ITEMS_PER_PAGE)
+    if not inventory_page['total']:
         await query.answer(t(lang, 'favorites_pick_empty_inventory'), show_alert=True)
         await show_profile_favorites_v2(update, context)
         return
 
-    sorted_items = sorted(
-        inventory_items,
-        key=lambda i: (
-            RARITY_ORDER.index(i.rarity) if i.rarity in RARITY_ORDER else len(RARITY_ORDER),
-            i.drink.name.lower(),
-        )
-    )
-
-    total_items = len(sorted_items)
-    total_pages = max(1, (total_items + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE)
-    if page < 1:
-        page = 1
-    if page > total_pages:
-        page = total_pages
-    start_idx = (page - 1) * ITEMS_PER_PAGE
-    end_idx = start_idx + ITEMS_PER_PAGE
-    page_items = sorted_items[start_idx:end_idx]
+    total_items = inventory_page['total']
+    total_pages = inventory_page['total_pages']
+    page = inventory_page['page']
+    page_items = inventory_page['items']
 
     text = (
         f"{t(lang, 'favorites_pick_title').format(n=slot)}\n"
@@ -9202,7 +9038,7 @@ async def show_favorites_pick_inventory_v2(update: Update, context: ContextTypes
     keyboard_rows = []
     current_row = []
     for item in page_items:
-        display_name = item.drink.name or ("Плантационный энергетик" if getattr(getattr(item, 'drink', None), 'is_plantation', False) else "Энергетик")
+        display_name = item.name or ("Плантационный энергетик" if item.is_plantation else "Энергетик")
         btn_text = f"{COLOR_EMOJIS.get(item.rarity, '⚫')} {esc(display_name)}"
         callback = f"fav_pick_{slot}_{item.id}_p{page}"
         current_row.append(InlineKeyboardButton(btn_text, callback_data=callback))
@@ -9244,7 +9080,7 @@ async def start_favorites_search(update: Update, context: ContextTypes.DEFAULT_T
     await query.answer()
 
     user_id = query.from_user.id
-    player = db.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
+    player = uctx.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
     lang = getattr(player, 'language', 'ru') or 'ru'
 
     slot = int(slot or 0)
@@ -9275,24 +9111,24 @@ async def show_favorites_search_results(
     page: int = 1,
 ):
     user_id = update.effective_user.id
-    player = db.get_or_create_player(user_id, update.effective_user.username or update.effective_user.first_name)
+    player = uctx.get_or_create_player(user_id, update.effective_user.username or update.effective_user.first_name)
     lang = getattr(player, 'language', 'ru') or 'ru'
 
     slot = int(slot or 0)
     if slot not in (1, 2, 3):
         return
 
-    inventory_items = db.get_player_inventory_with_details(user_id) or []
-    search_lower = (search_query or '').strip().lower()
-    filtered_items = [it for it in inventory_items if search_lower and search_lower in str(getattr(getattr(it, 'drink', None), 'name', '')).lower()]
-
     context.user_data['favorites_last_search_query'] = search_query
     context.user_data['favorites_last_search_slot'] = slot
 
     if page < 1:
         page = 1
 
-    if not filtered_items:
+    inventory_page = {'total': 0}
+    if (search_query or '').strip():
+        inventory_page = await adb.get_inventory_page(user_id, page, ITEMS_PER_PAGE, name_query=search_query)
+
+    if not inventory_page['total']:
         text = (
             f"🔎 <b>{'Результаты поиска' if lang == 'ru' else 'Search results'}: \"{html.escape(search_query)}\"</b>\n\n"
             f"{'❌ Ничего не найдено в инвентаре.' if lang == 'ru' else '❌ No items found in your inventory.'}"
@@ -9311,22 +9147,10 @@ async def show_favorites_search_results(
             await update.effective_message.reply_html(text, reply_markup=InlineKeyboardMarkup(kb))
         return
 
-    sorted_items = sorted(
-        filtered_items,
-        key=lambda i: (
-            RARITY_ORDER.index(i.rarity) if i.rarity in RARITY_ORDER else len(RARITY_ORDER),
-            i.drink.name.lower(),
-        )
-    )
-
-    total_items = len(sorted_items)
-    total_pages = max(1, (total_items + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE)
-    if page > total_pages:
-        page = total_pages
-
-    start_idx = (page - 1) * ITEMS_PER_PAGE
-    end_idx = start_idx + ITEMS_PER_PAGE
-    page_items = sorted_items[start_idx:end_idx]
+    total_items = inventory_page['total']
+    total_pages = inventory_page['total_pages']
+    page = inventory_page['page']
+    page_items = inventory_page['items']
 
     text = (
         f"🔎 <b>{'Результаты поиска' if lang == 'ru' else 'Search results'}: \"{html.escape(search_query)}\"</b>\n"
@@ -9338,7 +9162,7 @@ async def show_favorites_search_results(
     kb_rows = []
     row = []
     for item in page_items:
-        name = item.drink.name or ("Энергетик" if lang == 'ru' else "Energy drink")
+        name = item.name or ("Энергетик" if lang == 'ru' else "Energy drink")
         emoji = COLOR_EMOJIS.get(item.rarity, '⚫')
         row.append(InlineKeyboardButton(f"{emoji} {name}", callback_data=f"fav_pick_{slot}_{item.id}_p{page}"))
         if len(row) == 2:
@@ -9379,7 +9203,7 @@ async def handle_sell_action(update: Update, context: ContextTypes.DEFAULT_TYPE,
     async with lock:
         qty = 10**9 if sell_all else 1
         try:
-            result = db.sell_inventory_item(user_id, item_id, qty)
+            result = await adb.sell_inventory_item(user_id, item_id, qty)
         except Exception:
             await query.answer("Ошибка при продаже. Попробуйте позже.", show_alert=True)
             return
@@ -9439,7 +9263,7 @@ async def handle_sell_all_but_one(update: Update, context: ContextTypes.DEFAULT_
     lock = _get_lock(f"sell_all_but_one:{user_id}:{item_id}")
     async with lock:
         try:
-            result = db.sell_all_but_one(user_id, item_id)
+            result = await adb.sell_all_but_one(user_id, item_id)
         except Exception:
             await query.answer("Ошибка при продаже. Попробуйте позже.", show_alert=True)
             return
@@ -9487,7 +9311,7 @@ async def handle_sell_absolutely_all_but_one(update: Update, context: ContextTyp
     lock = _get_lock(f"sell_all_abs:{user_id}")
     async with lock:
         try:
-            result = db.sell_absolutely_all_but_one(user_id)
+            result = await adb.sell_absolutely_all_but_one(user_id)
         except Exception:
             await query.answer("Ошибка при массовой продаже. Попробуйте позже.", show_alert=True)
             return
@@ -9575,17 +9399,12 @@ async def show_receiver_sell_by_rarity(update: Update, context: ContextTypes.DEF
     await query.answer()
 
     user_id = query.from_user.id
-    player = db.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
+    player = uctx.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
     lang = getattr(player, 'language', 'ru') or 'ru'
-    rating_value = int(getattr(player, 'rating', 0) or 0)
 
-    # Получаем инвентарь игрока
-    inventory_items = db.get_player_inventory_with_details(user_id)
-    
-    # Группируем по редкости
-    rarity_counts = defaultdict(int)
-    for item in inventory_items:
-        rarity_counts[item.rarity] += item.quantity
+    # Предпросмотр продажи всего инвентаря: количество и выплаты по редкостям одним запросом
+    preview = await adb.preview_receiver_bulk_sell(user_id)
+    by_rarity = (preview or {}).get('by_rarity') or {}
 
     text = (
         "<b>♻️ Массовая продажа по редкостям</b>\n\n"
@@ -9600,12 +9419,12 @@ async def show_receiver_sell_by_rarity(update: Update, context: ContextTypes.DEF
     rows = []
     has_items = False
     for r in RARITY_ORDER:
-        count = rarity_counts.get(r, 0)
-        if count > 0:
-            unit_payout = int(db.get_receiver_unit_payout_with_rating(r, rating_value) or 0)
-            if unit_payout > 0:
+        info = by_rarity.get(r)
+        if info:
+            count = int(info.get('quantity', 0))
+            total_payout = int(info.get('total_payout', 0))
+            if count > 0 and total_payout > 0:
                 has_items = True
-                total_payout = unit_payout * count
                 emoji = COLOR_EMOJIS.get(r, '⚫')
                 btn_text = f"{emoji} {r} ({count} шт.) — +{total_payout} 🪙" if lang == 'ru' else f"{emoji} {r} ({count} pcs) — +{total_payout} 🪙"
                 rows.append([InlineKeyboardButton(btn_text, callback_data=f"rec_sell_rar_conf_{r}")])
@@ -9634,20 +9453,17 @@ async def confirm_receiver_sell_rarity(update: Update, context: ContextTypes.DEF
         return
 
     user_id = query.from_user.id
-    player = db.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
+    player = uctx.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
     lang = getattr(player, 'language', 'ru') or 'ru'
-    rating_value = int(getattr(player, 'rating', 0) or 0)
 
-    inventory_items = db.get_player_inventory_with_details(user_id)
-    count = sum(item.quantity for item in inventory_items if item.rarity == rarity)
-
-    if count <= 0:
+    preview = await adb.preview_receiver_bulk_sell(user_id, rarity)
+    if not preview or not preview.get('ok'):
         await query.answer("У вас нет предметов этой редкости" if lang == 'ru' else "You have no items of this rarity", show_alert=True)
         await show_receiver_sell_by_rarity(update, context)
         return
 
-    unit_payout = int(db.get_receiver_unit_payout_with_rating(rarity, rating_value) or 0)
-    total_payout = unit_payout * count
+    count = int(preview.get('total_items_sold', 0))
+    total_payout = int(preview.get('total_earned', 0))
 
     emoji = COLOR_EMOJIS.get(rarity, '⚫')
     text = (
@@ -9685,11 +9501,11 @@ async def execute_receiver_sell_rarity(update: Update, context: ContextTypes.DEF
 
     lock = _get_lock(f"sell_rarity:{user_id}:{rarity}")
     async with lock:
-        player = db.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
+        player = uctx.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
         lang = getattr(player, 'language', 'ru') or 'ru'
 
         try:
-            result = db.sell_all_drinks_of_rarity(user_id, rarity)
+            result = await adb.sell_all_drinks_of_rarity(user_id, rarity)
         except Exception:
             await query.answer("Ошибка при массовой продаже. Попробуйте позже.", show_alert=True)
             return
@@ -9748,7 +9564,7 @@ async def handle_sell_all_inventory(update: Update, context: ContextTypes.DEFAUL
     lock = _get_lock(f"sell_all_inventory:{user_id}")
     async with lock:
         try:
-            result = db.sell_all_inventory(user_id)
+            result = await adb.sell_all_inventory(user_id)
         except Exception:
             await query.answer("Ошибка при массовой продаже. Попробуйте позже.", show_alert=True)
             return
@@ -9820,7 +9636,7 @@ async def handle_receiver_item_sell(update: Update, context: ContextTypes.DEFAUL
     lock = _get_lock(f"receiver_item_sell:{user_id}:{item_key}")
     async with lock:
         try:
-            result = db.sell_receiver_player_item(user_id, item_key, quantity)
+            result = await adb.sell_receiver_player_item(user_id, item_key, quantity)
         except Exception:
             await query.answer("Ошибка при продаже. Попробуйте позже.", show_alert=True)
             return
@@ -9841,7 +9657,7 @@ async def handle_receiver_item_sell(update: Update, context: ContextTypes.DEFAUL
         total = int(result.get('total_payout', 0) or 0)
         coins_after = int(result.get('coins_after', 0) or 0)
         left = int(result.get('item_left_qty', 0) or 0)
-        player = db.get_or_create_player(user_id, user.username or user.first_name)
+        player = uctx.get_or_create_player(user_id, user.username or user.first_name)
         lang = getattr(player, 'language', 'ru') or 'ru'
         item_name = _receiver_item_display_name(item_key, lang)
 
@@ -9878,7 +9694,7 @@ async def show_extra_bonuses(update: Update, context: ContextTypes.DEFAULT_TYPE)
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     lang = player.language
 
     text = t(lang, 'extra_bonuses_title')
@@ -10072,7 +9888,7 @@ async def show_blackjack_bet_screen(update: Update, context: ContextTypes.DEFAUL
     await query.answer()
     
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     coins = int(getattr(player, 'coins', 0) or 0)
     
     text = (
@@ -10119,7 +9935,7 @@ async def start_blackjack_game(update: Update, context: ContextTypes.DEFAULT_TYP
         return
     
     async with lock:
-        player = db.get_or_create_player(user.id, user.username or user.first_name)
+        player = uctx.get_or_create_player(user.id, user.username or user.first_name)
         coins = int(getattr(player, 'coins', 0) or 0)
         
         if coins < bet_amount:
@@ -10291,7 +10107,7 @@ async def handle_blackjack_double(update: Update, context: ContextTypes.DEFAULT_
         return
     
     # Проверяем баланс для удвоения
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     coins = int(getattr(player, 'coins', 0) or 0)
     bet = game['bet']
     
@@ -10391,7 +10207,7 @@ async def finish_blackjack_game(update: Update, context: ContextTypes.DEFAULT_TY
         db.increment_coins(user_id, winnings)
     
     # Обновляем статистику
-    player = db.get_or_create_player(user_id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user_id, user.username or user.first_name)
     if win:
         _casino_record_result(user_id, True)
     elif result not in ['push', 'surrender']:
@@ -10408,11 +10224,11 @@ async def finish_blackjack_game(update: Update, context: ContextTypes.DEFAULT_TY
     )
     
     # Проверяем достижения на актуальной статистике после записи результата
-    player = db.get_or_create_player(user_id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user_id, user.username or user.first_name)
     achievement_bonus = check_casino_achievements(user_id, player)
     
     # Формируем итоговое сообщение
-    player = db.get_or_create_player(user_id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user_id, user.username or user.first_name)
     new_balance = int(getattr(player, 'coins', 0) or 0)
     
     text = (
@@ -10503,7 +10319,7 @@ async def show_mines_settings(update: Update, context: ContextTypes.DEFAULT_TYPE
     await query.answer()
     
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     coins = int(getattr(player, 'coins', 0) or 0)
     
     text = (
@@ -10540,7 +10356,7 @@ async def show_mines_bet_screen(update: Update, context: ContextTypes.DEFAULT_TY
     await query.answer()
     
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     coins = int(getattr(player, 'coins', 0) or 0)
     
     # Показываем потенциальные множители
@@ -10589,7 +10405,7 @@ async def start_mines_game(update: Update, context: ContextTypes.DEFAULT_TYPE, m
         return
     
     async with lock:
-        player = db.get_or_create_player(user.id, user.username or user.first_name)
+        player = uctx.get_or_create_player(user.id, user.username or user.first_name)
         coins = int(getattr(player, 'coins', 0) or 0)
         
         if coins < bet_amount:
@@ -10783,7 +10599,7 @@ async def finish_mines_game(update: Update, context: ContextTypes.DEFAULT_TYPE,
         db.increment_coins(user_id, winnings)
     
     # Обновляем статистику
-    player = db.get_or_create_player(user_id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user_id, user.username or user.first_name)
     if win:
         _casino_record_result(user_id, True)
     elif result == 'exploded':
@@ -10799,9 +10615,9 @@ async def finish_mines_game(update: Update, context: ContextTypes.DEFAULT_TYPE,
         success=win
     )
     
-    player = db.get_or_create_player(user_id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user_id, user.username or user.first_name)
     achievement_bonus = check_casino_achievements(user_id, player)
-    player = db.get_or_create_player(user_id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user_id, user.username or user.first_name)
     new_balance = int(getattr(player, 'coins', 0) or 0)
     
     # Формируем визуализацию поля
@@ -10884,7 +10700,7 @@ async def show_crash_bet_screen(update: Update, context: ContextTypes.DEFAULT_TY
     await query.answer()
     
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     coins = int(getattr(player, 'coins', 0) or 0)
     
     text = (
@@ -10924,11 +10740,9 @@ async def start_crash_game(update: Update, context: ContextTypes.DEFAULT_TYPE, b
         return
     
     # Проверяем, нет ли уже активной игры
-    if user.id in CRASH_GAMES:
-        game = CRASH_GAMES[user.id]
-        if game.get('status') == 'playing':
-            await query.answer("У вас уже есть активная игра!", show_alert=True)
-            return
+    if _crash_engine.get(user.id):
+        await query.answer("У вас уже есть активная игра!", show_alert=True)
+        return
     
     lock = _get_lock(f"user:{user.id}:crash")
     if lock.locked():
@@ -10936,7 +10750,7 @@ async def start_crash_game(update: Update, context: ContextTypes.DEFAULT_TYPE, b
         return
     
     async with lock:
-        player = db.get_or_create_player(user.id, user.username or user.first_name)
+        player = uctx.get_or_create_player(user.id, user.username or user.first_name)
         coins = int(getattr(player, 'coins', 0) or 0)
         
         if coins < bet_amount:
@@ -10948,37 +10762,24 @@ async def start_crash_game(update: Update, context: ContextTypes.DEFAULT_TYPE, b
             await query.answer("Недостаточно септимов", show_alert=True)
             return
         
-        # Генерируем точку краша
-        crash_point = generate_crash_point()
-        
-        CRASH_GAMES[user.id] = {
-            'bet': bet_amount,
-            'multiplier': 1.0,
-            'crash_point': crash_point,
-            'status': 'playing',
-            'message_id': None,
-            'chat_id': query.message.chat_id,
-            'task': None
-        }
+        # Генерируем точку краша; дальше игру ведёт общий тикер движка
+        game = CrashGame(
+            user_id=user.id,
+            username=user.username or user.first_name,
+            bet=bet_amount,
+            crash_point=generate_crash_point(),
+            chat_id=query.message.chat_id,
+            message_id=query.message.message_id,
+        )
+        _crash_engine.start(context.bot, game)
         
         # Показываем начальный экран
         await show_crash_game_screen(update, context, user.id)
-        
-        # Запускаем асинхронную анимацию
-        task = asyncio.create_task(crash_animation_loop(context, user.id, user.username or user.first_name))
-        CRASH_GAMES[user.id]['task'] = task
 
 
-async def show_crash_game_screen(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int):
-    """Показывает экран игры Краш."""
-    query = update.callback_query
-    
-    game = CRASH_GAMES.get(user_id)
-    if not game:
-        return
-    
-    bet = game['bet']
-    multiplier = game['multiplier']
+def _crash_frame(game: CrashGame, multiplier: float):
+    """Кадр игры Краш для текущего множителя: текст и клавиатура с кнопкой «Забрать»."""
+    bet = game.bet
     potential_win = int(bet * multiplier)
     
     # Визуальная шкала множителя
@@ -10997,140 +10798,78 @@ async def show_crash_game_screen(update: Update, context: ContextTypes.DEFAULT_T
     keyboard = [
         [InlineKeyboardButton(f"💰 ЗАБРАТЬ {potential_win}", callback_data='crash_cashout')],
     ]
-    
-    try:
-        msg = await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='HTML')
-        game['message_id'] = msg.message_id
-    except BadRequest:
-        pass
+    return text, InlineKeyboardMarkup(keyboard)
 
 
-async def crash_animation_loop(context: ContextTypes.DEFAULT_TYPE, user_id: int, username: str):
-    """Асинхронный цикл анимации краша - НЕ блокирует бота."""
+async def show_crash_game_screen(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int):
+    """Показывает начальный экран игры Краш."""
+    query = update.callback_query
+    
+    game = _crash_engine.get(user_id)
+    if not game:
+        return
+    
+    text, reply_markup = _crash_frame(game, 1.0)
+    game.last_frame = text
     try:
-        while True:
-            await asyncio.sleep(CRASH_UPDATE_INTERVAL)
-            
-            game = CRASH_GAMES.get(user_id)
-            if not game or game['status'] != 'playing':
-                break
-            
-            # Увеличиваем множитель
-            game['multiplier'] = round(game['multiplier'] + CRASH_GROWTH_RATE + (game['multiplier'] * 0.05), 2)
-            
-            # Проверяем краш
-            if game['multiplier'] >= game['crash_point']:
-                game['status'] = 'crashed'
-                await finish_crash_game_internal(context, user_id, username, 'crashed')
-                break
-            
-            # Обновляем экран
-            bet = game['bet']
-            multiplier = game['multiplier']
-            potential_win = int(bet * multiplier)
-            
-            bar_length = min(int(multiplier * 2), 20)
-            bar = "🟢" * bar_length + "⬜" * (20 - bar_length)
-            
-            text = (
-                f"<b>📈 КРАШ</b>\n\n"
-                f"<code>{bar}</code>\n\n"
-                f"📊 Множитель: <b>x{multiplier:.2f}</b>\n"
-                f"💰 Ставка: <b>{bet}</b>\n"
-                f"💵 Выигрыш: <b>{potential_win}</b>\n\n"
-                "⚡ <i>Нажмите 'Забрать' пока не поздно!</i>"
-            )
-            
-            keyboard = [
-                [InlineKeyboardButton(f"💰 ЗАБРАТЬ {potential_win}", callback_data='crash_cashout')],
-            ]
-            
-            try:
-                await context.bot.edit_message_text(
-                    chat_id=game['chat_id'],
-                    message_id=game['message_id'],
-                    text=text,
-                    reply_markup=InlineKeyboardMarkup(keyboard),
-                    parse_mode='HTML'
-                )
-            except Exception:
-                pass
-                
-    except asyncio.CancelledError:
+        await query.edit_message_text(text, reply_markup=reply_markup, parse_mode='HTML')
+    except BadRequest:
         pass
-    except Exception as e:
-        logger.error(f"Crash animation error: {e}")
 
 
 async def handle_crash_cashout(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Игрок забирает выигрыш."""
+    """Игрок забирает выигрыш: исход определяется временем нажатия, а не последним кадром."""
     query = update.callback_query
     await query.answer()
     user = query.from_user
     
-    game = CRASH_GAMES.get(user.id)
-    if not game or game['status'] != 'playing':
+    game = _crash_engine.cash_out(user.id)
+    if game is None:
         await query.answer("Игра не найдена или завершена", show_alert=True)
         return
     
-    game['status'] = 'cashed_out'
-    
-    # Отменяем задачу анимации
-    if game.get('task'):
-        game['task'].cancel()
-    
-    await finish_crash_game(update, context, user.id, 'cashout')
+    # Кадр, который ещё отправляется, не должен перезаписать итоговый экран
+    await _crash_engine.settle(game)
+    if game.status == 'crashed':
+        await finish_crash_game_internal(context.bot, game)
+    else:
+        await finish_crash_game(update, context, game)
 
 
-async def finish_crash_game(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int, result: str):
-    """Завершает игру Краш (вызывается при cashout)."""
+async def finish_crash_game(update: Update, context: ContextTypes.DEFAULT_TYPE, game: CrashGame):
+    """Завершает игру Краш выигрышем (вызывается при cashout до краша)."""
     query = update.callback_query
     user = query.from_user
+    user_id = game.user_id
     
-    game = CRASH_GAMES.get(user_id)
-    if not game:
-        return
-    
-    bet = game['bet']
-    multiplier = game['multiplier']
-    crash_point = game['crash_point']
-    
-    winnings = 0
-    win = False
+    bet = game.bet
+    multiplier = game.cashout_multiplier
+    crash_point = game.crash_point
     
-    if result == 'cashout':
-        winnings = int(bet * multiplier)
-        result_emoji = "💰"
-        result_text = f"ЗАБРАЛИ на x{multiplier:.2f}!"
-        win = True
-    else:
-        result_emoji = "💥"
-        result_text = f"КРАШ на x{crash_point:.2f}!"
+    winnings = int(bet * multiplier)
+    result_emoji = "💰"
+    result_text = f"ЗАБРАЛИ на x{multiplier:.2f}!"
     
     # Начисляем выигрыш
     if winnings > 0:
         db.increment_coins(user_id, winnings)
     
     # Обновляем статистику
-    player = db.get_or_create_player(user_id, user.username or user.first_name)
-    if win:
-        _casino_record_result(user_id, True)
-    else:
-        _casino_record_result(user_id, False)
+    _casino_record_result(user_id, True)
     
     # Логируем
     db.log_action(
         user_id=user_id,
         username=user.username or user.first_name,
         action_type='casino',
-        action_details=f'crash: ставка {bet}, результат {result}, множитель x{multiplier:.2f}, crash_point x{crash_point:.2f}',
-        amount=winnings - bet if win else -bet,
-        success=win
+        action_details=f'crash: ставка {bet}, результат cashout, множитель x{multiplier:.2f}, crash_point x{crash_point:.2f}',
+        amount=winnings - bet,
+        success=True
     )
     
-    player = db.get_or_create_player(user_id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user_id, user.username or user.first_name)
     achievement_bonus = check_casino_achievements(user_id, player)
-    player = db.get_or_create_player(user_id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user_id, user.username or user.first_name)
     new_balance = int(getattr(player, 'coins', 0) or 0)
     
     text = (
@@ -11138,21 +10877,13 @@ async def finish_crash_game(update: Update, context: ContextTypes.DEFAULT_TYPE,
         f"━━━━━━━━━━━━━━━━━━\n"
     )
     
-    if win:
-        profit = winnings - bet
-        text += f"💰 Выигрыш: <b>+{profit}</b> (x{multiplier:.2f})\n"
-    else:
-        text += f"💸 Потеряно: <b>{bet}</b> септимов\n"
-        text += f"📊 Краш был на: <b>x{crash_point:.2f}</b>\n"
-    
+    profit = winnings - bet
+    text += f"💰 Выигрыш: <b>+{profit}</b> (x{multiplier:.2f})\n"
     text += f"💵 Баланс: <b>{new_balance}</b> септимов"
     if achievement_bonus:
         ach = achievement_bonus['achievement']
         text += f"\n\n🏆 <b>Достижение!</b>\n{ach['name']}: {ach['desc']}\n💰 Бонус: +{achievement_bonus['bonus']}"
     
-    # Очищаем игру
-    del CRASH_GAMES[user_id]
-    
     keyboard = [
         [InlineKeyboardButton("🔄 Играть ещё", callback_data='casino_game_crash')],
         [InlineKeyboardButton("🎮 Другая игра", callback_data='city_casino')],
@@ -11168,20 +10899,14 @@ async def finish_crash_game(update: Update, context: ContextTypes.DEFAULT_TYPE,
             pass
 
 
-async def finish_crash_game_internal(context: ContextTypes.DEFAULT_TYPE, user_id: int, username: str, result: str):
-    """Завершает игру Краш (вызывается из анимации при краше)."""
-    game = CRASH_GAMES.get(user_id)
-    if not game:
-        return
-    
-    bet = game['bet']
-    multiplier = game['multiplier']
-    crash_point = game['crash_point']
-    chat_id = game['chat_id']
-    message_id = game['message_id']
+async def finish_crash_game_internal(bot, game: CrashGame):
+    """Завершает игру Краш проигрышем (вызывается тикером движка или при запоздалом cashout)."""
+    user_id = game.user_id
+    username = game.username
+    bet = game.bet
+    crash_point = game.crash_point
     
     # Обновляем статистику
-    player = db.get_or_create_player(user_id, username)
     _casino_record_result(user_id, False)
     
     # Логируем
@@ -11194,7 +10919,7 @@ async def finish_crash_game_internal(context: ContextTypes.DEFAULT_TYPE, user_id
         success=False
     )
     
-    player = db.get_or_create_player(user_id, username)
+    player = uctx.get_or_create_player(user_id, username)
     new_balance = int(getattr(player, 'coins', 0) or 0)
     
     text = (
@@ -11204,9 +10929,6 @@ async def finish_crash_game_internal(context: ContextTypes.DEFAULT_TYPE, user_id
         f"💵 Баланс: <b>{new_balance}</b> септимов"
     )
     
-    # Очищаем игру
-    del CRASH_GAMES[user_id]
-    
     keyboard = [
         [InlineKeyboardButton("🔄 Играть ещё", callback_data='casino_game_crash')],
         [InlineKeyboardButton("🎮 Другая игра", callback_data='city_casino')],
@@ -11214,9 +10936,9 @@ async def finish_crash_game_internal(context: ContextTypes.DEFAULT_TYPE, user_id
     ]
     
     try:
-        await context.bot.edit_message_text(
-            chat_id=chat_id,
-            message_id=message_id,
+        await bot.edit_message_text(
+            chat_id=game.chat_id,
+            message_id=game.message_id,
             text=text,
             reply_markup=InlineKeyboardMarkup(keyboard),
             parse_mode='HTML'
@@ -11225,13 +10947,16 @@ async def finish_crash_game_internal(context: ContextTypes.DEFAULT_TYPE, user_id
         pass
 
 
+_crash_engine = CrashEngine(render=_crash_frame, on_crash=finish_crash_game_internal)
+
+
 async def show_casino_achievements_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает страницу достижений казино."""
     query = update.callback_query
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     
     casino_wins = int(getattr(player, 'casino_wins', 0) or 0)
     unlocked = getattr(player, 'casino_achievements', '') or ''
@@ -11279,7 +11004,7 @@ async def handle_casino_bet(update: Update, context: ContextTypes.DEFAULT_TYPE,
         await query.answer("Игра уже обрабатывается…", show_alert=True)
         return
     async with lock:
-        player = db.get_or_create_player(user.id, user.username or user.first_name)
+        player = uctx.get_or_create_player(user.id, user.username or user.first_name)
         coins_before = int(getattr(player, 'coins', 0) or 0)
         if coins_before < int(amount):
             await query.answer("Недостаточно септимов", show_alert=True)
@@ -11307,9 +11032,9 @@ async def handle_casino_bet(update: Update, context: ContextTypes.DEFAULT_TYPE,
             result_line = f"💥 Поражение! Списано {amount} септимов."
             _casino_record_result(user.id, False)
 
-        player = db.get_or_create_player(user.id, user.username or user.first_name)
+        player = uctx.get_or_create_player(user.id, user.username or user.first_name)
         achievement_bonus = check_casino_achievements(user.id, player)
-        player = db.get_or_create_player(user.id, user.username or user.first_name)
+        player = uctx.get_or_create_player(user.id, user.username or user.first_name)
         casino_wins = int(getattr(player, 'casino_wins', 0) or 0)
         casino_losses = int(getattr(player, 'casino_losses', 0) or 0)
         casino_total = casino_wins + casino_losses
@@ -11346,7 +11071,7 @@ async def open_casino_from_text(update: Update, context: ContextTypes.DEFAULT_TY
     """Открывает Казино по текстовому триггеру (сообщение)."""
     msg = update.effective_message
     user = update.effective_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     coins = int(getattr(player, 'coins', 0) or 0)
     
     # Получаем статистику казино
@@ -11388,7 +11113,7 @@ async def start_custom_bet(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     coins = int(getattr(player, 'coins', 0) or 0)
     
     text = (
@@ -11436,7 +11161,7 @@ async def handle_custom_bet_input(update: Update, context: ContextTypes.DEFAULT_
         return CASINO_CUSTOM_BET
     
     # Проверяем баланс
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     coins = int(getattr(player, 'coins', 0) or 0)
     
     if coins < bet_amount:
@@ -11471,9 +11196,9 @@ async def handle_custom_bet_input(update: Update, context: ContextTypes.DEFAULT_
             result_line = f"💥 Поражение! Списано {bet_amount} септимов."
             _casino_record_result(user.id, False)
         
-        player = db.get_or_create_player(user.id, user.username or user.first_name)
+        player = uctx.get_or_create_player(user.id, user.username or user.first_name)
         achievement_bonus = check_casino_achievements(user.id, player)
-        player = db.get_or_create_player(user.id, user.username or user.first_name)
+        player = uctx.get_or_create_player(user.id, user.username or user.first_name)
         casino_wins = int(getattr(player, 'casino_wins', 0) or 0)
         casino_losses = int(getattr(player, 'casino_losses', 0) or 0)
         casino_total = casino_wins + casino_losses
@@ -11522,7 +11247,7 @@ async def cancel_custom_bet(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def show_casino_after_custom_bet(msg, user, context):
     """Показывает казино после завершения custom bet."""
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     coins = int(getattr(player, 'coins', 0) or 0)
     
     # Получаем статистику казино
@@ -11563,7 +11288,7 @@ async def buy_steam_game(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     lang = player.language
 
     # Защита от даблкликов
@@ -11626,7 +11351,7 @@ async def show_market_plantation(update: Update, context: ContextTypes.DEFAULT_T
     context.user_data['last_plantation_screen'] = 'market'
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     lang = getattr(player, 'language', 'ru') or 'ru'
 
     if lang == 'en':
@@ -11674,7 +11399,7 @@ async def open_seed_coupon_shop(update: Update, context: ContextTypes.DEFAULT_TY
     query = update.callback_query
     await query.answer()
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     lang = getattr(player, 'language', 'ru') or 'ru'
     lock = _get_lock(f"user:{user.id}:seed_coupon_shop")
     if lock.locked():
@@ -11710,7 +11435,7 @@ async def show_seed_coupon_shop(
     if query and not already_answered:
         await query.answer()
     user = update.effective_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     lang = getattr(player, 'language', 'ru') or 'ru'
     if not context.user_data.get('seed_coupon_shop_active'):
         if query:
@@ -11793,7 +11518,7 @@ async def seed_coupon_shop_search_start(update: Update, context: ContextTypes.DE
     query = update.callback_query
     await query.answer()
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     lang = getattr(player, 'language', 'ru') or 'ru'
     if not context.user_data.get('seed_coupon_shop_active'):
         await query.answer("Сессия купона уже завершена." if lang == 'ru' else "Coupon session has already ended.", show_alert=True)
@@ -11835,7 +11560,7 @@ async def show_plantation_bed_prices(update: Update, context: ContextTypes.DEFAU
     except Exception:
         pass
 
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     coins = int(getattr(player, 'coins', 0) or 0)
     beds = db.get_player_beds(user.id) or []
     owned = len(beds)
@@ -11875,7 +11600,7 @@ async def show_plantation_my_beds(update: Update, context: ContextTypes.DEFAULT_
     await query.answer()
     user = query.from_user
     context.user_data['last_plantation_screen'] = 'beds'
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     max_fert = max(1, db.get_setting_int('plantation_fertilizer_max_per_bed', PLANTATION_FERTILIZER_MAX_PER_BED))
     lang = getattr(player, 'language', 'ru') or 'ru'
     # Гарантируем грядки и читаем текущее состояние
@@ -12042,7 +11767,7 @@ async def show_plantation_shop(update: Update, context: ContextTypes.DEFAULT_TYP
     query = update.callback_query
     await query.answer()
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     seed_types = []
     try:
         drinks = db.get_all_drinks() or []
@@ -12185,7 +11910,7 @@ async def start_seed_custom_buy(update: Update, context: ContextTypes.DEFAULT_TY
     user = query.from_user
 
     if context.user_data.get('seed_coupon_shop_active') and not _is_coupon_seed_allowed(int(seed_type_id)):
-        await query.answer("Семена недоступны для купона." if getattr(db.get_or_create_player(user.id, user.username or user.first_name), 'language', 'ru') == 'ru' else "This seed is not available for the coupon.", show_alert=True)
+        await query.answer("Семена недоступны для купона." if getattr(uctx.get_or_create_player(user.id, user.username or user.first_name), 'language', 'ru') == 'ru' else "This seed is not available for the coupon.", show_alert=True)
         return ConversationHandler.END
 
     context.user_data['seed_custom_buy_id'] = int(seed_type_id)
@@ -12204,7 +11929,7 @@ async def start_seed_custom_buy(update: Update, context: ContextTypes.DEFAULT_TY
         await query.answer("Семена не найдены", show_alert=True)
         return ConversationHandler.END
 
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     balance = int(getattr(player, 'coins', 0) or 0)
 
     text, _, max_qty = _build_seed_buy_prompt_text(seed_type, balance)
@@ -12251,7 +11976,7 @@ async def seed_custom_retry(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.answer("Семена не найдены", show_alert=True)
         return ConversationHandler.END
 
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     balance = int(getattr(player, 'coins', 0) or 0)
 
     text, _, _ = _build_seed_buy_prompt_text(seed_type, balance)
@@ -12288,7 +12013,7 @@ async def seed_custom_buy_max(update: Update, context: ContextTypes.DEFAULT_TYPE
         return ConversationHandler.END
 
     price = int(getattr(seed_type, 'price_coins', 0) or 0)
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     balance = int(getattr(player, 'coins', 0) or 0)
     max_qty = (balance // price) if price > 0 else 0
     if max_qty <= 0:
@@ -12368,7 +12093,7 @@ async def handle_seed_custom_qty_input(update: Update, context: ContextTypes.DEF
         return ConversationHandler.END
 
     total_cost = price * int(quantity)
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     balance = int(getattr(player, 'coins', 0) or 0)
 
     if total_cost > balance:
@@ -12495,7 +12220,7 @@ async def show_plantation_stats(update: Update, context: ContextTypes.DEFAULT_TY
     query = update.callback_query
     await query.answer()
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     beds = db.get_player_beds(user.id) or []
     seed_inv = db.get_seed_inventory(user.id) or []
     
@@ -12760,7 +12485,7 @@ async def show_plantation_fertilizers_shop(update: Update, context: ContextTypes
     query = update.callback_query
     await query.answer()
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     
     # Гарантируем наличие дефолтных удобрений (и новых) перед выводом
     try:
@@ -12978,7 +12703,7 @@ async def start_fertilizer_custom_buy(update: Update, context: ContextTypes.DEFA
         name = html.escape(getattr(fert, 'name', 'Удобрение'))
         price = int(getattr(fert, 'price_coins', 0) or 0)
         
-        player = db.get_or_create_player(user.id, user.username or user.first_name)
+        player = uctx.get_or_create_player(user.id, user.username or user.first_name)
         balance = int(getattr(player, 'coins', 0) or 0)
         max_qty = balance // price if price > 0 else 0
         
@@ -13041,7 +12766,7 @@ async def handle_fertilizer_custom_qty_input(update: Update, context: ContextTyp
         price = int(getattr(fert, 'price_coins', 0) or 0)
         total_cost = price * quantity
         
-        player = db.get_or_create_player(user.id, user.username or user.first_name)
+        player = uctx.get_or_create_player(user.id, user.username or user.first_name)
         balance = int(getattr(player, 'coins', 0) or 0)
         
         if total_cost > balance:
@@ -13432,7 +13157,7 @@ async def show_plantation_choose_seed(update: Update, context: ContextTypes.DEFA
     await query.answer()
     user = query.from_user
     inv = db.get_seed_inventory(user.id) or []
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     seed_coupons = int(getattr(player, 'seed_coupon_count', 0) or 0)
     lines = [f"<b>🌱 Выбор семян для грядки {bed_index}</b>"]
     keyboard = []
@@ -13508,21 +13233,10 @@ async def handle_plantation_plant(update: Update, context: ContextTypes.DEFAULT_
                     
                     # Если полили, нужно перепланировать напоминание, так как таймер сбросился
                     # Новое время полива = water_interval
-                    player = db.get_or_create_player(user.id, user.username or user.first_name)
-                    if getattr(player, 'remind_plantation', False) and context.application and context.application.job_queue:
+                    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
+                    if getattr(player, 'remind_plantation', False):
                         water_interval = int(water_res.get('water_interval_sec', 1800))
-                        # Удаляем только что созданное напоминание (которое было на water_interval от посадки)
-                        current_jobs = context.application.job_queue.get_jobs_by_name(f"plantation_water_reminder_{user.id}_{bed_index}")
-                        for job in current_jobs:
-                            job.schedule_removal()
-                        
-                        context.application.job_queue.run_once(
-                            plantation_water_reminder_job,
-                            when=water_interval,
-                            chat_id=user.id,
-                            data={'bed_index': bed_index},
-                            name=f"plantation_water_reminder_{user.id}_{bed_index}",
-                        )
+                        plantation_reminders.schedule_in(user.id, bed_index, water_interval)
                 else:
                     # Если не удалось полить (странно), просто пишем "Посажено"
                     await query.answer('Посажено!', show_alert=False)
@@ -13617,26 +13331,11 @@ async def handle_plantation_water(update: Update, context: ContextTypes.DEFAULT_
                 pass
             
             # Планируем напоминание о следующем поливе, если включено
-            player = db.get_or_create_player(user.id, user.username or user.first_name)
-            if getattr(player, 'remind_plantation', False) and context.application and context.application.job_queue:
+            player = uctx.get_or_create_player(user.id, user.username or user.first_name)
+            if getattr(player, 'remind_plantation', False):
                 water_interval = int(res.get('water_interval_sec', 0))
                 if water_interval > 0:
-                    try:
-                        # Удаляем старые напоминания для этой грядки
-                        current_jobs = context.application.job_queue.get_jobs_by_name(f"plantation_water_reminder_{user.id}_{bed_index}")
-                        for job in current_jobs:
-                            job.schedule_removal()
-                        
-                        # Планируем новое напоминание
-                        context.application.job_queue.run_once(
-                            plantation_water_reminder_job,
-                            when=water_interval,
-                            chat_id=user.id,
-                            data={'bed_index': bed_index},
-                            name=f"plantation_water_reminder_{user.id}_{bed_index}",
-                        )
-                    except Exception as ex:
-                        logger.warning(f"Не удалось запланировать напоминание о поливе: {ex}")
+                    plantation_reminders.schedule_in(user.id, bed_index, water_interval)
         await show_plantation_my_beds(update, context)
 
 
@@ -13644,7 +13343,7 @@ async def handle_plantation_harvest(update: Update, context: ContextTypes.DEFAUL
     query = update.callback_query
     user = query.from_user
     try:
-        player = db.get_or_create_player(user.id, user.username or user.first_name)
+        player = uctx.get_or_create_player(user.id, user.username or user.first_name)
         lang = getattr(player, 'language', 'ru') or 'ru'
     except Exception:
         lang = 'ru'
@@ -13673,13 +13372,7 @@ async def handle_plantation_harvest(update: Update, context: ContextTypes.DEFAUL
             new_rating = res.get('new_rating')
 
             # Удаляем напоминание о поливе для этой грядки
-            if context.application and context.application.job_queue:
-                try:
-                    current_jobs = context.application.job_queue.get_jobs_by_name(f"plantation_water_reminder_{user.id}_{bed_index}")
-                    for job in current_jobs:
-                        job.schedule_removal()
-                except Exception as ex:
-                    logger.warning(f"Не удалось удалить напоминание о поливе при сборе урожая: {ex}")
+            plantation_reminders.cancel(user.id, bed_index)
 
             # Короткое подтверждение
             if lang == 'en':
@@ -13777,7 +13470,7 @@ async def handle_plantation_harvest_all(update: Update, context: ContextTypes.DE
     async with lock:
         beds = db.get_player_beds(user.id) or []
         try:
-            player = db.get_or_create_player(user.id, user.username or user.first_name)
+            player = uctx.get_or_create_player(user.id, user.username or user.first_name)
             lang = getattr(player, 'language', 'ru') or 'ru'
         except Exception:
             lang = 'ru'
@@ -13799,13 +13492,7 @@ async def handle_plantation_harvest_all(update: Update, context: ContextTypes.DE
                 continue
             
             # Удаляем напоминание о поливе для этой грядки
-            if context.application and context.application.job_queue:
-                try:
-                    current_jobs = context.application.job_queue.get_jobs_by_name(f"plantation_water_reminder_{user.id}_{idx}")
-                    for job in current_jobs:
-                        job.schedule_removal()
-                except Exception as ex:
-                    logger.warning(f"Не удалось удалить напоминание о поливе при массовом сборе: {ex}")
+            plantation_reminders.cancel(user.id, idx)
 
             amount = int(res.get('yield') or 0)
             items_added = int(res.get('items_added') or 0)
@@ -13941,7 +13628,7 @@ async def show_market_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     lang = player.language  # на будущее, сейчас текст на русском
 
     text = "<b>🛒 Рынок</b>\nВыберите раздел:"
@@ -13972,7 +13659,7 @@ async def show_cities_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     lang = getattr(player, 'language', 'ru') or 'ru'
 
     text = (
@@ -14034,7 +13721,7 @@ async def show_city_hightown(update: Update, context: ContextTypes.DEFAULT_TYPE)
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     lang = getattr(player, 'language', 'ru') or 'ru'
 
     text = (
@@ -14085,7 +13772,7 @@ async def show_city_rostov(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     _ = player.language
 
     text = (
@@ -14134,7 +13821,7 @@ async def show_city_powerlines(update: Update, context: ContextTypes.DEFAULT_TYP
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     _ = player.language
 
     text = (
@@ -14286,7 +13973,7 @@ async def show_power_sematori(update: Update, context: ContextTypes.DEFAULT_TYPE
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     
     is_vip_plus, is_vip_status = _get_powerlines_access_flags(user, player=player)
     
@@ -14360,7 +14047,7 @@ async def handle_power_sematori_play(update: Update, context: ContextTypes.DEFAU
     
     lock = _get_lock(f"user:{user_id}:sematori_play")
     async with lock:
-        player = db.get_or_create_player(user_id, user.username or user.first_name)
+        player = uctx.get_or_create_player(user_id, user.username or user.first_name)
         
         is_vip_plus, is_vip_status = _get_powerlines_access_flags(user, player=player)
         
@@ -14485,7 +14172,7 @@ async def handle_sematori_ans(update: Update, context: ContextTypes.DEFAULT_TYPE
         except Exception:
             chosen_ans = None
             
-        player = db.get_or_create_player(user_id, user.username or user.first_name)
+        player = uctx.get_or_create_player(user_id, user.username or user.first_name)
         
         if chosen_ans != correct_ans:
             await query.answer("❌ Неверно!", show_alert=True)
@@ -14568,7 +14255,7 @@ async def show_rostov_elite_items(update: Update, context: ContextTypes.DEFAULT_
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
 
     coins = int(getattr(player, 'coins', 0) or 0)
     luck = int(getattr(player, 'luck_coupon_charges', 0) or 0)
@@ -14639,7 +14326,7 @@ async def handle_rostov_elite_buy(update: Update, context: ContextTypes.DEFAULT_
         await query.answer("Подождите…", show_alert=True)
         return
     async with lock:
-        player = db.get_or_create_player(user.id, user.username or user.first_name)
+        player = uctx.get_or_create_player(user.id, user.username or user.first_name)
         coins = int(getattr(player, 'coins', 0) or 0)
 
         price = int(ROSTOV_ELITE_ITEM_PRICES.get(item_key, 0) or 0)
@@ -14709,7 +14396,7 @@ async def show_selyuk_farmer_settings(update: Update, context: ContextTypes.DEFA
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
 
     auto_w = bool(getattr(player, 'farmer_auto_water', True))
     auto_h = bool(getattr(player, 'farmer_auto_harvest', True))
@@ -14777,7 +14464,7 @@ async def handle_selyuk_farmer_toggle_setting(update: Update, context: ContextTy
     query = update.callback_query
     await query.answer()
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     cur = bool(getattr(player, field, False))
     db.update_player(user.id, **{field: (not cur)})
     await show_selyuk_farmer_settings(update, context)
@@ -14787,7 +14474,7 @@ async def show_selyuk_farmer_min_balance(update: Update, context: ContextTypes.D
     query = update.callback_query
     await query.answer()
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     cur = int(getattr(player, 'farmer_min_balance', 0) or 0)
     text = f"🛡️ <b>Минимальный остаток</b>\n\nТекущее значение: <b>{cur}</b> 💎\n\nВыбери новое значение:"
     vals = [0, 100, 500, 1000, 5000, 10000]
@@ -14801,7 +14488,7 @@ async def show_selyuk_farmer_daily_limit(update: Update, context: ContextTypes.D
     query = update.callback_query
     await query.answer()
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     cur = int(getattr(player, 'farmer_daily_limit', 0) or 0)
     text = f"📆 <b>Дневной лимит расходов</b>\n\nТекущее значение: <b>{cur}</b> 💎\n\nВыбери новое значение:"
     vals = [0, 500, 1000, 5000, 10000, 50000]
@@ -14815,7 +14502,7 @@ async def show_selyuk_farmer_summary_interval(update: Update, context: ContextTy
     query = update.callback_query
     await query.answer()
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     cur = int(getattr(player, 'farmer_summary_interval_sec', 3600) or 3600)
     text = f"🧾 <b>Интервал сводок</b>\n\nТекущее значение: <b>{int(cur/60)}</b> мин\n\nВыбери новое значение:"
     vals = [900, 1800, 3600, 7200]
@@ -14831,7 +14518,7 @@ async def show_selyuk_farmer_seed_settings(update: Update, context: ContextTypes
     query = update.callback_query
     await query.answer()
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     mode = str(getattr(player, 'farmer_seed_mode', 'any') or 'any')
     mode_readable = {'any': 'Любые', 'whitelist': 'Только выбранные', 'blacklist': 'Кроме выбранных'}.get(mode, mode)
     text = (
@@ -14868,7 +14555,7 @@ async def show_selyuk_farmer_seed_list(update: Update, context: ContextTypes.DEF
     query = update.callback_query
     await query.answer()
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     seed_ids, prio_ids = _farmer_seed_lists_from_player(player)
     mode = str(getattr(player, 'farmer_seed_mode', 'any') or 'any')
     inv = db.get_seed_inventory(user.id) or []
@@ -14903,7 +14590,7 @@ async def show_selyuk_farmer_seed_priority(update: Update, context: ContextTypes
     query = update.callback_query
     await query.answer()
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     seed_ids, prio_ids = _farmer_seed_lists_from_player(player)
     inv = db.get_seed_inventory(user.id) or []
     seeds = [(it.seed_type, int(getattr(it, 'quantity', 0) or 0)) for it in inv if getattr(it, 'seed_type', None)]
@@ -14970,7 +14657,7 @@ async def _edit_or_send_power_red_cores(query, context: ContextTypes.DEFAULT_TYP
 async def _render_power_red_cores_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     now_ts = int(time.time())
     is_vip_plus, is_vip_status = _get_powerlines_access_flags(user, player=player)
 
@@ -15029,7 +14716,7 @@ async def handle_power_red_cores_mine(update: Update, context: ContextTypes.DEFA
 
     lock = _get_lock(f"user:{user.id}:red_cores")
     async with lock:
-        player = db.get_or_create_player(user.id, user.username or user.first_name)
+        player = uctx.get_or_create_player(user.id, user.username or user.first_name)
         is_vip_plus, is_vip_status = _get_powerlines_access_flags(user, player=player)
         result = db.apply_red_core_mine_atomic(
             user.id,
@@ -15101,7 +14788,7 @@ async def handle_power_red_cores_mine(update: Update, context: ContextTypes.DEFA
 async def _render_power_red_cores_shop(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     cores = int(getattr(player, 'red_cores', 0) or 0)
     text = (
         "♻️ <b>ОБМЕННИК КРАСНЫХ ЯДЕР</b>\n\n"
@@ -15430,7 +15117,7 @@ async def show_rostov_elite_shop(update: Update, context: ContextTypes.DEFAULT_T
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     _ = player.language
 
     text = (
@@ -15473,7 +15160,7 @@ async def show_rostov_hub(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     _ = player.language
 
     text = (
@@ -15520,7 +15207,7 @@ async def show_rostov_hub_my_selyuki(update: Update, context: ContextTypes.DEFAU
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     selyuki = db.get_player_selyuki(user.id)
 
     if not selyuki:
@@ -15601,7 +15288,7 @@ async def show_selyuk_type_farmer(update: Update, context: ContextTypes.DEFAULT_
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     farmer = db.get_selyuk_by_type(user.id, 'farmer')
 
     if farmer:
@@ -15654,7 +15341,7 @@ async def show_selyuk_farmer_manage(update: Update, context: ContextTypes.DEFAUL
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     farmer = db.get_selyuk_by_type(user.id, 'farmer')
 
     if not farmer:
@@ -15713,7 +15400,7 @@ async def handle_selyuk_buy_farmer(update: Update, context: ContextTypes.DEFAULT
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     res = db.buy_farmer_selyuk(user.id, price=50000)
 
     if not res.get('ok'):
@@ -16071,7 +15758,7 @@ async def show_rostov_exchange(update: Update, context: ContextTypes.DEFAULT_TYP
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     _ = player.language
 
     text = (
@@ -16116,7 +15803,7 @@ async def show_market_shop(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     _ = player.language
 
     # Определяем страницу: из callback или из user_data (после покупки)
@@ -16262,7 +15949,7 @@ async def show_market_receiver(update: Update, context: ContextTypes.DEFAULT_TYP
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     lang = getattr(player, 'language', 'ru') or 'ru'
 
     # Собираем прайс-лист (выплата за 1 шт. с учётом комиссии и рейтинга)
@@ -16387,7 +16074,7 @@ async def show_stars_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     lang = player.language
 
     stock = db.get_bonus_stock('stars_500')
@@ -16420,7 +16107,7 @@ async def buy_vip(update: Update, context: ContextTypes.DEFAULT_TYPE, plan_key:
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     lang = player.language
 
     if plan_key not in VIP_COSTS or plan_key not in VIP_DURATIONS_SEC:
@@ -16480,7 +16167,7 @@ async def view_receipt_handler(update: Update, context: ContextTypes.DEFAULT_TYP
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     lang = player.language
 
     data = query.data or ''
@@ -16559,7 +16246,7 @@ async def my_receipts_handler(update: Update, context: ContextTypes.DEFAULT_TYPE
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     lang = player.language
 
     recs = db.get_receipts_by_user(user.id, limit=10)
@@ -16609,7 +16296,7 @@ async def myreceipts_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
     """Команда /myreceipts — показать список последних чеков пользователя."""
     msg = update.message
     user = update.effective_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     lang = player.language
 
     recs = db.get_receipts_by_user(user.id, limit=10)
@@ -16653,7 +16340,7 @@ async def show_stars_500(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     lang = player.language
 
     # Текст с ценой и балансом
@@ -16697,7 +16384,7 @@ async def show_vip_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     access = _get_access_profile(user, player=player)
     lang = player.language
 
@@ -16819,7 +16506,7 @@ async def show_vip_1d(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     access = _get_access_profile(user, player=player)
     lang = player.language
     if str(access.get('tier') or '') in ('admin', 'admin_plus'):
@@ -16862,7 +16549,7 @@ async def show_vip_7d(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     access = _get_access_profile(user, player=player)
     lang = player.language
     if str(access.get('tier') or '') in ('admin', 'admin_plus'):
@@ -16905,7 +16592,7 @@ async def show_vip_30d(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     access = _get_access_profile(user, player=player)
     lang = player.language
     if str(access.get('tier') or '') in ('admin', 'admin_plus'):
@@ -16949,7 +16636,7 @@ async def show_bonus_tg_premium(update: Update, context: ContextTypes.DEFAULT_TY
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     lang = player.language
 
     # Данные для экрана
@@ -16995,7 +16682,7 @@ async def buy_stars_500(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     lang = player.language
 
     # Защита от даблкликов
@@ -17057,7 +16744,7 @@ async def buy_tg_premium(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     lang = player.language
 
     # Защита от даблкликов
@@ -17117,7 +16804,7 @@ async def show_bonus_steam_game(update: Update, context: ContextTypes.DEFAULT_TY
     await query.answer()
 
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     lang = player.language
 
     stock = db.get_bonus_stock('steam_game')
@@ -17165,1271 +16852,1462 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await register_group_if_needed(update)
     except Exception:
         pass
-    db.get_or_create_player(user.id, username=getattr(user, 'username', None), display_name=(getattr(user, 'full_name', None) or getattr(user, 'first_name', None)))
+    uctx.get_or_create_player(user.id, username=getattr(user, 'username', None), display_name=(getattr(user, 'full_name', None) or getattr(user, 'first_name', None)))
     await show_menu(update, context)
 
 
-async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обрабатывает все нажатия на inline-кнопки."""
-    if await abort_if_banned(update, context):
-        return
-    # Регистрируем группу, если нажатие было в группе
-    try:
-        await register_group_if_needed(update)
-    except Exception:
-        pass
+# VULN-006: "персональные" callback'ы, которые в группах может нажимать только адресат сообщения.
+_PERSONAL_CALLBACK_PREFIXES = (
+    'inventory', 'view_', 'my_profile', 'profile_', 'find_energy',
+    'claim_bonus', 'daily_bonus', 'receiver_', 'fav_', 'favtrack_',
+    'friends_', 'casino_game_', 'casino_custom', 'casino_achievements',
+    'casino_rules', 'city_', 'power_', 'sematori_ans:', 'toggle_', 'autosell_', 'silk_',
+    'language_', 'settings_', 'snooze_remind', 'luck_coupon_',
+)
+
+
+# ==========================================
+# РАЗДЕЛ: МАРШРУТЫ INLINE-КНОПОК (button_handler)
+# ==========================================
+
+async def _cb_admin_player_vip_give(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    # Переадресуем на стандартный обработчик VIP с указанием player_id
+    parts = data.split(':')
+    if len(parts) > 1:
+        context.user_data['admin_vip_player_id'] = int(parts[1])
+    await admin_vip_give_start(update, context)
+
+
+async def _cb_admin_player_vip_plus_give(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    parts = data.split(':')
+    if len(parts) > 1:
+        context.user_data['admin_vip_plus_player_id'] = int(parts[1])
+    await admin_vip_plus_give_start(update, context)
+
+
+async def _cb_admin_player_vip_remove(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
     query = update.callback_query
-    if not query:
-        return
+    parts = data.split(':')
+    if len(parts) > 1:
+        player_id = int(parts[1])
+        dbs = SessionLocal()
+        try:
+            player = dbs.query(Player).filter(Player.user_id == player_id).first()
+            if player:
+                db.update_player(player_id, vip_until=0)
+                await query.answer("✅ VIP отозван!", show_alert=False)
+                await show_player_details(update, context, player_id)
+            else:
+                await query.answer("❌ Игрок не найден", show_alert=True)
+        finally:
+            dbs.close()
 
-    try:
-        u = query.from_user
-        if u:
-            db.get_or_create_player(u.id, username=getattr(u, 'username', None), display_name=(getattr(u, 'full_name', None) or getattr(u, 'first_name', None)))
-    except Exception:
-        pass
-    
-    data = query.data
-    
-    # Чтобы не падало, если кнопка без данных
-    if not data:
-        await query.answer()
+
+async def _cb_admin_player_vip_plus_remove(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    parts = data.split(':')
+    if len(parts) > 1:
+        player_id = int(parts[1])
+        dbs = SessionLocal()
+        try:
+            player = dbs.query(Player).filter(Player.user_id == player_id).first()
+            if player:
+                db.update_player(player_id, vip_plus_until=0)
+                await query.answer("✅ VIP+ отозван!", show_alert=False)
+                await show_player_details(update, context, player_id)
+            else:
+                await query.answer("❌ Игрок не найден", show_alert=True)
+        finally:
+            dbs.close()
+
+
+async def _cb_admin_stock_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    logger.info(f"[BUTTON_HANDLER] Обработка кнопки admin_stock_menu от пользователя {query.from_user.id}")
+    await show_admin_stock_menu(update, context)
+
+
+async def _cb_drink_confirm_rename(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    user = query.from_user
+    if not has_creator_panel_access(user.id, user.username):
+        await query.answer("⛔ Доступ запрещён!", show_alert=True)
         return
+    did = context.user_data.get('edit_drink_id')
+    new_name = context.user_data.get('pending_rename')
+    if data == 'drink_confirm_rename' and did and new_name:
+        ok = db.admin_update_drink(int(did), name=new_name)
+        text = "✅ Название обновлено" if ok else "❌ Ошибка при обновлении"
+    else:
+        text = "Отменено"
+    try:
+        await query.message.edit_text(text, reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔧 Управление энергетиками", callback_data='admin_drinks_menu')]]))
+    except BadRequest:
+        await query.message.reply_text(text, reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔧 Управление энергетиками", callback_data='admin_drinks_menu')]]))
+    context.user_data.pop('pending_rename', None)
+    context.user_data.pop('edit_drink_id', None)
+    context.user_data.pop('awaiting_admin_action', None)
 
-    # VULN-006 fix: защита персональных callback'ов в групповых чатах.
-    # Если сообщение отправлено в группе и callback является "персональным"
-    # (инвентарь, профиль, поиск, избранное, казино и т.д.), проверяем
-    # что кнопку нажал тот же пользователь, которому предназначено сообщение.
-    _PERSONAL_CALLBACK_PREFIXES = (
-        'inventory', 'view_', 'my_profile', 'profile_', 'find_energy',
-        'claim_bonus', 'daily_bonus', 'receiver_', 'fav_', 'favtrack_',
-        'friends_', 'casino_game_', 'casino_custom', 'casino_achievements',
-        'casino_rules', 'city_', 'power_', 'sematori_ans:', 'toggle_', 'autosell_', 'silk_',
-        'language_', 'settings_', 'snooze_remind', 'luck_coupon_',
-    )
-    if (query.message
-        and query.message.chat
-        and query.message.chat.type != 'private'
-        and data.startswith(_PERSONAL_CALLBACK_PREFIXES)):
-        # В группе: проверяем что reply_to или from_user совпадает
-        original_msg = query.message
-        # Бот отправил сообщение конкретному пользователю (reply_to_message)
-        original_user_id = None
-        if original_msg.reply_to_message and original_msg.reply_to_message.from_user:
-            original_user_id = original_msg.reply_to_message.from_user.id
-        
-        if original_user_id and original_user_id != query.from_user.id:
-            await query.answer("⛔ Это не ваша кнопка!", show_alert=True)
-            return
 
-    if ordinary_plantation.can_handle_callback(data):
-        await ordinary_plantation.handle_callback(update, context, data)
+async def _cb_drink_confirm_redesc(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    user = query.from_user
+    if not has_creator_panel_access(user.id, user.username):
+        await query.answer("⛔ Доступ запрещён!", show_alert=True)
         return
+    did = context.user_data.get('edit_drink_id')
+    new_desc = context.user_data.get('pending_redesc')
+    if data == 'drink_confirm_redesc' and did and new_desc is not None:
+        ok = db.admin_update_drink(int(did), description=new_desc)
+        text = "✅ Описание обновлено" if ok else "❌ Ошибка при обновлении"
+    else:
+        text = "Отменено"
+    try:
+        await query.message.edit_text(text, reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔧 Управление энергетиками", callback_data='admin_drinks_menu')]]))
+    except BadRequest:
+        await query.message.reply_text(text, reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔧 Управление энергетиками", callback_data='admin_drinks_menu')]]))
+    context.user_data.pop('pending_redesc', None)
+    context.user_data.pop('edit_drink_id', None)
+    context.user_data.pop('awaiting_admin_action', None)
 
-    # Централизованная проверка прав для админских callback'ов по матрице.
-    required_level = get_required_level_for_callback(data)
-    if required_level is not None:
-        actor = query.from_user
-        if not has_admin_level(actor.id, actor.username, required_level):
-            msg = "⛔ Доступ только для Создателя." if required_level >= 99 else "⛔ Недостаточный уровень доступа."
-            await query.answer(msg, show_alert=True)
-            return
 
-    if data == 'menu':
-        await show_menu(update, context)
-    elif swaga_module.can_handle_callback(data):
-        await swaga_module.handle_callback(update, context, data)
-    elif data == 'creator_panel':
-        await show_creator_panel(update, context)
-    elif data == 'admin_grants_menu':
-        await show_admin_grants_menu(update, context)
-    elif data == 'creator_wipe':
-        await creator_wipe_start(update, context)
-    elif data == 'creator_wipe_confirm':
-        await creator_wipe_confirm(update, context)
-    elif data == 'creator_reset_bonus':
-        await creator_reset_bonus_start(update, context)
-    elif data == 'creator_give_coins':
-        await creator_give_coins_start(update, context)
-    elif data == 'creator_user_stats':
-        await creator_user_stats_start(update, context)
-    elif data == 'creator_admins':
-        await show_admins_panel(update, context)
-    elif data == 'creator_admin_add':
-        await creator_admin_add_start(update, context)
-    elif data == 'creator_admin_promote':
-        await creator_admin_promote_start(update, context)
-    elif data == 'creator_admin_demote':
-        await creator_admin_demote_start(update, context)
-    elif data == 'creator_admin_remove':
-        await creator_admin_remove_start(update, context)
-    elif data == 'admin_bot_stats':
-        await show_bot_stats(update, context)
-    elif data == 'admin_players_menu':
-        await show_admin_players_menu(update, context)
-    elif data == 'admin_player_search':
-        await admin_player_search_start(update, context)
-    elif data == 'admin_players_list' or data.startswith('admin_players_list:'):
-        await admin_players_list(update, context)
-    elif data == 'admin_players_top':
-        await admin_players_top(update, context)
-    elif data.startswith('admin_player_details:'):
-        await show_player_details(update, context)
-    elif data.startswith('admin_player_balance:'):
-        await admin_player_balance_start(update, context)
-    elif data.startswith('admin_player_rating:'):
-        await admin_player_rating_start(update, context)
-    elif data.startswith('admin_player_vip:'):
-        await admin_player_vip_menu(update, context)
-    elif data.startswith('admin_player_vip_give:'):
-        # Переадресуем на стандартный обработчик VIP с указанием player_id
-        parts = data.split(':')
-        if len(parts) > 1:
-            context.user_data['admin_vip_player_id'] = int(parts[1])
-        await admin_vip_give_start(update, context)
-    elif data.startswith('admin_player_vip_plus_give:'):
-        parts = data.split(':')
-        if len(parts) > 1:
-            context.user_data['admin_vip_plus_player_id'] = int(parts[1])
-        await admin_vip_plus_give_start(update, context)
-    elif data.startswith('admin_player_vip_remove:'):
-        parts = data.split(':')
-        if len(parts) > 1:
-            player_id = int(parts[1])
-            dbs = SessionLocal()
+async def _cb_drink_confirm_photo(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    user = query.from_user
+    if not has_creator_panel_access(user.id, user.username):
+        await query.answer("⛔ Доступ запрещён!", show_alert=True)
+        return
+    did = context.user_data.get('edit_drink_id')
+    image_name = context.user_data.get('pending_photo')
+    if data == 'drink_confirm_photo' and did and image_name:
+        ok = db.admin_update_drink_image(int(did), image_name)
+        text = "✅ Фото обновлено" if ok else "❌ Ошибка при обновлении фото"
+    else:
+        if image_name:
             try:
-                player = dbs.query(Player).filter(Player.user_id == player_id).first()
-                if player:
-                    db.update_player(player_id, vip_until=0)
-                    await query.answer("✅ VIP отозван!", show_alert=False)
-                    await show_player_details(update, context, player_id)
-                else:
-                    await query.answer("❌ Игрок не найден", show_alert=True)
-            finally:
-                dbs.close()
-    elif data.startswith('admin_player_vip_plus_remove:'):
-        parts = data.split(':')
-        if len(parts) > 1:
-            player_id = int(parts[1])
-            dbs = SessionLocal()
-            try:
-                player = dbs.query(Player).filter(Player.user_id == player_id).first()
-                if player:
-                    db.update_player(player_id, vip_plus_until=0)
-                    await query.answer("✅ VIP+ отозван!", show_alert=False)
-                    await show_player_details(update, context, player_id)
-                else:
-                    await query.answer("❌ Игрок не найден", show_alert=True)
-            finally:
-                dbs.close()
-    elif data.startswith('admin_player_logs:'):
-        await admin_player_logs_show(update, context)
-    elif data.startswith('admin_player_reset_bonus:'):
-        await admin_player_reset_bonus_execute(update, context)
-    elif data == 'admin_vip_menu':
-        await show_admin_vip_menu(update, context)
-    elif data == 'admin_stock_menu':
-        logger.info(f"[BUTTON_HANDLER] Обработка кнопки admin_stock_menu от пользователя {query.from_user.id}")
-        await show_admin_stock_menu(update, context)
-    elif data == 'admin_broadcast_menu':
-        await show_admin_broadcast_menu(update, context)
-    elif data == 'admin_broadcast_start':
-        await admin_broadcast_start(update, context)
-    elif data == 'admin_vip_give':
-        await admin_vip_give_start(update, context)
-    elif data == 'admin_vip_plus_give':
-        await admin_vip_plus_give_start(update, context)
-    elif data == 'admin_vip_remove':
-        await admin_vip_remove_start(update, context)
-    elif data == 'admin_vip_plus_remove':
-        await admin_vip_plus_remove_start(update, context)
-    elif data == 'admin_vip_list':
-        await admin_vip_list_show(update, context)
-    
-    # Новые разделы админ панели
-    elif data == 'admin_analytics':
-        await show_admin_analytics(update, context)
-    elif data == 'admin_analytics_export':
-        await export_admin_analytics(update, context)
-    elif data == 'admin_drinks_menu':
-        await show_admin_drinks_menu(update, context)
-    elif data == 'admin_economy_menu':
-        await show_admin_economy_menu(update, context)
-    elif data == 'admin_events_menu':
-        await show_admin_events_menu(update, context)
-    
-    # Управление энергетиками
-    elif data == 'admin_drink_add':
-        await admin_drink_add_start(update, context)
-    elif data == 'admin_drink_edit':
-        await admin_drink_edit_start(update, context)
-    elif data == 'admin_drink_rename':
-        await admin_drink_rename_start(update, context)
-    elif data == 'admin_drink_redesc':
-        await admin_drink_redesc_start(update, context)
-    elif data == 'admin_drink_update_photo':
-        await admin_drink_update_photo_start(update, context)
-    elif data == 'admin_drink_delete':
-        await admin_drink_delete_start(update, context)
-    elif data == 'admin_drink_list':
-        await admin_drink_list_show_ids(update, context)
-    elif data.startswith('admin_drink_list_p'):
-        await admin_drink_list_show(update, context)
-    elif data == 'admin_drink_search':
-        await admin_drink_search_start(update, context)
-    elif data == 'drink_confirm_rename' or data == 'drink_cancel_rename':
-        user = query.from_user
-        if not has_creator_panel_access(user.id, user.username):
-            await query.answer("⛔ Доступ запрещён!", show_alert=True)
-            return
-        did = context.user_data.get('edit_drink_id')
-        new_name = context.user_data.get('pending_rename')
-        if data == 'drink_confirm_rename' and did and new_name:
-            ok = db.admin_update_drink(int(did), name=new_name)
-            text = "✅ Название обновлено" if ok else "❌ Ошибка при обновлении"
-        else:
-            text = "Отменено"
-        try:
-            await query.message.edit_text(text, reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔧 Управление энергетиками", callback_data='admin_drinks_menu')]]))
-        except BadRequest:
-            await query.message.reply_text(text, reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔧 Управление энергетиками", callback_data='admin_drinks_menu')]]))
-        context.user_data.pop('pending_rename', None)
-        context.user_data.pop('edit_drink_id', None)
-        context.user_data.pop('awaiting_admin_action', None)
-    elif data == 'drink_confirm_redesc' or data == 'drink_cancel_redesc':
-        user = query.from_user
-        if not has_creator_panel_access(user.id, user.username):
-            await query.answer("⛔ Доступ запрещён!", show_alert=True)
-            return
-        did = context.user_data.get('edit_drink_id')
-        new_desc = context.user_data.get('pending_redesc')
-        if data == 'drink_confirm_redesc' and did and new_desc is not None:
-            ok = db.admin_update_drink(int(did), description=new_desc)
-            text = "✅ Описание обновлено" if ok else "❌ Ошибка при обновлении"
+                fp = os.path.join(ENERGY_IMAGES_DIR, image_name)
+                if os.path.exists(fp):
+                    os.remove(fp)
+            except Exception:
+                pass
+        text = "Отменено"
+    try:
+        if getattr(query.message, 'photo', None):
+            await query.message.edit_caption(caption=text, reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔧 Управление энергетиками", callback_data='admin_drinks_menu')]]))
         else:
-            text = "Отменено"
-        try:
             await query.message.edit_text(text, reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔧 Управление энергетиками", callback_data='admin_drinks_menu')]]))
-        except BadRequest:
-            await query.message.reply_text(text, reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔧 Управление энергетиками", callback_data='admin_drinks_menu')]]))
-        context.user_data.pop('pending_redesc', None)
-        context.user_data.pop('edit_drink_id', None)
-        context.user_data.pop('awaiting_admin_action', None)
-    elif data == 'drink_confirm_photo' or data == 'drink_cancel_photo':
-        user = query.from_user
-        if not has_creator_panel_access(user.id, user.username):
-            await query.answer("⛔ Доступ запрещён!", show_alert=True)
-            return
-        did = context.user_data.get('edit_drink_id')
-        image_name = context.user_data.get('pending_photo')
-        if data == 'drink_confirm_photo' and did and image_name:
-            ok = db.admin_update_drink_image(int(did), image_name)
-            text = "✅ Фото обновлено" if ok else "❌ Ошибка при обновлении фото"
-        else:
-            if image_name:
-                try:
-                    fp = os.path.join(ENERGY_IMAGES_DIR, image_name)
-                    if os.path.exists(fp):
-                        os.remove(fp)
-                except Exception:
-                    pass
-            text = "Отменено"
-        try:
-            if getattr(query.message, 'photo', None):
-                await query.message.edit_caption(caption=text, reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔧 Управление энергетиками", callback_data='admin_drinks_menu')]]))
-            else:
-                await query.message.edit_text(text, reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔧 Управление энергетиками", callback_data='admin_drinks_menu')]]))
-        except BadRequest:
-            await query.message.reply_text(text, reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔧 Управление энергетиками", callback_data='admin_drinks_menu')]]))
-        context.user_data.pop('pending_photo', None)
-        context.user_data.pop('edit_drink_id', None)
-        context.user_data.pop('awaiting_admin_action', None)
-    
-    # Логи системы
-    elif data in [
-                  'admin_settings_shop', 'admin_settings_notifications',
-                  'admin_settings_localization',
-                  'admin_econ_shop_prices', 'admin_econ_casino_bets', 'admin_econ_rewards',
-                  'admin_econ_inflation', 'admin_econ_vip_prices', 'admin_econ_exchange', 'admin_event_create',
-                  'admin_event_list_active', 'admin_event_list_all', 'admin_event_edit', 'admin_event_end',
-                  'admin_event_stats']:
-        await query.answer("⚙️ Функция в разработке!", show_alert=True)
-    elif inventory_module.can_handle_callback(data):
-        await inventory_module.handle_callback(update, context, data, get_bot_runtime())
-    elif data == 'my_profile':
-        await show_my_profile(update, context)
-    elif data == 'profile_stats':
-        await show_stats(update, context)
-    elif data == 'profile_friends':
-        await show_profile_friends(update, context)
-    elif data == 'profile_favorites':
-        await show_profile_favorites_v2(update, context)
-    elif data == 'profile_favtrack':
-        await show_profile_favorite_track(update, context)
-    elif data == 'favtrack_clear':
-        user_id = query.from_user.id
-        player = db.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
-        lang = getattr(player, 'language', 'ru') or 'ru'
-        try:
-            db.update_player(user_id, favorite_swaga_track_id=0)
-        except Exception:
-            await query.answer("Ошибка" if lang == 'ru' else "Error", show_alert=True)
-            return
-        await query.answer("✅ Сброшено" if lang == 'ru' else "✅ Cleared")
-        await show_profile_favorite_track(update, context)
-    elif data.startswith('favtrack_pick_page_'):
-        try:
-            page = int(data.split('favtrack_pick_page_')[1])
-        except Exception:
-            page = 1
-        await show_favorite_track_pick(update, context, page=page)
-    elif data.startswith('favtrack_set_'):
-        try:
-            track_id = int(data.split('favtrack_set_')[1])
-        except Exception:
-            track_id = 0
-        user_id = query.from_user.id
-        player = db.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
-        lang = getattr(player, 'language', 'ru') or 'ru'
-        if track_id <= 0:
-            await query.answer("Ошибка" if lang == 'ru' else "Error", show_alert=True)
-            return
-
-        dbs = db.SessionLocal()
-        try:
-            owns = bool(dbs.query(db.PlayerSwagaTrack).filter_by(user_id=int(user_id), track_id=int(track_id)).first())
-        finally:
-            dbs.close()
-        if not owns:
-            await query.answer("У тебя нет этого трека." if lang == 'ru' else "You don't own this track.", show_alert=True)
-            return
-        try:
-            db.update_player(user_id, favorite_swaga_track_id=int(track_id))
-        except Exception:
-            await query.answer("Ошибка" if lang == 'ru' else "Error", show_alert=True)
-            return
-        await query.answer("✅ Установлено" if lang == 'ru' else "✅ Set")
-        await show_profile_favorite_track(update, context)
-    elif data.startswith('fav_add_'):
-        query = update.callback_query
-        try:
-            parts = data.split('_')
-            item_id = int(parts[2])
-            page = int(parts[3][1:])
-            inventory_type = parts[4]
-        except Exception:
-            await query.answer("Ошибка данных", show_alert=True)
-            return
-
-        user_id = query.from_user.id
-        player = db.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
-        lang = getattr(player, 'language', 'ru') or 'ru'
-
-        empty_slot = None
-        for i in (1, 2, 3):
-            if not getattr(player, f'favorite_drink_{i}', None):
-                empty_slot = i
-                break
-
-        if empty_slot is not None:
-            res = db.set_favorite_drink_slot(user_id, empty_slot, item_id)
-            if res and res.get('ok'):
-                await query.answer(f"⭐️ Добавлено в слот {empty_slot}!" if lang == 'ru' else f"⭐️ Added to slot {empty_slot}!")
-            else:
-                await query.answer("Ошибка добавления" if lang == 'ru' else "Error adding", show_alert=True)
-            query.data = f"view_{item_id}_{'rp' if inventory_type == 'receiver' else ('sp' if inventory_type == 'search' else 'p')}{page}"
-            await view_inventory_item(update, context)
-        else:
-            # Все слоты заняты: выводим меню замены
-            text = (
-                "<b>⚠️ Все слоты избранного заняты</b>\n\n"
-                "У вас уже выбрано 3 избранных напитка. Выберите слот для замены:\n\n"
-                if lang == 'ru' else
-                "<b>⚠️ All favorite slots are full</b>\n\n"
-                "You already have 3 favorite drinks selected. Choose a slot to replace:\n\n"
-            )
-            for i in (1, 2, 3):
-                slot_item_id = int(getattr(player, f'favorite_drink_{i}', 0) or 0)
-                item_details = db.get_inventory_item(slot_item_id)
-                drink_name = "Пусто" if lang == 'ru' else "Empty"
-                if item_details and item_details.drink:
-                    drink_name = item_details.drink.name
-                text += f"<b>{i}.</b> {drink_name}\n"
-
-            rows = []
-            for i in (1, 2, 3):
-                rows.append([
-                    InlineKeyboardButton(
-                        f"🔄 Заменить слот {i}" if lang == 'ru' else f"🔄 Replace slot {i}",
-                        callback_data=f"fav_replace_{item_id}_{i}_p{page}_{inventory_type}"
-                    )
-                ])
-            rows.append([
-                InlineKeyboardButton(
-                    "❌ Отмена" if lang == 'ru' else "❌ Cancel",
-                    callback_data=f"view_{item_id}_{'rp' if inventory_type == 'receiver' else ('sp' if inventory_type == 'search' else 'p')}{page}"
-                )
-            ])
-            await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(rows), parse_mode='HTML')
-
-    elif data.startswith('fav_remove_'):
-        query = update.callback_query
-        try:
-            parts = data.split('_')
-            item_id = int(parts[2])
-            page = int(parts[3][1:])
-            inventory_type = parts[4]
-        except Exception:
-            await query.answer("Ошибка данных", show_alert=True)
-            return
-
-        user_id = query.from_user.id
-        player = db.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
-        lang = getattr(player, 'language', 'ru') or 'ru'
+    except BadRequest:
+        await query.message.reply_text(text, reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔧 Управление энергетиками", callback_data='admin_drinks_menu')]]))
+    context.user_data.pop('pending_photo', None)
+    context.user_data.pop('edit_drink_id', None)
+    context.user_data.pop('awaiting_admin_action', None)
 
-        slot_to_clear = None
-        for i in (1, 2, 3):
-            if int(getattr(player, f'favorite_drink_{i}', 0) or 0) == item_id:
-                slot_to_clear = i
-                break
 
-        if slot_to_clear is not None:
-            res = db.clear_favorite_drink_slot(user_id, slot_to_clear)
-            if res and res.get('ok'):
-                await query.answer("❌ Убрано из избранного!" if lang == 'ru' else "❌ Removed from favorites!")
-            else:
-                await query.answer("Ошибка удаления" if lang == 'ru' else "Error removing", show_alert=True)
-        else:
-            await query.answer("Напиток не найден в избранном" if lang == 'ru' else "Drink not found in favorites", show_alert=True)
+async def _cb_admin_settings_shop(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    await query.answer("⚙️ Функция в разработке!", show_alert=True)
 
-        query.data = f"view_{item_id}_{'rp' if inventory_type == 'receiver' else ('sp' if inventory_type == 'search' else 'p')}{page}"
-        await view_inventory_item(update, context)
 
-    elif data.startswith('fav_replace_'):
-        query = update.callback_query
-        try:
-            parts = data.split('_')
-            item_id = int(parts[2])
-            slot = int(parts[3])
-            page = int(parts[4][1:])
-            inventory_type = parts[5]
-        except Exception:
-            await query.answer("Ошибка данных", show_alert=True)
-            return
+async def _cb_inventory_module(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    await inventory_module.handle_callback(update, context, data, get_bot_runtime())
 
-        user_id = query.from_user.id
-        player = db.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
-        lang = getattr(player, 'language', 'ru') or 'ru'
 
-        res = db.set_favorite_drink_slot(user_id, slot, item_id)
-        if res and res.get('ok'):
-            await query.answer(f"✅ Слот {slot} успешно обновлен!" if lang == 'ru' else f"✅ Slot {slot} updated!")
-        else:
-            await query.answer("Ошибка замены" if lang == 'ru' else "Error replacing", show_alert=True)
+async def _cb_favtrack_clear(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    user_id = query.from_user.id
+    player = uctx.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
+    lang = getattr(player, 'language', 'ru') or 'ru'
+    try:
+        db.update_player(user_id, favorite_swaga_track_id=0)
+    except Exception:
+        await query.answer("Ошибка" if lang == 'ru' else "Error", show_alert=True)
+        return
+    await query.answer("✅ Сброшено" if lang == 'ru' else "✅ Cleared")
+    await show_profile_favorite_track(update, context)
 
-        query.data = f"view_{item_id}_{'rp' if inventory_type == 'receiver' else ('sp' if inventory_type == 'search' else 'p')}{page}"
-        await view_inventory_item(update, context)
 
-    elif data.startswith('gift_inv_'):
-        query = update.callback_query
-        user_id = query.from_user.id
-        player = db.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
-        lang = getattr(player, 'language', 'ru') or 'ru'
+async def _cb_favtrack_pick_page(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    try:
+        page = int(data.split('favtrack_pick_page_')[1])
+    except Exception:
+        page = 1
+    await show_favorite_track_pick(update, context, page=page)
 
-        if data.startswith('gift_inv_friend_'):
-            try:
-                parts = data.split('_')
-                item_id = int(parts[3])
-                friend_id = int(parts[4])
-                page = int(parts[5][1:])
-                inventory_type = parts[6]
-            except Exception:
-                await query.answer("Ошибка данных", show_alert=True)
-                return
 
-            if friend_id == user_id:
-                await query.answer("Нельзя дарить самому себе" if lang == 'ru' else "Cannot gift to yourself", show_alert=True)
-                return
+async def _cb_favtrack_set(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    try:
+        track_id = int(data.split('favtrack_set_')[1])
+    except Exception:
+        track_id = 0
+    user_id = query.from_user.id
+    player = uctx.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
+    lang = getattr(player, 'language', 'ru') or 'ru'
+    if track_id <= 0:
+        await query.answer("Ошибка" if lang == 'ru' else "Error", show_alert=True)
+        return
 
-            giver_restriction = db.get_gift_restriction_info(user_id)
-            if giver_restriction:
-                await query.answer("Вы временно заблокированы в системе подарков" if lang == 'ru' else "You are restricted from gifting", show_alert=True)
-                return
+    dbs = db.SessionLocal()
+    try:
+        owns = bool(dbs.query(db.PlayerSwagaTrack).filter_by(user_id=int(user_id), track_id=int(track_id)).first())
+    finally:
+        dbs.close()
+    if not owns:
+        await query.answer("У тебя нет этого трека." if lang == 'ru' else "You don't own this track.", show_alert=True)
+        return
+    try:
+        db.update_player(user_id, favorite_swaga_track_id=int(track_id))
+    except Exception:
+        await query.answer("Ошибка" if lang == 'ru' else "Error", show_alert=True)
+        return
+    await query.answer("✅ Установлено" if lang == 'ru' else "✅ Set")
+    await show_profile_favorite_track(update, context)
 
-            recipient_restriction = db.get_gift_restriction_info(friend_id)
-            if recipient_restriction:
-                await query.answer("Получатель временно не может принимать подарки" if lang == 'ru' else "Recipient is restricted from receiving", show_alert=True)
-                return
 
-            gifts_sent_today = db.get_user_gifts_sent_today(user_id)
-            remaining_daily = gift_feature.DAILY_LIMIT - gifts_sent_today
-            if remaining_daily <= 0:
-                await query.answer("Достигнут дневной лимит подарков" if lang == 'ru' else "Daily limit reached", show_alert=True)
-                return
+async def _cb_fav_add(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    query = update.callback_query
+    try:
+        parts = data.split('_')
+        item_id = int(parts[2])
+        page = int(parts[3][1:])
+        inventory_type = parts[4]
+    except Exception:
+        await query.answer("Ошибка данных", show_alert=True)
+        return
 
-            last_gift_time = db.get_user_last_gift_time(user_id)
-            if last_gift_time and (time.time() - last_gift_time) < gift_feature.COOLDOWN_SECONDS:
-                remaining = int(gift_feature.COOLDOWN_SECONDS - (time.time() - last_gift_time))
-                await query.answer(f"Подождите {remaining} сек." if lang == 'ru' else f"Wait {remaining}s.", show_alert=True)
-                return
+    user_id = query.from_user.id
+    player = uctx.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
+    lang = getattr(player, 'language', 'ru') or 'ru'
 
-            inventory_item = db.get_inventory_item(item_id)
-            if not inventory_item or inventory_item.quantity <= 0:
-                await query.answer("Предмет не найден в инвентаре" if lang == 'ru' else "Item not found", show_alert=True)
-                return
+    empty_slot = None
+    for i in (1, 2, 3):
+        if not getattr(player, f'favorite_drink_{i}', None):
+            empty_slot = i
+            break
 
-            friend_player = db.get_or_create_player(friend_id, None)
-            friend_username = getattr(friend_player, 'username', None)
-            friend_display = getattr(friend_player, 'display_name', None) or f"@{friend_username}" if friend_username else f"ID {friend_id}"
-
-            gift_feature.selection_state[user_id] = {
-                "created_at": int(time.time()),
-                "group_id": friend_id,
-                "recipient_username": friend_username or "",
-                "recipient_id": friend_id,
-                "recipient_display": friend_display,
-                "inventory_items": [inventory_item],
-                "gifts_sent_today": gifts_sent_today,
-                "max_gifts": min(gift_feature.MAX_BUNDLE_SIZE, remaining_daily),
-                "cart": {item_id: 1},
-                "current_page": 1,
-                "search_query": None,
-                "awaiting_search": False,
-                "search_message_id": None,
-                "gift_snapshot": gift_feature._build_gift_flow_snapshot(user_id, friend_id),
-            }
+    if empty_slot is not None:
+        res = db.set_favorite_drink_slot(user_id, empty_slot, item_id)
+        if res and res.get('ok'):
+            await query.answer(f"⭐️ Добавлено в слот {empty_slot}!" if lang == 'ru' else f"⭐️ Added to slot {empty_slot}!")
+        else:
+            await query.answer("Ошибка добавления" if lang == 'ru' else "Error adding", show_alert=True)
+        query.data = f"view_{item_id}_{'rp' if inventory_type == 'receiver' else ('sp' if inventory_type == 'search' else 'p')}{page}"
+        await view_inventory_item(update, context)
+    else:
+        # Все слоты заняты: выводим меню замены
+        text = (
+            "<b>⚠️ Все слоты избранного заняты</b>\n\n"
+            "У вас уже выбрано 3 избранных напитка. Выберите слот для замены:\n\n"
+            if lang == 'ru' else
+            "<b>⚠️ All favorite slots are full</b>\n\n"
+            "You already have 3 favorite drinks selected. Choose a slot to replace:\n\n"
+        )
+        for i in (1, 2, 3):
+            slot_item_id = int(getattr(player, f'favorite_drink_{i}', 0) or 0)
+            item_details = db.get_inventory_item(slot_item_id)
+            drink_name = "Пусто" if lang == 'ru' else "Empty"
+            if item_details and item_details.drink:
+                drink_name = item_details.drink.name
+            text += f"<b>{i}.</b> {drink_name}\n"
 
-            try:
-                await gift_feature._send_bundle_offer(update, context)
-            except Forbidden:
-                gift_feature.selection_state.pop(user_id, None)
-                await query.edit_message_text(
-                    "❌ Не удалось отправить предложение подарка получателю.\n\n"
-                    "Ему нужно сначала запустить этого бота в ЛС (нажать /start)."
-                    if lang == 'ru' else
-                    "❌ Could not send gift offer to recipient.\n\n"
-                    "They need to start this bot first in private messages (press /start)."
+        rows = []
+        for i in (1, 2, 3):
+            rows.append([
+                InlineKeyboardButton(
+                    f"🔄 Заменить слот {i}" if lang == 'ru' else f"🔄 Replace slot {i}",
+                    callback_data=f"fav_replace_{item_id}_{i}_p{page}_{inventory_type}"
                 )
-            except Exception as e:
-                gift_feature.selection_state.pop(user_id, None)
-                await query.edit_message_text(f"❌ Ошибка при отправке подарка: {e}")
+            ])
+        rows.append([
+            InlineKeyboardButton(
+                "❌ Отмена" if lang == 'ru' else "❌ Cancel",
+                callback_data=f"view_{item_id}_{'rp' if inventory_type == 'receiver' else ('sp' if inventory_type == 'search' else 'p')}{page}"
+            )
+        ])
+        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(rows), parse_mode='HTML')
 
-        elif data.startswith('gift_inv_username_'):
-            try:
-                parts = data.split('_')
-                item_id = int(parts[3])
-                page = int(parts[4][1:])
-                inventory_type = parts[5]
-            except Exception:
-                await query.answer("Ошибка данных", show_alert=True)
-                return
 
-            context.user_data['awaiting_gift_inv_username'] = {
-                "item_id": item_id,
-                "page": page,
-                "inventory_type": inventory_type
-            }
+async def _cb_fav_remove(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    query = update.callback_query
+    try:
+        parts = data.split('_')
+        item_id = int(parts[2])
+        page = int(parts[3][1:])
+        inventory_type = parts[4]
+    except Exception:
+        await query.answer("Ошибка данных", show_alert=True)
+        return
 
-            text = (
-                "<b>🔍 Ввод получателя вручную</b>\n\n"
-                "Введите Telegram @username или ID игрока, которому хотите подарить напиток.\n"
-                "Пример: <code>@username</code> или <code>123456789</code>."
-                if lang == 'ru' else
-                "<b>🔍 Enter username manually</b>\n\n"
-                "Enter Telegram @username or ID of the player you want to gift this drink.\n"
-                "Example: <code>@username</code> or <code>123456789</code>."
-            )
-            keyboard = [[
-                InlineKeyboardButton(
-                    "❌ Отмена" if lang == 'ru' else "❌ Cancel",
-                    callback_data=f"gift_inv_{item_id}_p{page}_{inventory_type}"
-                )
-            ]]
-            await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='HTML')
+    user_id = query.from_user.id
+    player = uctx.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
+    lang = getattr(player, 'language', 'ru') or 'ru'
+
+    slot_to_clear = None
+    for i in (1, 2, 3):
+        if int(getattr(player, f'favorite_drink_{i}', 0) or 0) == item_id:
+            slot_to_clear = i
+            break
 
+    if slot_to_clear is not None:
+        res = db.clear_favorite_drink_slot(user_id, slot_to_clear)
+        if res and res.get('ok'):
+            await query.answer("❌ Убрано из избранного!" if lang == 'ru' else "❌ Removed from favorites!")
         else:
-            try:
-                parts = data.split('_')
-                if 'fpage' in parts:
-                    fpage = int(parts[3])
-                    item_id = int(parts[4])
-                    page = int(parts[5][1:])
-                    inventory_type = parts[6]
-                else:
-                    fpage = 1
-                    item_id = int(parts[2])
-                    page = int(parts[3][1:])
-                    inventory_type = parts[4]
-            except Exception:
-                await query.answer("Ошибка данных", show_alert=True)
-                return
+            await query.answer("Ошибка удаления" if lang == 'ru' else "Error removing", show_alert=True)
+    else:
+        await query.answer("Напиток не найден в избранном" if lang == 'ru' else "Drink not found in favorites", show_alert=True)
 
-            await query.answer()
+    query.data = f"view_{item_id}_{'rp' if inventory_type == 'receiver' else ('sp' if inventory_type == 'search' else 'p')}{page}"
+    await view_inventory_item(update, context)
 
-            friends_res = db.list_friends(user_id, page=fpage-1, per_page=5)
-            friends = friends_res.get('items', [])
-            total_friends = friends_res.get('total', 0)
 
-            text = (
-                "<b>👥 Выберите друга для подарка</b>\n\n"
-                "Ниже показан список ваших друзей. Выберите получателя или введите @username вручную."
-                if lang == 'ru' else
-                "<b>👥 Choose friend to gift</b>\n\n"
-                "Below is your friends list. Select a recipient or enter @username manually."
-            )
+async def _cb_fav_replace(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    query = update.callback_query
+    try:
+        parts = data.split('_')
+        item_id = int(parts[2])
+        slot = int(parts[3])
+        page = int(parts[4][1:])
+        inventory_type = parts[5]
+    except Exception:
+        await query.answer("Ошибка данных", show_alert=True)
+        return
 
-            rows = []
-            for f in friends:
-                f_id = f['user_id']
-                f_uname = f['username'] or f['display_name'] or str(f_id)
-                rows.append([
-                    InlineKeyboardButton(
-                        f"👤 @{f_uname}" if f['username'] else f"👤 {f_uname}",
-                        callback_data=f"gift_inv_friend_{item_id}_{f_id}_p{page}_{inventory_type}"
-                    )
-                ])
+    user_id = query.from_user.id
+    player = uctx.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
+    lang = getattr(player, 'language', 'ru') or 'ru'
 
-            nav_row = []
-            total_pages = max(1, (total_friends + 4) // 5)
-            if total_pages > 1:
-                prev_fpage = total_pages if fpage == 1 else fpage - 1
-                next_fpage = 1 if fpage == total_pages else fpage + 1
-                nav_row.append(InlineKeyboardButton("⬅️", callback_data=f"gift_inv_fpage_{prev_fpage}_{item_id}_p{page}_{inventory_type}"))
-                nav_row.append(InlineKeyboardButton(f"{fpage}/{total_pages}", callback_data="noop"))
-                nav_row.append(InlineKeyboardButton("➡️", callback_data=f"gift_inv_fpage_{next_fpage}_{item_id}_p{page}_{inventory_type}"))
-                rows.append(nav_row)
+    res = db.set_favorite_drink_slot(user_id, slot, item_id)
+    if res and res.get('ok'):
+        await query.answer(f"✅ Слот {slot} успешно обновлен!" if lang == 'ru' else f"✅ Slot {slot} updated!")
+    else:
+        await query.answer("Ошибка замены" if lang == 'ru' else "Error replacing", show_alert=True)
+
+    query.data = f"view_{item_id}_{'rp' if inventory_type == 'receiver' else ('sp' if inventory_type == 'search' else 'p')}{page}"
+    await view_inventory_item(update, context)
 
-            rows.append([
-                InlineKeyboardButton(
-                    "🔍 Ввести @username вручную" if lang == 'ru' else "🔍 Enter @username manually",
-                    callback_data=f"gift_inv_username_{item_id}_p{page}_{inventory_type}"
-                )
-            ])
-            rows.append([
-                InlineKeyboardButton(
-                    "🔙 Назад к карточке" if lang == 'ru' else "🔙 Back to card",
-                    callback_data=f"view_{item_id}_{'rp' if inventory_type == 'receiver' else ('sp' if inventory_type == 'search' else 'p')}{page}"
-                )
-            ])
 
-            await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(rows), parse_mode='HTML')
+async def _cb_gift_inv(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    query = update.callback_query
+    user_id = query.from_user.id
+    player = uctx.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
+    lang = getattr(player, 'language', 'ru') or 'ru'
 
-    elif data.startswith('fav_slot_'):
-        query = update.callback_query
+    if data.startswith('gift_inv_friend_'):
         try:
-            slot = int(data.split('_')[-1])
+            parts = data.split('_')
+            item_id = int(parts[3])
+            friend_id = int(parts[4])
+            page = int(parts[5][1:])
+            inventory_type = parts[6]
         except Exception:
-            slot = 0
-        if slot not in (1, 2, 3):
-            await query.answer('Ошибка', show_alert=True)
+            await query.answer("Ошибка данных", show_alert=True)
             return
 
-        user_id = query.from_user.id
-        lock = _get_lock(f"favorites:{user_id}")
-        async with lock:
-            await show_favorites_pick_inventory_v2(update, context, slot=slot, page=1)
-    elif data.startswith('fav_clear_'):
-        query = update.callback_query
-        try:
-            slot = int(data.split('_')[-1])
-        except Exception:
-            slot = 0
-        if slot not in (1, 2, 3):
-            await query.answer('Ошибка', show_alert=True)
+        if friend_id == user_id:
+            await query.answer("Нельзя дарить самому себе" if lang == 'ru' else "Cannot gift to yourself", show_alert=True)
             return
-        user_id = query.from_user.id
-        lock = _get_lock(f"favorites:{user_id}")
-        async with lock:
-            player = db.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
-            lang = getattr(player, 'language', 'ru') or 'ru'
-            res = db.clear_favorite_drink_slot(user_id, slot)
-            if not res or not res.get('ok'):
-                await query.answer('Ошибка' if lang == 'ru' else 'Error', show_alert=True)
-                return
-            await query.answer('✅ Слот очищен' if lang == 'ru' else '✅ Slot cleared')
-            await show_profile_favorites_v2(update, context)
-    elif data.startswith('fav_search_start_'):
-        query = update.callback_query
-        try:
-            slot = int(data.split('_')[-1])
-        except Exception:
-            slot = 0
-        if slot not in (1, 2, 3):
-            await query.answer('Ошибка', show_alert=True)
+
+        giver_restriction = db.get_gift_restriction_info(user_id)
+        if giver_restriction:
+            await query.answer("Вы временно заблокированы в системе подарков" if lang == 'ru' else "You are restricted from gifting", show_alert=True)
             return
-        await start_favorites_search(update, context, slot=slot)
-    elif data.startswith('fav_search_page_'):
-        query = update.callback_query
-        try:
-            _, _, _, slot_str, page_str = data.split('_', 4)
-            slot = int(slot_str)
-            page = int(page_str)
-        except Exception:
-            await query.answer('Ошибка', show_alert=True)
+
+        recipient_restriction = db.get_gift_restriction_info(friend_id)
+        if recipient_restriction:
+            await query.answer("Получатель временно не может принимать подарки" if lang == 'ru' else "Recipient is restricted from receiving", show_alert=True)
             return
-        search_query = str(context.user_data.get('favorites_last_search_query') or '').strip()
-        last_slot = int(context.user_data.get('favorites_last_search_slot') or 0)
-        if search_query and slot == last_slot:
-            await show_favorites_search_results(update, context, slot=slot, search_query=search_query, page=page)
-        else:
-            await show_favorites_pick_inventory_v2(update, context, slot=slot, page=1)
-    elif data.startswith('fav_pick_page_'):
-        query = update.callback_query
-        try:
-            _, _, _, slot_str, page_str = data.split('_', 4)
-            slot = int(slot_str)
-            page = int(page_str)
-        except Exception:
-            await query.answer('Ошибка', show_alert=True)
+
+        gifts_sent_today = db.get_user_gifts_sent_today(user_id)
+        remaining_daily = gift_feature.DAILY_LIMIT - gifts_sent_today
+        if remaining_daily <= 0:
+            await query.answer("Достигнут дневной лимит подарков" if lang == 'ru' else "Daily limit reached", show_alert=True)
+            return
+
+        last_gift_time = db.get_user_last_gift_time(user_id)
+        if last_gift_time and (time.time() - last_gift_time) < gift_feature.COOLDOWN_SECONDS:
+            remaining = int(gift_feature.COOLDOWN_SECONDS - (time.time() - last_gift_time))
+            await query.answer(f"Подождите {remaining} сек." if lang == 'ru' else f"Wait {remaining}s.", show_alert=True)
+            return
+
+        inventory_item = db.get_inventory_item(item_id)
+        if not inventory_item or inventory_item.quantity <= 0:
+            await query.answer("Предмет не найден в инвентаре" if lang == 'ru' else "Item not found", show_alert=True)
             return
-        await show_favorites_pick_inventory_v2(update, context, slot=slot, page=page)
-    elif data.startswith('fav_pick_'):
-        query = update.callback_query
+
+        friend_player = uctx.get_or_create_player(friend_id, None)
+        friend_username = getattr(friend_player, 'username', None)
+        friend_display = getattr(friend_player, 'display_name', None) or f"@{friend_username}" if friend_username else f"ID {friend_id}"
+
+        gift_feature.selection_state[user_id] = {
+            "created_at": int(time.time()),
+            "group_id": friend_id,
+            "recipient_username": friend_username or "",
+            "recipient_id": friend_id,
+            "recipient_display": friend_display,
+            "inventory_items": [inventory_item],
+            "gifts_sent_today": gifts_sent_today,
+            "max_gifts": min(gift_feature.MAX_BUNDLE_SIZE, remaining_daily),
+            "cart": {item_id: 1},
+            "current_page": 1,
+            "search_query": None,
+            "awaiting_search": False,
+            "search_message_id": None,
+            "gift_snapshot": gift_feature._build_gift_flow_snapshot(user_id, friend_id),
+        }
+
+        try:
+            await gift_feature._send_bundle_offer(update, context)
+        except Forbidden:
+            gift_feature.selection_state.pop(user_id, None)
+            await query.edit_message_text(
+                "❌ Не удалось отправить предложение подарка получателю.\n\n"
+                "Ему нужно сначала запустить этого бота в ЛС (нажать /start)."
+                if lang == 'ru' else
+                "❌ Could not send gift offer to recipient.\n\n"
+                "They need to start this bot first in private messages (press /start)."
+            )
+        except Exception as e:
+            gift_feature.selection_state.pop(user_id, None)
+            await query.edit_message_text(f"❌ Ошибка при отправке подарка: {e}")
+
+    elif data.startswith('gift_inv_username_'):
         try:
-            # fav_pick_{slot}_{item_id}_p{page}
             parts = data.split('_')
-            slot = int(parts[2])
             item_id = int(parts[3])
-            page_part = parts[4] if len(parts) > 4 else 'p1'
-            page = int(str(page_part).lstrip('p') or 1)
+            page = int(parts[4][1:])
+            inventory_type = parts[5]
         except Exception:
-            await query.answer('Ошибка', show_alert=True)
+            await query.answer("Ошибка данных", show_alert=True)
             return
 
-        user_id = query.from_user.id
-        lock = _get_lock(f"favorites:{user_id}")
-        async with lock:
-            player = db.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
-            lang = getattr(player, 'language', 'ru') or 'ru'
-            res = db.set_favorite_drink_slot(user_id, slot, item_id)
-            if not res or not res.get('ok'):
-                reason = (res or {}).get('reason')
-                if reason == 'forbidden':
-                    msg = '❌ Это не ваш предмет.' if lang == 'ru' else "❌ This isn't your item."
-                elif reason == 'not_found':
-                    msg = '❌ Предмет не найден.' if lang == 'ru' else '❌ Item not found.'
-                else:
-                    msg = '❌ Ошибка.' if lang == 'ru' else '❌ Error.'
-                await query.answer(msg, show_alert=True)
-                await show_favorites_pick_inventory_v2(update, context, slot=slot, page=page)
-                return
+        context.user_data['awaiting_gift_inv_username'] = {
+            "item_id": item_id,
+            "page": page,
+            "inventory_type": inventory_type
+        }
 
-            await query.answer('✅ Сохранено' if lang == 'ru' else '✅ Saved')
-            await show_profile_favorites_v2(update, context)
-    elif data == 'friends_add_start':
-        await friends_add_start(update, context)
-    elif data.startswith('friends_add_search:'):
-        # Backward-compat: если в старых сообщениях остались кнопки пагинации
-        q = context.user_data.get('friends_last_search_query') or ''
-        if q:
-            await friends_search_results(update, context, str(q), page=0)
-        else:
-            await friends_add_start(update, context)
-    elif data.startswith('friends_add_pick:'):
-        try:
-            uid = int(data.split(':', 1)[1])
-        except Exception:
-            uid = 0
-        if uid:
-            await friends_add_pick(update, context, uid)
-        else:
-            await query.answer('Ошибка', show_alert=True)
-    elif data.startswith('friends_requests_'):
-        try:
-            page = int(data.split('_')[-1])
-        except Exception:
-            page = 0
-        await friends_requests_menu(update, context, page=page)
-    elif data.startswith('friends_outgoing_'):
-        try:
-            page = int(data.split('_')[-1])
-        except Exception:
-            page = 0
-        await friends_outgoing_menu(update, context, page=page)
-    elif data.startswith('friends_out_open:'):
-        try:
-            rid = int(data.split(':', 1)[1])
-        except Exception:
-            rid = 0
-        if rid:
-            await friends_outgoing_open(update, context, rid)
-        else:
-            await query.answer('Ошибка', show_alert=True)
-    elif data.startswith('friends_req_open:'):
-        try:
-            rid = int(data.split(':', 1)[1])
-        except Exception:
-            rid = 0
-        if rid:
-            await friends_request_open(update, context, rid)
-        else:
-            await query.answer('Ошибка', show_alert=True)
-    elif data.startswith('friends_req_accept:'):
-        try:
-            rid = int(data.split(':', 1)[1])
-        except Exception:
-            rid = 0
-        if rid:
-            await friends_req_accept(update, context, rid)
-        else:
-            await query.answer('Ошибка', show_alert=True)
-    elif data.startswith('friends_req_reject:'):
-        try:
-            rid = int(data.split(':', 1)[1])
-        except Exception:
-            rid = 0
-        if rid:
-            await friends_req_reject(update, context, rid)
-        else:
-            await query.answer('Ошибка', show_alert=True)
-    elif data.startswith('friends_req_cancel:'):
-        try:
-            rid = int(data.split(':', 1)[1])
-        except Exception:
-            rid = 0
-        if rid:
-            await friends_req_cancel(update, context, rid)
-        else:
-            await query.answer('Ошибка', show_alert=True)
-    elif data.startswith('friends_list_'):
-        try:
-            page = int(data.split('_')[-1])
-        except Exception:
-            page = 0
-        await friends_list_menu(update, context, page=page)
-    elif data.startswith('friends_open:'):
-        try:
-            uid = int(data.split(':', 1)[1])
-        except Exception:
-            uid = 0
-        if uid:
-            await friends_open_menu(update, context, uid)
-        else:
-            await query.answer('Ошибка', show_alert=True)
-    elif data.startswith('friends_remove_confirm:'):
-        try:
-            uid = int(data.split(':', 1)[1])
-        except Exception:
-            uid = 0
-        if uid:
-            await friends_remove_confirm(update, context, uid)
-        else:
-            await query.answer('Ошибка', show_alert=True)
-    elif data.startswith('friends_remove_do:'):
-        try:
-            uid = int(data.split(':', 1)[1])
-        except Exception:
-            uid = 0
-        if uid:
-            await friends_remove_do(update, context, uid)
-        else:
-            await query.answer('Ошибка', show_alert=True)
-    elif data.startswith('friends_give_coins:'):
-        try:
-            uid = int(data.split(':', 1)[1])
-        except Exception:
-            uid = 0
-        if uid:
-            await friends_start_transfer(update, context, 'coins', uid)
-        else:
-            await query.answer('Ошибка', show_alert=True)
-    elif data.startswith('friends_give_fragments:'):
-        try:
-            uid = int(data.split(':', 1)[1])
-        except Exception:
-            uid = 0
-        if uid:
-            await friends_start_transfer(update, context, 'fragments', uid)
-        else:
-            await query.answer('Ошибка', show_alert=True)
-    elif data.startswith('friends_give_rating:'):
-        try:
-            uid = int(data.split(':', 1)[1])
-        except Exception:
-            uid = 0
-        if uid:
-            await friends_start_transfer(update, context, 'rating', uid)
-        else:
-            await query.answer('Ошибка', show_alert=True)
-    elif data.startswith('friends_give_vip7:'):
+        text = (
+            "<b>🔍 Ввод получателя вручную</b>\n\n"
+            "Введите Telegram @username или ID игрока, которому хотите подарить напиток.\n"
+            "Пример: <code>@username</code> или <code>123456789</code>."
+            if lang == 'ru' else
+            "<b>🔍 Enter username manually</b>\n\n"
+            "Enter Telegram @username or ID of the player you want to gift this drink.\n"
+            "Example: <code>@username</code> or <code>123456789</code>."
+        )
+        keyboard = [[
+            InlineKeyboardButton(
+                "❌ Отмена" if lang == 'ru' else "❌ Cancel",
+                callback_data=f"gift_inv_{item_id}_p{page}_{inventory_type}"
+            )
+        ]]
+        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='HTML')
+
+    else:
         try:
-            uid = int(data.split(':', 1)[1])
-        except Exception:
-            uid = 0
-        if not uid:
-            await query.answer('Ошибка', show_alert=True)
-        else:
-            user = query.from_user
-            p = db.get_or_create_player(user.id, user.username or user.first_name)
-            lang = p.language
-            res = db.gift_vip_7d_to_friend(user.id, uid)
-            if not res or not res.get('ok'):
-                reason = (res or {}).get('reason')
-                if reason == 'sender_not_vip':
-                    msg = "❌ Нужно иметь VIP для подарка." if lang == 'ru' else "❌ You need VIP to gift."
-                elif reason == 'sender_is_vip_plus':
-                    msg = "❌ VIP+ не может дарить VIP." if lang == 'ru' else "❌ VIP+ can't gift VIP."
-                elif reason == 'cooldown':
-                    msg = "❌ Подарок VIP доступен раз в 2 недели." if lang == 'ru' else "❌ VIP gift is available once per 2 weeks."
-                elif reason == 'not_friends':
-                    msg = "❌ Этот игрок не у вас в друзьях." if lang == 'ru' else "❌ Not your friend."
-                else:
-                    msg = "❌ Ошибка. Попробуйте позже." if lang == 'ru' else "❌ Error. Try later."
-                await query.answer(msg, show_alert=True)
-                await friends_open_menu(update, context, uid)
+            parts = data.split('_')
+            if 'fpage' in parts:
+                fpage = int(parts[3])
+                item_id = int(parts[4])
+                page = int(parts[5][1:])
+                inventory_type = parts[6]
             else:
-                await query.answer("✅ VIP подарен на 7 дней!" if lang == 'ru' else "✅ VIP gifted for 7 days!", show_alert=True)
-                try:
-                    await context.bot.send_message(chat_id=uid, text="🎁 Вам подарили VIP на 7 дней!" if lang == 'ru' else "🎁 You received VIP for 7 days!")
-                except Exception:
-                    pass
-                await friends_open_menu(update, context, uid)
-    elif data == 'profile_boosts':
-        await show_profile_boosts(update, context)
-    elif data == 'luck_coupon_auto_toggle':
-        await toggle_luck_coupon_auto_use(update, context)
-    elif data == 'stats':
-        await show_stats(update, context)
-    elif data == 'extra_bonuses':
-        await show_extra_bonuses(update, context)
-    elif data == 'cities_menu':
-        await show_cities_menu(update, context)
-    elif data == 'city_hightown' or data == 'market_menu':
-        await show_city_hightown(update, context)
-    elif data == 'city_silk':
-        await silk_ui.show_city_silk(update, context)
-    elif data == 'city_rostov':
-        await show_city_rostov(update, context)
-    elif data == 'city_powerlines':
-        await show_city_powerlines(update, context)
-    elif data == 'rostov_hub':
-        await show_rostov_hub(update, context)
-    elif data == 'power_sematori':
-        await show_power_sematori(update, context)
-    elif data == 'power_sematori_play':
-        await handle_power_sematori_play(update, context)
-    elif data.startswith('sematori_ans:'):
-        await handle_sematori_ans(update, context)
-    elif data == 'power_red_cores':
-        await show_power_red_cores(update, context)
-    elif data.startswith('power_red_cores_mine:'):
-        await handle_power_red_cores_mine(update, context)
-    elif data == 'power_red_cores_shop':
-        await show_power_red_cores_shop(update, context)
-    elif data.startswith('power_red_cores_exchange:'):
-        await handle_power_red_cores_exchange(update, context)
-    elif data == 'power_glasswool_field':
-        await show_power_glasswool_field(update, context)
-    elif data == 'power_persimmon':
-        await show_power_persimmon(update, context)
-    elif data == 'rostov_hub_my_selyuki':
-        await show_rostov_hub_my_selyuki(update, context)
-    elif data == 'rostov_hub_selyuki_on_sale':
-        await show_rostov_hub_selyuki_on_sale(update, context)
-    elif data == 'rostov_hub_sell_selyuk':
-        await show_rostov_hub_sell_selyuk(update, context)
-    elif data == 'selyuk_type_farmer':
-        await show_selyuk_type_farmer(update, context)
-    elif data == 'selyuk_type_silkmaker':
-        await show_selyuk_type_silkmaker(update, context)
-    elif data == 'selyuk_type_trickster':
-        await show_selyuk_type_trickster(update, context)
-    elif data == 'selyuk_type_buyer':
-        await show_selyuk_type_buyer(update, context)
-    elif data == 'selyuk_type_boss':
-        await show_selyuk_type_boss(update, context)
-    elif data == 'selyuk_buy_farmer':
-        await handle_selyuk_buy_farmer(update, context)
-    elif data == 'selyuk_farmer_manage':
-        await show_selyuk_farmer_manage(update, context)
-    elif data == 'selyuk_farmer_settings':
-        await show_selyuk_farmer_settings(update, context)
-    elif data == 'selyuk_farmer_set_autow':
-        await handle_selyuk_farmer_toggle_setting(update, context, 'farmer_auto_water')
-    elif data == 'selyuk_farmer_set_autoh':
-        await handle_selyuk_farmer_toggle_setting(update, context, 'farmer_auto_harvest')
-    elif data == 'selyuk_farmer_set_autop':
-        await handle_selyuk_farmer_toggle_setting(update, context, 'farmer_auto_plant')
-    elif data == 'selyuk_farmer_set_autof':
-        await handle_selyuk_farmer_toggle_setting(update, context, 'farmer_auto_fertilize')
-    elif data == 'selyuk_farmer_set_silent':
-        await handle_selyuk_farmer_toggle_setting(update, context, 'farmer_silent')
-    elif data == 'selyuk_farmer_set_summary':
-        await handle_selyuk_farmer_toggle_setting(update, context, 'farmer_summary_enabled')
-    elif data == 'selyuk_farmer_summary_interval':
-        await show_selyuk_farmer_summary_interval(update, context)
-    elif data.startswith('selyuk_farmer_set_sumint_'):
-        try:
-            sec = int(data.split('_')[-1])
-        except Exception:
-            sec = 3600
-        db.update_player(query.from_user.id, farmer_summary_interval_sec=max(300, sec))
-        await show_selyuk_farmer_settings(update, context)
-    elif data == 'selyuk_farmer_min_balance':
-        await show_selyuk_farmer_min_balance(update, context)
-    elif data.startswith('selyuk_farmer_set_minbal_'):
-        try:
-            v = int(data.split('_')[-1])
+                fpage = 1
+                item_id = int(parts[2])
+                page = int(parts[3][1:])
+                inventory_type = parts[4]
         except Exception:
-            v = 0
-        db.update_player(query.from_user.id, farmer_min_balance=max(0, v))
-        await show_selyuk_farmer_settings(update, context)
-    elif data == 'selyuk_farmer_daily_limit':
-        await show_selyuk_farmer_daily_limit(update, context)
-    elif data.startswith('selyuk_farmer_set_dlim_'):
-        try:
-            v = int(data.split('_')[-1])
-        except Exception:
-            v = 0
-        db.update_player(query.from_user.id, farmer_daily_limit=max(0, v))
-        await show_selyuk_farmer_settings(update, context)
-    elif data == 'selyuk_farmer_seed_settings':
-        await show_selyuk_farmer_seed_settings(update, context)
-    elif data == 'selyuk_farmer_seed_mode_any':
-        db.update_player(query.from_user.id, farmer_seed_mode='any')
-        await show_selyuk_farmer_seed_settings(update, context)
-    elif data == 'selyuk_farmer_seed_mode_whitelist':
-        db.update_player(query.from_user.id, farmer_seed_mode='whitelist')
-        await show_selyuk_farmer_seed_settings(update, context)
-    elif data == 'selyuk_farmer_seed_mode_blacklist':
-        db.update_player(query.from_user.id, farmer_seed_mode='blacklist')
-        await show_selyuk_farmer_seed_settings(update, context)
-    elif data.startswith('selyuk_farmer_seed_list_'):
-        try:
-            page = int(data.split('_')[-1])
-        except Exception:
-            page = 0
-        await show_selyuk_farmer_seed_list(update, context, page)
-    elif data.startswith('selyuk_farmer_seed_prio_'):
-        try:
-            page = int(data.split('_')[-1])
-        except Exception:
-            page = 0
-        await show_selyuk_farmer_seed_priority(update, context, page)
-    elif data.startswith('selyuk_farmer_seed_tgl_'):
-        # selyuk_farmer_seed_tgl_{seed_id}_{page}
+            await query.answer("Ошибка данных", show_alert=True)
+            return
+
+        await query.answer()
+
+        friends_res = db.list_friends(user_id, page=fpage-1, per_page=5)
+        friends = friends_res.get('items', [])
+        total_friends = friends_res.get('total', 0)
+
+        text = (
+            "<b>👥 Выберите друга для подарка</b>\n\n"
+            "Ниже показан список ваших друзей. Выберите получателя или введите @username вручную."
+            if lang == 'ru' else
+            "<b>👥 Choose friend to gift</b>\n\n"
+            "Below is your friends list. Select a recipient or enter @username manually."
+        )
+
+        rows = []
+        for f in friends:
+            f_id = f['user_id']
+            f_uname = f['username'] or f['display_name'] or str(f_id)
+            rows.append([
+                InlineKeyboardButton(
+                    f"👤 @{f_uname}" if f['username'] else f"👤 {f_uname}",
+                    callback_data=f"gift_inv_friend_{item_id}_{f_id}_p{page}_{inventory_type}"
+                )
+            ])
+
+        nav_row = []
+        total_pages = max(1, (total_friends + 4) // 5)
+        if total_pages > 1:
+            prev_fpage = total_pages if fpage == 1 else fpage - 1
+            next_fpage = 1 if fpage == total_pages else fpage + 1
+            nav_row.append(InlineKeyboardButton("⬅️", callback_data=f"gift_inv_fpage_{prev_fpage}_{item_id}_p{page}_{inventory_type}"))
+            nav_row.append(InlineKeyboardButton(f"{fpage}/{total_pages}", callback_data="noop"))
+            nav_row.append(InlineKeyboardButton("➡️", callback_data=f"gift_inv_fpage_{next_fpage}_{item_id}_p{page}_{inventory_type}"))
+            rows.append(nav_row)
+
+        rows.append([
+            InlineKeyboardButton(
+                "🔍 Ввести @username вручную" if lang == 'ru' else "🔍 Enter @username manually",
+                callback_data=f"gift_inv_username_{item_id}_p{page}_{inventory_type}"
+            )
+        ])
+        rows.append([
+            InlineKeyboardButton(
+                "🔙 Назад к карточке" if lang == 'ru' else "🔙 Back to card",
+                callback_data=f"view_{item_id}_{'rp' if inventory_type == 'receiver' else ('sp' if inventory_type == 'search' else 'p')}{page}"
+            )
+        ])
+
+        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(rows), parse_mode='HTML')
+
+
+async def _cb_fav_slot(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    query = update.callback_query
+    try:
+        slot = int(data.split('_')[-1])
+    except Exception:
+        slot = 0
+    if slot not in (1, 2, 3):
+        await query.answer('Ошибка', show_alert=True)
+        return
+
+    user_id = query.from_user.id
+    lock = _get_lock(f"favorites:{user_id}")
+    async with lock:
+        await show_favorites_pick_inventory_v2(update, context, slot=slot, page=1)
+
+
+async def _cb_fav_clear(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    query = update.callback_query
+    try:
+        slot = int(data.split('_')[-1])
+    except Exception:
+        slot = 0
+    if slot not in (1, 2, 3):
+        await query.answer('Ошибка', show_alert=True)
+        return
+    user_id = query.from_user.id
+    lock = _get_lock(f"favorites:{user_id}")
+    async with lock:
+        player = uctx.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
+        lang = getattr(player, 'language', 'ru') or 'ru'
+        res = db.clear_favorite_drink_slot(user_id, slot)
+        if not res or not res.get('ok'):
+            await query.answer('Ошибка' if lang == 'ru' else 'Error', show_alert=True)
+            return
+        await query.answer('✅ Слот очищен' if lang == 'ru' else '✅ Slot cleared')
+        await show_profile_favorites_v2(update, context)
+
+
+async def _cb_fav_search_start(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    query = update.callback_query
+    try:
+        slot = int(data.split('_')[-1])
+    except Exception:
+        slot = 0
+    if slot not in (1, 2, 3):
+        await query.answer('Ошибка', show_alert=True)
+        return
+    await start_favorites_search(update, context, slot=slot)
+
+
+async def _cb_fav_search_page(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    query = update.callback_query
+    try:
+        _, _, _, slot_str, page_str = data.split('_', 4)
+        slot = int(slot_str)
+        page = int(page_str)
+    except Exception:
+        await query.answer('Ошибка', show_alert=True)
+        return
+    search_query = str(context.user_data.get('favorites_last_search_query') or '').strip()
+    last_slot = int(context.user_data.get('favorites_last_search_slot') or 0)
+    if search_query and slot == last_slot:
+        await show_favorites_search_results(update, context, slot=slot, search_query=search_query, page=page)
+    else:
+        await show_favorites_pick_inventory_v2(update, context, slot=slot, page=1)
+
+
+async def _cb_fav_pick_page(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    query = update.callback_query
+    try:
+        _, _, _, slot_str, page_str = data.split('_', 4)
+        slot = int(slot_str)
+        page = int(page_str)
+    except Exception:
+        await query.answer('Ошибка', show_alert=True)
+        return
+    await show_favorites_pick_inventory_v2(update, context, slot=slot, page=page)
+
+
+async def _cb_fav_pick(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    query = update.callback_query
+    try:
+        # fav_pick_{slot}_{item_id}_p{page}
         parts = data.split('_')
-        try:
-            seed_id = int(parts[-2])
-            page = int(parts[-1])
-        except Exception:
-            seed_id = 0
-            page = 0
-        player = db.get_or_create_player(query.from_user.id, query.from_user.username or query.from_user.first_name)
-        seed_ids, prio_ids = _farmer_seed_lists_from_player(player)
-        if seed_id > 0:
-            if seed_id in set(seed_ids):
-                seed_ids = [x for x in seed_ids if x != seed_id]
-                prio_ids = [x for x in prio_ids if x != seed_id]
+        slot = int(parts[2])
+        item_id = int(parts[3])
+        page_part = parts[4] if len(parts) > 4 else 'p1'
+        page = int(str(page_part).lstrip('p') or 1)
+    except Exception:
+        await query.answer('Ошибка', show_alert=True)
+        return
+
+    user_id = query.from_user.id
+    lock = _get_lock(f"favorites:{user_id}")
+    async with lock:
+        player = uctx.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
+        lang = getattr(player, 'language', 'ru') or 'ru'
+        res = db.set_favorite_drink_slot(user_id, slot, item_id)
+        if not res or not res.get('ok'):
+            reason = (res or {}).get('reason')
+            if reason == 'forbidden':
+                msg = '❌ Это не ваш предмет.' if lang == 'ru' else "❌ This isn't your item."
+            elif reason == 'not_found':
+                msg = '❌ Предмет не найден.' if lang == 'ru' else '❌ Item not found.'
             else:
-                seed_ids.append(seed_id)
-        db.update_player(query.from_user.id, farmer_seed_ids=json.dumps(seed_ids), farmer_seed_priority=json.dumps(prio_ids))
-        await show_selyuk_farmer_seed_list(update, context, page)
-    elif data.startswith('selyuk_farmer_prio_add_'):
-        # selyuk_farmer_prio_add_{seed_id}_{page}
-        parts = data.split('_')
-        try:
-            seed_id = int(parts[-2])
-            page = int(parts[-1])
-        except Exception:
-            seed_id = 0
-            page = 0
-        player = db.get_or_create_player(query.from_user.id, query.from_user.username or query.from_user.first_name)
-        seed_ids, prio_ids = _farmer_seed_lists_from_player(player)
-        if seed_id > 0 and seed_id not in set(prio_ids):
-            prio_ids.append(seed_id)
-        if seed_id > 0 and seed_id not in set(seed_ids):
-            seed_ids.append(seed_id)
-        db.update_player(query.from_user.id, farmer_seed_ids=json.dumps(seed_ids), farmer_seed_priority=json.dumps(prio_ids))
-        await show_selyuk_farmer_seed_priority(update, context, page)
-    elif data.startswith('selyuk_farmer_prio_rm_'):
-        # selyuk_farmer_prio_rm_{seed_id}_{page}
-        parts = data.split('_')
-        try:
-            seed_id = int(parts[-2])
-            page = int(parts[-1])
-        except Exception:
-            seed_id = 0
-            page = 0
-        player = db.get_or_create_player(query.from_user.id, query.from_user.username or query.from_user.first_name)
-        seed_ids, prio_ids = _farmer_seed_lists_from_player(player)
-        if seed_id > 0:
+                msg = '❌ Ошибка.' if lang == 'ru' else '❌ Error.'
+            await query.answer(msg, show_alert=True)
+            await show_favorites_pick_inventory_v2(update, context, slot=slot, page=page)
+            return
+
+        await query.answer('✅ Сохранено' if lang == 'ru' else '✅ Saved')
+        await show_profile_favorites_v2(update, context)
+
+
+async def _cb_friends_add_search(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    # Backward-compat: если в старых сообщениях остались кнопки пагинации
+    q = context.user_data.get('friends_last_search_query') or ''
+    if q:
+        await friends_search_results(update, context, str(q), page=0)
+    else:
+        await friends_add_start(update, context)
+
+
+async def _cb_friends_add_pick(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    try:
+        uid = int(data.split(':', 1)[1])
+    except Exception:
+        uid = 0
+    if uid:
+        await friends_add_pick(update, context, uid)
+    else:
+        await query.answer('Ошибка', show_alert=True)
+
+
+async def _cb_friends_requests(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    try:
+        page = int(data.split('_')[-1])
+    except Exception:
+        page = 0
+    await friends_requests_menu(update, context, page=page)
+
+
+async def _cb_friends_outgoing(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    try:
+        page = int(data.split('_')[-1])
+    except Exception:
+        page = 0
+    await friends_outgoing_menu(update, context, page=page)
+
+
+async def _cb_friends_out_open(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    try:
+        rid = int(data.split(':', 1)[1])
+    except Exception:
+        rid = 0
+    if rid:
+        await friends_outgoing_open(update, context, rid)
+    else:
+        await query.answer('Ошибка', show_alert=True)
+
+
+async def _cb_friends_req_open(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    try:
+        rid = int(data.split(':', 1)[1])
+    except Exception:
+        rid = 0
+    if rid:
+        await friends_request_open(update, context, rid)
+    else:
+        await query.answer('Ошибка', show_alert=True)
+
+
+async def _cb_friends_req_accept(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    try:
+        rid = int(data.split(':', 1)[1])
+    except Exception:
+        rid = 0
+    if rid:
+        await friends_req_accept(update, context, rid)
+    else:
+        await query.answer('Ошибка', show_alert=True)
+
+
+async def _cb_friends_req_reject(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    try:
+        rid = int(data.split(':', 1)[1])
+    except Exception:
+        rid = 0
+    if rid:
+        await friends_req_reject(update, context, rid)
+    else:
+        await query.answer('Ошибка', show_alert=True)
+
+
+async def _cb_friends_req_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    try:
+        rid = int(data.split(':', 1)[1])
+    except Exception:
+        rid = 0
+    if rid:
+        await friends_req_cancel(update, context, rid)
+    else:
+        await query.answer('Ошибка', show_alert=True)
+
+
+async def _cb_friends_list(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    try:
+        page = int(data.split('_')[-1])
+    except Exception:
+        page = 0
+    await friends_list_menu(update, context, page=page)
+
+
+async def _cb_friends_open(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    try:
+        uid = int(data.split(':', 1)[1])
+    except Exception:
+        uid = 0
+    if uid:
+        await friends_open_menu(update, context, uid)
+    else:
+        await query.answer('Ошибка', show_alert=True)
+
+
+async def _cb_friends_remove_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    try:
+        uid = int(data.split(':', 1)[1])
+    except Exception:
+        uid = 0
+    if uid:
+        await friends_remove_confirm(update, context, uid)
+    else:
+        await query.answer('Ошибка', show_alert=True)
+
+
+async def _cb_friends_remove_do(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    try:
+        uid = int(data.split(':', 1)[1])
+    except Exception:
+        uid = 0
+    if uid:
+        await friends_remove_do(update, context, uid)
+    else:
+        await query.answer('Ошибка', show_alert=True)
+
+
+async def _cb_friends_give_coins(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    try:
+        uid = int(data.split(':', 1)[1])
+    except Exception:
+        uid = 0
+    if uid:
+        await friends_start_transfer(update, context, 'coins', uid)
+    else:
+        await query.answer('Ошибка', show_alert=True)
+
+
+async def _cb_friends_give_fragments(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    try:
+        uid = int(data.split(':', 1)[1])
+    except Exception:
+        uid = 0
+    if uid:
+        await friends_start_transfer(update, context, 'fragments', uid)
+    else:
+        await query.answer('Ошибка', show_alert=True)
+
+
+async def _cb_friends_give_rating(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    try:
+        uid = int(data.split(':', 1)[1])
+    except Exception:
+        uid = 0
+    if uid:
+        await friends_start_transfer(update, context, 'rating', uid)
+    else:
+        await query.answer('Ошибка', show_alert=True)
+
+
+async def _cb_friends_give_vip7(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    try:
+        uid = int(data.split(':', 1)[1])
+    except Exception:
+        uid = 0
+    if not uid:
+        await query.answer('Ошибка', show_alert=True)
+    else:
+        user = query.from_user
+        p = uctx.get_or_create_player(user.id, user.username or user.first_name)
+        lang = p.language
+        res = db.gift_vip_7d_to_friend(user.id, uid)
+        if not res or not res.get('ok'):
+            reason = (res or {}).get('reason')
+            if reason == 'sender_not_vip':
+                msg = "❌ Нужно иметь VIP для подарка." if lang == 'ru' else "❌ You need VIP to gift."
+            elif reason == 'sender_is_vip_plus':
+                msg = "❌ VIP+ не может дарить VIP." if lang == 'ru' else "❌ VIP+ can't gift VIP."
+            elif reason == 'cooldown':
+                msg = "❌ Подарок VIP доступен раз в 2 недели." if lang == 'ru' else "❌ VIP gift is available once per 2 weeks."
+            elif reason == 'not_friends':
+                msg = "❌ Этот игрок не у вас в друзьях." if lang == 'ru' else "❌ Not your friend."
+            else:
+                msg = "❌ Ошибка. Попробуйте позже." if lang == 'ru' else "❌ Error. Try later."
+            await query.answer(msg, show_alert=True)
+            await friends_open_menu(update, context, uid)
+        else:
+            await query.answer("✅ VIP подарен на 7 дней!" if lang == 'ru' else "✅ VIP gifted for 7 days!", show_alert=True)
+            try:
+                await context.bot.send_message(chat_id=uid, text="🎁 Вам подарили VIP на 7 дней!" if lang == 'ru' else "🎁 You received VIP for 7 days!")
+            except Exception:
+                pass
+            await friends_open_menu(update, context, uid)
+
+
+async def _cb_selyuk_farmer_set_autow(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    await handle_selyuk_farmer_toggle_setting(update, context, 'farmer_auto_water')
+
+
+async def _cb_selyuk_farmer_set_autoh(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    await handle_selyuk_farmer_toggle_setting(update, context, 'farmer_auto_harvest')
+
+
+async def _cb_selyuk_farmer_set_autop(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    await handle_selyuk_farmer_toggle_setting(update, context, 'farmer_auto_plant')
+
+
+async def _cb_selyuk_farmer_set_autof(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    await handle_selyuk_farmer_toggle_setting(update, context, 'farmer_auto_fertilize')
+
+
+async def _cb_selyuk_farmer_set_silent(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    await handle_selyuk_farmer_toggle_setting(update, context, 'farmer_silent')
+
+
+async def _cb_selyuk_farmer_set_summary(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    await handle_selyuk_farmer_toggle_setting(update, context, 'farmer_summary_enabled')
+
+
+async def _cb_selyuk_farmer_set_sumint(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    try:
+        sec = int(data.split('_')[-1])
+    except Exception:
+        sec = 3600
+    db.update_player(query.from_user.id, farmer_summary_interval_sec=max(300, sec))
+    await show_selyuk_farmer_settings(update, context)
+
+
+async def _cb_selyuk_farmer_set_minbal(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    try:
+        v = int(data.split('_')[-1])
+    except Exception:
+        v = 0
+    db.update_player(query.from_user.id, farmer_min_balance=max(0, v))
+    await show_selyuk_farmer_settings(update, context)
+
+
+async def _cb_selyuk_farmer_set_dlim(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    try:
+        v = int(data.split('_')[-1])
+    except Exception:
+        v = 0
+    db.update_player(query.from_user.id, farmer_daily_limit=max(0, v))
+    await show_selyuk_farmer_settings(update, context)
+
+
+async def _cb_selyuk_farmer_seed_mode_any(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    db.update_player(query.from_user.id, farmer_seed_mode='any')
+    await show_selyuk_farmer_seed_settings(update, context)
+
+
+async def _cb_selyuk_farmer_seed_mode_whitelist(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    db.update_player(query.from_user.id, farmer_seed_mode='whitelist')
+    await show_selyuk_farmer_seed_settings(update, context)
+
+
+async def _cb_selyuk_farmer_seed_mode_blacklist(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    db.update_player(query.from_user.id, farmer_seed_mode='blacklist')
+    await show_selyuk_farmer_seed_settings(update, context)
+
+
+async def _cb_selyuk_farmer_seed_list(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    try:
+        page = int(data.split('_')[-1])
+    except Exception:
+        page = 0
+    await show_selyuk_farmer_seed_list(update, context, page)
+
+
+async def _cb_selyuk_farmer_seed_prio(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    try:
+        page = int(data.split('_')[-1])
+    except Exception:
+        page = 0
+    await show_selyuk_farmer_seed_priority(update, context, page)
+
+
+async def _cb_selyuk_farmer_seed_tgl(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    # selyuk_farmer_seed_tgl_{seed_id}_{page}
+    parts = data.split('_')
+    try:
+        seed_id = int(parts[-2])
+        page = int(parts[-1])
+    except Exception:
+        seed_id = 0
+        page = 0
+    player = uctx.get_or_create_player(query.from_user.id, query.from_user.username or query.from_user.first_name)
+    seed_ids, prio_ids = _farmer_seed_lists_from_player(player)
+    if seed_id > 0:
+        if seed_id in set(seed_ids):
+            seed_ids = [x for x in seed_ids if x != seed_id]
             prio_ids = [x for x in prio_ids if x != seed_id]
-        db.update_player(query.from_user.id, farmer_seed_priority=json.dumps(prio_ids))
-        await show_selyuk_farmer_seed_priority(update, context, page)
-    elif data.startswith('selyuk_farmer_fert_prio_add_'):
-        parts = data.split('_')
-        try:
-            fert_id = int(parts[-2])
-            page = int(parts[-1])
-        except Exception:
-            fert_id = 0
-            page = 0
-        player = db.get_or_create_player(query.from_user.id, query.from_user.username or query.from_user.first_name)
-        prio_ids = _farmer_fert_priority_from_player(player)
-        if fert_id > 0 and fert_id not in set(prio_ids):
-            prio_ids.append(fert_id)
-        db.update_player(query.from_user.id, farmer_fert_priority=json.dumps(prio_ids))
-        await show_selyuk_farmer_fert_priority(update, context, page)
-    elif data.startswith('selyuk_farmer_fert_prio_rm_'):
-        parts = data.split('_')
-        try:
-            fert_id = int(parts[-2])
-            page = int(parts[-1])
-        except Exception:
-            fert_id = 0
-            page = 0
-        player = db.get_or_create_player(query.from_user.id, query.from_user.username or query.from_user.first_name)
-        prio_ids = _farmer_fert_priority_from_player(player)
-        if fert_id > 0:
-            prio_ids = [x for x in prio_ids if x != fert_id]
-        db.update_player(query.from_user.id, farmer_fert_priority=json.dumps(prio_ids))
-        await show_selyuk_farmer_fert_priority(update, context, page)
-    elif data.startswith('selyuk_farmer_fert_prio_'):
+        else:
+            seed_ids.append(seed_id)
+    db.update_player(query.from_user.id, farmer_seed_ids=json.dumps(seed_ids), farmer_seed_priority=json.dumps(prio_ids))
+    await show_selyuk_farmer_seed_list(update, context, page)
+
+
+async def _cb_selyuk_farmer_prio_add(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    # selyuk_farmer_prio_add_{seed_id}_{page}
+    parts = data.split('_')
+    try:
+        seed_id = int(parts[-2])
+        page = int(parts[-1])
+    except Exception:
+        seed_id = 0
+        page = 0
+    player = uctx.get_or_create_player(query.from_user.id, query.from_user.username or query.from_user.first_name)
+    seed_ids, prio_ids = _farmer_seed_lists_from_player(player)
+    if seed_id > 0 and seed_id not in set(prio_ids):
+        prio_ids.append(seed_id)
+    if seed_id > 0 and seed_id not in set(seed_ids):
+        seed_ids.append(seed_id)
+    db.update_player(query.from_user.id, farmer_seed_ids=json.dumps(seed_ids), farmer_seed_priority=json.dumps(prio_ids))
+    await show_selyuk_farmer_seed_priority(update, context, page)
+
+
+async def _cb_selyuk_farmer_prio_rm(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    # selyuk_farmer_prio_rm_{seed_id}_{page}
+    parts = data.split('_')
+    try:
+        seed_id = int(parts[-2])
+        page = int(parts[-1])
+    except Exception:
+        seed_id = 0
+        page = 0
+    player = uctx.get_or_create_player(query.from_user.id, query.from_user.username or query.from_user.first_name)
+    seed_ids, prio_ids = _farmer_seed_lists_from_player(player)
+    if seed_id > 0:
+        prio_ids = [x for x in prio_ids if x != seed_id]
+    db.update_player(query.from_user.id, farmer_seed_priority=json.dumps(prio_ids))
+    await show_selyuk_farmer_seed_priority(update, context, page)
+
+
+async def _cb_selyuk_farmer_fert_prio_add(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    parts = data.split('_')
+    try:
+        fert_id = int(parts[-2])
+        page = int(parts[-1])
+    except Exception:
+        fert_id = 0
+        page = 0
+    player = uctx.get_or_create_player(query.from_user.id, query.from_user.username or query.from_user.first_name)
+    prio_ids = _farmer_fert_priority_from_player(player)
+    if fert_id > 0 and fert_id not in set(prio_ids):
+        prio_ids.append(fert_id)
+    db.update_player(query.from_user.id, farmer_fert_priority=json.dumps(prio_ids))
+    await show_selyuk_farmer_fert_priority(update, context, page)
+
+
+async def _cb_selyuk_farmer_fert_prio_rm(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    parts = data.split('_')
+    try:
+        fert_id = int(parts[-2])
+        page = int(parts[-1])
+    except Exception:
+        fert_id = 0
+        page = 0
+    player = uctx.get_or_create_player(query.from_user.id, query.from_user.username or query.from_user.first_name)
+    prio_ids = _farmer_fert_priority_from_player(player)
+    if fert_id > 0:
+        prio_ids = [x for x in prio_ids if x != fert_id]
+    db.update_player(query.from_user.id, farmer_fert_priority=json.dumps(prio_ids))
+    await show_selyuk_farmer_fert_priority(update, context, page)
+
+
+async def _cb_selyuk_farmer_fert_prio(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    try:
+        page = int(data.split('_')[-1])
+    except Exception:
+        page = 0
+    await show_selyuk_farmer_fert_priority(update, context, page)
+
+
+async def _cb_selyuk_farmer_topup(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    try:
+        amt = int(data.split('_')[-1])
+        await handle_selyuk_farmer_topup(update, context, amt)
+    except Exception:
+        await update.callback_query.answer('Ошибка', show_alert=True)
+
+
+async def _cb_rostov_elite_buy(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    key = data.replace('rostov_elite_buy_', '', 1)
+    await handle_rostov_elite_buy(update, context, key)
+
+
+async def _cb_rostov_elite_boosters(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    await query.answer("⚙️ Раздел Магазина элиты в разработке!", show_alert=True)
+
+
+async def _cb_silk_plant(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    level = data.split('_')[-1]
+    await silk_ui.handle_silk_plant(update, context, level)
+
+
+async def _cb_silk_harvest(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    plantation_id = int(data.split('_')[-1])
+    await silk_ui.handle_silk_harvest(update, context, plantation_id)
+
+
+async def _cb_silk_sell(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    # silk_sell_{silk_type}_{quantity}
+    try:
+        _, _, silk_type, quantity_str = data.split('_')
+        await silk_ui.handle_silk_sell(update, context, silk_type, quantity_str)
+    except Exception:
+        await update.callback_query.answer('Ошибка', show_alert=True)
+
+
+async def _cb_silk_instant_grow(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    # silk_instant_grow_{plantation_id} or silk_instant_grow_all
+    if data == 'silk_instant_grow_all':
+        await silk_ui.handle_silk_instant_grow_all(update, context)
+    else:
         try:
-            page = int(data.split('_')[-1])
+            plantation_id = int(data.split('_')[-1])
+            await silk_ui.handle_silk_instant_grow(update, context, plantation_id)
         except Exception:
-            page = 0
-        await show_selyuk_farmer_fert_priority(update, context, page)
-    elif data == 'selyuk_farmer_toggle':
-        await handle_selyuk_farmer_toggle(update, context)
-    elif data == 'selyuk_farmer_howto':
-        await show_selyuk_farmer_howto(update, context)
-    elif data == 'selyuk_farmer_upgrade':
-        await show_selyuk_farmer_upgrade(update, context)
-    elif data == 'selyuk_farmer_sell':
-        await show_selyuk_farmer_sell(update, context)
-    elif data.startswith('selyuk_farmer_topup_'):
+            await update.callback_query.answer('Ошибка', show_alert=True)
+
+
+async def _cb_casino_module(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    await casino_module.handle_callback(update, context, data, get_bot_runtime())
+
+
+async def _cb_receiver_module(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    await receiver_module.handle_callback(update, context, data, get_bot_runtime())
+
+
+async def _cb_shop_buy(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    # shop_buy_{offerIndex}_p{page}
+    try:
+        _, _, idx, p = data.split('_')
+        page = int(p[1:]) if p.startswith('p') else 1
+        await handle_shop_buy(update, context, int(idx), int(page))
+    except Exception:
+        await update.callback_query.answer('Ошибка', show_alert=True)
+
+
+async def _cb_seed_coupon_shop_open(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    if data == 'seed_coupon_shop_open:boosts':
+        await open_seed_coupon_shop(update, context, origin='profile_boosts')
+    elif data.startswith('seed_coupon_shop_open:bed:'):
         try:
-            amt = int(data.split('_')[-1])
-            await handle_selyuk_farmer_topup(update, context, amt)
+            bed_index = int(data.split(':')[-1])
         except Exception:
-            await update.callback_query.answer('Ошибка', show_alert=True)
-    elif data == 'rostov_elite_shop':
-        await show_rostov_elite_shop(update, context)
-    elif data == 'rostov_elite_items':
-        await show_rostov_elite_items(update, context)
-    elif data.startswith('rostov_elite_buy_'):
-        key = data.replace('rostov_elite_buy_', '', 1)
-        await handle_rostov_elite_buy(update, context, key)
-    elif data in [
+            bed_index = 0
+        await open_seed_coupon_shop(update, context, origin='plantation_choose', bed_index=bed_index)
+    else:
+        await open_seed_coupon_shop(update, context, origin='market_plantation')
+
+
+async def _cb_seed_coupon_shop_page(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    try:
+        page = int(data.split(':', 1)[1])
+    except Exception:
+        page = 0
+    await show_seed_coupon_shop(update, context, page=page)
+
+
+async def _cb_seed_coupon_shop_clear(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    await show_seed_coupon_shop(update, context, page=0, search_query='')
+
+
+async def _cb_premium_shop_module(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    await premium_shop_module.handle_callback(update, context, data, get_bot_runtime())
+
+
+async def _cb_noop(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    query = update.callback_query
+    # Заглушка для неактивных кнопок (например, пагинации на крайних страницах)
+    await query.answer()
+
+
+async def _cb_user_settings_module(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    await user_settings_module.handle_callback(update, context, data, get_bot_runtime())
+
+
+def build_callback_router() -> CallbackRouter:
+    """Собирает таблицу маршрутов button_handler.
+
+    Порядок регистрации повторяет прежнюю цепочку if/elif: при пересечении
+    ключей выигрывает маршрут, добавленный раньше.
+    """
+    router = CallbackRouter(ADMIN_CALLBACK_LEVELS, ADMIN_CALLBACK_PREFIX_LEVELS)
+    router.module(ordinary_plantation, ordinary_plantation.handle_callback)
+    router.prefix('admin_player_selyuki:', admin_player_selyuki_show, pass_data=False)
+    router.exact('menu', show_menu)
+    router.module(swaga_module, swaga_module.handle_callback)
+    router.exact('creator_panel', show_creator_panel)
+    router.exact('admin_grants_menu', show_admin_grants_menu)
+    # creator_wipe / creator_wipe_confirm: обработчики вайпа не реализованы, кнопки ведут в никуда
+    router.exact('creator_reset_bonus', creator_reset_bonus_start)
+    router.exact('creator_give_coins', creator_give_coins_start)
+    router.exact('creator_user_stats', creator_user_stats_start)
+    router.exact('creator_admins', show_admins_panel)
+    router.exact('creator_admin_add', creator_admin_add_start)
+    router.exact('creator_admin_promote', creator_admin_promote_start)
+    router.exact('creator_admin_demote', creator_admin_demote_start)
+    router.exact('creator_admin_remove', creator_admin_remove_start)
+    router.exact('admin_bot_stats', show_bot_stats)
+    router.exact('admin_players_menu', show_admin_players_menu)
+    router.exact('admin_player_search', admin_player_search_start)
+    router.exact('admin_players_list', admin_players_list)
+    router.prefix('admin_players_list:', admin_players_list, pass_data=False)
+    router.exact('admin_players_top', admin_players_top)
+    router.prefix('admin_player_details:', show_player_details, pass_data=False)
+    router.prefix('admin_player_balance:', admin_player_balance_start, pass_data=False)
+    # admin_player_rating: обработчик изменения рейтинга не реализован
+    router.prefix('admin_player_vip:', admin_player_vip_menu, pass_data=False)
+    router.prefix('admin_player_vip_give:', _cb_admin_player_vip_give)
+    router.prefix('admin_player_vip_plus_give:', _cb_admin_player_vip_plus_give)
+    router.prefix('admin_player_vip_remove:', _cb_admin_player_vip_remove)
+    router.prefix('admin_player_vip_plus_remove:', _cb_admin_player_vip_plus_remove)
+    router.prefix('admin_player_logs:', admin_player_logs_show, pass_data=False)
+    router.prefix('admin_player_reset_bonus:', admin_player_reset_bonus_execute, pass_data=False)
+    router.exact('admin_vip_menu', show_admin_vip_menu)
+    router.exact('admin_stock_menu', _cb_admin_stock_menu, pass_data=True)
+    router.exact('admin_broadcast_menu', show_admin_broadcast_menu)
+    router.exact('admin_broadcast_start', admin_broadcast_start)
+    router.prefix('admin_broadcast_cancel:', admin_broadcast_cancel, pass_data=False)
+    router.exact('admin_vip_give', admin_vip_give_start)
+    router.exact('admin_vip_plus_give', admin_vip_plus_give_start)
+    router.exact('admin_vip_remove', admin_vip_remove_start)
+    router.exact('admin_vip_plus_remove', admin_vip_plus_remove_start)
+    router.exact('admin_vip_list', admin_vip_list_show)
+    # Новые разделы админ панели
+    router.exact('admin_analytics', show_admin_analytics)
+    router.exact('admin_analytics_export', export_admin_analytics)
+    router.exact('admin_drinks_menu', show_admin_drinks_menu)
+    router.exact('admin_economy_menu', show_admin_economy_menu)
+    router.exact('admin_events_menu', show_admin_events_menu)
+    # Управление энергетиками
+    router.exact('admin_drink_add', admin_drink_add_start)
+    router.exact('admin_drink_edit', admin_drink_edit_start)
+    router.exact('admin_drink_rename', admin_drink_rename_start)
+    router.exact('admin_drink_redesc', admin_drink_redesc_start)
+    router.exact('admin_drink_update_photo', admin_drink_update_photo_start)
+    router.exact('admin_drink_delete', admin_drink_delete_start)
+    router.exact('admin_drink_list', admin_drink_list_show_ids)
+    router.prefix('admin_drink_list_p', admin_drink_list_show, pass_data=False)
+    router.exact('admin_drink_search', admin_drink_search_start)
+    router.exact(('drink_confirm_rename', 'drink_cancel_rename'), _cb_drink_confirm_rename, pass_data=True)
+    router.exact(('drink_confirm_redesc', 'drink_cancel_redesc'), _cb_drink_confirm_redesc, pass_data=True)
+    router.exact(('drink_confirm_photo', 'drink_cancel_photo'), _cb_drink_confirm_photo, pass_data=True)
+    # Логи системы
+    router.exact((
+        'admin_settings_shop',
+        'admin_settings_notifications',
+        'admin_settings_localization',
+        'admin_econ_shop_prices',
+        'admin_econ_casino_bets',
+        'admin_econ_rewards',
+        'admin_econ_inflation',
+        'admin_econ_vip_prices',
+        'admin_econ_exchange',
+        'admin_event_create',
+        'admin_event_list_active',
+        'admin_event_list_all',
+        'admin_event_edit',
+        'admin_event_end',
+        'admin_event_stats',
+    ), _cb_admin_settings_shop, pass_data=True)
+    router.module(inventory_module, _cb_inventory_module)
+    router.exact('my_profile', show_my_profile)
+    router.exact('profile_stats', show_stats)
+    router.exact('profile_friends', show_profile_friends)
+    router.exact('profile_favorites', show_profile_favorites_v2)
+    router.exact('profile_favtrack', show_profile_favorite_track)
+    router.exact('favtrack_clear', _cb_favtrack_clear, pass_data=True)
+    router.prefix('favtrack_pick_page_', _cb_favtrack_pick_page)
+    router.prefix('favtrack_set_', _cb_favtrack_set)
+    router.prefix('fav_add_', _cb_fav_add)
+    router.prefix('fav_remove_', _cb_fav_remove)
+    router.prefix('fav_replace_', _cb_fav_replace)
+    router.prefix('gift_inv_', _cb_gift_inv)
+    router.prefix('fav_slot_', _cb_fav_slot)
+    router.prefix('fav_clear_', _cb_fav_clear)
+    router.prefix('fav_search_start_', _cb_fav_search_start)
+    router.prefix('fav_search_page_', _cb_fav_search_page)
+    router.prefix('fav_pick_page_', _cb_fav_pick_page)
+    router.prefix('fav_pick_', _cb_fav_pick)
+    router.exact('friends_add_start', friends_add_start)
+    router.prefix('friends_add_search:', _cb_friends_add_search)
+    router.prefix('friends_add_pick:', _cb_friends_add_pick)
+    router.prefix('friends_requests_', _cb_friends_requests)
+    router.prefix('friends_outgoing_', _cb_friends_outgoing)
+    router.prefix('friends_out_open:', _cb_friends_out_open)
+    router.prefix('friends_req_open:', _cb_friends_req_open)
+    router.prefix('friends_req_accept:', _cb_friends_req_accept)
+    router.prefix('friends_req_reject:', _cb_friends_req_reject)
+    router.prefix('friends_req_cancel:', _cb_friends_req_cancel)
+    router.prefix('friends_list_', _cb_friends_list)
+    router.prefix('friends_open:', _cb_friends_open)
+    router.prefix('friends_remove_confirm:', _cb_friends_remove_confirm)
+    router.prefix('friends_remove_do:', _cb_friends_remove_do)
+    router.prefix('friends_give_coins:', _cb_friends_give_coins)
+    router.prefix('friends_give_fragments:', _cb_friends_give_fragments)
+    router.prefix('friends_give_rating:', _cb_friends_give_rating)
+    router.prefix('friends_give_vip7:', _cb_friends_give_vip7)
+    router.exact('profile_boosts', show_profile_boosts)
+    router.exact('luck_coupon_auto_toggle', toggle_luck_coupon_auto_use)
+    router.exact('stats', show_stats)
+    router.exact('extra_bonuses', show_extra_bonuses)
+    router.exact('cities_menu', show_cities_menu)
+    router.exact(('city_hightown', 'market_menu'), show_city_hightown)
+    router.exact('city_silk', silk_ui.show_city_silk)
+    router.exact('city_rostov', show_city_rostov)
+    router.exact('city_powerlines', show_city_powerlines)
+    router.exact('rostov_hub', show_rostov_hub)
+    router.exact('power_sematori', show_power_sematori)
+    router.exact('power_sematori_play', handle_power_sematori_play)
+    router.prefix('sematori_ans:', handle_sematori_ans, pass_data=False)
+    router.exact('power_red_cores', show_power_red_cores)
+    router.prefix('power_red_cores_mine:', handle_power_red_cores_mine, pass_data=False)
+    router.exact('power_red_cores_shop', show_power_red_cores_shop)
+    router.prefix('power_red_cores_exchange:', handle_power_red_cores_exchange, pass_data=False)
+    router.exact('power_glasswool_field', show_power_glasswool_field)
+    router.exact('power_persimmon', show_power_persimmon)
+    router.exact('rostov_hub_my_selyuki', show_rostov_hub_my_selyuki)
+    router.exact('rostov_hub_selyuki_on_sale', show_rostov_hub_selyuki_on_sale)
+    router.exact('rostov_hub_sell_selyuk', show_rostov_hub_sell_selyuk)
+    router.exact('selyuk_type_farmer', show_selyuk_type_farmer)
+    router.exact('selyuk_type_silkmaker', show_selyuk_type_silkmaker)
+    router.exact('selyuk_type_trickster', show_selyuk_type_trickster)
+    router.exact('selyuk_type_buyer', show_selyuk_type_buyer)
+    router.exact('selyuk_type_boss', show_selyuk_type_boss)
+    router.exact('selyuk_buy_farmer', handle_selyuk_buy_farmer)
+    router.exact('selyuk_farmer_manage', show_selyuk_farmer_manage)
+    router.exact('selyuk_farmer_settings', show_selyuk_farmer_settings)
+    router.exact('selyuk_farmer_set_autow', _cb_selyuk_farmer_set_autow, pass_data=True)
+    router.exact('selyuk_farmer_set_autoh', _cb_selyuk_farmer_set_autoh, pass_data=True)
+    router.exact('selyuk_farmer_set_autop', _cb_selyuk_farmer_set_autop, pass_data=True)
+    router.exact('selyuk_farmer_set_autof', _cb_selyuk_farmer_set_autof, pass_data=True)
+    router.exact('selyuk_farmer_set_silent', _cb_selyuk_farmer_set_silent, pass_data=True)
+    router.exact('selyuk_farmer_set_summary', _cb_selyuk_farmer_set_summary, pass_data=True)
+    router.exact('selyuk_farmer_summary_interval', show_selyuk_farmer_summary_interval)
+    router.prefix('selyuk_farmer_set_sumint_', _cb_selyuk_farmer_set_sumint)
+    router.exact('selyuk_farmer_min_balance', show_selyuk_farmer_min_balance)
+    router.prefix('selyuk_farmer_set_minbal_', _cb_selyuk_farmer_set_minbal)
+    router.exact('selyuk_farmer_daily_limit', show_selyuk_farmer_daily_limit)
+    router.prefix('selyuk_farmer_set_dlim_', _cb_selyuk_farmer_set_dlim)
+    router.exact('selyuk_farmer_seed_settings', show_selyuk_farmer_seed_settings)
+    router.exact('selyuk_farmer_seed_mode_any', _cb_selyuk_farmer_seed_mode_any, pass_data=True)
+    router.exact('selyuk_farmer_seed_mode_whitelist', _cb_selyuk_farmer_seed_mode_whitelist, pass_data=True)
+    router.exact('selyuk_farmer_seed_mode_blacklist', _cb_selyuk_farmer_seed_mode_blacklist, pass_data=True)
+    router.prefix('selyuk_farmer_seed_list_', _cb_selyuk_farmer_seed_list)
+    router.prefix('selyuk_farmer_seed_prio_', _cb_selyuk_farmer_seed_prio)
+    router.prefix('selyuk_farmer_seed_tgl_', _cb_selyuk_farmer_seed_tgl)
+    router.prefix('selyuk_farmer_prio_add_', _cb_selyuk_farmer_prio_add)
+    router.prefix('selyuk_farmer_prio_rm_', _cb_selyuk_farmer_prio_rm)
+    router.prefix('selyuk_farmer_fert_prio_add_', _cb_selyuk_farmer_fert_prio_add)
+    router.prefix('selyuk_farmer_fert_prio_rm_', _cb_selyuk_farmer_fert_prio_rm)
+    router.prefix('selyuk_farmer_fert_prio_', _cb_selyuk_farmer_fert_prio)
+    router.exact('selyuk_farmer_toggle', handle_selyuk_farmer_toggle)
+    router.exact('selyuk_farmer_howto', show_selyuk_farmer_howto)
+    router.exact('selyuk_farmer_upgrade', show_selyuk_farmer_upgrade)
+    router.exact('selyuk_farmer_sell', show_selyuk_farmer_sell)
+    router.prefix('selyuk_farmer_topup_', _cb_selyuk_farmer_topup)
+    router.exact('rostov_elite_shop', show_rostov_elite_shop)
+    router.exact('rostov_elite_items', show_rostov_elite_items)
+    router.prefix('rostov_elite_buy_', _cb_rostov_elite_buy)
+    router.exact((
         'rostov_elite_boosters',
         'rostov_elite_themes',
         'rostov_elite_titles',
         'rostov_elite_collectibles',
         'rostov_elite_battlepass',
         'rostov_elite_cards',
-    ]:
-        await query.answer("⚙️ Раздел Магазина элиты в разработке!", show_alert=True)
-    elif data == 'rostov_exchange':
-        await show_rostov_exchange(update, context)
-    elif data == 'rostov_exchange_sept_to_currency':
-        await show_rostov_exchange_sept_to_currency(update, context)
-    elif data == 'rostov_exchange_sept_to_resources':
-        await show_rostov_exchange_sept_to_resources(update, context)
-    elif data == 'rostov_exchange_sept_to_cards':
-        await show_rostov_exchange_sept_to_cards(update, context)
-    elif data == 'rostov_exchange_convert_resources':
-        await show_rostov_exchange_convert_resources(update, context)
-    elif data == 'rostov_exchange_resource_rates':
-        await show_rostov_exchange_resource_rates(update, context)
-    elif data == 'rostov_exchange_daily_deals':
-        await show_rostov_exchange_daily_deals(update, context)
-    elif data == 'rostov_exchange_bonuses':
-        await show_rostov_exchange_bonuses(update, context)
-    elif data == 'rostov_exchange_history':
-        await show_rostov_exchange_history(update, context)
-    elif data == 'silk_plantations':
-        await silk_ui.show_silk_plantations(update, context)
-    elif data == 'silk_market':
-        await silk_ui.show_silk_market(update, context)
-    elif data == 'silk_inventory':
-        await silk_ui.show_silk_inventory(update, context)
-    elif data == 'silk_stats':
-        await silk_ui.show_silk_stats(update, context)
-    elif data == 'silk_create_plantation':
-        await silk_ui.show_silk_create_plantation(update, context)
-    elif data.startswith('silk_plant_'):
-        level = data.split('_')[-1]
-        await silk_ui.handle_silk_plant(update, context, level)
-    elif data.startswith('silk_harvest_'):
-        plantation_id = int(data.split('_')[-1])
-        await silk_ui.handle_silk_harvest(update, context, plantation_id)
-    elif data.startswith('silk_sell_'):
-        # silk_sell_{silk_type}_{quantity}
-        try:
-            _, _, silk_type, quantity_str = data.split('_')
-            await silk_ui.handle_silk_sell(update, context, silk_type, quantity_str)
-        except Exception:
-            await update.callback_query.answer('Ошибка', show_alert=True)
-    elif data.startswith('silk_instant_grow_'):
-        # silk_instant_grow_{plantation_id} or silk_instant_grow_all
-        if data == 'silk_instant_grow_all':
-            await silk_ui.handle_silk_instant_grow_all(update, context)
-        else:
-            try:
-                plantation_id = int(data.split('_')[-1])
-                await silk_ui.handle_silk_instant_grow(update, context, plantation_id)
-            except Exception:
-                await update.callback_query.answer('Ошибка', show_alert=True)
-    elif casino_module.can_handle_callback(data):
-        await casino_module.handle_callback(update, context, data, get_bot_runtime())
-    elif data == 'market_shop':
-        await show_market_shop(update, context)
-    elif receiver_module.can_handle_callback(data):
-        await receiver_module.handle_callback(update, context, data, get_bot_runtime())
-    elif data.startswith('shop_p_'):
-        await show_market_shop(update, context)
-    elif data.startswith('shop_buy_'):
-        # shop_buy_{offerIndex}_p{page}
-        try:
-            _, _, idx, p = data.split('_')
-            page = int(p[1:]) if p.startswith('p') else 1
-            await handle_shop_buy(update, context, int(idx), int(page))
-        except Exception:
-            await update.callback_query.answer('Ошибка', show_alert=True)
-    elif data.startswith('seed_coupon_shop_open:'):
-        if data == 'seed_coupon_shop_open:boosts':
-            await open_seed_coupon_shop(update, context, origin='profile_boosts')
-        elif data.startswith('seed_coupon_shop_open:bed:'):
-            try:
-                bed_index = int(data.split(':')[-1])
-            except Exception:
-                bed_index = 0
-            await open_seed_coupon_shop(update, context, origin='plantation_choose', bed_index=bed_index)
-        else:
-            await open_seed_coupon_shop(update, context, origin='market_plantation')
-    elif data.startswith('seed_coupon_shop_page:'):
-        try:
-            page = int(data.split(':', 1)[1])
-        except Exception:
-            page = 0
-        await show_seed_coupon_shop(update, context, page=page)
-    elif data == 'seed_coupon_shop_search':
-        await seed_coupon_shop_search_start(update, context)
-    elif data == 'seed_coupon_shop_clear':
-        await show_seed_coupon_shop(update, context, page=0, search_query='')
-    elif data == 'seed_coupon_shop_close':
-        await close_seed_coupon_shop(update, context)
-    elif premium_shop_module.can_handle_callback(data):
-        await premium_shop_module.handle_callback(update, context, data, get_bot_runtime())
-    elif data == 'noop':
-        # Заглушка для неактивных кнопок (например, пагинации на крайних страницах)
+    ), _cb_rostov_elite_boosters, pass_data=True)
+    router.exact('rostov_exchange', show_rostov_exchange)
+    router.exact('rostov_exchange_sept_to_currency', show_rostov_exchange_sept_to_currency)
+    router.exact('rostov_exchange_sept_to_resources', show_rostov_exchange_sept_to_resources)
+    router.exact('rostov_exchange_sept_to_cards', show_rostov_exchange_sept_to_cards)
+    router.exact('rostov_exchange_convert_resources', show_rostov_exchange_convert_resources)
+    router.exact('rostov_exchange_resource_rates', show_rostov_exchange_resource_rates)
+    router.exact('rostov_exchange_daily_deals', show_rostov_exchange_daily_deals)
+    router.exact('rostov_exchange_bonuses', show_rostov_exchange_bonuses)
+    router.exact('rostov_exchange_history', show_rostov_exchange_history)
+    router.exact('silk_plantations', silk_ui.show_silk_plantations)
+    router.exact('silk_market', silk_ui.show_silk_market)
+    router.exact('silk_inventory', silk_ui.show_silk_inventory)
+    router.exact('silk_stats', silk_ui.show_silk_stats)
+    router.exact('silk_create_plantation', silk_ui.show_silk_create_plantation)
+    router.prefix('silk_plant_', _cb_silk_plant)
+    router.prefix('silk_harvest_', _cb_silk_harvest)
+    router.prefix('silk_sell_', _cb_silk_sell)
+    router.prefix('silk_instant_grow_', _cb_silk_instant_grow)
+    router.module(casino_module, _cb_casino_module)
+    router.exact('market_shop', show_market_shop)
+    router.module(receiver_module, _cb_receiver_module)
+    router.prefix('shop_p_', show_market_shop, pass_data=False)
+    router.prefix('shop_buy_', _cb_shop_buy)
+    router.prefix('seed_coupon_shop_open:', _cb_seed_coupon_shop_open)
+    router.prefix('seed_coupon_shop_page:', _cb_seed_coupon_shop_page)
+    router.exact('seed_coupon_shop_search', seed_coupon_shop_search_start)
+    router.exact('seed_coupon_shop_clear', _cb_seed_coupon_shop_clear, pass_data=True)
+    router.exact('seed_coupon_shop_close', close_seed_coupon_shop)
+    router.module(premium_shop_module, _cb_premium_shop_module)
+    router.exact('noop', _cb_noop, pass_data=True)
+    router.prefix('approve_', approve_pending, pass_data=False)
+    router.prefix('reject_', reject_pending, pass_data=False)
+    router.prefix('delapprove_', approve_pending_deletion, pass_data=False)
+    router.prefix('delreject_', reject_pending_deletion, pass_data=False)
+    router.prefix('editapprove_', approve_pending_edit, pass_data=False)
+    router.prefix('editreject_', reject_pending_edit, pass_data=False)
+    router.module(user_settings_module, _cb_user_settings_module)
+    return router
+
+
+_CALLBACK_ROUTER: CallbackRouter | None = None
+
+
+def get_callback_router() -> CallbackRouter:
+    global _CALLBACK_ROUTER
+    if _CALLBACK_ROUTER is None:
+        router = build_callback_router()
+        for name, key in router.shadowed:
+            logger.warning("[CALLBACKS] Route %s for %r is shadowed by an earlier route", name, key)
+        _CALLBACK_ROUTER = router
+    return _CALLBACK_ROUTER
+
+
+async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обрабатывает все нажатия на inline-кнопки."""
+    if await abort_if_banned(update, context):
+        return
+    # Регистрируем группу, если нажатие было в группе
+    try:
+        await register_group_if_needed(update)
+    except Exception:
+        pass
+    query = update.callback_query
+    if not query:
+        return
+
+    try:
+        u = query.from_user
+        if u:
+            await adb.call(uctx.get_or_create_player, u.id, username=getattr(u, 'username', None), display_name=(getattr(u, 'full_name', None) or getattr(u, 'first_name', None)))
+    except Exception:
+        pass
+    
+    data = query.data
+    
+    # Чтобы не падало, если кнопка без данных
+    if not data:
         await query.answer()
-    elif data.startswith('approve_'):
-        await approve_pending(update, context)
-    elif data.startswith('reject_'):
-        await reject_pending(update, context)
-    elif data.startswith('delapprove_'):
-        await approve_pending_deletion(update, context)
-    elif data.startswith('delreject_'):
-        await reject_pending_deletion(update, context)
-    elif data.startswith('editapprove_'):
-        await approve_pending_edit(update, context)
-    elif data.startswith('editreject_'):
-        await reject_pending_edit(update, context)
-    elif user_settings_module.can_handle_callback(data):
-        await user_settings_module.handle_callback(update, context, data, get_bot_runtime())
+        return
+
+    # VULN-006 fix: защита персональных callback'ов в групповых чатах.
+    # Если сообщение отправлено в группе и callback является "персональным"
+    # (инвентарь, профиль, поиск, избранное, казино и т.д.), проверяем
+    # что кнопку нажал тот же пользователь, которому предназначено сообщение.
+    if (query.message
+        and query.message.chat
+        and query.message.chat.type != 'private'
+        and data.startswith(_PERSONAL_CALLBACK_PREFIXES)):
+        # В группе: проверяем что reply_to или from_user совпадает
+        original_msg = query.message
+        # Бот отправил сообщение конкретному пользователю (reply_to_message)
+        original_user_id = None
+        if original_msg.reply_to_message and original_msg.reply_to_message.from_user:
+            original_user_id = original_msg.reply_to_message.from_user.id
+        
+        if original_user_id and original_user_id != query.from_user.id:
+            await query.answer("⛔ Это не ваша кнопка!", show_alert=True)
+            return
+
+    route, required_level = get_callback_router().resolve(data)
+
+    # Централизованная проверка прав для админских callback'ов по матрице.
+    if required_level is not None:
+        actor = query.from_user
+        if not has_admin_level(actor.id, actor.username, required_level):
+            msg = "⛔ Доступ только для Создателя." if required_level >= 99 else "⛔ Недостаточный уровень доступа."
+            await query.answer(msg, show_alert=True)
+            return
+
+    if route is not None:
+        await route(update, context, data)
 async def group_register_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Регистрирует группу при любом групповом сообщении/команде."""
     try:
@@ -19121,7 +18999,7 @@ async def send_auto_delete_message(context: ContextTypes.DEFAULT_TYPE, chat_id:
         sent_message = await context.bot.send_message(chat_id=chat_id, text=text, **kwargs)
         
         # Проверяем, является ли это групповым чатом и включено ли автоудаление
-        settings = db.get_group_settings(chat_id)
+        settings = await adb.get_group_settings(chat_id)
         if settings.get('auto_delete_enabled', False):
             delay = settings.get('auto_delete_delay_minutes', 5)
             await schedule_auto_delete_message(context, chat_id, sent_message.message_id, delay)
@@ -19140,7 +19018,7 @@ async def reply_auto_delete_message(message, text: str, context: ContextTypes.DE
         if context:
             # Проверяем, является ли это групповым чатом и включено ли автоудаление
             chat_id = message.chat_id
-            settings = db.get_group_settings(chat_id)
+            settings = await adb.get_group_settings(chat_id)
             if settings.get('auto_delete_enabled', False):
                 delay = settings.get('auto_delete_delay_minutes', 5)
                 await schedule_auto_delete_message(context, chat_id, sent_message.message_id, delay)
@@ -19152,153 +19030,34 @@ async def reply_auto_delete_message(message, text: str, context: ContextTypes.DE
 
 
 async def schedule_auto_delete_message(context: ContextTypes.DEFAULT_TYPE, chat_id: int, message_id: int, delay_minutes: int = 5):
-    """Планирует автоудаление сообщения, если в группе включено автоудаление."""
+    """Планирует автоудаление сообщения, если в группе включено автоудаление.
+
+    Задача только записывается в scheduled_auto_deletes — удаляет её auto_delete_sweep_job.
+    """
     try:
-        # Проверяем, включено ли автоудаление в этой группе
-        settings = db.get_group_settings(chat_id)
+        # Проверяем, включено ли автоудаление в этой группе (настройки из кэша)
+        settings = await adb.get_group_settings(chat_id)
         if not settings.get('auto_delete_enabled', False):
             return
         
-        # Вычисляем время удаления
         delete_at = int(time.time()) + (delay_minutes * 60)
-        
-        # Сохраняем задачу в БД для восстановления после перезапуска
-        scheduled_id = db.save_scheduled_auto_delete(chat_id, message_id, delete_at)
-        
-        # Планируем задачу удаления
-        job_name = f"auto_delete_{chat_id}_{message_id}"
-        context.application.job_queue.run_once(
-            auto_delete_message_job,
-            when=delay_minutes * 60,  # Преобразуем минуты в секунды
-            data={'chat_id': chat_id, 'message_id': message_id, 'scheduled_id': scheduled_id},
-            name=job_name
-        )
-        
-        # Сохраняем ссылку на сообщение в глобальном словаре
-        AUTO_DELETE_MESSAGES[job_name] = {
-            'chat_id': chat_id,
-            'message_id': message_id,
-            'scheduled_at': time.time(),
-            'scheduled_id': scheduled_id
-        }
-        
-        logger.info(f"[AUTO_DELETE] Scheduled deletion for message {message_id} in chat {chat_id} in {delay_minutes} minutes (DB ID: {scheduled_id})")
+        scheduled_id = await adb.save_scheduled_auto_delete(chat_id, message_id, delete_at)
+        logger.debug(f"[AUTO_DELETE] Scheduled deletion for message {message_id} in chat {chat_id} in {delay_minutes} minutes (DB ID: {scheduled_id})")
     except Exception as e:
         logger.warning(f"[AUTO_DELETE] Failed to schedule auto-delete for message {message_id} in chat {chat_id}: {e}")
 
 
-async def auto_delete_message_job(context: ContextTypes.DEFAULT_TYPE):
-    """Задача для автоудаления сообщения."""
-    try:
-        job_data = context.job.data
-        chat_id = job_data['chat_id']
-        message_id = job_data['message_id']
-        scheduled_id = job_data.get('scheduled_id')
-        
-        # Проверяем, что автоудаление всё ещё включено
-        settings = db.get_group_settings(chat_id)
-        if not settings.get('auto_delete_enabled', False):
-            logger.info(f"[AUTO_DELETE] Auto-delete disabled for chat {chat_id}, skipping message {message_id}")
-            # Удаляем из БД даже если автоудаление выключено
-            if scheduled_id:
-                db.delete_scheduled_auto_delete(scheduled_id)
-            return
-        
-        # Пытаемся удалить сообщение
-        try:
-            await context.bot.delete_message(chat_id=chat_id, message_id=message_id)
-            logger.info(f"[AUTO_DELETE] Successfully deleted message {message_id} from chat {chat_id}")
-        except BadRequest as e:
-            if "Message to delete not found" in str(e):
-                logger.info(f"[AUTO_DELETE] Message {message_id} in chat {chat_id} already deleted")
-            else:
-                logger.warning(f"[AUTO_DELETE] Failed to delete message {message_id} from chat {chat_id}: {e}")
-        except Exception as e:
-            logger.warning(f"[AUTO_DELETE] Error deleting message {message_id} from chat {chat_id}: {e}")
-        
-        # Удаляем запись из БД после выполнения
-        if scheduled_id:
-            db.delete_scheduled_auto_delete(scheduled_id)
-            logger.debug(f"[AUTO_DELETE] Removed scheduled task {scheduled_id} from database")
-        
-    except Exception as e:
-        logger.error(f"[AUTO_DELETE] Error in auto_delete_message_job: {e}")
-    finally:
-        # Удаляем запись из словаря
-        job_name = context.job.name
-        if job_name and job_name in AUTO_DELETE_MESSAGES:
-            del AUTO_DELETE_MESSAGES[job_name]
-
-
-async def restore_scheduled_auto_deletes(application):
-    """Восстанавливает запланированные задачи автоудаления из БД при запуске бота."""
+async def auto_delete_sweep_job(context: ContextTypes.DEFAULT_TYPE):
+    """JobQueue: единый проход автоудаления — удаляет сообщения, у которых подошёл срок."""
     try:
-        logger.info("[AUTO_DELETE] Restoring scheduled auto-delete tasks from database...")
-        
-        # Получаем все запланированные задачи
-        scheduled_tasks = db.get_all_scheduled_auto_deletes()
-        
-        if not scheduled_tasks:
-            logger.info("[AUTO_DELETE] No scheduled tasks to restore")
-            return
-        
-        current_time = int(time.time())
-        restored_count = 0
-        expired_count = 0
-        
-        for scheduled_id, chat_id, message_id, delete_at in scheduled_tasks:
-            # Проверяем, не истекло ли время удаления
-            if delete_at <= current_time:
-                # Время удаления уже прошло - удаляем сразу
-                try:
-                    await application.bot.delete_message(chat_id=chat_id, message_id=message_id)
-                    logger.info(f"[AUTO_DELETE] Deleted expired message {message_id} from chat {chat_id}")
-                except Exception as e:
-                    logger.debug(f"[AUTO_DELETE] Could not delete expired message {message_id}: {e}")
-                
-                # Удаляем из БД
-                db.delete_scheduled_auto_delete(scheduled_id)
-                expired_count += 1
-            else:
-                # Задача еще актуальна - восстанавливаем
-                delay_seconds = delete_at - current_time
-                
-                # Проверяем, включено ли автоудаление в группе
-                settings = db.get_group_settings(chat_id)
-                if not settings.get('auto_delete_enabled', False):
-                    # Автоудаление выключено - удаляем задачу
-                    db.delete_scheduled_auto_delete(scheduled_id)
-                    logger.debug(f"[AUTO_DELETE] Skipped task {scheduled_id} - auto-delete disabled for chat {chat_id}")
-                    continue
-                
-                # Планируем задачу
-                job_name = f"auto_delete_{chat_id}_{message_id}"
-                application.job_queue.run_once(
-                    auto_delete_message_job,
-                    when=delay_seconds,
-                    data={'chat_id': chat_id, 'message_id': message_id, 'scheduled_id': scheduled_id},
-                    name=job_name
-                )
-                
-                AUTO_DELETE_MESSAGES[job_name] = {
-                    'chat_id': chat_id,
-                    'message_id': message_id,
-                    'scheduled_at': time.time(),
-                    'scheduled_id': scheduled_id
-                }
-                
-                restored_count += 1
-                logger.debug(f"[AUTO_DELETE] Restored task {scheduled_id} for message {message_id} (delete in {delay_seconds}s)")
-        
-        logger.info(f"[AUTO_DELETE] Restored {restored_count} tasks, processed {expired_count} expired tasks")
-        
-        # Очистка устаревших записей (старше 24 часов)
-        db.cleanup_old_scheduled_deletes()
-        
-    except Exception as e:
-        logger.error(f"[AUTO_DELETE] Error restoring scheduled tasks: {e}")
-        import traceback
-        traceback.print_exc()
+        stats = await auto_delete_sweeper.sweep(context.bot)
+        if stats['deleted'] or stats['failed'] or stats['kept']:
+            logger.info(
+                "[AUTO_DELETE] Sweep: deleted=%s failed=%s skipped=%s kept=%s",
+                stats['deleted'], stats['failed'], stats['skipped'], stats['kept'],
+            )
+    except Exception:
+        logger.exception("[AUTO_DELETE] Ошибка в проходе автоудаления")
 
 
 async def groupsettings_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -19357,7 +19116,7 @@ async def add_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     is_admin = db.is_admin(user.id) or (user.username in ADMIN_USERNAMES)
     if not is_admin:
         try:
-            player = db.get_or_create_player(user.id, user.username or "")
+            player = uctx.get_or_create_player(user.id, user.username or "")
             now = int(time.time())
             cooldown = 6 * 60 * 60  # 6 часов
             last_add = getattr(player, 'last_add', 0) or 0
@@ -19862,7 +19621,7 @@ async def addcoins_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Логируем транзакцию
     try:
-        target_player = db.get_or_create_player(target_id, target_username or str(target_id))
+        target_player = uctx.get_or_create_player(target_id, target_username or str(target_id))
         db.log_action(
             user_id=target_id,
             username=getattr(target_player, 'username', None) or target_username or str(target_id),
@@ -19967,7 +19726,7 @@ async def delmoney_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Логируем транзакцию
     try:
-        target_player = db.get_or_create_player(target_id, target_username or str(target_id))
+        target_player = uctx.get_or_create_player(target_id, target_username or str(target_id))
         removed_amount = result.get('removed_amount', amount)
         db.log_action(
             user_id=target_id,
@@ -20012,7 +19771,7 @@ async def show_settings(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
 
     user_id = query.from_user.id
-    player = db.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
+    player = uctx.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
     access = _get_access_profile(query.from_user, player=player)
 
     lang = player.language
@@ -20105,7 +19864,7 @@ async def show_settings_quick_access(update: Update, context: ContextTypes.DEFAU
     query = update.callback_query
     await query.answer()
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     access = _get_access_profile(user, player=player)
     lang = player.language
     if not access.get('quick_access_eligible'):
@@ -20138,7 +19897,7 @@ async def set_quick_access_target(update: Update, context: ContextTypes.DEFAULT_
     query = update.callback_query
     await query.answer()
     user = query.from_user
-    player = db.get_or_create_player(user.id, user.username or user.first_name)
+    player = uctx.get_or_create_player(user.id, user.username or user.first_name)
     access = _get_access_profile(user, player=player)
     lang = player.language
     if not access.get('quick_access_eligible'):
@@ -20157,7 +19916,7 @@ async def settings_lang_menu(update: Update, context: ContextTypes.DEFAULT_TYPE)
     query = update.callback_query
     await query.answer()
 
-    player = db.get_or_create_player(query.from_user.id, query.from_user.username or query.from_user.first_name)
+    player = uctx.get_or_create_player(query.from_user.id, query.from_user.username or query.from_user.first_name)
     lang = player.language
     keyboard = [
         [InlineKeyboardButton("Русский", callback_data='lang_ru'), InlineKeyboardButton("English", callback_data='lang_en')],
@@ -20178,7 +19937,7 @@ async def toggle_reminder(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
 
-    player = db.get_or_create_player(query.from_user.id, query.from_user.username or query.from_user.first_name)
+    player = uctx.get_or_create_player(query.from_user.id, query.from_user.username or query.from_user.first_name)
     new_state = not player.remind
     db.update_player(player.user_id, remind=new_state)
     await query.answer("Изменено" , show_alert=True)
@@ -20186,95 +19945,27 @@ async def toggle_reminder(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     await show_settings(update, context)
 
-async def restore_plantation_reminders(application):
-    """Восстанавливает напоминания о поливе после рестарта."""
-    try:
-        active_beds = db.get_all_active_beds_for_reminders()
-        count = 0
-        now_ts = int(time.time())
-        
-        for bed in active_beds:
-            user_id = bed['user_id']
-            bed_index = bed['bed_index']
-            next_water_ts = bed['next_water_ts']
-            
-            # Вычисляем задержку
-            delay = next_water_ts - now_ts
-            # Если время уже прошло, ставим небольшую задержку, чтобы сработало сразу
-            if delay < 0:
-                delay = 1
-            
-            try:
-                # Удаляем старые на всякий случай
-                jobs = application.job_queue.get_jobs_by_name(f"plantation_water_reminder_{user_id}_{bed_index}")
-                for j in jobs:
-                    j.schedule_removal()
-                
-                application.job_queue.run_once(
-                    plantation_water_reminder_job,
-                    when=delay,
-                    chat_id=user_id,
-                    data={'bed_index': bed_index},
-                    name=f"plantation_water_reminder_{user_id}_{bed_index}",
-                )
-                count += 1
-            except Exception as e:
-                logger.warning(f"[PLANTATION] Failed to restore reminder for user {user_id} bed {bed_index}: {e}")
-                
-        if count > 0:
-            logger.info(f"[PLANTATION] Restored {count} watering reminders")
-            
-    except Exception as e:
-        logger.error(f"[PLANTATION] Error restoring reminders: {e}")
-
 async def toggle_plantation_reminder(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
 
-    player = db.get_or_create_player(query.from_user.id, query.from_user.username or query.from_user.first_name)
+    player = uctx.get_or_create_player(query.from_user.id, query.from_user.username or query.from_user.first_name)
     new_state = not getattr(player, 'remind_plantation', False)
     db.update_player(player.user_id, remind_plantation=new_state)
     
     # Smart Toggle Logic
     user_id = player.user_id
     if new_state:
-        # Включили: нужно найти все растущие грядки и запланировать напоминания
+        # Включили: ставим напоминания для всех растущих грядок игрока (один запрос)
         try:
-            # Получаем активные грядки и фильтруем по текущему пользователю
-            active_beds = db.get_all_active_beds_for_reminders()
-            my_beds = [b for b in active_beds if b['user_id'] == user_id]
-            
-            now_ts = int(time.time())
-            for bed in my_beds:
-                bed_index = bed['bed_index']
-                next_water_ts = bed['next_water_ts']
-                delay = max(1, next_water_ts - now_ts)
-                
-                context.application.job_queue.run_once(
-                    plantation_water_reminder_job,
-                    when=delay,
-                    chat_id=user_id,
-                    data={'bed_index': bed_index},
-                    name=f"plantation_water_reminder_{user_id}_{bed_index}",
-                )
-            logger.info(f"[PLANTATION] Enabled reminders for user {user_id}, scheduled {len(my_beds)} jobs")
-            
+            scheduled = await adb.call(plantation_reminders.restore, user_id)
+            logger.info(f"[PLANTATION] Enabled reminders for user {user_id}, scheduled {scheduled} beds")
         except Exception as e:
             logger.error(f"[PLANTATION] Error scheduling reminders on toggle: {e}")
-            
     else:
-        # Выключили: найти и удалить все задачи напоминаний для этого юзера
-        try:
-            # Мы не знаем индексы грядок наверняка без запроса, но можем попробовать удалить по маске имени?
-            # job_queue не поддерживает удаление по маске.
-            # Придется перебрать возможные индексы (например 1..10)
-            for i in range(1, 20):
-                jobs = context.application.job_queue.get_jobs_by_name(f"plantation_water_reminder_{user_id}_{i}")
-                for j in jobs:
-                    j.schedule_removal()
-            logger.info(f"[PLANTATION] Disabled reminders for user {user_id}, cancelled jobs")
-        except Exception as e:
-            logger.error(f"[PLANTATION] Error cancelling reminders on toggle: {e}")
+        # Выключили: снимаем напоминания всех грядок игрока
+        cancelled = plantation_reminders.cancel_user(user_id)
+        logger.info(f"[PLANTATION] Disabled reminders for user {user_id}, cancelled {cancelled} beds")
 
     await query.answer("Изменено" , show_alert=True)
     await show_settings(update, context)
@@ -20283,7 +19974,7 @@ async def toggle_auto_search(update: Update, context: ContextTypes.DEFAULT_TYPE)
     query = update.callback_query
 
     user_id = query.from_user.id
-    player = db.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
+    player = uctx.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
     access = _get_access_profile(query.from_user, player=player)
     lang = player.language
 
@@ -20294,27 +19985,16 @@ async def toggle_auto_search(update: Update, context: ContextTypes.DEFAULT_TYPE)
             await show_settings(update, context)
             return
         await query.answer()
-        db.update_player(user_id, auto_search_enabled=True)
-        # Сбрасываем окно и счётчик, если reset_ts не задан или уже истёк (BUG-05 fix)
+        # Срок сразу сохраняем в БД, чтобы рестарт до ближайшего тика не потерял включение
         now_ts = int(time.time())
+        db.update_player(user_id, auto_search_enabled=True, auto_search_next_ts=now_ts)
+        # Сбрасываем окно и счётчик, если reset_ts не задан или уже истёк (BUG-05 fix)
         reset_ts = int(getattr(player, 'auto_search_reset_ts', 0) or 0)
         if reset_ts == 0 or now_ts >= reset_ts:
             db.update_player(user_id, auto_search_count=0, auto_search_reset_ts=now_ts + 24*60*60)
-        # Снесём предыдущие задачи и запланируем новую
-        try:
-            jobs = context.application.job_queue.get_jobs_by_name(f"auto_search_{user_id}")
-            for j in jobs:
-                j.schedule_removal()
-        except Exception as e:
-            logger.warning(f"[AUTO] Не удалось удалить предыдущие задачи автопоиска для {user_id}: {e}")
         try:
-            context.application.job_queue.run_once(
-                auto_search_job,
-                when=1,
-                chat_id=user_id,
-                name=f"auto_search_{user_id}",
-            )
-            logger.debug(f"[AUTO] Автопоиск включён и запланирована задача для {user_id}")
+            auto_search_scheduler.schedule_in(user_id, 1)
+            logger.debug(f"[AUTO] Автопоиск включён и запланирован для {user_id}")
         except Exception as e:
             logger.error(f"[AUTO] Критическая ошибка: не удалось запланировать автопоиск для {user_id}: {e}")
         try:
@@ -20331,12 +20011,7 @@ async def toggle_auto_search(update: Update, context: ContextTypes.DEFAULT_TYPE)
             await _send_auto_search_summary(user_id, player, context, reason='disabled')
 
         db.update_player(user_id, auto_search_enabled=False)
-        try:
-            jobs = context.application.job_queue.get_jobs_by_name(f"auto_search_{user_id}")
-            for j in jobs:
-                j.schedule_removal()
-        except Exception:
-            pass
+        auto_search_scheduler.cancel(user_id)
     
     await show_settings(update, context)
 
@@ -20346,7 +20021,7 @@ async def show_autosell_menu(update: Update, context: ContextTypes.DEFAULT_TYPE)
     await query.answer()
 
     user_id = query.from_user.id
-    player = db.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
+    player = uctx.get_or_create_player(user_id, query.from_user.username or query.from_user.first_name)
     lang = player.language
 
     settings = db.get_autosell_settings(user_id)
@@ -20387,7 +20062,7 @@ async def reset_prompt(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
 
-    player = db.get_or_create_player(query.from_user.id, query.from_user.username or query.from_user.first_name)
+    player = uctx.get_or_create_player(query.from_user.id, query.from_user.username or query.from_user.first_name)
     lang = player.language
     keyboard = [
         [InlineKeyboardButton("✅ Yes" if lang=='en' else "✅ Да", callback_data='reset_yes'),
@@ -20402,7 +20077,7 @@ async def reset_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE, conf
         db.delete_player(query.from_user.id)
         player_lang = 'ru'
         try:
-            player_lang = db.get_or_create_player(query.from_user.id, query.from_user.username or query.from_user.first_name).language
+            player_lang = uctx.get_or_create_player(query.from_user.id, query.from_user.username or query.from_user.first_name).language
         except:
             pass
         await query.edit_message_text(t(player_lang, 'data_deleted'))
@@ -20608,7 +20283,7 @@ async def _format_display_name(context: ContextTypes.DEFAULT_TYPE, update: Updat
 
 async def show_leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает таблицу лидеров."""
-    leaderboard_data = db.get_leaderboard()
+    leaderboard_data = await adb.get_leaderboard()
     
     if not leaderboard_data:
         text = "Еще никто не нашел ни одного энергетика. Будь первым!"
@@ -20639,12 +20314,27 @@ async def show_leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
         rating_value = int(rating or 0)
         text += f"{medal} {display_name}{vip_badge} - <b>{total_drinks} шт.</b> | ⭐ {rating_value}\n"
 
+    text += await _format_my_leaderboard_rank(update, 'drinks', "шт.")
     await update.message.reply_html(text)
 
 
+async def _format_my_leaderboard_rank(update: Update, board: str, unit: str) -> str:
+    """Строка «ваше место» под лидербордом (O(log n), см. db.get_leaderboard_rank)."""
+    user = update.effective_user
+    if not user:
+        return ""
+    try:
+        info = await adb.get_leaderboard_rank(user.id, board)
+    except Exception:
+        return ""
+    if not info.get('rank'):
+        return ""
+    return f"\n📍 Ваше место: <b>#{info['rank']}</b> из {info['total']} — {info['score']:,} {unit}"
+
+
 async def show_money_leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает таблицу лидеров по деньгам."""
-    money_leaderboard_data = db.get_money_leaderboard()
+    money_leaderboard_data = await adb.get_money_leaderboard()
     
     if not money_leaderboard_data:
         text = "💰 Еще никто не накопил денег. Будь первым!"
@@ -20665,8 +20355,8 @@ async def show_money_leaderboard(update: Update, context: ContextTypes.DEFAULT_T
         display_name = await _format_display_name(context, update, user_id, username)
         
         # Проверяем VIP статус
-        vip_until = db.get_vip_until(user_id)
-        vip_plus_until = db.get_vip_plus_until(user_id)
+        vip_until = player_data.get('vip_until', 0)
+        vip_plus_until = player_data.get('vip_plus_until', 0)
         current_time = int(time.time())
         vip_plus_active = vip_plus_until and current_time < vip_plus_until
         vip_active = vip_until and current_time < vip_until
@@ -20680,6 +20370,7 @@ async def show_money_leaderboard(update: Update, context: ContextTypes.DEFAULT_T
         
         text += f"{medal} {display_name}{vip_badge} - <b>{coins:,} септимов</b>\n"
 
+    text += await _format_my_leaderboard_rank(update, 'coins', "септимов")
     await update.message.reply_html(text)
 
 
@@ -20688,7 +20379,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     player = None
     try:
-        player = db.get_or_create_player(user.id, getattr(user, 'username', None) or getattr(user, 'first_name', None))
+        player = uctx.get_or_create_player(user.id, getattr(user, 'username', None) or getattr(user, 'first_name', None))
     except Exception:
         player = None
     lang = getattr(player, 'language', 'ru') or 'ru'
@@ -20757,6 +20448,62 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_html(text, disable_web_page_preview=True)
 
 
+_youtube_service: YoutubeDownloadService | None = None
+
+
+def _get_youtube_service() -> YoutubeDownloadService:
+    """Общий сервис скачивания: пул процессов создаётся при первой загрузке."""
+    global _youtube_service
+    if _youtube_service is None:
+        _youtube_service = YoutubeDownloadService(
+            YOUTUBE_CACHE_DIR,
+            max_workers=YOUTUBE_DOWNLOAD_WORKERS,
+            max_pending=YOUTUBE_DOWNLOAD_MAX_PENDING,
+            max_cache_bytes=YOUTUBE_CACHE_MAX_MB * 1024 * 1024,
+        )
+    return _youtube_service
+
+
+async def _send_youtube_entry(bot, chat_id: int, service: YoutubeDownloadService, entry) -> None:
+    """Отправляет обложку и MP3: по сохранённым file_id, а при первой отправке — файлами,
+    запоминая выданные Telegram file_id для следующих запросов того же ролика."""
+    title_html = html.escape(entry.title)
+    uploader_html = html.escape(entry.uploader)
+    thumb_path = entry.thumbnail_path if entry.thumbnail_path and entry.thumbnail_path.exists() else None
+
+    if entry.photo_file_id or thumb_path:
+        with contextlib.ExitStack() as stack:
+            photo = entry.photo_file_id or stack.enter_context(open(thumb_path, 'rb'))
+            sent = await _send_photo_long(
+                bot.send_photo,
+                chat_id=chat_id,
+                photo=photo,
+                caption=f"Обложка: <b>{title_html}</b>",
+                parse_mode='HTML',
+            )
+        if not entry.photo_file_id and getattr(sent, 'photo', None):
+            service.cache.remember_file_ids(entry.key, photo_file_id=sent.photo[-1].file_id)
+
+    with contextlib.ExitStack() as stack:
+        if entry.audio_file_id:
+            audio, thumbnail = entry.audio_file_id, None
+        else:
+            audio = stack.enter_context(open(entry.audio_path, 'rb'))
+            thumbnail = stack.enter_context(open(thumb_path, 'rb')) if thumb_path else None
+        sent = await _send_audio_long(
+            bot.send_audio,
+            chat_id=chat_id,
+            audio=audio,
+            caption=f"🎵 <b>{title_html}</b>\n👤 {uploader_html}",
+            parse_mode='HTML',
+            title=entry.title[:255],
+            performer=entry.uploader[:255] if entry.uploader else None,
+            thumbnail=thumbnail,
+        )
+    if not entry.audio_file_id and getattr(sent, 'audio', None):
+        service.cache.remember_file_ids(entry.key, audio_file_id=sent.audio.file_id)
+
+
 async def _handle_youtube_download_request(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE,
@@ -20785,59 +20532,37 @@ async def _handle_youtube_download_request(
         await msg.reply_text("Скачивание уже выполняется. Дождись завершения текущей загрузки.")
         return
 
-    status_message = await msg.reply_text("Скачиваю трек и конвертирую в MP3, это может занять до минуты.")
-    result = None
+    service = _get_youtube_service()
+    if service.is_cached(url):
+        status_message = await msg.reply_text("Отправляю трек...")
+    else:
+        status_message = await msg.reply_text("Скачиваю трек и конвертирую в MP3, это может занять до минуты.")
     async with lock:
         try:
-            result = await download_youtube_audio_async(url)
-            title_html = html.escape(result.title)
-            uploader_html = html.escape(result.uploader)
-
-            if result.thumbnail_path and result.thumbnail_path.exists():
-                with open(result.thumbnail_path, 'rb') as photo:
-                    await _send_photo_long(
-                        context.bot.send_photo,
-                        chat_id=chat.id,
-                        photo=photo,
-                        caption=f"Обложка: <b>{title_html}</b>",
-                        parse_mode='HTML',
-                    )
-
-            thumb_handle = None
-            try:
-                if result.thumbnail_path and result.thumbnail_path.exists():
-                    thumb_handle = open(result.thumbnail_path, 'rb')
-                with open(result.audio_path, 'rb') as audio_file:
-                    await _send_audio_long(
-                        context.bot.send_audio,
-                        chat_id=chat.id,
-                        audio=audio_file,
-                        caption=f"🎵 <b>{title_html}</b>\n👤 {uploader_html}",
-                        parse_mode='HTML',
-                        title=result.title[:255],
-                        performer=result.uploader[:255] if result.uploader else None,
-                        thumbnail=thumb_handle,
-                    )
-            finally:
-                if thumb_handle:
-                    try:
-                        thumb_handle.close()
-                    except Exception:
-                        pass
-
+            # Вторая попытка — если Telegram отверг сохранённый file_id: он забывается, трек шлётся файлом
+            for attempt in range(2):
+                try:
+                    async with service.audio(url) as entry:
+                        await _send_youtube_entry(context.bot, chat.id, service, entry)
+                    break
+                except BadRequest as exc:
+                    if attempt or not (entry.audio_file_id or entry.photo_file_id):
+                        raise
+                    logger.info("[YTDL] Cached file_id rejected for %s: %s", entry.key, exc)
+                    service.cache.forget_file_ids(entry.key)
             await status_message.edit_text("Готово.")
         except UnsupportedYoutubeUrlError:
             await status_message.edit_text("Поддерживаются только ссылки на YouTube и YouTube Music.")
         except FfmpegNotFoundError:
             await status_message.edit_text("На сервере не найден ffmpeg. Установи ffmpeg, и MP3-конвертация заработает.")
+        except YoutubeDownloadBusyError:
+            await status_message.edit_text("Сейчас скачивается слишком много треков. Попробуй через пару минут.")
         except YoutubeAudioDownloadError as exc:
             logger.warning("[YTDL] Download failed for user %s: %s", user.id, exc)
             await status_message.edit_text("Не удалось скачать этот трек. Возможно, ссылка недоступна или YouTube временно режет доступ.")
         except Exception as exc:
             logger.exception("[YTDL] Unexpected error for user %s", user.id)
             await status_message.edit_text("Произошла ошибка при скачивании трека. Попробуй позже.")
-        finally:
-            cleanup_downloaded_audio(result)
 
 
 async def youtube_download_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -20956,7 +20681,7 @@ async def text_message_handler(update: Update, context: ContextTypes.DEFAULT_TYP
         inventory_type = gift_data['inventory_type']
 
         user_id = update.effective_user.id
-        player = db.get_or_create_player(user_id, update.effective_user.username or update.effective_user.first_name)
+        player = await adb.call(uctx.get_or_create_player, user_id, update.effective_user.username or update.effective_user.first_name)
         lang = getattr(player, 'language', 'ru') or 'ru'
         
         incoming = (msg.text or "").strip()
@@ -20967,7 +20692,7 @@ async def text_message_handler(update: Update, context: ContextTypes.DEFAULT_TYP
         
         if recipient_username.isdigit():
             recipient_id = int(recipient_username)
-            recipient_player = db.get_or_create_player(recipient_id, None)
+            recipient_player = uctx.get_or_create_player(recipient_id, None)
         else:
             recipient_player = db.get_player_by_username(recipient_username)
             if recipient_player:
@@ -21111,7 +20836,7 @@ async def text_message_handler(update: Update, context: ContextTypes.DEFAULT_TYP
     try:
         u = update.effective_user
         if u:
-            db.get_or_create_player(u.id, username=getattr(u, 'username', None), display_name=(getattr(u, 'full_name', None) or getattr(u, 'first_name', None)))
+            uctx.get_or_create_player(u.id, username=getattr(u, 'username', None), display_name=(getattr(u, 'full_name', None) or getattr(u, 'first_name', None)))
     except Exception:
         pass
     try:
@@ -21146,7 +20871,7 @@ async def text_message_handler(update: Update, context: ContextTypes.DEFAULT_TYP
         if not code:
             await msg.reply_text("Пустой код. Отправьте промокод ещё раз.")
             return
-        res = db.redeem_promo(update.effective_user.id, code)
+        res = await adb.redeem_promo(update.effective_user.id, code)
         if not res or not res.get('ok'):
             reason = (res or {}).get('reason')
             if reason == 'expired':
@@ -21316,7 +21041,7 @@ async def text_message_handler(update: Update, context: ContextTypes.DEFAULT_TYP
             return
 
         user = update.effective_user
-        player = db.get_or_create_player(user.id, user.username or user.first_name)
+        player = uctx.get_or_create_player(user.id, user.username or user.first_name)
         lang = player.language
 
         if kind == 'coins':
@@ -21431,7 +21156,7 @@ async def text_message_handler(update: Update, context: ContextTypes.DEFAULT_TYP
         return
     async with lock:
         # Предварительная проверка кулдауна (учёт VIP+/VIP), чтобы не показывать спиннер впустую
-        player = db.get_or_create_player(user.id, user.username or user.first_name)
+        player = uctx.get_or_create_player(user.id, user.username or user.first_name)
         lang = getattr(player, 'language', 'ru') or 'ru'
         now_ts = time.time()
         access = _get_access_profile(user, player=player)
@@ -21801,6 +21526,7 @@ async def abort_if_banned(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         user = update.effective_user
         if not user:
             return False
+        # Индекс банов в памяти: проверка не ходит в БД и не блокирует loop
         ban = db.get_active_ban(user.id)
         if not ban:
             return False
@@ -21832,10 +21558,25 @@ async def abort_if_banned(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return False
 
 
-async def global_ban_guard(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Stop every update from users with an active bot ban."""
-    if await abort_if_banned(update, context):
-        raise ApplicationHandlerStop
+async def begin_update_context(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Открывает контекст апдейта: игрок и доступ читаются один раз на апдейт."""
+    uctx.begin_update(update, context)
+    user = update.effective_user
+    chat = update.effective_chat
+    # Игрок сам пишет боту в личку — значит, снял блокировку; рассылки опять его включают
+    if user and chat is not None and chat.type == 'private' and db.is_user_marked_unreachable(user.id):
+        try:
+            await adb.mark_user_reachable(user.id)
+        except Exception as e:
+            logger.warning(f"[BROADCAST] Failed to clear bot_blocked_at for {user.id}: {e}")
+
+
+async def finish_update_context(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Закрывает контекст апдейта и учитывает число SQL-запросов."""
+    uctx.finish_update(uctx.current(context))
+
+
+global_ban_guard = make_ban_guard(abort_if_banned)
 
 
 gift_feature = GiftFeature(
@@ -21863,7 +21604,7 @@ async def event_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     player = None
     try:
-        player = db.get_or_create_player(
+        player = uctx.get_or_create_player(
             user.id,
             username=getattr(user, 'username', None),
             display_name=(getattr(user, 'full_name', None) or getattr(user, 'first_name', None))
@@ -22278,10 +22019,73 @@ def _load_rarity_emoji_overrides_into_constants() -> None:
         return
 
 
+async def drink_discovery_flush_job(context: ContextTypes.DEFAULT_TYPE):
+    """JobQueue: пакетно сохраняет накопленную статистику находок напитков."""
+    try:
+        await adb.flush_drink_discovery_buffer()
+    except Exception as e:
+        logger.warning(f"[DISCOVERY] Flush job failed: {e}")
+
+
+async def leaderboard_sync_job(context: ContextTypes.DEFAULT_TYPE):
+    """JobQueue: применяет журнал изменений к лидербордам, чтобы он не разрастался."""
+    try:
+        await adb.sync_leaderboards()
+    except Exception as e:
+        logger.warning(f"[LEADERBOARD] Sync job failed: {e}")
+
+
+async def ban_index_resync_job(context: ContextTypes.DEFAULT_TYPE):
+    """JobQueue: перечитывает индекс банов в пуле БД, guard тем временем видит прежний снимок."""
+    try:
+        loaded = await adb.call(db.refresh_ban_index)
+        if loaded is not None:
+            logger.debug(f"[BAN] Ban index resynced: {loaded} active bans")
+    except Exception as e:
+        logger.warning(f"[BAN] Ban index resync failed: {e}")
+
+
+async def _post_init(application) -> None:
+    """Запускает фоновую инфраструктуру внутри event loop приложения."""
+    action_log_writer.start()
+
+
+async def _post_stop(application) -> None:
+    """Снимает фоновые рассылки: курсор уже в БД, после рестарта они продолжатся."""
+    try:
+        cancelled = await _broadcast_tasks.cancel_all()
+        if cancelled:
+            logger.info(f"[SHUTDOWN] Broadcasts paused until restart: {cancelled}")
+    except Exception as e:
+        logger.warning(f"[SHUTDOWN] Failed to stop broadcasts: {e}")
+
+
+async def _post_shutdown(application) -> None:
+    """Останавливает фоновую инфраструктуру после остановки polling."""
+    try:
+        await adb.flush_drink_discovery_buffer()
+    except Exception as e:
+        logger.warning(f"[SHUTDOWN] Failed to flush drink discovery stats: {e}")
+    try:
+        await action_log_writer.stop()
+    except Exception as e:
+        logger.warning(f"[SHUTDOWN] Failed to flush action log: {e}")
+    try:
+        adb.shutdown(wait=True)
+    except Exception as e:
+        logger.warning(f"[SHUTDOWN] Failed to stop DB executor: {e}")
+    if _youtube_service is not None:
+        try:
+            _youtube_service.shutdown(wait=False)
+        except Exception as e:
+            logger.warning(f"[SHUTDOWN] Failed to stop YouTube download workers: {e}")
+
+
 def main():
     """Запускает бота."""
     global BOT_RUNTIME
-    db.ensure_schema()
+    # Миграция схемы выполняется только здесь; при совпавшем отпечатке — одно чтение PRAGMA
+    db.migrate_schema()
     _load_rarity_emoji_overrides_into_constants()
     # Инициализируем дефолтные типы семян для плантации (идемпотентно)
     try:
@@ -22308,6 +22112,16 @@ def main():
             logger.info(f"[BOOT] Removed bans from protected users: {removed}")
     except Exception as e:
         logger.warning(f"[BOOT] Failed to unban protected users: {e}")
+    try:
+        bans_loaded = db.load_ban_index()
+        logger.info(f"[BOOT] Ban index loaded: {bans_loaded} active bans")
+    except Exception as e:
+        logger.warning(f"[BOOT] Failed to load ban index: {e}")
+    try:
+        unreachable = db.load_unreachable_users()
+        logger.info(f"[BOOT] Players who blocked the bot: {unreachable}")
+    except Exception as e:
+        logger.warning(f"[BOOT] Failed to load players who blocked the bot: {e}")
  
     request = HTTPXRequest(
         connection_pool_size=8,
@@ -22316,9 +22130,10 @@ def main():
         connect_timeout=15.0,
         pool_timeout=15.0,
     )
-    application = ApplicationBuilder().token(config.TOKEN).request(request).build()
+    application = ApplicationBuilder().token(config.TOKEN).request(request).post_init(_post_init).post_stop(_post_stop).post_shutdown(_post_shutdown).build()
     BOT_RUNTIME = get_bot_runtime()
  
+    application.add_handler(TypeHandler(Update, begin_update_context), group=-1000)
     application.add_handler(TypeHandler(Update, global_ban_guard), group=-100)
     application.add_handler(MessageHandler(filters.ChatType.GROUPS & filters.COMMAND, debug_log_commands), group=2)
     application.add_handler(CommandHandler("start", start_command))
@@ -22409,11 +22224,12 @@ def main():
     application.add_handler(CallbackQueryHandler(toggle_auto_search_silent, pattern='^toggle_silent_mode$'))
     
     application.add_handler(CallbackQueryHandler(handle_selyuk_farmer_upgrade_action, pattern='^selyuk_farmer_upgrade_action$'))
-    application.add_handler(CallbackQueryHandler(admin_player_selyuki_show, pattern='^admin_player_selyuki:'))
     register_modular_handlers(application, BOT_RUNTIME)
     application.add_handler(CallbackQueryHandler(admin_event_callback_handler, pattern='^admin_event_'))
     gift_feature.register_handlers(application)
     application.add_handler(CallbackQueryHandler(button_handler))
+    # Таблица маршрутов button_handler собирается при старте, чтобы ошибки всплыли сразу
+    get_callback_router()
     # ВАЖНО: перехватываем ответы на ForceReply с причиной отклонения до общего текстового обработчика
     application.add_handler(MessageHandler(filters.REPLY & filters.TEXT & ~filters.COMMAND, handle_reject_reason_reply), group=0)
     # Общий текстовый обработчик — после reply-хендлера
@@ -22428,6 +22244,8 @@ def main():
 
     # Свага Команды
     swaga_module.register_handlers(application)
+    # Закрытие контекста апдейта — последней группой, после всех хендлеров
+    application.add_handler(TypeHandler(Update, finish_update_context), group=1000)
     
     # Логируем информацию о боте после старта (диагностика: верный ли бот запущен)
     async def _log_bot_info(context: ContextTypes.DEFAULT_TYPE):
@@ -22620,25 +22438,55 @@ def main():
 
         ordinary_plantation.schedule_jobs(application)
 
-        # --- Восстановление задач автопоиска VIP после рестарта ---
-        restored = _restore_auto_search_jobs(application)
+        # Отложенная запись статистики находок напитков
+        application.job_queue.run_repeating(
+            drink_discovery_flush_job,
+            interval=db.DRINK_DISCOVERY_FLUSH_SEC,
+            first=db.DRINK_DISCOVERY_FLUSH_SEC,
+            name="drink_discovery_flush",
+        )
+        application.job_queue.run_repeating(
+            leaderboard_sync_job,
+            interval=LEADERBOARD_SYNC_SEC,
+            first=30,
+            name="leaderboard_sync",
+        )
+        # Индекс банов: проверка свежести чаще срока, чтобы перечитка не сдвигалась на целый интервал
+        application.job_queue.run_repeating(
+            ban_index_resync_job,
+            interval=max(1, db.BAN_INDEX_RESYNC_SEC // 5),
+            first=db.BAN_INDEX_RESYNC_SEC,
+            name="ban_index_resync",
+        )
+
+        # --- Единый планировщик автопоиска VIP: восстановление сроков после рестарта ---
+        restored = _restore_auto_search_schedule()
         if restored:
-            logger.info(f"[AUTO] Восстановлено задач автопоиска: {restored}")
+            logger.info(f"[AUTO] Восстановлено в расписании автопоиска: {restored}")
+
+        application.job_queue.run_repeating(
+            auto_search_tick_job,
+            interval=AUTO_SEARCH_TICK_SEC,
+            first=5,
+            name="auto_search_tick",
+        )
+        application.job_queue.run_repeating(
+            auto_search_notify_job,
+            interval=1,
+            first=6,
+            name="auto_search_notify",
+        )
 
-        auto_watchdog_interval = 5 * 60
-        auto_watchdog_delay = 90
+        # --- Единый проход автоудаления: после рестарта просроченные задачи попадут в первый же проход ---
         application.job_queue.run_repeating(
-            auto_search_watchdog_job,
-            interval=auto_watchdog_interval,
-            first=auto_watchdog_delay,
-            name="auto_search_watchdog",
+            auto_delete_sweep_job,
+            interval=AUTO_DELETE_SWEEP_SEC,
+            first=3,
+            name="auto_delete_sweep",
         )
 
-        # --- Восстановление задач автоудаления после рестарта ---
-        async def restore_auto_delete_on_startup(context: ContextTypes.DEFAULT_TYPE):
-            await restore_scheduled_auto_deletes(context.application)
-        
-        application.job_queue.run_once(restore_auto_delete_on_startup, when=3)
+        # --- Продолжение незавершённых рассылок после рестарта ---
+        application.job_queue.run_once(resume_broadcasts_on_startup, when=5, name="broadcast_resume")
 
     print("Бот запущен...")
     application.run_polling()
@@ -0,0 +1,232 @@
+# file: auto_search_engine.py
+"""
+Пакетный движок автопоиска VIP.
+
+Планировщик (core.auto_search_scheduler) отдаёт пачку пользователей, у
+которых подошёл срок. Движок обрабатывает её целиком:
+
+1. одним запросом читает состояние всех игроков пачки (кулдаун, счётчик и
+   окно лимита, VIP/админ, буст, удача, избранное) — load_auto_search_states;
+2. в памяти считает профиль доступа, лимит, кулдаун и дроп (напитки берутся
+   из кэша каталога, редкости — по весам с учётом рейтинга);
+3. применяет все исходы одной пишущей транзакцией — apply_auto_search_batch,
+   где кулдаун/флаг/лимит перепроверяются на случай параллельного ручного поиска.
+
+Движок не трогает Telegram: результаты возвращаются вызывающему коду,
+а уведомления уходят через отдельную очередь.
+
+Использование:
+    engine = AutoSearchEngine(rarity_weights=lambda rating: {...})
+    results = engine.run(user_ids)   # {user_id: {'status': 'ok' | 'cooldown' | ...}}
+"""
+
+from __future__ import annotations
+
+import logging
+import random
+import time
+from types import SimpleNamespace
+from typing import Callable, Iterable
+
+import core.database as db
+from core.constants import FAVORITE_DRINK_WEIGHT_MULT, RARITIES, SEARCH_COOLDOWN
+
+logger = logging.getLogger(__name__)
+
+# Сколько свага-карточек выдаётся за каждый найденный энергетик
+SWAGA_CARDS_PER_DROP = 10
+
+
+class AutoSearchEngine:
+    """Планирует и применяет автопоиск для пачки пользователей.
+
+    rarity_weights(rating) -> {редкость: вес} — веса редкостей с учётом рейтинга
+    (по умолчанию базовые RARITIES). swaga_weights — веса свага-карточек или None,
+    если карточки в автопоиске не выдаются.
+    """
+
+    def __init__(
+        self,
+        *,
+        rarity_weights: Callable[[int], dict] | None = None,
+        swaga_weights: dict | None = None,
+        favorite_weight_mult: float = FAVORITE_DRINK_WEIGHT_MULT,
+        rng: random.Random | None = None,
+    ):
+        self.rarity_weights = rarity_weights or (lambda rating: RARITIES)
+        self.swaga_weights = dict(swaga_weights) if swaga_weights else None
+        self.favorite_weight_mult = favorite_weight_mult
+        self.rng = rng or random
+
+    def run(self, user_ids: Iterable[int], now_ts: float | None = None) -> dict[int, dict]:
+        """Полный проход по пачке: чтение, расчёт в памяти, одна пишущая транзакция."""
+        user_ids = [int(uid) for uid in user_ids]
+        if not user_ids:
+            return {}
+        now_ts = time.time() if now_ts is None else float(now_ts)
+        states = db.load_auto_search_states(user_ids)
+        results, outcomes = self.plan(user_ids, states, now_ts)
+        if outcomes:
+            applied = db.apply_auto_search_batch(outcomes, int(now_ts))
+            late_limits = self._merge_applied(results, applied)
+            if late_limits:
+                # Лимит исчерпан параллельным поиском уже после чтения — выключаем отдельно
+                db.apply_auto_search_batch([{'user_id': uid, 'action': 'disable'} for uid in late_limits], int(now_ts))
+        return results
+
+    def plan(self, user_ids: list[int], states: dict[int, dict], now_ts: float) -> tuple[dict[int, dict], list[dict]]:
+        """Расчёт без записи в БД: {user_id: результат} и исходы для apply_auto_search_batch."""
+        base_cooldown = float(db.get_setting_int('search_cooldown', SEARCH_COOLDOWN))
+        has_drinks = db.count_search_drinks() > 0
+        results: dict[int, dict] = {}
+        outcomes: list[dict] = []
+        for uid in user_ids:
+            state = states.get(uid)
+            if state is None:
+                results[uid] = {'status': 'missing'}
+                continue
+            result, outcome = self._plan_one(uid, state, now_ts, base_cooldown, has_drinks)
+            results[uid] = result
+            if outcome is not None:
+                outcomes.append(outcome)
+        return results, outcomes
+
+    def _plan_one(self, uid: int, state: dict, now_ts: float, base_cooldown: float,
+                  has_drinks: bool) -> tuple[dict, dict | None]:
+        result = {
+            'status': 'ok',
+            'language': state.get('language') or 'ru',
+            'silent': bool(state.get('auto_search_silent')),
+            'remind': bool(state.get('remind')),
+        }
+        if not state.get('auto_search_enabled'):
+            result['status'] = 'disabled'
+            return result, None
+
+        access = db.get_access_profile(
+            uid,
+            username=state.get('username'),
+            player=SimpleNamespace(**state),
+            admin_level=state['admin_level'],
+        )
+        result['access'] = access
+        if not access.get('acts_like_vip'):
+            result['status'] = 'vip_expired'
+            return result, {'user_id': uid, 'action': 'disable'}
+
+        count = int(state.get('auto_search_count') or 0)
+        reset_ts = int(state.get('auto_search_reset_ts') or 0)
+        if reset_ts == 0 or now_ts >= reset_ts:
+            count = 0
+        daily_limit = db.auto_search_daily_limit_for(
+            str(access.get('tier') or 'ordinary'),
+            int(state.get('auto_search_boost_count') or 0),
+            int(state.get('auto_search_boost_until') or 0),
+            int(now_ts),
+        )
+        result['daily_limit'] = daily_limit
+        if count >= daily_limit:
+            result['status'] = 'limit'
+            return result, {'user_id': uid, 'action': 'disable'}
+
+        cooldown = base_cooldown * float(access.get('search_cooldown_mult', 1.0) or 1.0)
+        result['cooldown'] = cooldown
+        since_last = now_ts - float(state.get('last_search') or 0)
+        if since_last < cooldown:
+            result['status'] = 'cooldown'
+            result['time_left'] = cooldown - since_last
+            return result, None
+        if not has_drinks:
+            result['status'] = 'no_drinks'
+            return result, None
+
+        rng = self.rng
+        luck_charges = int(state.get('luck_coupon_charges') or 0)
+        luck_auto_use = bool(state.get('luck_coupon_auto_use', True))
+        base_chance = 0.50 if (luck_charges > 0 and luck_auto_use) else 0.10
+        chance = min(1.0, max(0.0, base_chance + float(access.get('double_drop_bonus_chance', 0) or 0)))
+        found_count = 2 if rng.random() < chance else 1
+        used_luck_coupon = found_count == 2 and luck_charges > 0 and luck_auto_use
+
+        septims_reward = int(access.get('fixed_search_reward', 0) or 0)
+        if septims_reward <= 0:
+            septims_reward = rng.randint(5, 10) * 2  # автопоиск доступен только VIP
+
+        weights = self.rarity_weights(int(state.get('rating') or 0))
+        drops: list[dict] = []
+        for _ in range(found_count):
+            drink = db.pick_search_drink(state.get('favorite_drink_ids'), self.favorite_weight_mult, rng=rng)
+            if drink is None:
+                result['status'] = 'no_drinks'
+                return result, None
+            if drink.is_special:
+                rarity = 'Special'
+            else:
+                rarity = rng.choices(list(weights.keys()), weights=list(weights.values()), k=1)[0]
+            drops.append({'drink': drink, 'rarity': rarity, 'temp': db.get_drink_temperature(drink.id),
+                          'autosell_enabled': False, 'autosell_payout': 0})
+
+        swaga_found: list[str] = []
+        swaga_counts: dict[str, int] = {}
+        swaga_total = SWAGA_CARDS_PER_DROP * found_count
+        if self.swaga_weights:
+            swaga_found = rng.choices(list(self.swaga_weights.keys()), weights=list(self.swaga_weights.values()),
+                                      k=swaga_total)
+            for sr in swaga_found:
+                swaga_counts[sr] = swaga_counts.get(sr, 0) + 1
+
+        result.update({
+            'found_count': found_count,
+            'drops': drops,
+            'rarities': [d['rarity'] for d in drops],
+            'septims_reward': septims_reward,
+            'swaga_cards_found': swaga_found,
+            'swaga_cards_total': swaga_total,
+            'used_luck_coupon': used_luck_coupon,
+        })
+        outcome = {
+            'user_id': uid,
+            'action': 'search',
+            'effective_cooldown': cooldown,
+            'base_reward_coins': septims_reward,
+            'consume_luck_charge': used_luck_coupon,
+            'drops': [{'drink_id': int(d['drink'].id), 'rarity': str(d['rarity'])} for d in drops],
+            'swaga_counts': swaga_counts,
+            'auto_search_daily_limit': daily_limit,
+            'silent': result['silent'],
+        }
+        return result, outcome
+
+    @staticmethod
+    def _merge_applied(results: dict[int, dict], applied: dict[int, dict]) -> list[int]:
+        late_limits: list[int] = []
+        for uid, res in applied.items():
+            result = results.get(uid)
+            if result is None or result['status'] != 'ok':
+                continue
+            if not res.get('ok'):
+                reason = str(res.get('reason') or 'exception')
+                if reason == 'cooldown':
+                    result['status'] = 'cooldown'
+                    result['time_left'] = float(res.get('time_left', result.get('cooldown', 5)) or 5)
+                elif reason in ('disabled', 'limit'):
+                    result['status'] = reason
+                    if reason == 'limit':
+                        late_limits.append(uid)
+                else:
+                    result['status'] = 'error'
+                continue
+            for drop, drop_result in zip(result['drops'], res.get('drop_results') or []):
+                drop['autosell_enabled'] = bool(drop_result.get('autosell_enabled', False))
+                drop['autosell_payout'] = int(drop_result.get('autosell_payout', 0) or 0)
+            total_autosell = int(res.get('total_autosell_payout', 0) or 0)
+            result.update({
+                'coins_after': int(res.get('coins_after', 0) or 0),
+                'new_rating': int(res.get('new_rating', 0) or 0),
+                'total_autosell_payout': total_autosell,
+                'earned_coins': result['septims_reward'] + total_autosell,
+                'auto_search_count': int(res.get('auto_search_count', 0) or 0),
+                'luck_charges_left': int(res.get('luck_charges_left', 0) or 0),
+                'limit_reached': bool(res.get('limit_reached')),
+            })
+        return late_limits
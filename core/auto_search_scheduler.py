@@ -0,0 +1,185 @@
+# file: auto_search_scheduler.py
+"""
+Единый планировщик автопоиска VIP.
+
+Вместо отдельной JobQueue-задачи на каждого пользователя держим одну кучу
+(min-heap) по времени следующего запуска. Один повторяющийся тик забирает
+из кучи пачку пользователей, у которых подошёл срок, и передаёт её
+исполнителю.
+
+Срок следующего запуска хранится в players.auto_search_next_ts. Изменения
+копятся в памяти и сохраняются одним executemany в конце тика. Куча держит
+только ближайшие сроки: раз в AUTO_SEARCH_REFILL_SEC она дополняется из БД
+игроками, чей срок наступает в пределах AUTO_SEARCH_HORIZON_SEC. Запрос идёт
+по индексу (auto_search_enabled, auto_search_next_ts), поэтому и восстановление
+после рестарта, и «сторож» стоят O(due), а не O(всех VIP).
+
+Использование:
+    from core.auto_search_scheduler import auto_search_scheduler
+
+    auto_search_scheduler.schedule_in(user_id, delay)   # (пере)запланировать
+    auto_search_scheduler.cancel(user_id)               # снять с расписания
+    await auto_search_scheduler.tick(run_batch)         # из повторяющейся задачи
+"""
+
+from __future__ import annotations
+
+import heapq
+import logging
+import threading
+import time
+from typing import Awaitable, Callable, Iterable
+
+import core.database as db
+import core.db_async as adb
+from core.constants import (
+    AUTO_SEARCH_BATCH_SIZE,
+    AUTO_SEARCH_HORIZON_SEC,
+    AUTO_SEARCH_REFILL_SEC,
+)
+
+logger = logging.getLogger(__name__)
+
+BatchRunner = Callable[[list[int]], Awaitable[object]]
+
+
+class AutoSearchScheduler:
+    """Куча (срок, user_id) с ленивым удалением и отложенной записью сроков в БД."""
+
+    def __init__(
+        self,
+        *,
+        batch_size: int = AUTO_SEARCH_BATCH_SIZE,
+        refill_sec: float = AUTO_SEARCH_REFILL_SEC,
+        horizon_sec: float = AUTO_SEARCH_HORIZON_SEC,
+    ):
+        self.batch_size = max(1, int(batch_size))
+        self.refill_sec = float(refill_sec)
+        self.horizon_sec = max(float(horizon_sec), float(refill_sec))
+        self._heap: list[tuple[float, int]] = []
+        self._due: dict[int, float] = {}
+        self._inflight: set[int] = set()
+        self._dirty: dict[int, int] = {}
+        self._next_refill = 0.0
+        self._ticking = False
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def __contains__(self, user_id: int) -> bool:
+        return int(user_id) in self._due
+
+    def due_at(self, user_id: int) -> float | None:
+        return self._due.get(int(user_id))
+
+    def schedule(self, user_id: int, due_ts: float) -> None:
+        """Назначает (или переносит) следующий запуск пользователя на due_ts."""
+        uid = int(user_id)
+        due_ts = float(due_ts)
+        with self._lock:
+            self._due[uid] = due_ts
+            heapq.heappush(self._heap, (due_ts, uid))
+            self._dirty[uid] = int(due_ts)
+
+    def schedule_in(self, user_id: int, delay: float, now: float | None = None) -> None:
+        now = time.time() if now is None else now
+        self.schedule(user_id, now + max(1.0, float(delay)))
+
+    def cancel(self, user_id: int) -> None:
+        """Снимает пользователя с расписания; запись в куче удалится лениво."""
+        uid = int(user_id)
+        with self._lock:
+            self._due.pop(uid, None)
+            self._dirty.pop(uid, None)
+
+    def pop_due(self, now: float | None = None, limit: int | None = None) -> list[int]:
+        """Забирает до limit пользователей со сроком <= now и помечает их как выполняющихся."""
+        now = time.time() if now is None else now
+        limit = self.batch_size if limit is None else int(limit)
+        batch: list[int] = []
+        with self._lock:
+            heap = self._heap
+            while heap and len(batch) < limit and heap[0][0] <= now:
+                due_ts, uid = heapq.heappop(heap)
+                if self._due.get(uid) != due_ts:
+                    continue  # устаревшая запись после переноса или отмены
+                del self._due[uid]
+                self._inflight.add(uid)
+                batch.append(uid)
+        return batch
+
+    def done(self, user_ids: Iterable[int]) -> None:
+        with self._lock:
+            for uid in user_ids:
+                self._inflight.discard(int(uid))
+
+    def refill(self, now: float | None = None) -> int:
+        """Дополняет кучу сохранёнными сроками из БД в пределах горизонта."""
+        now = time.time() if now is None else now
+        rows = db.get_due_auto_search_players(now + self.horizon_sec)
+        added = 0
+        with self._lock:
+            for uid, due_ts in rows:
+                if uid in self._due or uid in self._inflight:
+                    continue
+                due_ts = float(due_ts)
+                self._due[uid] = due_ts
+                heapq.heappush(self._heap, (due_ts, uid))
+                added += 1
+            self._next_refill = now + self.refill_sec
+            # Куча без живых записей не должна расти от ленивого удаления
+            if len(self._heap) > 2 * len(self._due) + 64:
+                self._heap = [(ts, uid) for uid, ts in self._due.items()]
+                heapq.heapify(self._heap)
+        return added
+
+    def flush(self) -> int:
+        """Сохраняет накопленные сроки в БД одной пачкой."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        if not dirty:
+            return 0
+        try:
+            return db.set_auto_search_due_many(dirty)
+        except Exception:
+            with self._lock:
+                for uid, ts in dirty.items():
+                    self._dirty.setdefault(uid, ts)
+            raise
+
+    async def tick(self, runner: BatchRunner, now: float | None = None) -> int:
+        """Один проход: подгрузка из БД по расписанию, пачка due-пользователей, запись сроков."""
+        if self._ticking:
+            return 0
+        self._ticking = True
+        batch: list[int] = []
+        try:
+            now = time.time() if now is None else now
+            if now >= self._next_refill:
+                added = await adb.call(self.refill, now)
+                if added:
+                    logger.debug("[AUTO] Планировщик подгрузил из БД: %s", added)
+            batch = self.pop_due(now)
+            if batch:
+                await runner(batch)
+            return len(batch)
+        finally:
+            self.done(batch)
+            self._ticking = False
+            try:
+                await adb.call_write(self.flush)
+            except Exception:
+                logger.exception("[AUTO] Не удалось сохранить сроки автопоиска")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._heap.clear()
+            self._due.clear()
+            self._inflight.clear()
+            self._dirty.clear()
+            self._next_refill = 0.0
+            self._ticking = False
+
+
+auto_search_scheduler = AutoSearchScheduler()
@@ -17,6 +17,81 @@ PLANTATION_NEG_EVENT_CHANCE = 0.15
 PLANTATION_NEG_EVENT_MAX_ACTIVE = 0.25
 PLANTATION_NEG_EVENT_DURATION_SEC = 3600
 
+# --- Доступ к базе данных ---
+# Размер выделенного пула потоков для синхронных вызовов core.database из async-хендлеров.
+# Держим его не больше пула соединений SQLAlchemy, чтобы потоки не ждали соединение.
+DB_EXECUTOR_WORKERS = int(os.getenv('RELOAD_DB_EXECUTOR_WORKERS', '4'))
+# Профиль движка SQLite: 'production' (WAL, busy_timeout, пул под пул потоков) или 'legacy'
+# (rollback-журнал и настройки SQLAlchemy по умолчанию, как было раньше).
+DB_PROFILE = os.getenv('RELOAD_DB_PROFILE', 'production')
+# Сколько ждать освобождения блокировки записи, мс, прежде чем получить "database is locked".
+DB_BUSY_TIMEOUT_MS = int(os.getenv('RELOAD_DB_BUSY_TIMEOUT_MS', '5000'))
+# Период перечитки кэша bot_settings из БД, сек. 0 — только write-through через set_setting_*
+# (один процесс). При нескольких процессах на одной БД задайте, например, 30.
+SETTINGS_CACHE_TTL_SEC = float(os.getenv('RELOAD_SETTINGS_CACHE_TTL_SEC', '0'))
+# Сколько живёт снимок статистики админ-панели (get_bot_statistics), сек.
+STATS_SNAPSHOT_TTL_SEC = float(os.getenv('RELOAD_STATS_SNAPSHOT_TTL_SEC', '60'))
+# Период фоновой синхронизации лидербордов с журналом leaderboard_changes, сек.
+LEADERBOARD_SYNC_SEC = float(os.getenv('RELOAD_LEADERBOARD_SYNC_SEC', '60'))
+# Для скольких игроков держать в памяти прочитанные страницы инвентаря (LRU).
+# Страницы сбрасываются при любой записи в инвентарь игрока (версия из inventory_versions).
+INVENTORY_PAGE_CACHE_USERS = int(os.getenv('RELOAD_INVENTORY_PAGE_CACHE_USERS', '2000'))
+# Период перечитки индекса промокодов (нормализованный код -> условия промокода), сек.
+# Создание и деактивация промокода сбрасывают индекс сразу.
+PROMO_INDEX_RESYNC_SEC = float(os.getenv('RELOAD_PROMO_INDEX_RESYNC_SEC', '300'))
+# Сколько живут закэшированные настройки группы (group_chats), сек., и для скольких групп их держать.
+# Изменение настроек через update_group_settings / set_group_settings сбрасывает запись сразу.
+GROUP_SETTINGS_CACHE_TTL_SEC = float(os.getenv('RELOAD_GROUP_SETTINGS_CACHE_TTL_SEC', '60'))
+GROUP_SETTINGS_CACHE_SIZE = int(os.getenv('RELOAD_GROUP_SETTINGS_CACHE_SIZE', '5000'))
+
+# --- Планировщик автопоиска VIP ---
+# Период тика единого планировщика, сек., и сколько пользователей обрабатывается за тик.
+AUTO_SEARCH_TICK_SEC = float(os.getenv('RELOAD_AUTO_SEARCH_TICK_SEC', '2'))
+AUTO_SEARCH_BATCH_SIZE = int(os.getenv('RELOAD_AUTO_SEARCH_BATCH_SIZE', '50'))
+# Как часто и на сколько вперёд подгружать из БД сохранённые сроки запуска.
+AUTO_SEARCH_REFILL_SEC = float(os.getenv('RELOAD_AUTO_SEARCH_REFILL_SEC', '60'))
+AUTO_SEARCH_HORIZON_SEC = float(os.getenv('RELOAD_AUTO_SEARCH_HORIZON_SEC', '120'))
+
+# --- Напоминания о поливе плантаций ---
+# Период тика сервиса напоминаний, сек., и сколько созревших напоминаний отправляется за тик.
+PLANTATION_REMINDER_TICK_SEC = float(os.getenv('RELOAD_PLANTATION_REMINDER_TICK_SEC', '2'))
+PLANTATION_REMINDER_BATCH_SIZE = int(os.getenv('RELOAD_PLANTATION_REMINDER_BATCH_SIZE', '40'))
+
+# --- Автоудаление сообщений в группах ---
+# Период прохода единого чистильщика, сек., сколько созревших записей берётся за раз
+# и сколько запросов удаления к Telegram выполняется параллельно.
+AUTO_DELETE_SWEEP_SEC = float(os.getenv('RELOAD_AUTO_DELETE_SWEEP_SEC', '5'))
+AUTO_DELETE_BATCH_SIZE = int(os.getenv('RELOAD_AUTO_DELETE_BATCH_SIZE', '500'))
+AUTO_DELETE_CONCURRENCY = int(os.getenv('RELOAD_AUTO_DELETE_CONCURRENCY', '8'))
+
+# --- Журнал действий (action_logs) ---
+# log_action только кладёт запись в буфер в памяти; фоновая задача пишет буфер пачкой
+# раз в ACTION_LOG_FLUSH_SEC или сразу, как накопится ACTION_LOG_FLUSH_SIZE записей.
+ACTION_LOG_FLUSH_SEC = float(os.getenv('RELOAD_ACTION_LOG_FLUSH_SEC', '2'))
+ACTION_LOG_FLUSH_SIZE = int(os.getenv('RELOAD_ACTION_LOG_FLUSH_SIZE', '500'))
+# Сколько записей буфер держит максимум (например, пока БД недоступна); при переполнении
+# отбрасываются самые старые, их число видно в get_action_log_stats()['dropped'].
+ACTION_LOG_BUFFER_SIZE = int(os.getenv('RELOAD_ACTION_LOG_BUFFER_SIZE', '50000'))
+
+# --- Рассылки ---
+# Общий лимит отправки, сообщений/сек (Telegram допускает ~30/сек на бота), и число параллельных отправителей.
+BROADCAST_RATE_PER_SEC = float(os.getenv('RELOAD_BROADCAST_RATE_PER_SEC', '25'))
+BROADCAST_CONCURRENCY = int(os.getenv('RELOAD_BROADCAST_CONCURRENCY', '8'))
+# Сколько получателей берётся за раз; после каждой страницы курсор и счётчики сохраняются в БД.
+BROADCAST_PAGE_SIZE = int(os.getenv('RELOAD_BROADCAST_PAGE_SIZE', '200'))
+# Как часто обновлять сообщение с прогрессом у админа, сек.
+BROADCAST_PROGRESS_INTERVAL_SEC = float(os.getenv('RELOAD_BROADCAST_PROGRESS_INTERVAL_SEC', '5'))
+# Повтор той же рассылки в течение этого окна, сек., считается дублем и не запускается.
+BROADCAST_DEDUPE_WINDOW_SEC = int(os.getenv('RELOAD_BROADCAST_DEDUPE_WINDOW_SEC', '600'))
+
+# --- Скачивание с YouTube ---
+# Процессы-воркеры yt-dlp/ffmpeg и сколько разных роликов может ждать в очереди одновременно.
+YOUTUBE_DOWNLOAD_WORKERS = int(os.getenv('RELOAD_YOUTUBE_DOWNLOAD_WORKERS', '2'))
+YOUTUBE_DOWNLOAD_MAX_PENDING = int(os.getenv('RELOAD_YOUTUBE_DOWNLOAD_MAX_PENDING', '16'))
+# Кэш готовых MP3 по id ролика; при превышении объёма удаляются давно не запрошенные файлы.
+YOUTUBE_CACHE_DIR = os.getenv('RELOAD_YOUTUBE_CACHE_DIR', os.path.join(BASE_DIR, 'cache', 'youtube'))
+YOUTUBE_CACHE_MAX_MB = int(os.getenv('RELOAD_YOUTUBE_CACHE_MAX_MB', '1024'))
+
 # --- Игровые константы ---
 RARITIES = {
     'Basic': 50,
@@ -544,6 +619,11 @@ MINES_DEFAULT_COUNT = 5          # Кол-во мин по умолчанию
 CRASH_UPDATE_INTERVAL = 0.8      # Интервал обновления множителя (секунды)
 CRASH_GROWTH_RATE = 0.15         # Скорость роста множителя за шаг
 CRASH_MAX_MULTIPLIER = 100.0     # Максимальный множитель
+CRASH_COMPOUND_RATE = 0.05       # Доля текущего множителя, добавляемая за шаг
+CRASH_TICK_SEC = 0.2             # Период общего тикера: как быстро замечается краш
+CRASH_MAX_FRAME_INTERVAL = 5.0   # Предел замедления анимации при нехватке лимита Telegram
+# Общий лимит правок сообщений краша, в секунду, на все игры процесса.
+CRASH_EDIT_RATE_PER_SEC = float(os.getenv('RELOAD_CRASH_EDIT_RATE_PER_SEC', '20'))
 
 # --- VIP настройки ---
 VIP_EMOJI = '👑'
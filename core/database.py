@@ -1,14 +1,23 @@
 # file: database.py
 
 import os
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, ForeignKey, BigInteger, Index, and_, or_
+import sqlite3
+from sqlalchemy import create_engine, event, Column, Integer, String, Boolean, ForeignKey, BigInteger, Index, and_, or_
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import declarative_base, sessionmaker, relationship, joinedload
 from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 import re
-from sqlalchemy import text, func
+from sqlalchemy import text, func, case, select, literal_column
 import time
 import random
+import bisect
+import heapq
+import threading
 import json
+import hashlib
+from collections import OrderedDict, deque
+from typing import NamedTuple
 import logging
 import traceback
 from core.constants import (
@@ -21,6 +30,19 @@ from core.constants import (
     RECEIVER_ROTATION_ITEM_BONUS_PERCENT,
     SHOP_PRICES,
     ADMIN_USERNAMES,
+    SETTINGS_CACHE_TTL_SEC,
+    DB_PROFILE,
+    DB_BUSY_TIMEOUT_MS,
+    DB_EXECUTOR_WORKERS,
+    STATS_SNAPSHOT_TTL_SEC,
+    INVENTORY_PAGE_CACHE_USERS,
+    PROMO_INDEX_RESYNC_SEC,
+    GROUP_SETTINGS_CACHE_TTL_SEC,
+    GROUP_SETTINGS_CACHE_SIZE,
+    ACTION_LOG_FLUSH_SIZE,
+    ACTION_LOG_BUFFER_SIZE,
+    RARITY_ORDER,
+    BROADCAST_DEDUPE_WINDOW_SEC,
     AUTO_SEARCH_DAILY_LIMIT,
     ADMIN_EMOJI,
     ADMIN_PLUS_EMOJI,
@@ -44,7 +66,63 @@ from core.constants import (
 # --- Настройка базы данных ---
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATABASE_FILE = os.path.join(BASE_DIR, "data", "bot_data.db")
-engine = create_engine(f"sqlite:///{DATABASE_FILE}", connect_args={"check_same_thread": False})
+
+# Профили движка SQLite. PRAGMA применяются к каждому новому соединению пула.
+# WAL: читатели не блокируются писателем (BEGIN IMMEDIATE из _begin_write_transaction),
+# synchronous=NORMAL в WAL безопасен при падении процесса, busy_timeout вместо
+# мгновенного "database is locked". Пул: по соединению на поток core.db_async,
+# плюс поток записи и прямые вызовы из event loop.
+SQLITE_ENGINE_PROFILES = {
+    'legacy': {
+        'pragmas': {},
+        'pool': {},
+    },
+    'production': {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': DB_BUSY_TIMEOUT_MS,
+            'cache_size': -64000,      # ~64 МБ страничного кэша на соединение
+            'mmap_size': 268435456,    # 256 МБ
+            'temp_store': 'MEMORY',
+        },
+        'pool': {
+            'pool_size': DB_EXECUTOR_WORKERS + 2,
+            'max_overflow': DB_EXECUTOR_WORKERS,
+            'pool_timeout': 30,
+        },
+    },
+}
+
+
+def _apply_sqlite_pragmas(dbapi_connection, pragmas: dict) -> None:
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def create_sqlite_engine(path: str, profile: str | None = None):
+    """Создаёт Engine для файла SQLite с выбранным профилем (см. SQLITE_ENGINE_PROFILES)."""
+    profile = profile or DB_PROFILE
+    cfg = SQLITE_ENGINE_PROFILES.get(profile)
+    if cfg is None:
+        raise ValueError(f"Неизвестный профиль БД {profile!r}, доступны: {', '.join(SQLITE_ENGINE_PROFILES)}")
+    connect_args = {"check_same_thread": False}
+    pragmas = dict(cfg['pragmas'])
+    if 'busy_timeout' in pragmas:
+        connect_args["timeout"] = float(pragmas['busy_timeout']) / 1000.0
+    new_engine = create_engine(f"sqlite:///{path}", connect_args=connect_args, **cfg['pool'])
+    if pragmas:
+        @event.listens_for(new_engine, 'connect')
+        def _on_connect(dbapi_connection, connection_record):
+            _apply_sqlite_pragmas(dbapi_connection, pragmas)
+    return new_engine
+
+
+engine = create_sqlite_engine(DATABASE_FILE)
 # Важно: отключаем expire_on_commit, чтобы возвращаемые объекты не теряли значения полей после commit()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 Base = declarative_base()
@@ -137,6 +215,7 @@ class Player(Base):
     auto_search_enabled = Column(Boolean, default=False)
     auto_search_count = Column(Integer, default=0)
     auto_search_reset_ts = Column(Integer, default=0)
+    auto_search_next_ts = Column(Integer, default=0, server_default='0', nullable=False)  # когда планировщику снова запустить автопоиск
     # --- Автопоиск буст ---
     auto_search_boost_count = Column(Integer, default=0)  # дополнительные поиски за день
     auto_search_boost_until = Column(Integer, default=0)  # время истечения буста
@@ -179,8 +258,14 @@ class Player(Base):
     last_red_core_run = Column(Integer, default=0)
     red_core_runs = Column(Integer, default=0)
     red_core_successes = Column(Integer, default=0)
+    bot_blocked_at = Column(Integer, default=0)  # когда рассылка получила Forbidden (0 — бот доступен)
+    username_lower = Column(String, index=True)  # lower(username), заполняет триггер trg_player_search_*
     inventory = relationship("InventoryItem", back_populates="owner", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index('idx_players_auto_search_due', 'auto_search_enabled', 'auto_search_next_ts'),
+    )
+
 
 class FriendRequest(Base):
     __tablename__ = 'friend_requests'
@@ -433,6 +518,7 @@ class Promo(Base):
     __tablename__ = 'promos'
     id = Column(Integer, primary_key=True, autoincrement=True)
     code = Column(String, unique=True, index=True)
+    code_norm = Column(String, index=True)  # _normalize_promo_code(code): по нему ищется код при активации
     kind = Column(String, index=True)  # coins | vip | vip_plus | drink | custom
     value = Column(Integer, default=0)  # сумма монет, дни VIP, id напитка и т.п. (для custom — соглашение на уровне приложения)
     rarity = Column(String, nullable=True)
@@ -441,6 +527,7 @@ class Promo(Base):
     expires_at = Column(Integer, nullable=True, index=True)  # None = без срока
     active = Column(Boolean, default=True, index=True)
     created_at = Column(Integer, default=lambda: int(time.time()), index=True)
+    used_total = Column(Integer, default=0, nullable=False)  # число активаций (= строк promo_usages)
 
 class PromoUsage(Base):
     __tablename__ = 'promo_usages'
@@ -449,6 +536,13 @@ class PromoUsage(Base):
     user_id = Column(BigInteger, index=True)
     used_at = Column(Integer, default=lambda: int(time.time()), index=True)
 
+class PromoUserUsage(Base):
+    """Счётчик активаций промокода одним пользователем (для per_user_limit без COUNT по promo_usages)."""
+    __tablename__ = 'promo_user_usages'
+    promo_id = Column(Integer, ForeignKey('promos.id'), primary_key=True)
+    user_id = Column(BigInteger, primary_key=True)
+    used = Column(Integer, default=0, nullable=False)
+
 class BotSetting(Base):
     __tablename__ = 'bot_settings'
     key = Column(String, primary_key=True)
@@ -641,6 +735,7 @@ class PlantationBed(Base):
     status_effect_level = Column(Integer, default=1)
     status_effect_applied_at = Column(Integer, default=0)
     status_effect_expires_at = Column(Integer, default=0)
+    water_remind_at = Column(Integer, nullable=True)  # срок напоминания о поливе (см. modules/plantation/reminders.py)
 
     owner = relationship('Player')
     seed_type = relationship('SeedType')
@@ -892,6 +987,169 @@ class PlayerSwagaTrack(Base):
         Index('idx_player_swaga_track_unique', 'user_id', 'track_id', unique=True),
     )
 
+# --- Рассылки ---
+
+class BroadcastJob(Base):
+    """Задание рассылки: курсор по user_id и счётчики переживают рестарт бота."""
+    __tablename__ = 'broadcast_jobs'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    created_by = Column(BigInteger, index=True)
+    admin_chat_id = Column(BigInteger)
+    progress_message_id = Column(BigInteger, nullable=True)  # сообщение админу, которое редактируется по ходу
+    kind = Column(String, default='text')  # 'text' | 'audio'
+    text = Column(String, nullable=True)  # текст или подпись к аудио (HTML)
+    file_id = Column(String, nullable=True)
+    content_hash = Column(String, index=True)
+    status = Column(String, default='running', index=True)  # 'running' | 'done' | 'cancelled'
+    cursor_user_id = Column(BigInteger, default=0)  # все user_id <= курсора уже обработаны
+    total = Column(Integer, default=0)
+    sent = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    blocked = Column(Integer, default=0)
+    created_at = Column(Integer, default=lambda: int(time.time()))
+    updated_at = Column(Integer, default=lambda: int(time.time()))
+    finished_at = Column(Integer, nullable=True)
+
+# --- Журнал изменений для лидербордов ---
+
+class LeaderboardChange(Base):
+    """Игроки, у которых изменились монеты/рейтинг/инвентарь (пишут триггеры SQLite)."""
+    __tablename__ = 'leaderboard_changes'
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(BigInteger, nullable=False)
+
+
+# Триггеры ловят любой путь записи (ORM, executemany, сырой SQL), поэтому
+# лидерборды не зависят от того, обновляет ли конкретная функция какой-то кэш.
+_LEADERBOARD_TRIGGERS_SQL = (
+    """CREATE TRIGGER IF NOT EXISTS trg_lb_inventory_insert AFTER INSERT ON inventory_items
+       BEGIN INSERT INTO leaderboard_changes(user_id) VALUES (NEW.player_id); END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_lb_inventory_update AFTER UPDATE OF quantity, player_id ON inventory_items
+       WHEN NEW.quantity IS NOT OLD.quantity OR NEW.player_id IS NOT OLD.player_id
+       BEGIN
+           INSERT INTO leaderboard_changes(user_id) VALUES (NEW.player_id);
+           INSERT INTO leaderboard_changes(user_id) SELECT OLD.player_id WHERE OLD.player_id IS NOT NEW.player_id;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_lb_inventory_delete AFTER DELETE ON inventory_items
+       BEGIN INSERT INTO leaderboard_changes(user_id) VALUES (OLD.player_id); END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_lb_players_insert AFTER INSERT ON players
+       BEGIN INSERT INTO leaderboard_changes(user_id) VALUES (NEW.user_id); END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_lb_players_update AFTER UPDATE OF coins ON players
+       WHEN NEW.coins IS NOT OLD.coins
+       BEGIN INSERT INTO leaderboard_changes(user_id) VALUES (NEW.user_id); END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_lb_players_delete AFTER DELETE ON players
+       BEGIN INSERT INTO leaderboard_changes(user_id) VALUES (OLD.user_id); END""",
+)
+
+
+# --- Версии инвентаря для кэша страниц ---
+
+class InventoryVersion(Base):
+    """Счётчик изменений инвентаря игрока (пишут триггеры SQLite)."""
+    __tablename__ = 'inventory_versions'
+    user_id = Column(BigInteger, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+_INVENTORY_VERSION_TRIGGERS_SQL = tuple(
+    f"""CREATE TRIGGER IF NOT EXISTS trg_inventory_version_{event_name.lower()} AFTER {event_name} ON inventory_items
+       BEGIN
+           INSERT INTO inventory_versions(user_id, version) VALUES ({row}.player_id, 1)
+           ON CONFLICT(user_id) DO UPDATE SET version = version + 1;
+       END"""
+    for event_name, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD'))
+) + (
+    # Перенос предмета другому игроку меняет инвентарь и прежнего владельца
+    """CREATE TRIGGER IF NOT EXISTS trg_inventory_version_move AFTER UPDATE OF player_id ON inventory_items
+       WHEN NEW.player_id IS NOT OLD.player_id
+       BEGIN
+           INSERT INTO inventory_versions(user_id, version) VALUES (OLD.player_id, 1)
+           ON CONFLICT(user_id) DO UPDATE SET version = version + 1;
+       END""",
+)
+
+
+@event.listens_for(Base.metadata, 'after_create')
+def _create_leaderboard_triggers(target, connection, **kw):
+    if connection.dialect.name != 'sqlite':
+        return
+    for sql in _LEADERBOARD_TRIGGERS_SQL + _INVENTORY_VERSION_TRIGGERS_SQL:
+        connection.exec_driver_sql(sql)
+
+
+def _py_lower(value):
+    return value.lower() if isinstance(value, str) else value
+
+
+@event.listens_for(Engine, 'connect')
+def _register_sqlite_functions(dbapi_connection, connection_record):
+    """py_lower(x) — str.lower() для SQL: встроенный lower() SQLite меняет регистр только у ASCII,
+    а названия энергетиков бывают кириллическими."""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.create_function('py_lower', 1, _py_lower, deterministic=True)
+
+
+# --- Поисковый индекс игроков ---
+
+# player_search — FTS5 с trigram-токенизатором по username/display_name (rowid = user_id):
+# подстрока от 3 символов ищется по индексу и без учёта регистра (включая кириллицу).
+# Как и у лидербордов, синхронизацию делают триггеры, поэтому индекс не отстаёт ни от
+# get_or_create_player, ни от прочих путей, меняющих имена.
+_PLAYER_SEARCH_TABLE_SQL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS player_search USING fts5(username, display_name, tokenize='trigram')"
+)
+_PLAYER_SEARCH_TRIGGERS_SQL = (
+    """CREATE TRIGGER IF NOT EXISTS trg_player_search_insert AFTER INSERT ON players
+       BEGIN
+           UPDATE players SET username_lower = lower(NEW.username) WHERE user_id = NEW.user_id AND NEW.username IS NOT NULL;
+           INSERT INTO player_search(rowid, username, display_name) VALUES (NEW.user_id, NEW.username, NEW.display_name);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_player_search_update AFTER UPDATE OF username, display_name ON players
+       WHEN NEW.username IS NOT OLD.username OR NEW.display_name IS NOT OLD.display_name
+       BEGIN
+           UPDATE players SET username_lower = lower(NEW.username) WHERE user_id = NEW.user_id;
+           DELETE FROM player_search WHERE rowid = OLD.user_id;
+           INSERT INTO player_search(rowid, username, display_name) VALUES (NEW.user_id, NEW.username, NEW.display_name);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_player_search_delete AFTER DELETE ON players
+       BEGIN DELETE FROM player_search WHERE rowid = OLD.user_id; END""",
+)
+# Короче trigram индекс не ищет — такие запросы идут прежним сканированием
+PLAYER_SEARCH_MIN_CHARS = 3
+
+_player_search_fts: bool | None = None  # None — ещё не проверяли sqlite_master
+
+
+def _create_player_search_index(connection) -> None:
+    """Создаёт player_search и его триггеры; при первом создании заполняет из players."""
+    global _player_search_fts
+    if connection.dialect.name != 'sqlite':
+        _player_search_fts = False
+        return
+    existed = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE name = 'player_search'"
+    ).first() is not None
+    try:
+        connection.exec_driver_sql(_PLAYER_SEARCH_TABLE_SQL)
+    except Exception as e:
+        # Сборка SQLite без FTS5/trigram (< 3.34): поиск остаётся на сканировании
+        logger.warning("player_search (FTS5 trigram) недоступен: %s", e)
+        _player_search_fts = False
+        return
+    for sql in _PLAYER_SEARCH_TRIGGERS_SQL:
+        connection.exec_driver_sql(sql)
+    if not existed:
+        connection.exec_driver_sql(
+            "INSERT INTO player_search(rowid, username, display_name) SELECT user_id, username, display_name FROM players"
+        )
+    _player_search_fts = True
+
+
+@event.listens_for(Base.metadata, 'after_create')
+def _create_player_search_objects(target, connection, **kw):
+    _create_player_search_index(connection)
+
+
 # --- Функции для взаимодействия с базы данных ---
 
 def create_db_and_tables():
@@ -899,149 +1157,92 @@ def create_db_and_tables():
     Base.metadata.create_all(bind=engine)
     print("База данных и таблицы успешно созданы.")
 
-def ensure_schema():
-    """Проверяет и обновляет схему БД (миграции)."""
-    Base.metadata.create_all(bind=engine)
-    try:
-        with engine.connect() as connection:
-            # Миграция: default_rarity
-            try:
-                connection.execute(text("SELECT default_rarity FROM energy_drinks LIMIT 1"))
-            except Exception:
-                print("Adding column 'default_rarity' to table 'energy_drinks'")
-                try:
-                    connection.execute(text("ALTER TABLE energy_drinks ADD COLUMN default_rarity VARCHAR"))
-                    connection.commit()
-                except Exception as e:
-                    print(f"Failed to add column 'default_rarity': {e}")
-    except Exception as e:
-        print(f"Schema update error: {e}")
 
-    try:
-        _ensure_player_has_display_name_column()
-    except Exception:
-        pass
+_USERNAME_RE = re.compile(r"[A-Za-z0-9_]{3,32}")
 
-def _ensure_player_has_autosearch_columns():
-    """Гарантирует наличие колонок для тихого автопоиска в таблице players."""
-    try:
-        with engine.connect() as conn:
-            res = conn.execute(text("PRAGMA table_info(players)")).fetchall()
-            cols = [row[1] for row in res]
-            if 'auto_search_silent' not in cols:
-                conn.execute(text("ALTER TABLE players ADD COLUMN auto_search_silent BOOLEAN DEFAULT 0"))
-            if 'auto_search_session_stats' not in cols:
-                conn.execute(text("ALTER TABLE players ADD COLUMN auto_search_session_stats VARCHAR DEFAULT '{}'"))
-            conn.commit()
-    except Exception as e:
-        print(f"Error checking/adding auto_search columns: {e}")
-
-def _ensure_player_has_casino_stats():
-    """Гарантирует наличие колонок статистики казино в таблице players."""
-    try:
-        with engine.connect() as conn:
-            res = conn.execute(text("PRAGMA table_info(players)")).fetchall()
-            cols = [row[1] for row in res]
-            if 'casino_wins' not in cols:
-                conn.execute(text("ALTER TABLE players ADD COLUMN casino_wins INTEGER DEFAULT 0"))
-            if 'casino_losses' not in cols:
-                conn.execute(text("ALTER TABLE players ADD COLUMN casino_losses INTEGER DEFAULT 0"))
-            if 'casino_achievements' not in cols:
-                conn.execute(text("ALTER TABLE players ADD COLUMN casino_achievements VARCHAR DEFAULT ''"))
-            conn.commit()
-    except Exception as e:
-        print(f"Error checking/adding casino columns: {e}")
 
-def _ensure_promos_has_rarity_column():
-    """Гарантирует наличие колонки rarity в таблице promos (SQLite)."""
+def normalize_player_names(username=None, display_name=None) -> tuple[str | None, str | None]:
+    """Нормализует имя из Telegram в пару (username, display_name) для Player.
+
+    username сохраняется только валидный (буквы/цифры/подчёркивания 3-32),
+    иначе исходная строка уходит в display_name.
+    """
+    new_uname = None
+    new_display = None
     try:
-        with engine.connect() as conn:
-            res = conn.execute(text("PRAGMA table_info(promos)")).fetchall()
-            cols = [row[1] for row in res]
-            if 'rarity' not in cols:
-                conn.execute(text("ALTER TABLE promos ADD COLUMN rarity VARCHAR"))
+        if username:
+            uname = str(username).lstrip('@')
+            if _USERNAME_RE.fullmatch(uname or ""):
+                new_uname = uname
+        if display_name:
+            new_display = str(display_name).strip()
+        if (not new_display) and username and (new_uname is None):
+            new_display = str(username).strip()
     except Exception:
-        pass
+        new_uname = None
+        new_display = None
+    return new_uname, new_display
 
-def _ensure_player_has_selyuk_fragments_column():
-    """Гарантирует наличие колонки selyuk_fragments в таблице players."""
-    try:
-        with engine.connect() as conn:
-            res = conn.execute(text("PRAGMA table_info(players)")).fetchall()
-            cols = [row[1] for row in res]
-            if 'selyuk_fragments' not in cols:
-                conn.execute(text("ALTER TABLE players ADD COLUMN selyuk_fragments INTEGER DEFAULT 0"))
-    except Exception as e:
-        print(f"Error checking/adding selyuk_fragments column: {e}")
 
-def _ensure_player_has_display_name_column():
-    """Гарантирует наличие колонки display_name в таблице players."""
-    try:
-        with engine.connect() as conn:
-            res = conn.execute(text("PRAGMA table_info(players)")).fetchall()
-            cols = [row[1] for row in res]
-            if 'display_name' not in cols:
-                conn.execute(text("ALTER TABLE players ADD COLUMN display_name VARCHAR"))
-                conn.commit()
-    except Exception as e:
-        print(f"Error checking/adding display_name column: {e}")
+def player_names_up_to_date(player, username=None, display_name=None) -> bool:
+    """True, если get_or_create_player с такими именами ничего не запишет."""
+    new_uname, new_display = normalize_player_names(username, display_name)
+    if new_uname and new_uname != getattr(player, 'username', None):
+        return False
+    if new_display and new_display != getattr(player, 'display_name', None):
+        return False
+    return True
+
+
+def _upsert_player_identity(db, user_id: int, new_uname: str | None, new_display: str | None) -> int:
+    """Создаёт игрока или обновляет его имена одним условным UPSERT.
+
+    Пустые имена не затирают сохранённые; строка пишется только если
+    хотя бы одно имя действительно изменилось.
+    """
+    stmt = sqlite_insert(Player).values(user_id=int(user_id), username=new_uname, display_name=new_display)
+    excluded = stmt.excluded
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Player.user_id],
+        set_={
+            'username': func.coalesce(excluded.username, Player.username),
+            'display_name': func.coalesce(excluded.display_name, Player.display_name),
+        },
+        where=or_(
+            and_(excluded.username.isnot(None), Player.username.is_distinct_from(excluded.username)),
+            and_(excluded.display_name.isnot(None), Player.display_name.is_distinct_from(excluded.display_name)),
+        ),
+    )
+    return db.execute(stmt).rowcount
+
 
 def get_or_create_player(user_id, username=None, display_name=None):
-    """Возвращает игрока по ID. Если его нет, создает нового."""
+    """Возвращает игрока по ID. Если его нет, создает нового.
+
+    Имена из Telegram синхронизируются одним условным UPSERT и только когда
+    они отличаются от сохранённых; неизменные имена не вызывают записи.
+    """
     db = SessionLocal()
     try:
-        try:
-            player = db.query(Player).filter(Player.user_id == user_id).first()
-        except OperationalError as e:
-            err = str(e).lower()
-            if "no such column" in err and "players.display_name" in err:
-                try:
-                    _ensure_player_has_display_name_column()
-                except Exception:
-                    pass
-                try:
-                    db.rollback()
-                except Exception:
-                    pass
-                player = db.query(Player).filter(Player.user_id == user_id).first()
-            else:
-                raise
+        player = db.query(Player).filter(Player.user_id == user_id).first()
         # Нормализуем username: только валидные @username (буквы/цифры/подчёркивания 3-32)
-        new_uname = None
-        new_display = None
+        new_uname, new_display = normalize_player_names(username, display_name)
+        if player is not None:
+            if (not new_uname or new_uname == player.username) and (not new_display or new_display == player.display_name):
+                return player
         try:
-            if username:
-                uname = str(username).lstrip('@')
-                if re.fullmatch(r"[A-Za-z0-9_]{3,32}", uname or ""):
-                    new_uname = uname
-            if display_name:
-                new_display = str(display_name).strip()
-            if (not new_display) and username and (new_uname is None):
-                new_display = str(username).strip()
-        except Exception:
-            new_uname = None
-            new_display = None
-        if not player:
-            # Создаём игрока; заполняем username только если он валиден
-            player = Player(user_id=user_id, username=new_uname, display_name=new_display)
-            db.add(player)
+            _upsert_player_identity(db, user_id, new_uname, new_display)
             db.commit()
-            db.refresh(player)
+        except Exception:
+            db.rollback()
+            if player is not None:
+                return player
+            raise
+        created = player is None
+        player = db.query(Player).populate_existing().filter(Player.user_id == user_id).first()
+        if created:
+            _bot_stats_snapshot.bump(total_users=1)
             print(f"Создан новый игрок: {new_uname or user_id} ({user_id})")
-        else:
-            # Автообновляем username, если пришёл валидный и отличается от сохранённого
-            if new_uname and new_uname != getattr(player, 'username', None):
-                try:
-                    player.username = new_uname
-                    db.commit()
-                except Exception:
-                    db.rollback()
-            if new_display and new_display != getattr(player, 'display_name', None):
-                try:
-                    player.display_name = new_display
-                    db.commit()
-                except Exception:
-                    db.rollback()
         return player
     finally:
         db.close()
@@ -1110,45 +1311,191 @@ def add_energy_drink_with_id(drink_id: int, name: str, description: str, image_p
             raise
 
         db.refresh(drink)
+        invalidate_drink_catalog()
         return drink
     finally:
         db.close()
 
-def get_active_ban(user_id: int) -> dict | None:
+# --- Индекс активных банов (кэш процесса) ---
+
+# Полная перечитка индекса из БД (правки банов из другого процесса)
+BAN_INDEX_RESYNC_SEC = 300
+
+
+def _ban_row_to_dict(rec: UserBan) -> dict:
+    return {
+        'user_id': int(rec.user_id),
+        'reason': rec.reason,
+        'banned_at': int(rec.banned_at or 0),
+        'banned_until': int(rec.banned_until or 0) if rec.banned_until else None,
+        'banned_by': int(rec.banned_by or 0) if rec.banned_by else None,
+    }
+
+
+class _BanIndex:
+    """Активные баны в памяти: проверка бана на каждый апдейт без обращения к SQLite.
+
+    Временные баны дополнительно лежат в куче по banned_until и вычищаются
+    лениво при проверке. Индекс обновляется функциями ban_user / unban_user /
+    unban_protected_users и перечитывается раз в BAN_INDEX_RESYNC_SEC фоновой
+    задачей (load через пул БД); проверки до её завершения видят прежний снимок.
+    Синхронно индекс читается только до первой загрузки или после invalidate.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bans: dict[int, dict] = {}
+        self._expiry_heap: list[tuple[int, int]] = []
+        self._loaded_at = 0.0
+        # Правки, сделанные, пока load читает БД: применяются поверх нового снимка
+        self._pending_ops: list[tuple[str, int, dict | None]] | None = None
+
+    def load(self) -> int:
+        now_ts = int(time.time())
+        with self._lock:
+            self._pending_ops = []
+        dbs = SessionLocal()
+        try:
+            rows = (
+                dbs.query(UserBan)
+                .filter((UserBan.banned_until == None) | (UserBan.banned_until > now_ts))
+                .all()
+            )
+        except Exception:
+            with self._lock:
+                self._pending_ops = None
+            raise
+        finally:
+            dbs.close()
+        bans = {int(r.user_id): _ban_row_to_dict(r) for r in rows if r.user_id is not None}
+        with self._lock:
+            for op, uid, ban in self._pending_ops or ():
+                if op == 'put':
+                    bans[uid] = ban
+                else:
+                    bans.pop(uid, None)
+            self._pending_ops = None
+            heap = [(int(b['banned_until']), uid) for uid, b in bans.items() if b['banned_until']]
+            heapq.heapify(heap)
+            self._bans = bans
+            self._expiry_heap = heap
+            self._loaded_at = time.monotonic()
+        return len(bans)
+
+    def is_stale(self) -> bool:
+        return not self._loaded_at or (time.monotonic() - self._loaded_at) >= BAN_INDEX_RESYNC_SEC
+
+    def _ensure_loaded(self) -> None:
+        # Устаревший снимок не перечитываем на месте: это делает фоновая задача
+        if not self._loaded_at:
+            self.load()
+
+    def _purge_expired(self, now_ts: int) -> None:
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now_ts:
+            until, uid = heapq.heappop(heap)
+            ban = self._bans.get(uid)
+            # Запись в куче могла устареть после повторного бана с другим сроком
+            if ban is not None and ban['banned_until'] == until:
+                del self._bans[uid]
+
+    def get(self, user_id: int) -> dict | None:
+        self._ensure_loaded()
+        now_ts = int(time.time())
+        with self._lock:
+            if self._expiry_heap and self._expiry_heap[0][0] <= now_ts:
+                self._purge_expired(now_ts)
+            ban = self._bans.get(int(user_id))
+            return dict(ban) if ban is not None else None
+
+    def put(self, ban: dict) -> None:
+        with self._lock:
+            self._bans[int(ban['user_id'])] = dict(ban)
+            if ban.get('banned_until'):
+                heapq.heappush(self._expiry_heap, (int(ban['banned_until']), int(ban['user_id'])))
+            if self._pending_ops is not None:
+                self._pending_ops.append(('put', int(ban['user_id']), dict(ban)))
+
+    def discard(self, user_id: int) -> None:
+        with self._lock:
+            self._bans.pop(int(user_id), None)
+            if self._pending_ops is not None:
+                self._pending_ops.append(('discard', int(user_id), None))
+
+    def active_count(self) -> int:
+        self._ensure_loaded()
+        with self._lock:
+            self._purge_expired(int(time.time()))
+            return len(self._bans)
+
+    def banned_ids(self) -> set[int]:
+        self._ensure_loaded()
+        with self._lock:
+            self._purge_expired(int(time.time()))
+            return set(self._bans)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._loaded_at = 0.0
+
+
+_ban_index = _BanIndex()
+
+
+def load_ban_index() -> int:
+    """Загружает активные баны в память (вызывается при старте бота)."""
+    return _ban_index.load()
+
+
+def refresh_ban_index() -> int | None:
+    """Перечитывает индекс банов, если снимок старше BAN_INDEX_RESYNC_SEC.
+
+    Вызывается фоновой задачей через пул БД; возвращает число активных банов
+    или None, если снимок ещё свежий.
+    """
+    if not _ban_index.is_stale():
+        return None
+    return _ban_index.load()
+
+
+def invalidate_ban_index() -> None:
+    _ban_index.invalidate()
+
+
+def _delete_ban_row(user_id: int) -> None:
     db = SessionLocal()
     try:
+        recp = db.query(UserBan).filter(UserBan.user_id == int(user_id)).first()
+        if recp:
+            db.delete(recp)
+            db.commit()
+    except Exception:
         try:
-            if is_protected_user(int(user_id)):
-                try:
-                    recp = db.query(UserBan).filter(UserBan.user_id == int(user_id)).first()
-                    if recp:
-                        db.delete(recp)
-                        db.commit()
-                except Exception:
-                    try:
-                        db.rollback()
-                    except Exception:
-                        pass
-                return None
+            db.rollback()
         except Exception:
             pass
-        now_ts = int(time.time())
-        rec = db.query(UserBan).filter(UserBan.user_id == int(user_id)).first()
-        if not rec:
-            return None
-        until = getattr(rec, 'banned_until', None)
-        if until is None or int(until) > now_ts:
-            return {
-                'user_id': int(rec.user_id),
-                'reason': rec.reason,
-                'banned_at': int(rec.banned_at or 0),
-                'banned_until': int(rec.banned_until or 0) if rec.banned_until else None,
-                'banned_by': int(rec.banned_by or 0) if rec.banned_by else None,
-            }
-        return None
     finally:
         db.close()
 
+
+def get_active_ban(user_id: int) -> dict | None:
+    """Возвращает активный бан пользователя из индекса в памяти или None.
+
+    В БД идём только для забаненных: если пользователь с тех пор стал
+    защищённым (админ/Создатель), бан снимается, как и раньше.
+    """
+    ban = _ban_index.get(user_id)
+    if ban is None:
+        return None
+    try:
+        if is_protected_user(int(user_id)):
+            _delete_ban_row(int(user_id))
+            _ban_index.discard(int(user_id))
+            return None
+    except Exception:
+        pass
+    return ban
+
 def increment_rating(user_id: int, amount: int = 1, max_rating: int = 1000) -> int | None:
     """Увеличивает рейтинг игрока на amount (не более max_rating). Создаёт игрока при отсутствии."""
     db = SessionLocal()
@@ -1238,24 +1585,20 @@ def change_player_rating(user_id: int, delta: int, max_rating: int = 1000) -> in
 def create_promo(code: str, kind: str, value: int, max_uses: int, per_user_limit: int, expires_at: int | None, active: bool = True, rarity: str | None = None) -> dict:
     db = SessionLocal()
     try:
-        _ensure_promos_has_rarity_column()
         code_norm = _normalize_promo_code(code)
         if not code_norm or len(code_norm) < 3:
             return {"ok": False, "reason": "invalid_code"}
-        # Быстрый чек по точному совпадению
-        existing = db.query(Promo).filter(func.lower(Promo.code) == code_norm.lower()).first()
+        # Код считается занятым и при совпадении после нормализации (кириллица/латиница)
+        existing = (
+            db.query(Promo.id)
+            .filter((Promo.code_norm == code_norm) | (func.lower(Promo.code) == code_norm.lower()))
+            .first()
+        )
         if existing:
             return {"ok": False, "reason": "exists"}
-        # Доп. чек на "похожий" код (например, кириллица/латиница)
-        try:
-            rows = db.query(Promo.code).all()
-            for (c,) in rows:
-                if _normalize_promo_code(c) == code_norm:
-                    return {"ok": False, "reason": "exists"}
-        except Exception:
-            pass
         row = Promo(
             code=code_norm,
+            code_norm=code_norm,
             kind=kind.strip(),
             value=int(value),
             max_uses=int(max_uses or 0),
@@ -1267,6 +1610,7 @@ def create_promo(code: str, kind: str, value: int, max_uses: int, per_user_limit
         db.add(row)
         db.commit()
         db.refresh(row)
+        _promo_code_index.invalidate()
         return {"ok": True, "id": int(row.id)}
     except Exception:
         db.rollback()
@@ -1347,6 +1691,92 @@ def normalize_promo_code(code: str) -> str:
     return _normalize_promo_code(code)
 
 
+class _PromoCodeIndex:
+    """Промокоды в памяти: нормализованный код -> условия промокода.
+
+    Активация берёт условия (вид, приз, лимиты, срок) из снимка и не читает promos;
+    лимиты проверяют условные UPDATE счётчиков в redeem_promo. create_promo и
+    deactivate_promo_* сбрасывают индекс, кроме того он перечитывается раз в
+    PROMO_INDEX_RESYNC_SEC. Промах добирается запросом по ix_promos_code_norm.
+    Исчерпанный промокод помечается, и дальше отказ выдаётся без транзакции записи.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_code: dict[str, dict] = {}
+        self._loaded_at = 0.0
+
+    @staticmethod
+    def _snapshot(row) -> dict:
+        return {
+            'id': int(row.id),
+            'kind': str(row.kind or '').strip().lower(),
+            'value': int(row.value or 0),
+            'rarity': row.rarity,
+            'max_uses': int(row.max_uses or 0),
+            'per_user_limit': int(row.per_user_limit or 0),
+            'expires_at': int(row.expires_at or 0) or None,
+            'active': bool(row.active),
+            'exhausted': int(row.max_uses or 0) > 0 and int(row.used_total or 0) >= int(row.max_uses),
+        }
+
+    def _query(self, dbs):
+        return dbs.query(
+            Promo.id, Promo.code_norm, Promo.kind, Promo.value, Promo.rarity, Promo.max_uses,
+            Promo.per_user_limit, Promo.expires_at, Promo.active, Promo.used_total,
+        )
+
+    def load(self) -> int:
+        dbs = SessionLocal()
+        try:
+            rows = self._query(dbs).order_by(Promo.id.desc()).all()
+        finally:
+            dbs.close()
+        # При совпадении нормализованных кодов побеждает самый старый промокод
+        by_code = {str(r.code_norm): self._snapshot(r) for r in rows if r.code_norm}
+        with self._lock:
+            self._by_code = by_code
+            self._loaded_at = time.monotonic()
+        return len(by_code)
+
+    def get(self, code_norm: str) -> dict | None:
+        if not self._loaded_at or (time.monotonic() - self._loaded_at) >= PROMO_INDEX_RESYNC_SEC:
+            self.load()
+        promo = self._by_code.get(code_norm)
+        if promo is not None:
+            return promo
+        dbs = SessionLocal()
+        try:
+            row = self._query(dbs).filter(Promo.code_norm == code_norm).order_by(Promo.id.asc()).first()
+        finally:
+            dbs.close()
+        if row is None:
+            return None
+        promo = self._snapshot(row)
+        with self._lock:
+            self._by_code[code_norm] = promo
+        return promo
+
+    def mark_exhausted(self, promo_id: int) -> None:
+        with self._lock:
+            for code_norm, promo in self._by_code.items():
+                if promo['id'] == promo_id:
+                    self._by_code[code_norm] = dict(promo, exhausted=True)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._by_code = {}
+            self._loaded_at = 0.0
+
+
+_promo_code_index = _PromoCodeIndex()
+
+
+def invalidate_promo_index() -> None:
+    """Сбрасывает индекс промокодов: следующая активация перечитает promos."""
+    _promo_code_index.invalidate()
+
+
 def find_promos_by_code_debug(code: str, limit: int = 10) -> dict:
     """Диагностика: ищет промокоды по нормализованному коду и возвращает кандидатов.
 
@@ -1357,23 +1787,25 @@ def find_promos_by_code_debug(code: str, limit: int = 10) -> dict:
         code_norm = _normalize_promo_code(code)
         if not code_norm:
             return {"ok": False, "code_norm": "", "items": []}
-        rows = db.query(Promo).order_by(Promo.created_at.desc()).all()
+        rows = (
+            db.query(Promo)
+            .filter(Promo.code_norm == code_norm)
+            .order_by(Promo.created_at.desc())
+            .limit(int(limit or 10))
+            .all()
+        )
         items: list[dict] = []
         for r in rows:
-            raw = getattr(r, 'code', '')
-            if _normalize_promo_code(str(raw)) == code_norm:
-                items.append({
-                    'id': int(r.id),
-                    'code': str(r.code),
-                    'kind': str(r.kind),
-                    'value': int(r.value or 0),
-                    'active': bool(r.active),
-                    'expires_at': int(r.expires_at or 0) if getattr(r, 'expires_at', None) else None,
-                    'max_uses': int(r.max_uses or 0),
-                    'per_user_limit': int(r.per_user_limit or 0),
-                })
-                if len(items) >= int(limit or 10):
-                    break
+            items.append({
+                'id': int(r.id),
+                'code': str(r.code),
+                'kind': str(r.kind),
+                'value': int(r.value or 0),
+                'active': bool(r.active),
+                'expires_at': int(r.expires_at or 0) if getattr(r, 'expires_at', None) else None,
+                'max_uses': int(r.max_uses or 0),
+                'per_user_limit': int(r.per_user_limit or 0),
+            })
         return {"ok": True, "code_norm": code_norm, "items": items}
     except Exception:
         return {"ok": False, "code_norm": "", "items": []}
@@ -1390,7 +1822,7 @@ def list_promos(active_only: bool = False) -> list[dict]:
         rows = q.all()
         out = []
         for r in rows:
-            used = db.query(func.count(PromoUsage.id)).filter(PromoUsage.promo_id == r.id).scalar() or 0
+            used = int(r.used_total or 0)
             out.append({
                 'id': int(r.id),
                 'code': r.code,
@@ -1417,6 +1849,7 @@ def deactivate_promo_by_id(promo_id: int) -> bool:
             return False
         row.active = False
         db.commit()
+        _promo_code_index.invalidate()
         return True
     except Exception:
         db.rollback()
@@ -1430,21 +1863,12 @@ def deactivate_promo_by_code(code: str) -> bool:
         code_norm = _normalize_promo_code(code)
         if not code_norm:
             return False
-        row = db.query(Promo).filter(func.lower(Promo.code) == code_norm.lower()).first()
-        if not row:
-            # Фолбэк на нормализованное сравнение в Python (кириллица/латиница)
-            try:
-                rows = db.query(Promo).all()
-                for r in rows:
-                    if _normalize_promo_code(getattr(r, 'code', '')) == code_norm:
-                        row = r
-                        break
-            except Exception:
-                row = None
+        row = db.query(Promo).filter(Promo.code_norm == code_norm).order_by(Promo.id.asc()).first()
         if not row:
             return False
         row.active = False
         db.commit()
+        _promo_code_index.invalidate()
         return True
     except Exception:
         db.rollback()
@@ -1464,76 +1888,89 @@ def get_promo_usage_total() -> int:
 # Пользовательская активация промокодов
 
 def redeem_promo(user_id: int, code: str) -> dict:
-    db = SessionLocal()
-    try:
-        create_db_and_tables()
-        _ensure_promos_has_rarity_column()
-        _ensure_player_has_autosearch_columns()
-        _ensure_player_has_casino_stats()
-        code_norm = _normalize_promo_code(code)
-        if not code_norm:
-            return {"ok": False, "reason": "not_found_or_inactive"}
+    """Активация промокода пользователем.
 
-        # Сначала пробуем быстрый поиск по нормализованному коду
-        row = db.query(Promo).filter(func.lower(Promo.code) == code_norm.lower()).first()
-        if not row:
-            # Фолбэк: если в базе код сохранён кириллицей/латиницей, найдём через нормализацию в Python
-            try:
-                candidates = db.query(Promo).all()
-                for r in candidates:
-                    if _normalize_promo_code(getattr(r, 'code', '')) == code_norm:
-                        row = r
-                        break
-            except Exception:
-                row = None
-        if not row or not bool(row.active):
-            return {"ok": False, "reason": "not_found_or_inactive"}
+    Условия промокода берутся из _PromoCodeIndex. Лимиты проверяются в одной транзакции
+    BEGIN IMMEDIATE условными UPDATE счётчиков: promos.used_total растёт, только пока он
+    меньше max_uses, promo_user_usages.used — пока меньше per_user_limit. Поэтому при
+    одновременных активациях одного кода лимит не превышается, а если приз выдать
+    нельзя, откат возвращает и счётчики.
+    """
+    code_norm = _normalize_promo_code(code)
+    if not code_norm:
+        return {"ok": False, "reason": "not_found_or_inactive"}
+    try:
+        promo = _promo_code_index.get(code_norm)
+    except Exception:
+        logger.exception("[PROMO] promo index lookup failed: code=%r", code)
+        return {"ok": False, "reason": "exception"}
+    if promo is None or not promo['active']:
+        return {"ok": False, "reason": "not_found_or_inactive"}
+    now_ts = int(time.time())
+    if promo['expires_at'] and now_ts >= promo['expires_at']:
+        return {"ok": False, "reason": "expired"}
+    if promo['exhausted']:
+        return {"ok": False, "reason": "max_uses_reached"}
+
+    promo_id = promo['id']
+    kind = promo['kind']
+    value = promo['value']
+    result: dict = {"ok": True, "kind": kind, "value": value}
+    admin_tier = False
+    if kind in ('vip', 'vip_plus'):
+        # Профиль доступа читается до захвата блокировки записи
+        access = get_access_profile(int(user_id))
+        admin_tier = str(access.get('tier') or '') in ('admin', 'admin_plus')
 
-        now_ts = int(time.time())
-        if getattr(row, 'expires_at', None):
-            try:
-                exp = int(row.expires_at)
-            except Exception:
-                exp = None
-            if exp and now_ts >= exp:
+    db = SessionLocal()
+    try:
+        _begin_write_transaction(db)
+        # Общий лимит: счётчик растёт, только если промокод ещё активен и не исчерпан
+        claimed = (
+            db.query(Promo)
+            .filter(
+                Promo.id == promo_id,
+                Promo.active == True,
+                (Promo.expires_at == None) | (Promo.expires_at > now_ts),
+                (func.coalesce(Promo.max_uses, 0) <= 0) | (Promo.used_total < Promo.max_uses),
+            )
+            .update({Promo.used_total: Promo.used_total + 1}, synchronize_session=False)
+        )
+        if not claimed:
+            state = db.query(Promo.active, Promo.expires_at).filter(Promo.id == promo_id).first()
+            db.rollback()
+            if state is None or not bool(state.active):
+                _promo_code_index.invalidate()
+                return {"ok": False, "reason": "not_found_or_inactive"}
+            if state.expires_at and now_ts >= int(state.expires_at):
                 return {"ok": False, "reason": "expired"}
-
-        # Общий лимит
-        used_total = int(db.query(func.count(PromoUsage.id)).filter(PromoUsage.promo_id == row.id).scalar() or 0)
-        if int(row.max_uses or 0) > 0 and used_total >= int(row.max_uses):
+            _promo_code_index.mark_exhausted(promo_id)
             return {"ok": False, "reason": "max_uses_reached"}
 
-        # Лимит на пользователя
-        used_by_user = int(
-            db.query(func.count(PromoUsage.id))
-            .filter(PromoUsage.promo_id == row.id, PromoUsage.user_id == int(user_id))
-            .scalar() or 0
+        # Лимит на пользователя: upsert счётчика, при исчерпании строка не меняется
+        per_user_limit = promo['per_user_limit']
+        counter = sqlite_insert(PromoUserUsage).values(promo_id=promo_id, user_id=int(user_id), used=1)
+        counter = counter.on_conflict_do_update(
+            index_elements=[PromoUserUsage.promo_id, PromoUserUsage.user_id],
+            set_={'used': PromoUserUsage.used + 1},
+            where=(PromoUserUsage.used < per_user_limit) if per_user_limit > 0 else None,
         )
-        if int(row.per_user_limit or 0) > 0 and used_by_user >= int(row.per_user_limit):
+        if not db.execute(counter).rowcount:
+            db.rollback()
             return {"ok": False, "reason": "per_user_limit_reached"}
 
         # Гарантируем наличие игрока
-        player = db.query(Player).filter(Player.user_id == int(user_id)).with_for_update(read=False).first()
+        player = db.query(Player).filter(Player.user_id == int(user_id)).first()
         if not player:
             player = Player(user_id=int(user_id), username=None)
             db.add(player)
-            db.commit()
-            db.refresh(player)
-
-        kind = str(row.kind or '').strip().lower()
-        value = int(row.value or 0)
-        
-
-
-        result: dict = {"ok": True, "kind": kind, "value": value}
-        access = get_access_profile(int(user_id), player=player)
-        admin_tier = str(access.get('tier') or '') in ('admin', 'admin_plus')
+            db.flush()
 
         if kind == 'coins':
             add = max(0, value)
             current = int(player.coins or 0)
             player.coins = current + add
-            db.add(PromoUsage(promo_id=int(row.id), user_id=int(user_id)))
+            db.add(PromoUsage(promo_id=promo_id, user_id=int(user_id)))
             db.commit()
             result.update({"coins_added": add, "coins_total": int(player.coins)})
             try:
@@ -1549,14 +1986,14 @@ def redeem_promo(user_id: int, code: str) -> dict:
             if admin_tier:
                 amount = _seconds_to_linear_plan_cost(add_sec, int(VIP_COSTS.get('1d', 0) or 0))
                 player.coins = int(getattr(player, 'coins', 0) or 0) + amount
-                db.add(PromoUsage(promo_id=int(row.id), user_id=int(user_id)))
+                db.add(PromoUsage(promo_id=promo_id, user_id=int(user_id)))
                 db.commit()
                 result.update({"coins_added": int(amount), "coins_total": int(player.coins), "converted_to_coins": True, "converted_from": "vip"})
                 return result
             base_ts = int(getattr(player, 'vip_until', 0) or 0)
             start_ts = base_ts if base_ts > now_ts else now_ts
             player.vip_until = start_ts + add_sec
-            db.add(PromoUsage(promo_id=int(row.id), user_id=int(user_id)))
+            db.add(PromoUsage(promo_id=promo_id, user_id=int(user_id)))
             db.commit()
             result.update({"vip_until": int(player.vip_until)})
             try:
@@ -1572,14 +2009,14 @@ def redeem_promo(user_id: int, code: str) -> dict:
             if admin_tier:
                 amount = _seconds_to_linear_plan_cost(add_sec, int(VIP_PLUS_COSTS.get('1d', 0) or 0))
                 player.coins = int(getattr(player, 'coins', 0) or 0) + amount
-                db.add(PromoUsage(promo_id=int(row.id), user_id=int(user_id)))
+                db.add(PromoUsage(promo_id=promo_id, user_id=int(user_id)))
                 db.commit()
                 result.update({"coins_added": int(amount), "coins_total": int(player.coins), "converted_to_coins": True, "converted_from": "vip_plus"})
                 return result
             base_ts = int(getattr(player, 'vip_plus_until', 0) or 0)
             start_ts = base_ts if base_ts > now_ts else now_ts
             player.vip_plus_until = start_ts + add_sec
-            db.add(PromoUsage(promo_id=int(row.id), user_id=int(user_id)))
+            db.add(PromoUsage(promo_id=promo_id, user_id=int(user_id)))
             db.commit()
             result.update({"vip_plus_until": int(player.vip_plus_until)})
             try:
@@ -1592,9 +2029,10 @@ def redeem_promo(user_id: int, code: str) -> dict:
             # value — drink_id, редкость из колонки rarity (или Basic по умолчанию)
             drink = db.query(EnergyDrink).filter(EnergyDrink.id == int(value)).first()
             if not drink:
+                db.rollback()
                 return {"ok": False, "reason": "invalid_drink"}
             # Если редкость промокода не указана — используем встроенную default_rarity энергетика (если она есть)
-            rarity = str(getattr(row, 'rarity', '') or '').strip()
+            rarity = str(promo['rarity'] or '').strip()
             if not rarity:
                 rarity = str(getattr(drink, 'default_rarity', '') or '').strip()
             if not rarity:
@@ -1605,7 +2043,7 @@ def redeem_promo(user_id: int, code: str) -> dict:
                 item.quantity = int(item.quantity or 0) + 1
             else:
                 db.add(InventoryItem(player_id=int(user_id), drink_id=int(drink.id), rarity=rarity, quantity=1))
-            db.add(PromoUsage(promo_id=int(row.id), user_id=int(user_id)))
+            db.add(PromoUsage(promo_id=promo_id, user_id=int(user_id)))
             db.commit()
             result.update({"drink_name": getattr(drink, 'name', 'Энергетик'), "rarity": rarity})
             try:
@@ -1617,7 +2055,7 @@ def redeem_promo(user_id: int, code: str) -> dict:
         elif kind == 'selyuk_fragment':
             add = max(0, value)
             player.selyuk_fragments = int(getattr(player, 'selyuk_fragments', 0) or 0) + add
-            db.add(PromoUsage(promo_id=int(row.id), user_id=int(user_id)))
+            db.add(PromoUsage(promo_id=promo_id, user_id=int(user_id)))
             db.commit()
             result.update({"fragments_added": add, "fragments_total": int(player.selyuk_fragments)})
             return result
@@ -1635,7 +2073,7 @@ def redeem_promo(user_id: int, code: str) -> dict:
                 new_boost_count = boost_count
             player.auto_search_boost_count = int(new_boost_count)
             player.auto_search_boost_until = int(start_time + 86400)
-            db.add(PromoUsage(promo_id=int(row.id), user_id=int(user_id)))
+            db.add(PromoUsage(promo_id=promo_id, user_id=int(user_id)))
             db.commit()
             result.update({"boost_count": int(boost_count), "boost_count_after": int(player.auto_search_boost_count), "boost_until": int(player.auto_search_boost_until)})
             return result
@@ -1643,7 +2081,7 @@ def redeem_promo(user_id: int, code: str) -> dict:
         elif kind == 'luck_coupon':
             add = max(0, value)
             player.luck_coupon_charges = int(getattr(player, 'luck_coupon_charges', 0) or 0) + add
-            db.add(PromoUsage(promo_id=int(row.id), user_id=int(user_id)))
+            db.add(PromoUsage(promo_id=promo_id, user_id=int(user_id)))
             db.commit()
             result.update({"luck_added": add, "luck_after": int(player.luck_coupon_charges)})
             return result
@@ -1651,7 +2089,7 @@ def redeem_promo(user_id: int, code: str) -> dict:
         elif kind == 'seed_coupon':
             add = max(0, value)
             player.seed_coupon_count = int(getattr(player, 'seed_coupon_count', 0) or 0) + add
-            db.add(PromoUsage(promo_id=int(row.id), user_id=int(user_id)))
+            db.add(PromoUsage(promo_id=promo_id, user_id=int(user_id)))
             db.commit()
             result.update({"seed_coupon_added": add, "seed_coupon_after": int(player.seed_coupon_count)})
             return result
@@ -1660,7 +2098,7 @@ def redeem_promo(user_id: int, code: str) -> dict:
             count = max(0, int(value))
             if count > 0:
                 player.last_search = 0
-            db.add(PromoUsage(promo_id=int(row.id), user_id=int(user_id)))
+            db.add(PromoUsage(promo_id=promo_id, user_id=int(user_id)))
             db.commit()
             result.update({"search_skips_used": count})
             return result
@@ -1669,12 +2107,13 @@ def redeem_promo(user_id: int, code: str) -> dict:
             count = max(0, int(value))
             if count > 0:
                 player.daily_bonus_manual_ready = 1
-            db.add(PromoUsage(promo_id=int(row.id), user_id=int(user_id)))
+            db.add(PromoUsage(promo_id=promo_id, user_id=int(user_id)))
             db.commit()
             result.update({"bonus_skips_used": count, "bonus_ready": bool(count > 0)})
             return result
 
         else:
+            db.rollback()
             return {"ok": False, "reason": "unsupported_kind"}
 
     except Exception:
@@ -1736,15 +2175,140 @@ def get_all_active_beds_for_reminders() -> list[dict]:
     finally:
         db.close()
 
-def get_setting_str(key: str, default_value: str | None = None) -> str | None:
-    db = SessionLocal()
+def get_plantation_reminders_due(user_id: int | None = None) -> list[tuple[int, int, int]]:
+    """Сроки напоминаний о поливе одним запросом: [(user_id, bed_index, remind_at), ...].
+
+    Берутся растущие грядки игроков с включёнными напоминаниями. Срок — сохранённый
+    plantation_beds.water_remind_at, а если его ещё нет — последний полив (или посадка)
+    плюс интервал полива семени.
+    """
+    dbs = SessionLocal()
     try:
-        row = db.query(BotSetting).filter(BotSetting.key == key).first()
-        if not row or row.value is None:
-            return default_value
-        return str(row.value)
+        last_water = func.coalesce(func.nullif(PlantationBed.last_watered_at, 0), PlantationBed.planted_at, 0)
+        remind_at = func.coalesce(PlantationBed.water_remind_at, last_water + SeedType.water_interval_sec)
+        q = (
+            dbs.query(PlantationBed.owner_id, PlantationBed.bed_index, remind_at)
+            .join(SeedType, PlantationBed.seed_type_id == SeedType.id)
+            .join(Player, PlantationBed.owner_id == Player.user_id)
+            .filter(PlantationBed.state == 'growing', Player.remind_plantation == True)  # noqa: E712
+        )
+        if user_id is not None:
+            q = q.filter(PlantationBed.owner_id == int(user_id))
+        return [(int(uid), int(bed or 0), int(ts or 0)) for uid, bed, ts in q.all()]
     finally:
-        db.close()
+        dbs.close()
+
+
+def set_plantation_reminders_many(due: dict[tuple[int, int], int | None]) -> int:
+    """Сохраняет сроки напоминаний о поливе пачки грядок одним executemany (None — снять)."""
+    if not due:
+        return 0
+    dbs = SessionLocal()
+    try:
+        dbs.execute(
+            text("UPDATE plantation_beds SET water_remind_at = :ts WHERE owner_id = :uid AND bed_index = :bed"),
+            [
+                {"uid": int(uid), "bed": int(bed), "ts": (int(ts) if ts is not None else None)}
+                for (uid, bed), ts in due.items()
+            ],
+        )
+        dbs.commit()
+        return len(due)
+    except Exception:
+        dbs.rollback()
+        raise
+    finally:
+        dbs.close()
+
+
+# --- Кэш настроек bot_settings ---
+
+class _SettingsCache:
+    """Снимок таблицы bot_settings в памяти.
+
+    Чтение настройки — поиск в словаре. set_setting_* пишут в БД и сразу
+    обновляют снимок (write-through) и уведомляют подписчиков. При
+    SETTINGS_CACHE_TTL_SEC > 0 снимок периодически перечитывается целиком,
+    чтобы подхватить изменения из других процессов.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values: dict[str, str] = {}
+        self._loaded_at = 0.0
+        self._listeners: list = []
+        self.loads = 0
+
+    def _is_fresh(self) -> bool:
+        loaded_at = self._loaded_at
+        if not loaded_at:
+            return False
+        return SETTINGS_CACHE_TTL_SEC <= 0 or time.monotonic() - loaded_at < SETTINGS_CACHE_TTL_SEC
+
+    def _ensure_loaded(self) -> None:
+        if self._is_fresh():
+            return
+        with self._lock:
+            if self._is_fresh():
+                return
+            dbs = SessionLocal()
+            try:
+                rows = dbs.query(BotSetting.key, BotSetting.value).all()
+            finally:
+                dbs.close()
+            self._values = {str(k): str(v) for k, v in rows if v is not None}
+            self._loaded_at = time.monotonic()
+            self.loads += 1
+
+    def get(self, key: str) -> str | None:
+        self._ensure_loaded()
+        return self._values.get(key)
+
+    def put(self, key: str, value: str) -> None:
+        with self._lock:
+            self._values[key] = value
+            listeners = list(self._listeners)
+        for callback in listeners:
+            try:
+                callback(key, value)
+            except Exception as e:
+                logger.warning(f"[SETTINGS] Listener failed for {key}: {e}")
+
+    def add_listener(self, callback) -> None:
+        with self._lock:
+            if callback not in self._listeners:
+                self._listeners.append(callback)
+
+    def remove_listener(self, callback) -> None:
+        with self._lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._loaded_at = 0.0
+
+
+_settings_cache = _SettingsCache()
+
+
+def invalidate_settings_cache() -> None:
+    """Сбрасывает снимок настроек: следующее чтение перечитает bot_settings."""
+    _settings_cache.invalidate()
+
+
+def add_setting_listener(callback) -> None:
+    """Подписывает callback(key, value) на изменения настроек через set_setting_*."""
+    _settings_cache.add_listener(callback)
+
+
+def remove_setting_listener(callback) -> None:
+    _settings_cache.remove_listener(callback)
+
+
+def get_setting_str(key: str, default_value: str | None = None) -> str | None:
+    value = _settings_cache.get(key)
+    return default_value if value is None else value
 
 def set_setting_str(key: str, value: str) -> bool:
     db = SessionLocal()
@@ -1756,7 +2320,6 @@ def set_setting_str(key: str, value: str) -> bool:
         else:
             row.value = str(value)
         db.commit()
-        return True
     except Exception:
         try:
             db.rollback()
@@ -1765,6 +2328,8 @@ def set_setting_str(key: str, value: str) -> bool:
         return False
     finally:
         db.close()
+    _settings_cache.put(key, str(value))
+    return True
 
 def get_setting_int(key: str, default_value: int) -> int:
     s = get_setting_str(key, None)
@@ -1814,6 +2379,7 @@ def _ensure_gift_autoblock_defaults() -> None:
             if not row:
                 db.add(BotSetting(key=key, value=value))
         db.commit()
+        invalidate_settings_cache()
     except Exception:
         try:
             db.rollback()
@@ -3135,46 +3701,17 @@ def ensure_player_beds(user_id: int, total_beds: int = 1) -> list[PlantationBed]
 def get_player_beds(user_id: int) -> list[PlantationBed]:
     dbs = SessionLocal()
     try:
-        try:
-            beds = list(
-                dbs.query(PlantationBed)
-                .options(
-                    joinedload(PlantationBed.seed_type), 
-                    joinedload(PlantationBed.fertilizer),
-                    joinedload(PlantationBed.active_fertilizers).joinedload(BedFertilizer.fertilizer)
-                )
-                .filter(PlantationBed.owner_id == user_id)
-                .order_by(PlantationBed.bed_index.asc())
-                .all()
+        beds = list(
+            dbs.query(PlantationBed)
+            .options(
+                joinedload(PlantationBed.seed_type), 
+                joinedload(PlantationBed.fertilizer),
+                joinedload(PlantationBed.active_fertilizers).joinedload(BedFertilizer.fertilizer)
             )
-        except OperationalError as e:
-            if "no such column: plantation_beds.status_effect_level" in str(e):
-                try:
-                    dbs.rollback()
-                except Exception:
-                    pass
-                try:
-                    dbs.close()
-                except Exception:
-                    pass
-                try:
-                    ensure_schema()
-                except Exception:
-                    pass
-                dbs = SessionLocal()
-                beds = list(
-                    dbs.query(PlantationBed)
-                    .options(
-                        joinedload(PlantationBed.seed_type), 
-                        joinedload(PlantationBed.fertilizer),
-                        joinedload(PlantationBed.active_fertilizers).joinedload(BedFertilizer.fertilizer)
-                    )
-                    .filter(PlantationBed.owner_id == user_id)
-                    .order_by(PlantationBed.bed_index.asc())
-                    .all()
-                )
-            else:
-                raise
+            .filter(PlantationBed.owner_id == user_id)
+            .order_by(PlantationBed.bed_index.asc())
+            .all()
+        )
         
         # Обновляем состояние грядок (ленивая проверка)
         updated = False
@@ -4538,6 +5075,48 @@ def get_players_with_auto_search_enabled() -> list[dict]:
     finally:
         dbs.close()
 
+def get_due_auto_search_players(until_ts: float, limit: int = 5000) -> list[tuple[int, int]]:
+    """
+    Возвращает [(user_id, auto_search_next_ts)] игроков с включённым автопоиском,
+    у которых следующий запуск не позже until_ts, по возрастанию времени.
+    Идёт по индексу idx_players_auto_search_due, поэтому стоит O(due), а не O(всех VIP).
+    """
+    dbs = SessionLocal()
+    try:
+        rows = (
+            dbs.query(Player.user_id, Player.auto_search_next_ts)
+            .filter(
+                Player.auto_search_enabled == True,  # noqa: E712
+                Player.auto_search_next_ts <= int(until_ts),
+            )
+            .order_by(Player.auto_search_next_ts)
+            .limit(int(limit))
+            .all()
+        )
+        return [(int(r.user_id), int(r.auto_search_next_ts)) for r in rows]
+    finally:
+        dbs.close()
+
+
+def set_auto_search_due_many(due: dict[int, int]) -> int:
+    """Сохраняет время следующего автопоиска для пачки игроков одним executemany."""
+    if not due:
+        return 0
+    dbs = SessionLocal()
+    try:
+        dbs.execute(
+            text("UPDATE players SET auto_search_next_ts = :ts WHERE user_id = :uid"),
+            [{"uid": int(uid), "ts": int(ts)} for uid, ts in due.items()],
+        )
+        dbs.commit()
+        return len(due)
+    except Exception:
+        dbs.rollback()
+        raise
+    finally:
+        dbs.close()
+
+
 def get_auto_search_daily_limit(user_id: int, username: str | None = None) -> int:
     """
     Возвращает дневной лимит автопоиска для пользователя.
@@ -4549,35 +5128,41 @@ def get_auto_search_daily_limit(user_id: int, username: str | None = None) -> in
         if not player:
             return int(AUTO_SEARCH_DAILY_LIMIT)
 
-        base_limit = int(get_setting_int('auto_search_daily_limit_base', int(AUTO_SEARCH_DAILY_LIMIT)))
-        vip_mult = float(get_setting_float('auto_search_vip_daily_mult', 1.0))
-        vip_plus_mult = float(get_setting_float('auto_search_vip_plus_daily_mult', 2.0))
         access = get_access_profile(user_id, username=username, player=player)
-        tier = str(access.get('tier') or 'ordinary')
-
-        if tier == 'admin_plus':
-            base_limit = int(base_limit) + 60
-        elif tier == 'admin':
-            base_limit = int(base_limit) + 20
-        elif tier == 'vip_plus':
-            base_limit = int(round(base_limit * vip_plus_mult))
-        elif tier == 'vip':
-            base_limit = int(round(base_limit * vip_mult))
-
-        if base_limit < 0:
-            base_limit = 0
-        
-        boost_count = int(getattr(player, 'auto_search_boost_count', 0) or 0)
-        boost_until = int(getattr(player, 'auto_search_boost_until', 0) or 0)
-        
-        # Проверяем, активен ли буст
-        if boost_until > int(time.time()):
-            return base_limit + boost_count
-        else:
-            return base_limit
+        return auto_search_daily_limit_for(
+            str(access.get('tier') or 'ordinary'),
+            int(getattr(player, 'auto_search_boost_count', 0) or 0),
+            int(getattr(player, 'auto_search_boost_until', 0) or 0),
+        )
     finally:
         dbs.close()
 
+
+def auto_search_daily_limit_for(tier: str, boost_count: int = 0, boost_until: int = 0,
+                                now_ts: int | None = None) -> int:
+    """Дневной лимит автопоиска по уже известным tier и бусту (без запросов к БД)."""
+    base_limit = int(get_setting_int('auto_search_daily_limit_base', int(AUTO_SEARCH_DAILY_LIMIT)))
+    vip_mult = float(get_setting_float('auto_search_vip_daily_mult', 1.0))
+    vip_plus_mult = float(get_setting_float('auto_search_vip_plus_daily_mult', 2.0))
+
+    if tier == 'admin_plus':
+        base_limit = int(base_limit) + 60
+    elif tier == 'admin':
+        base_limit = int(base_limit) + 20
+    elif tier == 'vip_plus':
+        base_limit = int(round(base_limit * vip_plus_mult))
+    elif tier == 'vip':
+        base_limit = int(round(base_limit * vip_mult))
+
+    if base_limit < 0:
+        base_limit = 0
+
+    # Проверяем, активен ли буст
+    now_ts = int(time.time()) if now_ts is None else int(now_ts)
+    if int(boost_until or 0) > now_ts:
+        return base_limit + int(boost_count or 0)
+    return base_limit
+
 def increment_auto_search_count(user_id: int, delta: int = 1) -> int:
     """
     Атомарный инкремент auto_search_count.
@@ -4809,6 +5394,7 @@ def purchase_generic_bonus(user_id: int, cost_coins: int, kind: str, extra: str
         dbs.add(receipt)
 
         dbs.commit()
+        _bot_stats_snapshot.bump(total_purchases=1, purchases_today=1)
         return {
             "ok": True,
             "coins_left": int(player.coins),
@@ -4896,6 +5482,7 @@ def purchase_bonus_with_stock(
         dbs.add(receipt)
 
         dbs.commit()
+        _bot_stats_snapshot.bump(total_purchases=1, purchases_today=1)
         return {
             "ok": True,
             "coins_left": int(player.coins),
@@ -4986,6 +5573,7 @@ def purchase_tg_premium(user_id: int, cost_coins: int, duration_seconds: int) ->
         dbs.add(receipt)
 
         dbs.commit()
+        _bot_stats_snapshot.bump(total_purchases=1, purchases_today=1)
         return {
             "ok": True,
             "tg_premium_until": new_until,
@@ -5007,11 +5595,42 @@ def get_player_by_username(username: str) -> Player | None:
     try:
         if not username:
             return None
-        return db.query(Player).filter(func.lower(Player.username) == username.lower()).first()
+        return db.query(Player).filter(Player.username_lower == str(username).lstrip('@').lower()).first()
     finally:
         db.close()
 
 
+def _player_search_enabled(dbs) -> bool:
+    """Есть ли в БД FTS-индекс player_search (проверяется один раз на процесс)."""
+    global _player_search_fts
+    if _player_search_fts is None:
+        try:
+            _player_search_fts = dbs.execute(
+                text("SELECT 1 FROM sqlite_master WHERE name = 'player_search'")
+            ).first() is not None
+        except Exception:
+            _player_search_fts = False
+    return bool(_player_search_fts)
+
+
+def _player_search_filter(dbs, column: str, needle: str):
+    """Условие «needle входит в players.<column> без учёта регистра».
+
+    Через player_search, если индекс есть и строка не короче PLAYER_SEARCH_MIN_CHARS,
+    иначе прежний LIKE '%needle%' по всей таблице.
+    """
+    if len(needle) >= PLAYER_SEARCH_MIN_CHARS and _player_search_enabled(dbs):
+        match = column + ' : "' + needle.replace('"', '""') + '"'
+        return Player.user_id.in_(
+            select(literal_column('rowid'))
+            .select_from(text('player_search'))
+            .where(text('player_search MATCH :player_search_match').bindparams(player_search_match=match))
+        )
+    if column == 'username':
+        return Player.username_lower.contains(needle.lower(), autoescape=True)
+    return func.lower(Player.display_name).contains(needle.lower(), autoescape=True)
+
+
 def find_player_by_identifier(identifier, partial_limit: int = 5) -> dict:
     dbs = SessionLocal()
     try:
@@ -5055,18 +5674,14 @@ def find_player_by_identifier(identifier, partial_limit: int = 5) -> dict:
             return {"ok": True, "player": player} if player else {"ok": False, "reason": "not_found"}
 
         if re.fullmatch(r"[A-Za-z0-9_]{3,32}", uname):
-            player = (
-                dbs.query(Player)
-                .filter(Player.username.isnot(None))
-                .filter(func.lower(Player.username) == uname.lower())
-                .first()
-            )
+            player = dbs.query(Player).filter(Player.username_lower == uname.lower()).first()
             if player:
                 return {"ok": True, "player": player}
 
+        # Точное совпадение display_name: кандидаты из индекса, затем сравнение строки
         player = (
             dbs.query(Player)
-            .filter(Player.display_name.isnot(None))
+            .filter(_player_search_filter(dbs, 'display_name', uname))
             .filter(func.lower(Player.display_name) == uname.lower())
             .first()
         )
@@ -5076,7 +5691,7 @@ def find_player_by_identifier(identifier, partial_limit: int = 5) -> dict:
         candidates = (
             dbs.query(Player)
             .filter(Player.username.isnot(None))
-            .filter(func.lower(Player.username).contains(uname.lower()))
+            .filter(_player_search_filter(dbs, 'username', uname))
             .order_by(Player.user_id.asc())
             .limit(int(partial_limit) + 1)
             .all()
@@ -5086,7 +5701,7 @@ def find_player_by_identifier(identifier, partial_limit: int = 5) -> dict:
             candidates = (
                 dbs.query(Player)
                 .filter(Player.display_name.isnot(None))
-                .filter(func.lower(Player.display_name).contains(uname.lower()))
+                .filter(_player_search_filter(dbs, 'display_name', uname))
                 .order_by(Player.user_id.asc())
                 .limit(int(partial_limit) + 1)
                 .all()
@@ -5127,12 +5742,12 @@ def search_players_by_username(query: str, page: int = 0, per_page: int = 5) ->
         base = (
             dbs.query(Player)
             .filter(Player.username.isnot(None))
-            .filter(func.lower(Player.username).contains(q.lower()))
+            .filter(_player_search_filter(dbs, 'username', q))
         )
 
         total = int(base.count() or 0)
         rows = (
-            base.order_by(func.lower(Player.username).asc(), Player.user_id.asc())
+            base.order_by(Player.username_lower.asc(), Player.user_id.asc())
             .offset(page * per_page)
             .limit(per_page)
             .all()
@@ -6127,31 +6742,6 @@ def _is_autosell_enabled_in_session(dbs, user_id: int, rarity: str) -> bool:
     return bool(getattr(row, 'enabled', False))
 
 
-def _record_drink_discovery_in_session(dbs, drink_id: int, current_time: int | None = None):
-    ts = int(current_time or time.time())
-    current_date = int(ts // 86400)
-    stats = dbs.query(DrinkDiscoveryStats).filter_by(drink_id=int(drink_id)).first()
-    if stats:
-        stats.total_discoveries = int(getattr(stats, 'total_discoveries', 0) or 0) + 1
-        stats.last_discovered_at = ts
-        if int(getattr(stats, 'last_reset_date', 0) or 0) != current_date:
-            stats.global_discoveries_today = 1
-            stats.last_reset_date = current_date
-        else:
-            stats.global_discoveries_today = int(getattr(stats, 'global_discoveries_today', 0) or 0) + 1
-        return
-
-    dbs.add(
-        DrinkDiscoveryStats(
-            drink_id=int(drink_id),
-            total_discoveries=1,
-            last_discovered_at=ts,
-            global_discoveries_today=1,
-            last_reset_date=current_date,
-        )
-    )
-
-
 def _upsert_swaga_cards_in_session(dbs, user_id: int, drop_counts: dict[str, int] | None):
     for rarity_name, qty in (drop_counts or {}).items():
         amount = max(0, int(qty or 0))
@@ -6315,7 +6905,6 @@ def apply_energy_search_outcome_atomic(
             if (not autosell_enabled) or autosell_payout <= 0:
                 _merge_inventory_rows_in_session(dbs, int(user_id), drink_id, rarity, quantity=1)
 
-            _record_drink_discovery_in_session(dbs, drink_id, current_time=now_ts)
             applied_drops.append(
                 {
                     "drink_id": int(drink_id),
@@ -6337,6 +6926,10 @@ def apply_energy_search_outcome_atomic(
             player.auto_search_count = int(auto_count)
 
         dbs.commit()
+        # Статистика находок пишется отложенно (write-behind), чтобы популярные
+        # напитки не сериализовали все поиски на одной строке drink_discovery_stats.
+        for applied in applied_drops:
+            _note_drink_discovery(applied["drink_id"], now_ts)
         return {
             "ok": True,
             "coins_after": int(player.coins),
@@ -6357,6 +6950,287 @@ def apply_energy_search_outcome_atomic(
         dbs.close()
 
 
+_AUTO_SEARCH_STATE_COLUMNS = (
+    'username', 'language', 'coins', 'rating', 'last_search', 'remind',
+    'vip_until', 'vip_plus_until',
+    'auto_search_enabled', 'auto_search_count', 'auto_search_reset_ts',
+    'auto_search_boost_count', 'auto_search_boost_until', 'auto_search_silent',
+    'luck_coupon_charges', 'luck_coupon_auto_use',
+    'favorite_drink_1', 'favorite_drink_2', 'favorite_drink_3',
+)
+
+
+def load_auto_search_states(user_ids) -> dict[int, dict]:
+    """
+    Читает состояние пачки игроков для пакетного автопоиска: поля игрока и
+    уровень админа одним запросом (LEFT JOIN admin_users), плюс drink_id
+    избранных напитков вторым запросом по их id.
+    Возвращает {user_id: dict}; уровень админа — в ключе 'admin_level'
+    (с учётом ADMIN_USERNAMES, как get_effective_admin_level).
+    """
+    ids = sorted({int(uid) for uid in user_ids})
+    if not ids:
+        return {}
+    cols = [getattr(Player, name) for name in _AUTO_SEARCH_STATE_COLUMNS]
+    dbs = SessionLocal()
+    try:
+        rows = (
+            dbs.query(Player.user_id, *cols, AdminUser.user_id.label('admin_uid'), AdminUser.level.label('admin_lvl'))
+            .outerjoin(AdminUser, AdminUser.user_id == Player.user_id)
+            .filter(Player.user_id.in_(ids))
+            .all()
+        )
+        states: dict[int, dict] = {}
+        fav_items: dict[int, int] = {}
+        for r in rows:
+            state = {name: getattr(r, name) for name in _AUTO_SEARCH_STATE_COLUMNS}
+            uid = int(r.user_id)
+            state['user_id'] = uid
+            if state['username'] and str(state['username']) in ADMIN_USERNAMES:
+                state['admin_level'] = 99
+            elif r.admin_uid is None:
+                state['admin_level'] = 0
+            else:
+                lvl = r.admin_lvl
+                state['admin_level'] = int(lvl) if isinstance(lvl, int) and 1 <= lvl <= 3 else 1
+            state['favorite_drink_ids'] = set()
+            for slot in (1, 2, 3):
+                item_id = int(state.get(f'favorite_drink_{slot}') or 0)
+                if item_id > 0:
+                    fav_items[item_id] = uid
+            states[uid] = state
+
+        if fav_items:
+            for item_id, player_id, drink_id in (
+                dbs.query(InventoryItem.id, InventoryItem.player_id, InventoryItem.drink_id)
+                .filter(InventoryItem.id.in_(list(fav_items)))
+                .all()
+            ):
+                owner = fav_items.get(int(item_id))
+                if owner is not None and int(player_id or 0) == owner and int(drink_id or 0) > 0:
+                    states[owner]['favorite_drink_ids'].add(int(drink_id))
+        return states
+    finally:
+        dbs.close()
+
+
+def _merge_auto_search_session_stats(raw_value, found_count: int, earned_coins: int, rarities) -> str:
+    stats = _parse_json_stats(raw_value)
+    stats['total_found'] = int(stats.get('total_found', 0) or 0) + max(0, int(found_count or 0))
+    stats['total_coins'] = int(stats.get('total_coins', 0) or 0) + max(0, int(earned_coins or 0))
+    rarity_stats = stats.get('rarities') or {}
+    for rarity in (rarities or []):
+        if rarity:
+            rarity_stats[str(rarity)] = int(rarity_stats.get(str(rarity), 0) or 0) + 1
+    stats['rarities'] = rarity_stats
+    return json.dumps(stats, ensure_ascii=False)
+
+
+def apply_auto_search_batch(outcomes: list[dict], now_ts: int | None = None) -> dict[int, dict]:
+    """
+    Применяет исходы пакетного автопоиска одной пишущей транзакцией.
+
+    Исход — dict с user_id и action:
+      'disable' — выключить автопоиск (лимит, истёк VIP);
+      'search'  — поля как у apply_energy_search_outcome_atomic (effective_cooldown,
+                  base_reward_coins, consume_luck_charge, drops, swaga_counts,
+                  auto_search_daily_limit) плюс silent для статистики тихого режима;
+                  поиск, исчерпавший лимит, тут же выключает автопоиск (limit_reached).
+
+    Кулдаун, флаг автопоиска и дневной лимит перепроверяются внутри транзакции,
+    чтобы параллельный ручной поиск не дал двойного начисления. Инвентарь и
+    свага-карточки пишутся UPSERT-ами пачкой, игроки — одним executemany.
+    Возвращает {user_id: результат} с ok/reason, как у атомарного поиска.
+    """
+    now_ts = int(now_ts or time.time())
+    searches = [o for o in outcomes if o.get('action') == 'search']
+    disables = [int(o['user_id']) for o in outcomes if o.get('action') == 'disable']
+    results: dict[int, dict] = {}
+    if not searches and not disables:
+        return results
+
+    dbs = SessionLocal()
+    try:
+        _begin_write_transaction(dbs)
+        if disables:
+            dbs.execute(
+                text("UPDATE players SET auto_search_enabled = 0 WHERE user_id = :uid"),
+                [{"uid": uid} for uid in disables],
+            )
+            for uid in disables:
+                results[uid] = {"ok": True, "disabled": True}
+
+        search_ids = [int(o['user_id']) for o in searches]
+        current = {}
+        inventory: dict[tuple[int, int, str], int] = {}
+        autosell: set[tuple[int, str]] = set()
+        if search_ids:
+            current = {
+                int(r.user_id): r
+                for r in dbs.query(
+                    Player.user_id, Player.last_search, Player.auto_search_enabled,
+                    Player.auto_search_count, Player.auto_search_reset_ts, Player.rating,
+                    Player.coins, Player.luck_coupon_charges, Player.auto_search_session_stats,
+                ).filter(Player.user_id.in_(search_ids)).all()
+            }
+            drink_ids = {int(d.get('drink_id') or 0) for o in searches for d in (o.get('drops') or [])}
+            drink_ids.discard(0)
+            if drink_ids:
+                for player_id, drink_id, rarity, qty in (
+                    dbs.query(InventoryItem.player_id, InventoryItem.drink_id, InventoryItem.rarity, InventoryItem.quantity)
+                    .filter(InventoryItem.player_id.in_(search_ids), InventoryItem.drink_id.in_(list(drink_ids)))
+                    .all()
+                ):
+                    key = (int(player_id), int(drink_id), str(rarity))
+                    inventory[key] = inventory.get(key, 0) + max(0, int(qty or 0))
+                autosell = {
+                    (int(uid), str(rarity))
+                    for uid, rarity in dbs.query(AutoSellSetting.user_id, AutoSellSetting.rarity)
+                    .filter(AutoSellSetting.user_id.in_(search_ids), AutoSellSetting.enabled == True)  # noqa: E712
+                    .all()
+                }
+
+        player_rows: list[dict] = []
+        inventory_rows: list[dict] = []
+        swaga_rows: list[dict] = []
+        discoveries: list[int] = []
+        for o in searches:
+            uid = int(o['user_id'])
+            row = current.get(uid)
+            if row is None:
+                results[uid] = {"ok": False, "reason": "exception"}
+                continue
+            last_search = int(row.last_search or 0)
+            cooldown = float(o.get('effective_cooldown') or 0)
+            if cooldown > 0 and (float(now_ts) - float(last_search)) < cooldown:
+                results[uid] = {"ok": False, "reason": "cooldown",
+                                "time_left": float(max(0.0, cooldown - (float(now_ts) - float(last_search))))}
+                continue
+            if not bool(row.auto_search_enabled):
+                results[uid] = {"ok": False, "reason": "disabled"}
+                continue
+            auto_count = int(row.auto_search_count or 0)
+            reset_ts = int(row.auto_search_reset_ts or 0)
+            if reset_ts == 0 or now_ts >= reset_ts:
+                auto_count = 0
+                reset_ts = int(now_ts + 24 * 60 * 60)
+            daily_limit = o.get('auto_search_daily_limit')
+            if daily_limit is not None and auto_count >= int(daily_limit):
+                results[uid] = {"ok": False, "reason": "limit", "auto_search_count": int(auto_count)}
+                continue
+
+            rating_before = int(row.rating or 0)
+            luck_left = int(row.luck_coupon_charges or 0)
+            if o.get('consume_luck_charge') and luck_left > 0:
+                luck_left -= 1
+
+            total_autosell_payout = 0
+            applied_drops: list[dict] = []
+            for drop in (o.get('drops') or []):
+                drink_id = int(drop.get('drink_id') or 0)
+                rarity = str(drop.get('rarity') or 'Basic')
+                if drink_id <= 0:
+                    continue
+                key = (uid, drink_id, rarity)
+                autosell_enabled = False
+                autosell_payout = 0
+                if inventory.get(key, 0) > 0 and (uid, rarity) in autosell:
+                    try:
+                        autosell_payout = int(get_receiver_unit_payout_with_rating(rarity, rating_before) or 0)
+                    except Exception:
+                        autosell_payout = 0
+                    if autosell_payout > 0:
+                        autosell_enabled = True
+                        total_autosell_payout += autosell_payout
+                if not autosell_enabled:
+                    inventory[key] = inventory.get(key, 0) + 1
+                    inventory_rows.append({"player_id": uid, "drink_id": drink_id, "rarity": rarity, "quantity": 1})
+                discoveries.append(drink_id)
+                applied_drops.append({
+                    "drink_id": drink_id,
+                    "rarity": rarity,
+                    "autosell_enabled": autosell_enabled,
+                    "autosell_payout": int(autosell_payout),
+                })
+
+            for rarity_name, qty in (o.get('swaga_counts') or {}).items():
+                if int(qty or 0) > 0:
+                    swaga_rows.append({"user_id": uid, "rarity": str(rarity_name), "quantity": int(qty)})
+
+            base_reward = int(o.get('base_reward_coins') or 0)
+            coins_after = int(row.coins or 0) + base_reward + int(total_autosell_payout)
+            new_rating = min(int(o.get('max_rating', 1000)), rating_before + int(o.get('rating_delta', 1) or 0))
+            auto_count += 1
+            # Последний разрешённый поиск за окно сразу выключает автопоиск
+            limit_reached = daily_limit is not None and auto_count >= int(daily_limit)
+            session_stats = row.auto_search_session_stats
+            if o.get('silent'):
+                session_stats = _merge_auto_search_session_stats(
+                    session_stats,
+                    len(applied_drops),
+                    base_reward + total_autosell_payout,
+                    [d['rarity'] for d in applied_drops],
+                )
+            player_rows.append({
+                "uid": uid,
+                "ts": now_ts,
+                "rating": new_rating,
+                "coins": coins_after,
+                "luck": max(0, luck_left),
+                "cnt": auto_count,
+                "reset": reset_ts,
+                "enabled": 0 if limit_reached else 1,
+                "stats": session_stats,
+            })
+            results[uid] = {
+                "ok": True,
+                "coins_after": coins_after,
+                "new_rating": new_rating,
+                "total_autosell_payout": int(total_autosell_payout),
+                "drop_results": applied_drops,
+                "auto_search_count": int(auto_count),
+                "luck_charges_left": max(0, luck_left),
+                "limit_reached": bool(limit_reached),
+            }
+
+        if player_rows:
+            dbs.execute(
+                text(
+                    "UPDATE players SET last_search = :ts, rating = :rating, coins = :coins, "
+                    "luck_coupon_charges = :luck, auto_search_count = :cnt, auto_search_reset_ts = :reset, "
+                    "auto_search_enabled = :enabled, auto_search_session_stats = :stats WHERE user_id = :uid"
+                ),
+                player_rows,
+            )
+        if inventory_rows:
+            stmt = sqlite_insert(InventoryItem.__table__)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['player_id', 'drink_id', 'rarity'],
+                set_={'quantity': func.coalesce(InventoryItem.__table__.c.quantity, 0) + stmt.excluded.quantity},
+            )
+            dbs.execute(stmt, inventory_rows)
+        if swaga_rows:
+            stmt = sqlite_insert(SwagaCardInventory.__table__)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['user_id', 'rarity'],
+                set_={'quantity': func.coalesce(SwagaCardInventory.__table__.c.quantity, 0) + stmt.excluded.quantity},
+            )
+            dbs.execute(stmt, swaga_rows)
+        dbs.commit()
+        for drink_id in discoveries:
+            _note_drink_discovery(drink_id, now_ts)
+        return results
+    except Exception as e:
+        try:
+            dbs.rollback()
+        except Exception:
+            pass
+        logger.error(f"apply_auto_search_batch failed for {len(outcomes)} outcomes: {e}")
+        return {int(o['user_id']): {"ok": False, "reason": "exception"} for o in outcomes}
+    finally:
+        dbs.close()
+
+
 def add_drink_to_inventory(user_id, drink_id, rarity):
     """Добавляет энергетик в инвентарь игрока."""
     db = SessionLocal()
@@ -6403,128 +7277,398 @@ def add_custom_drink_to_inventory(user_id: int, drink_id: int, rarity: str, quan
 # --- Функции для системы "горячих" и "холодных" напитков ---
 
 def record_drink_discovery(drink_id: int):
-    """Записывает находку напитка для статистики."""
-    db = SessionLocal()
-    try:
-        current_time = int(time.time())
-        current_date = int(current_time // 86400)  # День с начала эпохи
-        
-        stats = db.query(DrinkDiscoveryStats).filter_by(drink_id=drink_id).first()
-        if stats:
-            # Обновляем существующую статистику
-            stats.total_discoveries += 1
-            stats.last_discovered_at = current_time
-            
-            # Проверяем, нужно ли сбросить дневной счетчик
-            if stats.last_reset_date != current_date:
-                stats.global_discoveries_today = 1
-                stats.last_reset_date = current_date
-            else:
-                stats.global_discoveries_today += 1
-        else:
-            # Создаем новую запись
-            stats = DrinkDiscoveryStats(
-                drink_id=drink_id,
-                total_discoveries=1,
-                last_discovered_at=current_time,
-                global_discoveries_today=1,
-                last_reset_date=current_date
-            )
-            db.add(stats)
-        
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        print(f"Ошибка при записи статистики находки: {e}")
-    finally:
-        db.close()
+    """Записывает находку напитка для статистики (через буфер, см. flush_drink_discovery_buffer)."""
+    _note_drink_discovery(int(drink_id), int(time.time()))
 
 
-def get_drink_temperature(drink_id: int) -> str:
-    """Определяет 'температуру' напитка на основе статистики.
-    Возвращает: 'hot' (горячий), 'cold' (холодный) или 'neutral' (нейтральный)
-    Напитки без статистики (никогда не находили) считаются 'hot' (редкими).
-    """
-    db = SessionLocal()
-    try:
-        current_time = int(time.time())
-        stats = db.query(DrinkDiscoveryStats).filter_by(drink_id=drink_id).first()
-        
-        if not stats:
-            return 'hot'  # Новые/редкие напитки считаются горячими
-        
-        time_since_discovery = current_time - stats.last_discovered_at
-        
-        # Холодный: нашли в последние 6 часов (21600 сек)
-        if time_since_discovery < 21600:
-            return 'cold'
-        
-        # Горячий: не находили более 48 часов (172800 сек)
-        if time_since_discovery > 172800:
-            return 'hot'
-        
-        # Нейтральный: между 6 и 48 часов
-        return 'neutral'
-    finally:
-        db.close()
+# --- Каталог энергетиков для поиска (кэш процесса) ---
 
+DRINK_TEMP_COLD_SEC = 21600       # находили в последние 6 часов -> холодный
+DRINK_TEMP_HOT_SEC = 172800       # не находили больше 48 часов -> горячий
+DRINK_TEMPERATURE_WEIGHTS = {'cold': 0.5, 'neutral': 1.0, 'hot': 2.0}
+# Полная перечитка каталога из БД (на случай правок из другого процесса, например scripts/)
+DRINK_CATALOG_RESYNC_SEC = 300
+# Период пакетной записи буфера находок в drink_discovery_stats
+DRINK_DISCOVERY_FLUSH_SEC = 5
 
-def get_weighted_drinks_list():
-    """Возвращает список напитков с весами на основе их 'температуры'.
-    Холодные напитки имеют вес 0.5x, горячие 2x, нейтральные 1x.
-    """
-    db = SessionLocal()
-    try:
-        all_drinks = db.query(EnergyDrink).all()
-        weighted_list = []
-        
-        for drink in all_drinks:
-            # Плантационные энергетики не участвуют в обычном поиске
-            if getattr(drink, 'is_plantation', False):
-                continue
-            temp = get_drink_temperature(drink.id)
-            
-            # Определяем вес
-            if temp == 'cold':
-                weight = 0.5
-            elif temp == 'hot':
-                weight = 2.0
-            else:  # neutral
-                weight = 1.0
-            
-            # Добавляем напиток в список с учетом веса
-            # Для упрощения выбора, добавляем напиток несколько раз
-            count = max(1, int(weight * 10))  # Минимум 1 раз
-            weighted_list.extend([drink] * count)
-        
-        return weighted_list
-    finally:
-        db.close()
+
+def _drink_temperature_from_ts(last_discovered_at: int | None, now_ts: int) -> str:
+    if not last_discovered_at:
+        return 'hot'  # Новые/редкие напитки считаются горячими
+    time_since_discovery = int(now_ts) - int(last_discovered_at)
+    if time_since_discovery < DRINK_TEMP_COLD_SEC:
+        return 'cold'
+    if time_since_discovery > DRINK_TEMP_HOT_SEC:
+        return 'hot'
+    return 'neutral'
+
+
+def _drink_temperature_bucket_change_ts(last_discovered_at: int | None, now_ts: int) -> int | None:
+    """Момент, когда температура напитка сменится сама по себе (без новых находок)."""
+    if not last_discovered_at:
+        return None
+    cold_until = int(last_discovered_at) + DRINK_TEMP_COLD_SEC
+    hot_from = int(last_discovered_at) + DRINK_TEMP_HOT_SEC + 1
+    return cold_until if cold_until > int(now_ts) else hot_from
+
+
+class _DrinkCatalog:
+    """Кэш энергетиков и статистики находок на весь процесс.
+
+    Держит выборку поиска в виде накопленных весов: выбор напитка — один bisect,
+    без обращений к БД. Веса пересчитываются только когда меняется распределение
+    напитков по температурам (новая находка «остывшего» напитка или истечение
+    6/48-часовых границ), сам каталог перечитывается при правках энергетиков
+    через invalidate_drink_catalog() и раз в DRINK_CATALOG_RESYNC_SEC.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded_at = 0.0
+        self._drinks: dict[int, EnergyDrink] = {}
+        self._stats: dict[int, tuple[int, int]] = {}  # drink_id -> (total_discoveries, last_discovered_at)
+        self._buckets: dict[int, str] = {}
+        self._next_bucket_change_ts = 0
+        self._ids: list[int] = []
+        self._cumulative: list[float] = []
+        self._weights: dict[int, float] = {}
+        self._total_weight = 0.0
+        self.sampler_rebuilds = 0
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._loaded_at = 0.0
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded_at and (time.monotonic() - self._loaded_at) < DRINK_CATALOG_RESYNC_SEC:
+            return
+        # Под замком сброса буфера находок: иначе между чтением БД и оверлеем
+        # может пройти flush, и одни и те же находки учтутся дважды (или ни разу).
+        # Новые находки в буфер при этом добавляются без ожидания.
+        with _drink_discovery_buffer._flush_lock:
+            dbs = SessionLocal()
+            try:
+                drinks = dbs.query(EnergyDrink).all()
+                stats_rows = dbs.query(
+                    DrinkDiscoveryStats.drink_id,
+                    DrinkDiscoveryStats.total_discoveries,
+                    DrinkDiscoveryStats.last_discovered_at,
+                ).all()
+            finally:
+                dbs.close()
+            pending = _drink_discovery_buffer.pending_view()
+        self._drinks = {int(d.id): d for d in drinks}
+        self._stats = {
+            int(row[0]): (int(row[1] or 0), int(row[2] or 0))
+            for row in stats_rows
+            if row[0] is not None
+        }
+        for drink_id, (count, last_ts) in pending.items():
+            total, db_last_ts = self._stats.get(drink_id, (0, 0))
+            self._stats[drink_id] = (total + count, max(db_last_ts, last_ts))
+        self._buckets = {}
+        self._next_bucket_change_ts = 0
+        self._loaded_at = time.monotonic()
+
+    def _refresh_sampler(self, now_ts: int) -> None:
+        if self._buckets and now_ts < self._next_bucket_change_ts:
+            return
+        buckets: dict[int, str] = {}
+        next_change = None
+        for drink_id, drink in self._drinks.items():
+            # Плантационные энергетики не участвуют в обычном поиске
+            if getattr(drink, 'is_plantation', False):
+                continue
+            last_ts = self._stats.get(drink_id, (0, 0))[1]
+            buckets[drink_id] = _drink_temperature_from_ts(last_ts, now_ts)
+            change_ts = _drink_temperature_bucket_change_ts(last_ts, now_ts)
+            if change_ts is not None and change_ts > now_ts and (next_change is None or change_ts < next_change):
+                next_change = change_ts
+        self._next_bucket_change_ts = int(next_change) if next_change is not None else 2 ** 62
+        if buckets == self._buckets and self._ids:
+            return
+        self._buckets = buckets
+        ids = sorted(buckets)
+        cumulative: list[float] = []
+        weights: dict[int, float] = {}
+        running = 0.0
+        for drink_id in ids:
+            weight = DRINK_TEMPERATURE_WEIGHTS[buckets[drink_id]]
+            weights[drink_id] = weight
+            running += weight
+            cumulative.append(running)
+        self._ids = ids
+        self._cumulative = cumulative
+        self._weights = weights
+        self._total_weight = running
+        self.sampler_rebuilds += 1
+
+    def _prepare(self, now_ts: int | None = None) -> int:
+        now = int(now_ts or time.time())
+        self._ensure_loaded()
+        self._refresh_sampler(now)
+        return now
+
+    def note_discovery(self, drink_id: int, ts: int, count: int = 1) -> None:
+        with self._lock:
+            if not self._loaded_at:
+                return
+            total, last_ts = self._stats.get(int(drink_id), (0, 0))
+            self._stats[int(drink_id)] = (total + int(count), max(int(last_ts), int(ts)))
+            if self._buckets.get(int(drink_id)) != _drink_temperature_from_ts(max(int(last_ts), int(ts)), int(time.time())):
+                self._next_bucket_change_ts = 0
+
+    def temperature(self, drink_id: int) -> str:
+        with self._lock:
+            now = self._prepare()
+            last_ts = self._stats.get(int(drink_id), (0, 0))[1]
+            return _drink_temperature_from_ts(last_ts, now)
+
+    def stats(self, drink_id: int) -> tuple[int, int]:
+        with self._lock:
+            self._prepare()
+            return self._stats.get(int(drink_id), (0, 0))
+
+    def searchable_count(self) -> int:
+        with self._lock:
+            self._prepare()
+            return len(self._ids)
+
+    def drinks(self) -> list[EnergyDrink]:
+        with self._lock:
+            self._prepare()
+            return list(self._drinks.values())
+
+    def weighted_entries(self) -> list[tuple[EnergyDrink, float]]:
+        with self._lock:
+            self._prepare()
+            return [(self._drinks[i], self._weights[i]) for i in self._ids]
+
+    def sample(self, favorite_ids: set[int] | None = None, favorite_mult: float = 1.0, rng=None) -> EnergyDrink | None:
+        """Выбирает напиток для поиска: O(log n) + O(число избранных).
+
+        Избранные получают вес weight * favorite_mult: к общей сумме добавляется
+        «надбавка» (favorite_mult - 1) * weight, которая разыгрывается отдельно.
+        """
+        rng = rng or random
+        with self._lock:
+            self._prepare()
+            if not self._ids:
+                return None
+            extra: list[tuple[int, float]] = []
+            if favorite_ids and favorite_mult > 1.0:
+                for fav_id in favorite_ids:
+                    weight = self._weights.get(int(fav_id))
+                    if weight:
+                        extra.append((int(fav_id), weight * (float(favorite_mult) - 1.0)))
+            extra_total = sum(w for _, w in extra)
+            r = rng.random() * (self._total_weight + extra_total)
+            if r < self._total_weight or not extra:
+                idx = bisect.bisect_right(self._cumulative, r)
+                return self._drinks[self._ids[min(idx, len(self._ids) - 1)]]
+            r -= self._total_weight
+            for fav_id, weight in extra:
+                if r < weight:
+                    return self._drinks[fav_id]
+                r -= weight
+            return self._drinks[extra[-1][0]]
+
+
+_drink_catalog = _DrinkCatalog()
+
+
+class _DrinkDiscoveryBuffer:
+    """Буфер находок напитков с отложенной записью в drink_discovery_stats.
+
+    Инкременты по одному напитку складываются в памяти и раз в
+    DRINK_DISCOVERY_FLUSH_SEC (и при остановке бота) пишутся одним пакетным UPSERT.
+    flush() забирает накопленное под блокировкой и пишет уже без неё, поэтому
+    поиск не ждёт SQLite. Если БД недоступна (OperationalError), инкременты
+    возвращаются в буфер; при другой ошибке пачка пишется по напитку, а не
+    записавшиеся сами по себе отбрасываются (dropped_rows).
+    """
+
+    _UPSERT_SQL = text(
+        "INSERT INTO drink_discovery_stats "
+        "(drink_id, total_discoveries, last_discovered_at, global_discoveries_today, last_reset_date) "
+        "VALUES (:drink_id, :total, :last_ts, :today, :day) "
+        "ON CONFLICT(drink_id) DO UPDATE SET "
+        "total_discoveries = COALESCE(drink_discovery_stats.total_discoveries, 0) + excluded.total_discoveries, "
+        "last_discovered_at = MAX(COALESCE(drink_discovery_stats.last_discovered_at, 0), excluded.last_discovered_at), "
+        "global_discoveries_today = CASE "
+        "WHEN drink_discovery_stats.last_reset_date = excluded.last_reset_date "
+        "THEN COALESCE(drink_discovery_stats.global_discoveries_today, 0) + excluded.global_discoveries_today "
+        "ELSE excluded.global_discoveries_today END, "
+        "last_reset_date = excluded.last_reset_date"
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # drink_id -> [total, last_discovered_at, day, count_for_day]
+        self._pending: dict[int, list[int]] = {}
+        # Забранное flush(), но ещё не записанное: остаётся видимым в pending_view
+        self._inflight: dict[int, list[int]] = {}
+        self.flushed_rows = 0
+        self.flushed_discoveries = 0
+        self.dropped_rows = 0
+
+    @staticmethod
+    def _merge(pending: dict[int, list[int]], drink_id: int, total: int, ts: int, day: int, today: int) -> None:
+        rec = pending.get(drink_id)
+        if rec is None:
+            pending[drink_id] = [total, ts, day, today]
+            return
+        rec[0] += total
+        rec[1] = max(rec[1], ts)
+        if day > rec[2]:
+            rec[2] = day
+            rec[3] = today
+        elif day == rec[2]:
+            rec[3] += today
+
+    def add(self, drink_id: int, ts: int, count: int = 1) -> None:
+        with self._lock:
+            self._merge(self._pending, int(drink_id), int(count), int(ts), int(ts // 86400), int(count))
+
+    def pending_view(self) -> dict[int, tuple[int, int]]:
+        """drink_id -> (несохранённые находки, последняя находка) для оверлея поверх БД."""
+        with self._lock:
+            view = {drink_id: (rec[0], rec[1]) for drink_id, rec in self._inflight.items()}
+            for drink_id, rec in self._pending.items():
+                total, ts = view.get(drink_id, (0, 0))
+                view[drink_id] = (total + rec[0], max(ts, rec[1]))
+            return view
+
+    def flush(self) -> int:
+        """Пишет накопленные инкременты одним UPSERT. Возвращает число обновлённых напитков."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                self._inflight, self._pending = self._pending, {}
+                params = [
+                    {"drink_id": drink_id, "total": rec[0], "last_ts": rec[1], "day": rec[2], "today": rec[3]}
+                    for drink_id, rec in self._inflight.items()
+                ]
+            dbs = SessionLocal()
+            try:
+                dbs.execute(self._UPSERT_SQL, params)
+                dbs.commit()
+                written = params
+            except Exception as e:
+                try:
+                    dbs.rollback()
+                except Exception:
+                    pass
+                if isinstance(e, OperationalError):
+                    self._requeue(params)
+                    logger.warning(f"[DISCOVERY] Failed to flush {len(params)} discovery rows, will retry: {e}")
+                    return 0
+                written = self._upsert_each(dbs, params)
+            finally:
+                dbs.close()
+            with self._lock:
+                self._inflight = {}
+                self.flushed_rows += len(written)
+                self.flushed_discoveries += sum(p["total"] for p in written)
+            return len(written)
+
+    def _upsert_each(self, dbs, params: list[dict]) -> list[dict]:
+        """Пишет пачку по напитку после ошибки общего UPSERT. Возвращает записанные строки."""
+        written = []
+        for n, row in enumerate(params):
+            try:
+                dbs.execute(self._UPSERT_SQL, row)
+                dbs.commit()
+                written.append(row)
+            except OperationalError as e:
+                dbs.rollback()
+                self._requeue(params[n:])
+                logger.warning(f"[DISCOVERY] Failed to flush {len(params) - n} discovery rows, will retry: {e}")
+                break
+            except Exception as e:
+                dbs.rollback()
+                with self._lock:
+                    self.dropped_rows += 1
+                logger.warning(f"[DISCOVERY] Dropped unwritable discovery row for drink {row['drink_id']}: {e}")
+        return written
+
+    def _requeue(self, params: list[dict]) -> None:
+        with self._lock:
+            for p in params:
+                self._merge(self._pending, p["drink_id"], p["total"], p["last_ts"], p["day"], p["today"])
+            self._inflight = {}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._pending.clear()
+
+
+_drink_discovery_buffer = _DrinkDiscoveryBuffer()
+
+
+def _note_drink_discovery(drink_id: int, ts: int) -> None:
+    _drink_discovery_buffer.add(drink_id, ts)
+    _drink_catalog.note_discovery(drink_id, ts)
+
+
+def flush_drink_discovery_buffer() -> int:
+    """Сбрасывает буфер находок в БД. Вызывается периодически и при остановке бота."""
+    return _drink_discovery_buffer.flush()
+
+
+def invalidate_drink_catalog() -> None:
+    """Сбрасывает кэш каталога энергетиков (вызывать после добавления/правки/удаления напитков)."""
+    _drink_catalog.invalidate()
+
+
+def pick_search_drink(favorite_drink_ids: set[int] | None = None, favorite_weight_mult: float = 1.0, rng=None) -> EnergyDrink | None:
+    """Выбирает энергетик для поиска с учётом температуры и избранного без запросов к БД."""
+    return _drink_catalog.sample(favorite_drink_ids, favorite_weight_mult, rng=rng)
+
+
+def count_search_drinks() -> int:
+    """Количество энергетиков, участвующих в обычном поиске."""
+    return _drink_catalog.searchable_count()
+
+
+def get_drink_temperature(drink_id: int) -> str:
+    """Определяет 'температуру' напитка на основе статистики.
+    Возвращает: 'hot' (горячий), 'cold' (холодный) или 'neutral' (нейтральный)
+    Напитки без статистики (никогда не находили) считаются 'hot' (редкими).
+    Читает кэш каталога, а не БД.
+    """
+    return _drink_catalog.temperature(drink_id)
+
+
+def get_weighted_drinks_list():
+    """Возвращает список напитков с весами на основе их 'температуры'.
+    Холодные напитки имеют вес 0.5x, горячие 2x, нейтральные 1x.
+    Оставлен для совместимости: поиск использует pick_search_drink().
+    """
+    weighted_list = []
+    for drink, weight in _drink_catalog.weighted_entries():
+        # Для упрощения выбора, добавляем напиток несколько раз
+        count = max(1, int(weight * 10))  # Минимум 1 раз
+        weighted_list.extend([drink] * count)
+    return weighted_list
 
 
 def get_all_drinks_with_temperature():
     """Возвращает список всех напитков с информацией о их температуре.
     Полезно для отладки и статистики.
     """
-    db = SessionLocal()
-    try:
-        all_drinks = db.query(EnergyDrink).all()
-        result = []
-        
-        for drink in all_drinks:
-            temp = get_drink_temperature(drink.id)
-            stats = db.query(DrinkDiscoveryStats).filter_by(drink_id=drink.id).first()
-            
-            result.append({
-                'drink': drink,
-                'temperature': temp,
-                'total_discoveries': stats.total_discoveries if stats else 0,
-                'last_discovered_at': stats.last_discovered_at if stats else 0,
-            })
-        
-        return result
-    finally:
-        db.close()
+    result = []
+    for drink in _drink_catalog.drinks():
+        total, last_ts = _drink_catalog.stats(drink.id)
+        result.append({
+            'drink': drink,
+            'temperature': _drink_catalog.temperature(drink.id),
+            'total_discoveries': total,
+            'last_discovered_at': last_ts,
+        })
+    return result
 
 def get_player_inventory_with_details(user_id):
     """Возвращает полный инвентарь игрока с деталями о каждом напитке."""
@@ -6536,6 +7680,166 @@ def get_player_inventory_with_details(user_id):
     finally:
         db.close()
 
+class InventoryRow(NamedTuple):
+    """Строка страницы инвентаря — без ORM-объектов и ленивых связей."""
+    id: int
+    drink_id: int
+    name: str | None
+    rarity: str
+    quantity: int
+    is_plantation: bool
+
+
+# Порядок редкостей для ORDER BY; неизвестные редкости — в конце, как в прежней сортировке.
+_INVENTORY_RARITY_RANK = case(
+    {rarity: idx for idx, rarity in enumerate(RARITY_ORDER)},
+    value=InventoryItem.rarity,
+    else_=len(RARITY_ORDER),
+)
+_INVENTORY_ORDERINGS = {
+    'rarity': (_INVENTORY_RARITY_RANK, func.py_lower(EnergyDrink.name), InventoryItem.id),
+    'quantity': (InventoryItem.quantity.desc(), func.py_lower(EnergyDrink.name), InventoryItem.id),
+}
+
+
+class _InventoryPages:
+    """Кэш страниц инвентаря по игрокам (LRU на max_users игроков).
+
+    Страница валидна, пока версия инвентаря игрока в inventory_versions (её ведут
+    триггеры на inventory_items) совпадает с версией на момент чтения, поэтому
+    любая запись в инвентарь — ORM, executemany или сырой SQL — сбрасывает страницы.
+    Проверка версии — один lookup по первичному ключу.
+    """
+
+    MAX_PAGES_PER_USER = 32
+
+    def __init__(self, max_users: int):
+        self._lock = threading.Lock()
+        self._max_users = max(1, int(max_users))
+        self._users: OrderedDict[int, tuple[int, dict]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int, version: int, key: tuple):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None or entry[0] != version or key not in entry[1]:
+                self.misses += 1
+                return None
+            self._users.move_to_end(user_id)
+            self.hits += 1
+            return entry[1][key]
+
+    def put(self, user_id: int, version: int, key: tuple, page: dict) -> None:
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None or entry[0] != version:
+                entry = (version, {})
+                self._users[user_id] = entry
+            pages = entry[1]
+            if len(pages) >= self.MAX_PAGES_PER_USER:
+                pages.pop(next(iter(pages)))
+            pages[key] = page
+            self._users.move_to_end(user_id)
+            while len(self._users) > self._max_users:
+                self._users.popitem(last=False)
+
+    def invalidate(self, user_id: int | None = None) -> None:
+        with self._lock:
+            if user_id is None:
+                self._users.clear()
+            else:
+                self._users.pop(int(user_id), None)
+
+
+_inventory_pages = _InventoryPages(INVENTORY_PAGE_CACHE_USERS)
+
+
+def invalidate_inventory_pages(user_id: int | None = None) -> None:
+    """Сбрасывает кэш страниц инвентаря (одного игрока или всех)."""
+    _inventory_pages.invalidate(user_id)
+
+
+def get_inventory_page(
+    user_id: int,
+    page: int = 1,
+    per_page: int = 10,
+    order: str = 'rarity',
+    rarity: str | None = None,
+    name_query: str | None = None,
+) -> dict:
+    """Страница инвентаря игрока: сортировка, фильтры и LIMIT/OFFSET выполняются в SQL.
+
+    order: 'rarity' (по RARITY_ORDER, затем по названию) или 'quantity' (по убыванию количества).
+    rarity — точная редкость, name_query — подстрока названия без учёта регистра.
+    Номер страницы приводится к 1..total_pages (навигация в боте циклическая).
+    Возвращает dict: {items: [InventoryRow], total, page, total_pages, per_page, max_quantity}.
+    """
+    ordering = _INVENTORY_ORDERINGS.get(order)
+    if ordering is None:
+        raise ValueError(f"Неизвестная сортировка инвентаря {order!r}")
+    per_page = max(1, int(per_page or 1))
+    needle = str(name_query or '').strip().lower() or None
+    key = (order, rarity, needle, int(page or 1), per_page)
+    dbs = SessionLocal()
+    try:
+        version = int(
+            dbs.query(InventoryVersion.version).filter(InventoryVersion.user_id == int(user_id)).scalar() or 0
+        )
+        cached = _inventory_pages.get(int(user_id), version, key)
+        if cached is not None:
+            return cached
+
+        filters = [InventoryItem.player_id == int(user_id)]
+        if rarity is not None:
+            filters.append(InventoryItem.rarity == rarity)
+        if needle:
+            filters.append(func.instr(func.py_lower(EnergyDrink.name), needle) > 0)
+
+        total, max_quantity = (
+            dbs.query(func.count(InventoryItem.id), func.max(InventoryItem.quantity))
+            .outerjoin(EnergyDrink, EnergyDrink.id == InventoryItem.drink_id)
+            .filter(*filters)
+            .one()
+        )
+        total = int(total or 0)
+        total_pages = max(1, (total + per_page - 1) // per_page)
+        current = min(max(1, int(page or 1)), total_pages)
+        rows = []
+        if total:
+            rows = (
+                dbs.query(
+                    InventoryItem.id,
+                    InventoryItem.drink_id,
+                    EnergyDrink.name,
+                    InventoryItem.rarity,
+                    InventoryItem.quantity,
+                    EnergyDrink.is_plantation,
+                )
+                .outerjoin(EnergyDrink, EnergyDrink.id == InventoryItem.drink_id)
+                .filter(*filters)
+                .order_by(*ordering)
+                .offset((current - 1) * per_page)
+                .limit(per_page)
+                .all()
+            )
+        result = {
+            "items": [
+                InventoryRow(int(r[0]), int(r[1] or 0), r[2], r[3], int(r[4] or 0), bool(r[5]))
+                for r in rows
+            ],
+            "total": total,
+            "page": current,
+            "total_pages": total_pages,
+            "per_page": per_page,
+            "max_quantity": int(max_quantity or 0),
+        }
+        _inventory_pages.put(int(user_id), version, key, result)
+        return result
+    finally:
+        dbs.close()
+
+
 def update_player(user_id, **kwargs):
     """Обновляет поля игрока (например, монеты или время поиска)."""
     db = SessionLocal()
@@ -6697,41 +8001,305 @@ def add_energy_drink(name: str, description: str, image_path: str | None = None,
         db.add(drink)
         db.commit()
         db.refresh(drink)
+        invalidate_drink_catalog()
         return drink
     finally:
         db.close()
 
+# --- Лидерборды (кэш процесса) ---
+
+class _RankedScores:
+    """Упорядоченные очки игроков с поиском места за O(log n).
+
+    Ключи (-score, user_id) лежат в отсортированных блоках по BLOCK_SIZE.
+    Блок ищется бинарным поиском по первым ключам, место внутри блока —
+    bisect, а число ключей в предыдущих блоках даёт дерево Фенвика.
+    """
+
+    BLOCK_SIZE = 512
+
+    def __init__(self):
+        self._scores: dict[int, int] = {}
+        self._blocks: list[list[tuple[int, int]]] = []
+        self._firsts: list[tuple[int, int]] = []
+        self._tree: list[int] = []
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def get(self, user_id: int) -> int | None:
+        return self._scores.get(user_id)
+
+    def load(self, scores: dict[int, int]) -> None:
+        self._scores = {int(uid): int(score) for uid, score in scores.items() if score and score > 0}
+        keys = sorted((-score, uid) for uid, score in self._scores.items())
+        size = self.BLOCK_SIZE
+        self._blocks = [keys[i:i + size] for i in range(0, len(keys), size)]
+        self._rebuild()
+
+    def _rebuild(self) -> None:
+        self._firsts = [block[0] for block in self._blocks]
+        tree = [0] * (len(self._blocks) + 1)
+        for i, block in enumerate(self._blocks, 1):
+            tree[i] += len(block)
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _tree_add(self, index: int, delta: int) -> None:
+        i = index + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _count_before(self, index: int) -> int:
+        total, i = 0, index
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def _block_for(self, key: tuple[int, int]) -> int:
+        return max(0, bisect.bisect_right(self._firsts, key) - 1)
+
+    def set(self, user_id: int, score: int) -> None:
+        """Ставит игроку очки; нулевые и отрицательные убирают его из таблицы."""
+        user_id, score = int(user_id), int(score or 0)
+        old = self._scores.get(user_id)
+        if old == score or (old is None and score <= 0):
+            return
+        if old is not None:
+            self._remove((-old, user_id))
+            del self._scores[user_id]
+        if score > 0:
+            self._insert((-score, user_id))
+            self._scores[user_id] = score
+
+    def _insert(self, key: tuple[int, int]) -> None:
+        if not self._blocks:
+            self._blocks = [[key]]
+            self._rebuild()
+            return
+        bi = self._block_for(key)
+        block = self._blocks[bi]
+        bisect.insort(block, key)
+        if len(block) > 2 * self.BLOCK_SIZE:
+            half = len(block) // 2
+            self._blocks[bi:bi + 1] = [block[:half], block[half:]]
+            self._rebuild()
+        elif block[0] == key:
+            self._firsts[bi] = key
+            self._tree_add(bi, 1)
+        else:
+            self._tree_add(bi, 1)
+
+    def _remove(self, key: tuple[int, int]) -> None:
+        bi = self._block_for(key)
+        block = self._blocks[bi]
+        i = bisect.bisect_left(block, key)
+        if i >= len(block) or block[i] != key:
+            return
+        del block[i]
+        if not block:
+            del self._blocks[bi]
+            self._rebuild()
+        else:
+            if i == 0:
+                self._firsts[bi] = block[0]
+            self._tree_add(bi, -1)
+
+    def rank(self, user_id: int) -> int | None:
+        """Место игрока (с 1) или None, если его нет в таблице."""
+        score = self._scores.get(int(user_id))
+        if score is None:
+            return None
+        key = (-score, int(user_id))
+        bi = self._block_for(key)
+        return self._count_before(bi) + bisect.bisect_left(self._blocks[bi], key) + 1
+
+    def count_ahead(self, user_id: int, user_ids) -> int:
+        """Сколько игроков из user_ids стоят в таблице выше user_id."""
+        score = self._scores.get(int(user_id))
+        if score is None:
+            return 0
+        key = (-score, int(user_id))
+        return sum(1 for uid in user_ids if uid in self._scores and (-self._scores[uid], uid) < key)
+
+    def top(self, limit: int, exclude=()) -> list[tuple[int, int]]:
+        out: list[tuple[int, int]] = []
+        for block in self._blocks:
+            for neg_score, uid in block:
+                if uid in exclude:
+                    continue
+                out.append((uid, -neg_score))
+                if len(out) >= limit:
+                    return out
+        return out
+
+
+class _Leaderboards:
+    """Лидерборды по энергетикам и монетам в памяти процесса.
+
+    При первом обращении очки всех игроков читаются одним запросом. Дальше
+    применяются только изменения: триггеры SQLite пишут user_id в
+    leaderboard_changes при любой записи в inventory_items и players.coins,
+    а sync() перечитывает итоги лишь этих игроков и чистит журнал. sync()
+    вызывает только периодическая sync_leaderboards (через очередь записей),
+    чтения top()/rank() обслуживаются из памяти и в БД не пишут.
+
+    Позицию в журнале не запоминаем: seq без AUTOINCREMENT, после очистки SQLite
+    снова выдаёт маленькие номера. Поэтому sync читает весь журнал и удаляет
+    ровно прочитанные строки; повторное применение изменения безвредно.
+    """
+
+    BOARDS = ('drinks', 'coins')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._boards = {name: _RankedScores() for name in self.BOARDS}
+        self._loaded = False
+        self.full_loads = 0
+
+    def _load(self, dbs) -> None:
+        # Журнал не трогаем: изменения во время загрузки применит следующий sync
+        totals = _load_leaderboard_totals(dbs)
+        for name, column in (('drinks', 0), ('coins', 1)):
+            self._boards[name].load({uid: row[column] for uid, row in totals.items()})
+        self._loaded = True
+        self.full_loads += 1
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            dbs = SessionLocal()
+            try:
+                self._load(dbs)
+            finally:
+                dbs.close()
+
+    def sync(self) -> int:
+        """Подтягивает изменения из журнала. Возвращает число обновлённых игроков.
+
+        Чтение журнала и его очистка идут без блокировки лидербордов: читатели
+        ждут только применения новых очков в памяти.
+        """
+        with self._sync_lock:
+            self._ensure_loaded()
+            dbs = SessionLocal()
+            try:
+                rows = dbs.query(LeaderboardChange.seq, LeaderboardChange.user_id).all()
+                if not rows:
+                    return 0
+                seqs = [int(r.seq) for r in rows]
+                user_ids = {int(r.user_id) for r in rows if r.user_id is not None}
+                totals = _load_leaderboard_totals(dbs, user_ids)
+                with self._lock:
+                    for uid in user_ids:
+                        drinks, coins = totals.get(uid, (0, 0))
+                        self._boards['drinks'].set(uid, drinks)
+                        self._boards['coins'].set(uid, coins)
+                for i in range(0, len(seqs), 500):
+                    dbs.query(LeaderboardChange).filter(
+                        LeaderboardChange.seq.in_(seqs[i:i + 500])
+                    ).delete(synchronize_session=False)
+                dbs.commit()
+                return len(user_ids)
+            except Exception:
+                dbs.rollback()
+                raise
+            finally:
+                dbs.close()
+
+    def top(self, board: str, limit: int, exclude=()) -> list[tuple[int, int]]:
+        self._ensure_loaded()
+        with self._lock:
+            return self._boards[board].top(limit, exclude)
+
+    def rank(self, board: str, user_id: int, exclude=()) -> tuple[int | None, int, int]:
+        """(место или None, очки, всего в таблице) без учёта игроков из exclude."""
+        self._ensure_loaded()
+        with self._lock:
+            scores = self._boards[board]
+            place = scores.rank(user_id)
+            if place is not None and exclude:
+                place -= scores.count_ahead(user_id, exclude)
+            total = len(scores) - sum(1 for uid in exclude if scores.get(uid) is not None)
+            return place, int(scores.get(int(user_id)) or 0), total
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._boards = {name: _RankedScores() for name in self.BOARDS}
+            self._loaded = False
+
+
+def _load_leaderboard_totals(dbs, user_ids=None) -> dict[int, tuple[int, int]]:
+    """{user_id: (энергетиков в инвентаре, монет)} — для всех игроков или только для user_ids."""
+    drinks_q = dbs.query(InventoryItem.player_id, func.sum(InventoryItem.quantity)).group_by(InventoryItem.player_id)
+    coins_q = dbs.query(Player.user_id, Player.coins)
+    if user_ids is None:
+        chunks = [None]
+    else:
+        ids = list(user_ids)
+        chunks = [ids[i:i + 500] for i in range(0, len(ids), 500)]
+    totals: dict[int, list[int]] = {}
+    for chunk in chunks:
+        dq, cq = drinks_q, coins_q
+        if chunk is not None:
+            dq = dq.filter(InventoryItem.player_id.in_(chunk))
+            cq = cq.filter(Player.user_id.in_(chunk))
+        for uid, coins in cq.all():
+            totals[int(uid)] = [0, int(coins or 0)]
+        for uid, drinks in dq.all():
+            # Инвентарь без строки в players в лидерборд не попадает
+            if int(uid) in totals:
+                totals[int(uid)][0] = int(drinks or 0)
+    return {uid: (row[0], row[1]) for uid, row in totals.items()}
+
+
+_leaderboards = _Leaderboards()
+
+
+def invalidate_leaderboards() -> None:
+    _leaderboards.invalidate()
+
+
+def sync_leaderboards() -> int:
+    """Применяет накопленные изменения к лидербордам (периодическая задача бота)."""
+    return _leaderboards.sync()
+
+
+def get_leaderboard_rank(user_id: int, board: str = 'drinks') -> dict:
+    """Место игрока в лидерборде ('drinks' | 'coins'): {'rank', 'score', 'total'}; rank=None — нет в таблице."""
+    exclude = _ban_index.banned_ids()
+    place, score, total = _leaderboards.rank(board, int(user_id), exclude)
+    if int(user_id) in exclude:
+        place = None
+    return {'rank': place, 'score': score, 'total': total}
+
+
+def _leaderboard_player_rows(dbs, user_ids: list[int]) -> dict[int, Player]:
+    if not user_ids:
+        return {}
+    return {int(p.user_id): p for p in dbs.query(Player).filter(Player.user_id.in_(user_ids)).all()}
+
+
 def get_leaderboard(limit: int = 10):
-    """Возвращает топ игроков по количеству энергетиков в инвентаре."""
+    """Возвращает топ игроков по количеству энергетиков в инвентаре (без забаненных)."""
+    top = _leaderboards.top('drinks', limit, _ban_index.banned_ids())
     db = SessionLocal()
     try:
-        now_ts = int(time.time())
-        leaderboard_data = (
-            db.query(
-                Player.user_id,
-                Player.username,
-                func.sum(InventoryItem.quantity).label('total_drinks'),
-                Player.vip_until,
-                Player.vip_plus_until,
-                Player.rating,
-            )
-            .join(InventoryItem, Player.user_id == InventoryItem.player_id)
-            .outerjoin(
-                UserBan,
-                and_(
-                    UserBan.user_id == Player.user_id,
-                    or_(UserBan.banned_until == None, UserBan.banned_until > now_ts)
-                )
-            )
-            .filter(UserBan.user_id == None)
-            .group_by(Player.user_id, Player.username, Player.vip_until, Player.vip_plus_until, Player.rating)
-            .order_by(func.sum(InventoryItem.quantity).desc())
-            .limit(limit)
-            .all()
-        )
-        return leaderboard_data
+        players = _leaderboard_player_rows(db, [uid for uid, _ in top])
     finally:
         db.close()
+    return [
+        (uid, players[uid].username, total, players[uid].vip_until, players[uid].vip_plus_until, players[uid].rating)
+        for uid, total in top if uid in players
+    ]
 
 def delete_energy_drink(drink_id: int) -> bool:
     """Полностью удаляет энергетик и все связанные элементы инвентаря. Возвращает True, если удалено."""
@@ -6745,6 +8313,7 @@ def delete_energy_drink(drink_id: int) -> bool:
         # Удаляем сам напиток
         db.delete(drink)
         db.commit()
+        invalidate_drink_catalog()
         return True
     finally:
         db.close()
@@ -6764,6 +8333,7 @@ def update_energy_drink_field(drink_id: int, field: str, new_value: str) -> bool
         except Exception:
             db.rollback()
             return False
+        invalidate_drink_catalog()
         return True
     finally:
         db.close()
@@ -6952,6 +8522,28 @@ def ensure_schema():
             conn.exec_driver_sql("ALTER TABLE players ADD COLUMN auto_search_count INTEGER DEFAULT 0")
         if 'auto_search_reset_ts' not in cols:
             conn.exec_driver_sql("ALTER TABLE players ADD COLUMN auto_search_reset_ts INTEGER DEFAULT 0")
+        if 'auto_search_next_ts' not in cols:
+            conn.exec_driver_sql("ALTER TABLE players ADD COLUMN auto_search_next_ts INTEGER DEFAULT 0")
+        # Без NULL выборка «кому пора» фильтрует и сортирует по самой колонке — диапазон по индексу
+        conn.exec_driver_sql("UPDATE players SET auto_search_next_ts = 0 WHERE auto_search_next_ts IS NULL")
+        # Игроки, заблокировавшие бота (рассылки их пропускают)
+        if 'bot_blocked_at' not in cols:
+            conn.exec_driver_sql("ALTER TABLE players ADD COLUMN bot_blocked_at INTEGER DEFAULT 0")
+        # Поиск игроков по нику: нормализованная колонка с индексом (дальше её ведут триггеры)
+        if 'username_lower' not in cols:
+            conn.exec_driver_sql("ALTER TABLE players ADD COLUMN username_lower VARCHAR")
+            conn.exec_driver_sql("UPDATE players SET username_lower = lower(username) WHERE username IS NOT NULL")
+        try:
+            conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_players_username_lower ON players(username_lower)")
+        except Exception:
+            pass
+        # Выборка «кому пора» для планировщика автопоиска
+        try:
+            conn.exec_driver_sql(
+                "CREATE INDEX IF NOT EXISTS idx_players_auto_search_due ON players(auto_search_enabled, auto_search_next_ts)"
+            )
+        except Exception:
+            pass
         # Автопоиск буст
         if 'auto_search_boost_count' not in cols:
             conn.exec_driver_sql("ALTER TABLE players ADD COLUMN auto_search_boost_count INTEGER DEFAULT 0")
@@ -7022,6 +8614,20 @@ def ensure_schema():
             conn.exec_driver_sql("ALTER TABLE players ADD COLUMN red_core_runs INTEGER DEFAULT 0")
         if 'red_core_successes' not in cols:
             conn.exec_driver_sql("ALTER TABLE players ADD COLUMN red_core_successes INTEGER DEFAULT 0")
+        if 'display_name' not in cols:
+            conn.exec_driver_sql("ALTER TABLE players ADD COLUMN display_name VARCHAR")
+        if 'selyuk_fragments' not in cols:
+            conn.exec_driver_sql("ALTER TABLE players ADD COLUMN selyuk_fragments INTEGER DEFAULT 0")
+        if 'auto_search_silent' not in cols:
+            conn.exec_driver_sql("ALTER TABLE players ADD COLUMN auto_search_silent BOOLEAN DEFAULT 0")
+        if 'auto_search_session_stats' not in cols:
+            conn.exec_driver_sql("ALTER TABLE players ADD COLUMN auto_search_session_stats VARCHAR DEFAULT '{}'")
+        if 'casino_wins' not in cols:
+            conn.exec_driver_sql("ALTER TABLE players ADD COLUMN casino_wins INTEGER DEFAULT 0")
+        if 'casino_losses' not in cols:
+            conn.exec_driver_sql("ALTER TABLE players ADD COLUMN casino_losses INTEGER DEFAULT 0")
+        if 'casino_achievements' not in cols:
+            conn.exec_driver_sql("ALTER TABLE players ADD COLUMN casino_achievements VARCHAR DEFAULT ''")
 
         # Обновления для energy_drinks (плантационные энергетики)
         res_drinks = conn.exec_driver_sql("PRAGMA table_info(energy_drinks)")
@@ -7030,6 +8636,32 @@ def ensure_schema():
             conn.exec_driver_sql("ALTER TABLE energy_drinks ADD COLUMN is_plantation INTEGER DEFAULT 0")
         if 'plantation_index' not in cols_drinks:
             conn.exec_driver_sql("ALTER TABLE energy_drinks ADD COLUMN plantation_index INTEGER")
+        if 'default_rarity' not in cols_drinks:
+            conn.exec_driver_sql("ALTER TABLE energy_drinks ADD COLUMN default_rarity VARCHAR")
+
+        # Обновления для promos
+        cols_promos = [row[1] for row in conn.exec_driver_sql("PRAGMA table_info(promos)")]
+        if 'rarity' not in cols_promos:
+            conn.exec_driver_sql("ALTER TABLE promos ADD COLUMN rarity VARCHAR")
+        if 'code_norm' not in cols_promos:
+            conn.exec_driver_sql("ALTER TABLE promos ADD COLUMN code_norm VARCHAR")
+            for promo_id, promo_code in list(conn.exec_driver_sql("SELECT id, code FROM promos")):
+                conn.exec_driver_sql(
+                    "UPDATE promos SET code_norm = ? WHERE id = ?",
+                    (_normalize_promo_code(str(promo_code or '')), int(promo_id)),
+                )
+        conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_promos_code_norm ON promos(code_norm)")
+        if 'used_total' not in cols_promos:
+            # Счётчики заполняются из истории активаций один раз, дальше их ведёт redeem_promo
+            conn.exec_driver_sql("ALTER TABLE promos ADD COLUMN used_total INTEGER NOT NULL DEFAULT 0")
+            conn.exec_driver_sql(
+                "UPDATE promos SET used_total = (SELECT COUNT(*) FROM promo_usages WHERE promo_usages.promo_id = promos.id)"
+            )
+            conn.exec_driver_sql(
+                "INSERT OR REPLACE INTO promo_user_usages (promo_id, user_id, used) "
+                "SELECT promo_id, user_id, COUNT(*) FROM promo_usages "
+                "WHERE promo_id IS NOT NULL AND user_id IS NOT NULL GROUP BY promo_id, user_id"
+            )
 
         # Обновления для fertilizers
         try:
@@ -7125,6 +8757,8 @@ def ensure_schema():
                 conn.exec_driver_sql("ALTER TABLE plantation_beds ADD COLUMN status_effect_applied_at INTEGER DEFAULT 0")
             if 'status_effect_expires_at' not in cols_beds:
                 conn.exec_driver_sql("ALTER TABLE plantation_beds ADD COLUMN status_effect_expires_at INTEGER DEFAULT 0")
+            if 'water_remind_at' not in cols_beds:
+                conn.exec_driver_sql("ALTER TABLE plantation_beds ADD COLUMN water_remind_at INTEGER")
             # Индекс для ускорения выборок по удобрениям
             try:
                 conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS idx_plantation_fertilizer ON plantation_beds(fertilizer_id)")
@@ -7178,6 +8812,61 @@ def ensure_schema():
         pass
 
 
+# Ревизия alembic/versions, которой соответствует схема после ensure_schema(): ею штампуется
+# alembic_version, чтобы `alembic upgrade head` не применял baseline к уже готовой базе.
+ALEMBIC_BASELINE_REVISION = 'c3f9eb5a49d2'
+# Увеличивать при изменении ensure_schema(), триггеров и прочего DDL вне моделей;
+# изменения самих моделей (таблицы, колонки, индексы) учитываются автоматически.
+SCHEMA_VERSION = 2
+
+_schema_verified = False
+
+
+def schema_fingerprint() -> int:
+    """Отпечаток ожидаемой схемы для PRAGMA user_version (31 бит, всегда > 0)."""
+    parts = [f"v{SCHEMA_VERSION}", ALEMBIC_BASELINE_REVISION]
+    for table in sorted(Base.metadata.tables.values(), key=lambda t: t.name):
+        parts.append(table.name + ':' + ','.join(sorted(c.name for c in table.columns)))
+        parts.extend(sorted(f"{table.name}.{index.name}" for index in table.indexes if index.name))
+    digest = hashlib.sha1('|'.join(parts).encode('utf-8')).digest()
+    return (int.from_bytes(digest[:4], 'big') & 0x7FFFFFFF) or 1
+
+
+def is_schema_current(bind=None) -> bool:
+    """True, если база уже промигрирована этой версией кода (одно чтение PRAGMA user_version)."""
+    with (bind or engine).connect() as conn:
+        return int(conn.exec_driver_sql("PRAGMA user_version").scalar() or 0) == schema_fingerprint()
+
+
+def migrate_schema(force: bool = False) -> bool:
+    """Единственный шаг миграции схемы: вызывается один раз при старте бота.
+
+    Если отпечаток в PRAGMA user_version совпадает с schema_fingerprint(), ничего не делает.
+    Иначе прогоняет ensure_schema() (create_all + ALTER TABLE + перенос данных), штампует
+    alembic_version базовой ревизией (если таблица пуста) и записывает отпечаток.
+    После этого в процессе выставляется флаг «схема проверена», и обработчики запросов
+    больше не выполняют никаких проверок DDL. Возвращает True, если миграция выполнялась.
+    """
+    global _schema_verified
+    if _schema_verified and not force:
+        return False
+    if not force and is_schema_current():
+        _schema_verified = True
+        return False
+    started = time.perf_counter()
+    ensure_schema()
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "CREATE TABLE IF NOT EXISTS alembic_version ("
+            "version_num VARCHAR(32) NOT NULL, CONSTRAINT alembic_version_pkc PRIMARY KEY (version_num))"
+        )
+        if conn.exec_driver_sql("SELECT COUNT(*) FROM alembic_version").scalar() == 0:
+            conn.exec_driver_sql("INSERT INTO alembic_version (version_num) VALUES (?)", (ALEMBIC_BASELINE_REVISION,))
+        conn.exec_driver_sql(f"PRAGMA user_version = {schema_fingerprint()}")
+    _schema_verified = True
+    logger.info("[DB] Schema migrated to fingerprint %s in %.2fs", schema_fingerprint(), time.perf_counter() - started)
+    return True
+
 
 def get_receipt_by_id(receipt_id: int) -> PurchaseReceipt | None:
     dbs = SessionLocal()
@@ -7424,12 +9113,22 @@ def get_effective_admin_level(user_id: int, username: str | None = None, player:
     return get_admin_level(int(user_id))
 
 
-def get_access_tier(user_id: int, username: str | None = None, player: Player | None = None) -> str:
-    admin_level = get_effective_admin_level(user_id, username=username, player=player)
+def _access_tier_for(admin_level: int, vip_until: int, vip_plus_until: int, now_ts: int) -> str:
     if admin_level >= 3:
         return 'admin_plus'
     if admin_level >= 1:
         return 'admin'
+    if vip_plus_until > now_ts:
+        return 'vip_plus'
+    if vip_until > now_ts:
+        return 'vip'
+    return 'ordinary'
+
+
+def get_access_tier(user_id: int, username: str | None = None, player: Player | None = None) -> str:
+    admin_level = get_effective_admin_level(user_id, username=username, player=player)
+    if admin_level >= 1:
+        return _access_tier_for(admin_level, 0, 0, 0)
 
     now_ts = int(time.time())
     vip_plus_until = int(getattr(player, 'vip_plus_until', 0) or 0) if player is not None else int(get_vip_plus_until(user_id) or 0)
@@ -7437,17 +9136,24 @@ def get_access_tier(user_id: int, username: str | None = None, player: Player |
         return 'vip_plus'
 
     vip_until = int(getattr(player, 'vip_until', 0) or 0) if player is not None else int(get_vip_until(user_id) or 0)
-    if vip_until > now_ts:
-        return 'vip'
-    return 'ordinary'
+    return _access_tier_for(0, vip_until, 0, now_ts)
+
 
+def get_access_profile(user_id: int, username: str | None = None, player: Player | None = None,
+                       admin_level: int | None = None) -> dict:
+    """Профиль доступа игрока (tier, множители кулдаунов, бонусы).
 
-def get_access_profile(user_id: int, username: str | None = None, player: Player | None = None) -> dict:
+    Если player не передан, он читается одним запросом; admin_level можно
+    передать уже известный, чтобы не читать admin_users повторно.
+    """
     now_ts = int(time.time())
-    tier = get_access_tier(user_id, username=username, player=player)
-    admin_level = get_effective_admin_level(user_id, username=username, player=player)
-    vip_until = int(getattr(player, 'vip_until', 0) or 0) if player is not None else int(get_vip_until(user_id) or 0)
-    vip_plus_until = int(getattr(player, 'vip_plus_until', 0) or 0) if player is not None else int(get_vip_plus_until(user_id) or 0)
+    if player is None:
+        player = get_player(int(user_id))
+    if admin_level is None:
+        admin_level = get_effective_admin_level(user_id, username=username, player=player)
+    vip_until = int(getattr(player, 'vip_until', 0) or 0) if player is not None else 0
+    vip_plus_until = int(getattr(player, 'vip_plus_until', 0) or 0) if player is not None else 0
+    tier = _access_tier_for(int(admin_level), vip_until, vip_plus_until, now_ts)
     vip_plus_active_timed = bool(vip_plus_until and now_ts < vip_plus_until)
     vip_active_timed = bool(vip_plus_active_timed or (vip_until and now_ts < vip_until))
 
@@ -8606,9 +10312,11 @@ def upsert_group_chat(chat_id: int, title: str | None):
             if title and grp.title != title:
                 grp.title = title
                 db.commit()
+                invalidate_group_settings(chat_id)
             return False
         db.add(GroupChat(chat_id=chat_id, title=title or None, is_enabled=True))
         db.commit()
+        invalidate_group_settings(chat_id)
         return True
     finally:
         db.close()
@@ -9002,135 +10710,131 @@ def sell_all_but_one(user_id: int, item_id: int) -> dict:
         dbs.close()
 
 
-def sell_all_inventory(user_id: int) -> dict:
+def _receiver_payout_table(rating: int, ts: int | None = None) -> dict[str, int]:
+    """Выплата за 1 шт. по всем редкостям Приёмника для данного рейтинга.
+
+    Ротация дня вычисляется один раз на таблицу, а не на каждую позицию инвентаря.
+    Значения совпадают с get_receiver_unit_payout_with_rating.
+    """
+    rotation = get_receiver_rotation_offer(ts)
+    multiplier = get_rating_bonus_multiplier(rating)
+    table = {}
+    for rarity in RECEIVER_PRICES:
+        base = get_receiver_unit_payout(rarity)
+        if base <= 0:
+            continue
+        payout = int(base * multiplier)
+        if str(rarity) == rotation.get('rarity'):
+            payout = _apply_percent_bonus(payout, int(rotation.get('rarity_bonus_percent', 0) or 0))
+        if payout > 0:
+            table[str(rarity)] = payout
+    return table
+
+
+def _bulk_sell(user_id: int, rarity: str | None = None, keep_one: bool = False, dry_run: bool = False) -> dict:
+    """Общий движок массовой продажи через Приёмник.
+
+    Один агрегирующий запрос по редкостям, выплаты — по таблице _receiver_payout_table,
+    затем один DELETE (или UPDATE quantity = 1 при keep_one) и обновление баланса.
+    Блокировка записи берётся только на эти несколько statement'ов; в режиме
+    dry_run ничего не меняется и блокировка не берётся.
+    """
+    keep = 1 if keep_one else 0
     dbs = SessionLocal()
     try:
-        user_items = (
-            dbs.query(InventoryItem)
-            .filter(InventoryItem.player_id == user_id)
+        if not dry_run:
+            _begin_write_transaction(dbs)
+        player = dbs.query(Player).filter(Player.user_id == user_id).first()
+        rating_value = int(getattr(player, 'rating', 0) or 0) if player else 0
+        payouts = _receiver_payout_table(rating_value)
+
+        filters = [InventoryItem.player_id == user_id]
+        if rarity is not None:
+            filters.append(InventoryItem.rarity == rarity)
+        sellable = case((InventoryItem.quantity > keep, 1), else_=0)
+        rows = (
+            dbs.query(
+                InventoryItem.rarity,
+                func.count(InventoryItem.id),
+                func.sum(case((InventoryItem.quantity > 0, 1), else_=0)),
+                func.sum(sellable),
+                func.sum(case((InventoryItem.quantity > keep, InventoryItem.quantity - keep), else_=0)),
+            )
+            .filter(*filters)
+            .group_by(InventoryItem.rarity)
             .all()
         )
-        if not user_items:
+        if not rows:
+            dbs.rollback()
             return {"ok": False, "reason": "no_items"}
 
-        player = (
-            dbs.query(Player)
-            .filter(Player.user_id == user_id)
-            .with_for_update(read=False)
-            .first()
-        )
-        if not player:
-            player = Player(user_id=user_id, username=None)
-            dbs.add(player)
-            dbs.commit()
-            dbs.refresh(player)
+        unit_payout = int(payouts.get(str(rarity), 0)) if rarity is not None else 0
+        if rarity is not None and unit_payout <= 0:
+            dbs.rollback()
+            return {"ok": False, "reason": "unsupported_rarity"}
 
-        rating_value = int(getattr(player, 'rating', 0) or 0)
+        by_rarity = {}
+        sell_rarities = []
         total_items_sold = 0
         total_earned = 0
         items_processed = 0
         skipped_items = 0
-
-        for item in user_items:
-            qty_available = int(item.quantity or 0)
-            if qty_available <= 0:
+        for row_rarity, _rows, non_empty, sell_rows, sell_qty in rows:
+            unit = int(payouts.get(str(row_rarity), 0)) if row_rarity is not None else 0
+            sell_rows = int(sell_rows or 0)
+            sell_qty = int(sell_qty or 0)
+            if unit <= 0:
+                skipped_items += int(sell_rows if keep_one else (non_empty or 0))
                 continue
-
-            unit_payout = get_receiver_unit_payout_with_rating(item.rarity, rating_value)
-            if unit_payout <= 0:
-                skipped_items += 1
+            if sell_qty <= 0:
                 continue
-
-            item_payout = int(unit_payout) * int(qty_available)
-            total_items_sold += qty_available
-            total_earned += item_payout
-            items_processed += 1
-
-            dbs.delete(item)
+            sell_rarities.append(row_rarity)
+            by_rarity[str(row_rarity)] = {
+                "quantity": sell_qty,
+                "items": sell_rows,
+                "unit_payout": unit,
+                "total_payout": unit * sell_qty,
+            }
+            total_items_sold += sell_qty
+            total_earned += unit * sell_qty
+            items_processed += sell_rows
 
         if total_items_sold == 0:
+            dbs.rollback()
             return {"ok": False, "reason": "nothing_to_sell"}
 
-        player.coins = int(player.coins or 0) + int(total_earned)
-        dbs.commit()
-        return {
-            "ok": True,
-            "total_items_sold": int(total_items_sold),
-            "total_earned": int(total_earned),
-            "items_processed": int(items_processed),
-            "skipped_items": int(skipped_items),
-            "coins_after": int(player.coins),
-        }
-    except Exception:
-        try:
-            dbs.rollback()
-        except Exception:
-            pass
-        return {"ok": False, "reason": "exception"}
-    finally:
-        dbs.close()
-
-
-def sell_all_drinks_of_rarity(user_id: int, rarity: str) -> dict:
-    """Массовая продажа всех энергетиков указанной редкости.
-    Возвращает dict: {ok, total_items_sold, total_earned, items_processed, coins_after, unit_payout}
-    """
-    dbs = SessionLocal()
-    try:
-        user_items = (
-            dbs.query(InventoryItem)
-            .filter(InventoryItem.player_id == user_id, InventoryItem.rarity == rarity)
-            .all()
-        )
-        if not user_items:
-            return {"ok": False, "reason": "no_items"}
-
-        player = (
-            dbs.query(Player)
-            .filter(Player.user_id == user_id)
-            .with_for_update(read=False)
-            .first()
-        )
-        if not player:
-            player = Player(user_id=user_id, username=None)
-            dbs.add(player)
+        coins_before = int(getattr(player, 'coins', 0) or 0) if player else 0
+        if not dry_run:
+            target = dbs.query(InventoryItem).filter(
+                InventoryItem.player_id == user_id,
+                InventoryItem.rarity.in_(sell_rarities),
+                InventoryItem.quantity > keep,
+            )
+            if keep_one:
+                target.update({InventoryItem.quantity: 1}, synchronize_session=False)
+            else:
+                target.delete(synchronize_session=False)
+            if not player:
+                player = Player(user_id=user_id, username=None)
+                dbs.add(player)
+            player.coins = coins_before + int(total_earned)
             dbs.commit()
-            dbs.refresh(player)
-
-        rating_value = int(getattr(player, 'rating', 0) or 0)
-        unit_payout = get_receiver_unit_payout_with_rating(rarity, rating_value)
-        if unit_payout <= 0:
-            return {"ok": False, "reason": "unsupported_rarity"}
-
-        total_items_sold = 0
-        total_earned = 0
-        items_processed = 0
-
-        for item in user_items:
-            qty_available = int(item.quantity or 0)
-            if qty_available <= 0:
-                continue
-
-            item_payout = int(unit_payout) * int(qty_available)
-            total_items_sold += qty_available
-            total_earned += item_payout
-            items_processed += 1
-
-            dbs.delete(item)
-
-        if total_items_sold == 0:
-            return {"ok": False, "reason": "nothing_to_sell"}
+        else:
+            dbs.rollback()
 
-        player.coins = int(player.coins or 0) + int(total_earned)
-        dbs.commit()
-        return {
+        result = {
             "ok": True,
+            "dry_run": bool(dry_run),
             "total_items_sold": int(total_items_sold),
             "total_earned": int(total_earned),
             "items_processed": int(items_processed),
-            "coins_after": int(player.coins),
-            "unit_payout": int(unit_payout),
+            "skipped_items": int(skipped_items),
+            "coins_after": int(coins_before + total_earned),
+            "by_rarity": by_rarity,
         }
+        if rarity is not None:
+            result["unit_payout"] = int(unit_payout)
+        return result
     except Exception:
         try:
             dbs.rollback()
@@ -9141,88 +10845,30 @@ def sell_all_drinks_of_rarity(user_id: int, rarity: str) -> dict:
         dbs.close()
 
 
-def sell_absolutely_all_but_one(user_id: int) -> dict:
+def sell_all_inventory(user_id: int, dry_run: bool = False) -> dict:
+    """Продажа всего инвентаря через Приёмник (редкости без цены пропускаются).
+    Возвращает dict: {ok, total_items_sold, total_earned, items_processed, skipped_items, coins_after, by_rarity}
+    """
+    return _bulk_sell(user_id, dry_run=dry_run)
+
+
+def sell_all_drinks_of_rarity(user_id: int, rarity: str, dry_run: bool = False) -> dict:
+    """Массовая продажа всех энергетиков указанной редкости.
+    Возвращает dict: {ok, total_items_sold, total_earned, items_processed, coins_after, unit_payout}
+    """
+    return _bulk_sell(user_id, rarity=rarity, dry_run=dry_run)
+
+
+def sell_absolutely_all_but_one(user_id: int, dry_run: bool = False) -> dict:
     """Продажа АБСОЛЮТНО всех энергетиков кроме одного экземпляра каждого типа.
     Возвращает dict: {ok, total_items_sold, total_earned, items_processed, coins_after}
     """
-    dbs = SessionLocal()
-    try:
-        # Получаем все предметы пользователя
-        user_items = (
-            dbs.query(InventoryItem)
-            .filter(InventoryItem.player_id == user_id)
-            .all()
-        )
-        
-        if not user_items:
-            return {"ok": False, "reason": "no_items"}
-        
-        # Получаем игрока для обновления баланса
-        player = (
-            dbs.query(Player)
-            .filter(Player.user_id == user_id)
-            .with_for_update(read=False)
-            .first()
-        )
-        if not player:
-            # Создаём игрока, если внезапно отсутствует
-            player = Player(user_id=user_id, username=None)
-            dbs.add(player)
-            dbs.commit()
-            dbs.refresh(player)
-        
-        rating_value = int(getattr(player, 'rating', 0) or 0)
-        total_items_sold = 0
-        total_earned = 0
-        items_processed = 0
-        
-        # Обрабатываем каждый предмет
-        for item in user_items:
-            qty_available = int(item.quantity or 0)
-            
-            # Пропускаем предметы с количеством 1 или меньше
-            if qty_available <= 1:
-                continue
-                
-            # Получаем выплату за предмет
-            unit_payout = get_receiver_unit_payout_with_rating(item.rarity, rating_value)
-            if unit_payout <= 0:
-                continue  # Пропускаем неподдерживаемые редкости
-            
-            # Продаём все кроме одного
-            qty_to_sell = qty_available - 1
-            item_payout = int(unit_payout) * int(qty_to_sell)
-            
-            total_items_sold += qty_to_sell
-            total_earned += item_payout
-            items_processed += 1
-            
-            # Обновляем количество предмета (оставляем 1)
-            item.quantity = 1
-        
-        # Если ничего не продали
-        if total_items_sold == 0:
-            return {"ok": False, "reason": "nothing_to_sell"}
-        
-        # Начисляем заработанные монеты
-        player.coins = int(player.coins or 0) + int(total_earned)
-        
-        dbs.commit()
-        return {
-            "ok": True,
-            "total_items_sold": int(total_items_sold),
-            "total_earned": int(total_earned),
-            "items_processed": int(items_processed),
-            "coins_after": int(player.coins),
-        }
-    except Exception:
-        try:
-            dbs.rollback()
-        except Exception:
-            pass
-        return {"ok": False, "reason": "exception"}
-    finally:
-        dbs.close()
+    return _bulk_sell(user_id, keep_one=True, dry_run=dry_run)
+
+
+def preview_receiver_bulk_sell(user_id: int, rarity: str | None = None, keep_one: bool = False) -> dict:
+    """Предпросмотр массовой продажи без изменения БД (для экранов подтверждения)."""
+    return _bulk_sell(user_id, rarity=rarity, keep_one=keep_one, dry_run=True)
 
 # --- Автопоиск буст: расширенные функции ---
 
@@ -9630,41 +11276,30 @@ def get_money_leaderboard(limit: int = 10) -> list[dict]:
         limit: Количество игроков в топе (по умолчанию 10)
         
     Returns:
-        Список словарей с данными игроков: {'user_id', 'username', 'coins', 'position'}
+        Список словарей с данными игроков: {'user_id', 'username', 'coins', 'position',
+        'vip_until', 'vip_plus_until'}
     """
-    dbs = SessionLocal()
     try:
-        now_ts = int(time.time())
-        players = (
-            dbs.query(Player)
-            .filter(Player.coins > 0)
-            .outerjoin(
-                UserBan,
-                and_(
-                    UserBan.user_id == Player.user_id,
-                    or_(UserBan.banned_until == None, UserBan.banned_until > now_ts)
-                )
-            )
-            .filter(UserBan.user_id == None)
-            .order_by(Player.coins.desc())
-            .limit(limit)
-            .all()
-        )
-        
+        top = _leaderboards.top('coins', limit, _ban_index.banned_ids())
+        dbs = SessionLocal()
+        try:
+            players = _leaderboard_player_rows(dbs, [uid for uid, _ in top])
+        finally:
+            dbs.close()
         result = []
-        for position, player in enumerate(players, 1):
+        for position, (uid, coins) in enumerate(top, 1):
+            player = players.get(uid)
             result.append({
-                'user_id': player.user_id,
-                'username': player.username or 'Неизвестный игрок',
-                'coins': player.coins,
-                'position': position
+                'user_id': uid,
+                'username': (player.username if player else None) or 'Неизвестный игрок',
+                'coins': coins,
+                'position': position,
+                'vip_until': int(player.vip_until or 0) if player else 0,
+                'vip_plus_until': int(player.vip_plus_until or 0) if player else 0,
             })
-        
         return result
     except Exception:
         return []
-    finally:
-        dbs.close()
 
 # --- Функции для управления групповыми настройками ---
 
@@ -9700,6 +11335,7 @@ def update_group_settings(chat_id: int, notify_disabled: bool = None, auto_delet
             group.auto_delete_enabled = auto_delete_enabled
         
         db.commit()
+        invalidate_group_settings(chat_id)
         return True
     except Exception:
         try:
@@ -9887,58 +11523,88 @@ def transfer_gift_bundle_atomic(
     giver_id: int,
     recipient_id: int,
     items: list,
+    *,
+    log_status: str | None = None,
 ) -> dict:
     """Атомарная передача пачки подарков: списание у гивера + начисление получателю в одной транзакции.
 
     items: [{"item_id": int, "drink_id": int, "rarity": str, "quantity": int}, ...]
+    Транзакция открывается BEGIN IMMEDIATE (SELECT ... FOR UPDATE в SQLite не работает),
+    поэтому параллельные передачи одних и тех же позиций выполняются строго по очереди.
+    Позиции гивера читаются одним SELECT по списку id, списание — одним UPDATE и одним
+    DELETE, начисление — одним upsert по уникальному (player_id, drink_id, rarity).
+    Если задан log_status, строки GiftHistory пишутся в той же транзакции.
     Возвращает {"ok": True} или {"ok": False, "reason": "..."}.
     """
+    requested: dict[int, int] = {}
+    expected: dict[int, tuple[int, str]] = {}
+    for bundle_item in items:
+        item_id = int(bundle_item["item_id"])
+        quantity = int(bundle_item["quantity"])
+        if quantity <= 0:
+            return {"ok": False, "reason": "invalid_quantity"}
+        requested[item_id] = requested.get(item_id, 0) + quantity
+        expected[item_id] = (int(bundle_item["drink_id"]), str(bundle_item["rarity"]))
+    if not requested:
+        return {"ok": False, "reason": "empty_bundle"}
+
     dbs = SessionLocal()
     try:
-        # Списание у гивера с row-locking
-        for bundle_item in items:
-            item = (
-                dbs.query(InventoryItem)
-                .filter(InventoryItem.id == int(bundle_item["item_id"]))
-                .with_for_update()
-                .first()
-            )
-            if not item:
+        _begin_write_transaction(dbs)
+        rows = {
+            int(row.id): row
+            for row in dbs.query(
+                InventoryItem.id, InventoryItem.player_id, InventoryItem.drink_id,
+                InventoryItem.rarity, InventoryItem.quantity,
+            ).filter(InventoryItem.id.in_(list(requested)))
+        }
+        for item_id, quantity in requested.items():
+            row = rows.get(item_id)
+            # Позиция могла исчезнуть, а её id — достаться другому напитку
+            if row is None or (int(row.drink_id), str(row.rarity)) != expected[item_id]:
                 dbs.rollback()
                 return {"ok": False, "reason": "item_not_found"}
-            if int(item.player_id) != int(giver_id):
+            if int(row.player_id) != int(giver_id):
                 dbs.rollback()
                 return {"ok": False, "reason": "not_owner"}
-            if int(item.quantity or 0) < int(bundle_item["quantity"]):
+            if int(row.quantity or 0) < quantity:
                 dbs.rollback()
                 return {"ok": False, "reason": "insufficient_quantity"}
 
-            new_qty = int(item.quantity) - int(bundle_item["quantity"])
-            if new_qty <= 0:
-                dbs.delete(item)
-            else:
-                item.quantity = new_qty
+        # Списание у гивера
+        emptied = [item_id for item_id, quantity in requested.items() if int(rows[item_id].quantity) == quantity]
+        partial = {item_id: quantity for item_id, quantity in requested.items() if item_id not in emptied}
+        if partial:
+            dbs.query(InventoryItem).filter(InventoryItem.id.in_(list(partial))).update(
+                {InventoryItem.quantity: InventoryItem.quantity - case(partial, value=InventoryItem.id)},
+                synchronize_session=False,
+            )
+        if emptied:
+            dbs.query(InventoryItem).filter(InventoryItem.id.in_(emptied)).delete(synchronize_session=False)
 
         # Начисление получателю
-        for bundle_item in items:
-            existing = (
-                dbs.query(InventoryItem)
-                .filter_by(
-                    player_id=int(recipient_id),
-                    drink_id=int(bundle_item["drink_id"]),
-                    rarity=str(bundle_item["rarity"]),
-                )
-                .first()
-            )
-            if existing:
-                existing.quantity = int(existing.quantity or 0) + int(bundle_item["quantity"])
-            else:
-                dbs.add(InventoryItem(
-                    player_id=int(recipient_id),
-                    drink_id=int(bundle_item["drink_id"]),
-                    rarity=str(bundle_item["rarity"]),
-                    quantity=int(bundle_item["quantity"]),
-                ))
+        credit: dict[tuple[int, str], int] = {}
+        for item_id, quantity in requested.items():
+            key = expected[item_id]
+            credit[key] = credit.get(key, 0) + quantity
+        stmt = sqlite_insert(InventoryItem.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['player_id', 'drink_id', 'rarity'],
+            set_={'quantity': func.coalesce(InventoryItem.__table__.c.quantity, 0) + stmt.excluded.quantity},
+        )
+        dbs.execute(stmt, [
+            {'player_id': int(recipient_id), 'drink_id': drink_id, 'rarity': rarity, 'quantity': quantity}
+            for (drink_id, rarity), quantity in credit.items()
+        ])
+
+        if log_status:
+            now_ts = int(time.time())
+            dbs.execute(GiftHistory.__table__.insert(), [
+                {'giver_id': int(giver_id), 'recipient_id': int(recipient_id), 'drink_id': drink_id,
+                 'rarity': rarity, 'status': log_status, 'created_at': now_ts}
+                for (drink_id, rarity), quantity in credit.items()
+                for _ in range(quantity)
+            ])
 
         dbs.commit()
         return {"ok": True}
@@ -10358,26 +12024,100 @@ def get_active_promo_count() -> int:
     finally:
         db.close()
 
-def get_group_settings(chat_id: int) -> dict:
-    """Возвращает настройки группы. Если записи нет — возвращает значения по умолчанию."""
-    db = SessionLocal()
-    try:
-        row = db.query(GroupChat).filter(GroupChat.chat_id == chat_id).first()
-        if not row:
-            return {
-                'notify_disabled': False,
-                'auto_delete_enabled': False,
-                'auto_delete_delay_minutes': 5,
-                'title': None,
-            }
+def _group_settings_snapshot(row=None) -> dict:
+    if row is None:
         return {
-            'notify_disabled': bool(row.notify_disabled),
-            'auto_delete_enabled': bool(row.auto_delete_enabled),
-            'auto_delete_delay_minutes': int(row.auto_delete_delay_minutes or 5),
-            'title': row.title,
+            'exists': False,
+            'notify_disabled': False,
+            'auto_delete_enabled': False,
+            'auto_delete_delay_minutes': 5,
+            'title': None,
         }
-    finally:
-        db.close()
+    return {
+        'exists': True,
+        'notify_disabled': bool(row.notify_disabled),
+        'auto_delete_enabled': bool(row.auto_delete_enabled),
+        'auto_delete_delay_minutes': int(row.auto_delete_delay_minutes or 5),
+        'title': row.title,
+    }
+
+
+class _GroupSettingsCache:
+    """Настройки групп в памяти: chat_id -> (снимок настроек, время чтения).
+
+    Запись живёт GROUP_SETTINGS_CACHE_TTL_SEC (LRU на GROUP_SETTINGS_CACHE_SIZE групп).
+    Изменение настроек функциями этого модуля сбрасывает запись группы сразу.
+    get_many() дочитывает все промахи одним запросом — так чистильщик автоудаления
+    проверяет чаты целой пачки разом.
+    """
+
+    def __init__(self, maxsize: int):
+        self._lock = threading.Lock()
+        self._items: OrderedDict[int, tuple[dict, float]] = OrderedDict()
+        self._generation = 0
+        self.maxsize = max(1, int(maxsize))
+        self.loads = 0
+
+    def get_many(self, chat_ids) -> dict[int, dict]:
+        now = time.monotonic()
+        result: dict[int, dict] = {}
+        missing: list[int] = []
+        with self._lock:
+            for chat_id in {int(c) for c in chat_ids}:
+                entry = self._items.get(chat_id)
+                if entry is not None and now - entry[1] < GROUP_SETTINGS_CACHE_TTL_SEC:
+                    self._items.move_to_end(chat_id)
+                    result[chat_id] = entry[0]
+                else:
+                    missing.append(chat_id)
+            generation = self._generation
+        if not missing:
+            return result
+        dbs = SessionLocal()
+        try:
+            rows = dbs.query(GroupChat).filter(GroupChat.chat_id.in_(missing)).all()
+        finally:
+            dbs.close()
+        loaded = {chat_id: _group_settings_snapshot() for chat_id in missing}
+        for row in rows:
+            loaded[int(row.chat_id)] = _group_settings_snapshot(row)
+        with self._lock:
+            self.loads += 1
+            # Настройки поменялись во время чтения — не кладём в кэш возможно устаревший снимок
+            if generation == self._generation:
+                for chat_id, settings in loaded.items():
+                    self._items[chat_id] = (settings, now)
+                    self._items.move_to_end(chat_id)
+                while len(self._items) > self.maxsize:
+                    self._items.popitem(last=False)
+        result.update(loaded)
+        return result
+
+    def invalidate(self, chat_id: int | None = None) -> None:
+        with self._lock:
+            self._generation += 1
+            if chat_id is None:
+                self._items.clear()
+            else:
+                self._items.pop(int(chat_id), None)
+
+
+_group_settings_cache = _GroupSettingsCache(GROUP_SETTINGS_CACHE_SIZE)
+
+
+def invalidate_group_settings(chat_id: int | None = None) -> None:
+    """Сбрасывает кэш настроек групп (одной группы или всех)."""
+    _group_settings_cache.invalidate(chat_id)
+
+
+def get_group_settings(chat_id: int) -> dict:
+    """Возвращает настройки группы (из кэша). Если записи нет — значения по умолчанию."""
+    return dict(_group_settings_cache.get_many((chat_id,))[int(chat_id)])
+
+
+def get_group_settings_many(chat_ids) -> dict[int, dict]:
+    """Настройки нескольких групп: chat_id -> снимок. Промахи кэша читаются одним запросом."""
+    return {chat_id: dict(settings) for chat_id, settings in _group_settings_cache.get_many(chat_ids).items()}
 
 def set_group_settings(chat_id: int, **kwargs) -> bool:
     """Создаёт/обновляет запись настроек для группы."""
@@ -10392,6 +12132,7 @@ def set_group_settings(chat_id: int, **kwargs) -> bool:
             if key in kwargs:
                 setattr(row, key, kwargs[key])
         db.commit()
+        invalidate_group_settings(chat_id)
         return True
     except Exception:
         db.rollback()
@@ -10428,6 +12169,44 @@ def delete_scheduled_auto_delete(scheduled_id: int) -> bool:
         db.close()
 
 
+def get_due_auto_deletes(now_ts: int | None = None, limit: int = 500) -> list[tuple[int, int, int]]:
+    """Созревшие задачи автоудаления (id, chat_id, message_id) в порядке delete_at — по индексу delete_at."""
+    now_ts = int(time.time()) if now_ts is None else int(now_ts)
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(ScheduledAutoDelete.id, ScheduledAutoDelete.chat_id, ScheduledAutoDelete.message_id)
+            .filter(ScheduledAutoDelete.delete_at <= now_ts)
+            .order_by(ScheduledAutoDelete.delete_at, ScheduledAutoDelete.id)
+            .limit(max(1, int(limit)))
+            .all()
+        )
+        return [(int(rid), int(chat_id), int(message_id)) for rid, chat_id, message_id in rows]
+    finally:
+        db.close()
+
+
+def delete_scheduled_auto_deletes(ids) -> int:
+    """Удаляет задачи автоудаления по списку ID одним DELETE. Возвращает число удалённых строк."""
+    ids = [int(i) for i in ids]
+    if not ids:
+        return 0
+    db = SessionLocal()
+    try:
+        deleted = (
+            db.query(ScheduledAutoDelete)
+            .filter(ScheduledAutoDelete.id.in_(ids))
+            .delete(synchronize_session=False)
+        )
+        db.commit()
+        return int(deleted or 0)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
 def get_banned_users_count() -> int:
     """Возвращает количество забаненных пользователей."""
     db = SessionLocal()
@@ -10440,31 +12219,7 @@ def get_banned_users_count() -> int:
         db.close()
 
 def is_user_banned(user_id: int) -> bool:
-    db = SessionLocal()
-    try:
-        try:
-            if is_protected_user(int(user_id)):
-                try:
-                    recp = db.query(UserBan).filter(UserBan.user_id == int(user_id)).first()
-                    if recp:
-                        db.delete(recp)
-                        db.commit()
-                except Exception:
-                    try:
-                        db.rollback()
-                    except Exception:
-                        pass
-                return False
-        except Exception:
-            pass
-        now_ts = int(time.time())
-        rec = db.query(UserBan).filter(UserBan.user_id == int(user_id)).first()
-        if not rec:
-            return False
-        until = getattr(rec, 'banned_until', None)
-        return True if (until is None or int(until) > now_ts) else False
-    finally:
-        db.close()
+    return get_active_ban(user_id) is not None
 
 def ban_user(user_id: int, banned_by: int | None = None, reason: str | None = None, duration_seconds: int | None = None) -> bool:
     db = SessionLocal()
@@ -10485,6 +12240,7 @@ def ban_user(user_id: int, banned_by: int | None = None, reason: str | None = No
             rec = UserBan(user_id=int(user_id), reason=reason, banned_at=now_ts, banned_until=until, banned_by=banned_by)
             db.add(rec)
         db.commit()
+        _ban_index.put(_ban_row_to_dict(rec))
         try:
             insert_moderation_log(actor_id=int(banned_by or 0), action='ban_user', request_id=None, target_id=int(user_id), details=reason)
         except Exception:
@@ -10501,9 +12257,11 @@ def unban_user(user_id: int, unbanned_by: int | None = None) -> bool:
     try:
         rec = db.query(UserBan).filter(UserBan.user_id == int(user_id)).first()
         if not rec:
+            _ban_index.discard(int(user_id))
             return False
         db.delete(rec)
         db.commit()
+        _ban_index.discard(int(user_id))
         try:
             insert_moderation_log(actor_id=int(unbanned_by or 0), action='unban_user', request_id=None, target_id=int(user_id), details=None)
         except Exception:
@@ -10555,13 +12313,14 @@ def unban_protected_users() -> int:
         except Exception:
             names = []
         if names:
-            creators = dbs.query(Player).filter(func.lower(Player.username).in_(names)).all()
+            creators = dbs.query(Player).filter(Player.username_lower.in_(names)).all()
             for p in creators:
                 try:
                     protected_ids.add(int(getattr(p, 'user_id', 0) or 0))
                 except Exception:
                     continue
         removed = 0
+        removed_ids = []
         for uid in protected_ids:
             if not uid:
                 continue
@@ -10569,8 +12328,11 @@ def unban_protected_users() -> int:
             if rec:
                 dbs.delete(rec)
                 removed += 1
+                removed_ids.append(int(uid))
         if removed:
             dbs.commit()
+            for uid in removed_ids:
+                _ban_index.discard(uid)
         return removed
     except Exception:
         try:
@@ -10697,75 +12459,151 @@ def get_active_events_count() -> int:
     return 0
 
 
-def get_bot_statistics() -> dict:
-    """Возвращает детальную статистику бота."""
-    db = SessionLocal()
+# --- Снимок статистики для админ-панели ---
+
+_PLAYER_STATS_SQL = text(
+    """
+    SELECT
+        COUNT(*) AS total_users,
+        COALESCE(SUM(coins), 0) AS total_coins,
+        COALESCE(SUM(CASE WHEN vip_until > :now THEN 1 ELSE 0 END), 0) AS active_vip,
+        COALESCE(SUM(CASE WHEN vip_plus_until > :now THEN 1 ELSE 0 END), 0) AS active_vip_plus,
+        COALESCE(SUM(CASE WHEN last_search > :day_ago THEN 1 ELSE 0 END), 0) AS active_today,
+        COALESCE(SUM(CASE WHEN last_search > :week_ago THEN 1 ELSE 0 END), 0) AS active_week,
+        COALESCE(SUM(CASE WHEN auto_search_boost_count > 0 AND auto_search_boost_until > :now
+                          THEN 1 ELSE 0 END), 0) AS active_boosts,
+        COALESCE(SUM(CASE WHEN auto_search_boost_count > 0 AND auto_search_boost_until > :now
+                          THEN auto_search_boost_count ELSE 0 END), 0) AS active_boost_total,
+        COALESCE(SUM(CASE WHEN auto_search_boost_count > 0 AND auto_search_boost_until <= :now
+                          THEN 1 ELSE 0 END), 0) AS expired_boosts
+    FROM players
+    """
+)
+
+_OTHER_STATS_SQL = text(
+    """
+    SELECT
+        (SELECT COUNT(*) FROM energy_drinks) AS total_drinks,
+        (SELECT COALESCE(SUM(quantity), 0) FROM inventory_items) AS total_inventory_items,
+        (SELECT COUNT(*) FROM purchase_receipts) AS total_purchases,
+        (SELECT COUNT(*) FROM purchase_receipts WHERE purchased_at > :day_ago) AS purchases_today,
+        (SELECT COUNT(*) FROM promos WHERE active = 1 AND (expires_at IS NULL OR expires_at > :now)) AS active_promo,
+        (SELECT COUNT(*) FROM user_bans WHERE banned_until IS NULL OR banned_until > :now) AS banned_users
+    """
+)
+
+
+def _compute_bot_statistics(dbs, now_ts: int) -> dict:
+    params = {'now': now_ts, 'day_ago': now_ts - 86400, 'week_ago': now_ts - 604800}
+    # Проход 1: все счётчики по players одним сканированием
+    players = dbs.execute(_PLAYER_STATS_SQL, params).mappings().one()
+    # Проход 2: остальные таблицы одним запросом со скалярными подзапросами
+    other = dbs.execute(_OTHER_STATS_SQL, params).mappings().one()
+    stats = {key: int(value or 0) for key, value in {**players, **other}.items()}
+    active_boost_total = stats.pop('active_boost_total')
+    stats['average_boost_count'] = round(active_boost_total / stats['active_boosts'], 1) if stats['active_boosts'] else 0
+
+    top_coins = _leaderboards.top('coins', 10)
+    top_drinks = _leaderboards.top('drinks', 10)
+    names = dict(dbs.query(Player.user_id, Player.username).filter(
+        Player.user_id.in_({uid for uid, _ in top_coins + top_drinks})
+    ).all()) if top_coins or top_drinks else {}
+    stats['top_coins'] = [(uid, names.get(uid), coins) for uid, coins in top_coins]
+    stats['top_drinks'] = [(uid, names.get(uid), total) for uid, total in top_drinks]
+    stats['generated_at'] = now_ts
+    return stats
+
+
+class _BotStatsSnapshot:
+    """Снимок статистики бота в памяти.
+
+    Снимок считается двумя агрегирующими запросами и живёт STATS_SNAPSHOT_TTL_SEC:
+    повторные открытия админ-панели в пределах TTL не трогают БД. Пути записи
+    (новый игрок, покупка) сдвигают счётчики снимка через bump(), поэтому
+    основные цифры не отстают от БД до следующего пересчёта.
+
+    Пересчёт идёт вне _lock, чтобы bump() на путях покупки и поиска не ждал
+    агрегирующих запросов; _compute_lock пропускает один пересчёт за раз,
+    остальные запросившие дожидаются его и берут готовый снимок.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._compute_lock = threading.Lock()
+        self._stats: dict | None = None
+        self._computed_at = 0.0
+        self.computes = 0
+
+    def _fresh(self, max_age: float, requested_at: float) -> dict | None:
+        with self._lock:
+            if self._stats is None:
+                return None
+            # Снимок, посчитанный после запроса, подходит даже при max_age=0
+            if time.monotonic() - self._computed_at < max_age or self._computed_at >= requested_at:
+                return dict(self._stats)
+            return None
+
+    def get(self, max_age: float | None = None) -> dict:
+        max_age = STATS_SNAPSHOT_TTL_SEC if max_age is None else float(max_age)
+        requested_at = time.monotonic()
+        stats = self._fresh(max_age, float('inf'))
+        if stats is not None:
+            return stats
+        with self._compute_lock:
+            stats = self._fresh(max_age, requested_at)
+            if stats is not None:
+                return stats
+            dbs = SessionLocal()
+            try:
+                stats = _compute_bot_statistics(dbs, int(time.time()))
+            finally:
+                dbs.close()
+            with self._lock:
+                self._stats = stats
+                self._computed_at = time.monotonic()
+                self.computes += 1
+            return dict(stats)
+
+    def bump(self, **deltas: int) -> None:
+        with self._lock:
+            if self._stats is None:
+                return
+            for key, delta in deltas.items():
+                self._stats[key] = int(self._stats.get(key, 0)) + int(delta)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._stats = None
+            self._computed_at = 0.0
+
+
+_bot_stats_snapshot = _BotStatsSnapshot()
+
+
+def invalidate_bot_statistics() -> None:
+    """Сбрасывает снимок статистики: следующий get_bot_statistics пересчитает его."""
+    _bot_stats_snapshot.invalidate()
+
+
+def get_bot_statistics(max_age: float | None = None) -> dict:
+    """
+    Возвращает детальную статистику бота (снимок, см. _BotStatsSnapshot).
+
+    Кроме общих счётчиков содержит бусты автопоиска (active_boosts, expired_boosts,
+    average_boost_count), active_promo и banned_users. max_age=0 — пересчитать сейчас.
+    """
     try:
-        current_time = int(time.time())
-        one_day_ago = current_time - 86400
-        one_week_ago = current_time - 604800
-        
-        # Общая статистика
-        total_users = db.query(Player).count()
-        total_drinks = db.query(EnergyDrink).count()
-        total_inventory_items = db.query(func.sum(InventoryItem.quantity)).scalar() or 0
-        total_coins = db.query(func.sum(Player.coins)).scalar() or 0
-        
-        # VIP статистика
-        active_vip = db.query(Player).filter(Player.vip_until > current_time).count()
-        active_vip_plus = db.query(Player).filter(Player.vip_plus_until > current_time).count()
-        
-        # Активность
-        active_today = db.query(Player).filter(Player.last_search > one_day_ago).count()
-        active_week = db.query(Player).filter(Player.last_search > one_week_ago).count()
-        
-        # Покупки
-        total_purchases = db.query(PurchaseReceipt).count()
-        purchases_today = db.query(PurchaseReceipt).filter(PurchaseReceipt.purchased_at > one_day_ago).count()
-        
-        # Топ игроков по монетам
-        top_coins = db.query(Player).order_by(Player.coins.desc()).limit(10).all()
-        
-        # Топ игроков по количеству напитков
-        top_drinks = (
-            db.query(
-                Player.user_id,
-                Player.username,
-                func.sum(InventoryItem.quantity).label('total_drinks')
-            )
-            .join(InventoryItem, Player.user_id == InventoryItem.player_id)
-            .group_by(Player.user_id, Player.username)
-            .order_by(func.sum(InventoryItem.quantity).desc())
-            .limit(10)
-            .all()
-        )
-        
-        return {
-            'total_users': total_users,
-            'total_drinks': total_drinks,
-            'total_inventory_items': int(total_inventory_items),
-            'total_coins': int(total_coins),
-            'active_vip': active_vip,
-            'active_vip_plus': active_vip_plus,
-            'active_today': active_today,
-            'active_week': active_week,
-            'total_purchases': total_purchases,
-            'purchases_today': purchases_today,
-            'top_coins': [(p.user_id, p.username, p.coins) for p in top_coins],
-            'top_drinks': [(user_id, username, int(total)) for user_id, username, total in top_drinks]
-        }
+        return _bot_stats_snapshot.get(max_age)
     except Exception as e:
         print(f"[DB] Error getting bot statistics: {e}")
         return {}
-    finally:
-        db.close()
 
 
 def get_all_users_for_broadcast(limit: int = None) -> list[int]:
-    """Возвращает список всех user_id для рассылки."""
+    """Возвращает список всех user_id для рассылки (кроме заблокировавших бота)."""
     db = SessionLocal()
     try:
-        query = db.query(Player.user_id)
+        query = db.query(Player.user_id).filter(func.coalesce(Player.bot_blocked_at, 0) == 0)
         if limit:
             query = query.limit(limit)
         return [row.user_id for row in query.all()]
@@ -10775,6 +12613,296 @@ def get_all_users_for_broadcast(limit: int = None) -> list[int]:
         db.close()
 
 
+# --- Задания рассылки ---
+
+def _broadcast_job_to_dict(job: BroadcastJob) -> dict:
+    return {
+        'id': int(job.id),
+        'created_by': int(job.created_by or 0),
+        'admin_chat_id': int(job.admin_chat_id or 0),
+        'progress_message_id': int(job.progress_message_id) if job.progress_message_id else None,
+        'kind': job.kind or 'text',
+        'text': job.text,
+        'file_id': job.file_id,
+        'status': job.status or 'running',
+        'cursor_user_id': int(job.cursor_user_id or 0),
+        'total': int(job.total or 0),
+        'sent': int(job.sent or 0),
+        'failed': int(job.failed or 0),
+        'blocked': int(job.blocked or 0),
+        'created_at': int(job.created_at or 0),
+        'updated_at': int(job.updated_at or 0),
+        'finished_at': int(job.finished_at) if job.finished_at else None,
+    }
+
+
+def _broadcast_content_hash(kind: str, text_value: str | None, file_id: str | None) -> str:
+    raw = json.dumps([kind, text_value or '', file_id or ''], ensure_ascii=False)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def count_broadcast_recipients() -> int:
+    """Сколько игроков получит рассылку (все, кроме заблокировавших бота)."""
+    dbs = SessionLocal()
+    try:
+        return int(dbs.query(func.count(Player.user_id)).filter(func.coalesce(Player.bot_blocked_at, 0) == 0).scalar() or 0)
+    finally:
+        dbs.close()
+
+
+def create_broadcast_job(created_by: int, admin_chat_id: int, kind: str = 'text', text_value: str | None = None,
+                         file_id: str | None = None, dedupe_window_sec: int = BROADCAST_DEDUPE_WINDOW_SEC) -> tuple[dict, bool]:
+    """
+    Создаёт задание рассылки. Возвращает (задание, создано ли новое).
+
+    Если такая же рассылка (тип, текст, file_id) ещё идёт или была создана не раньше
+    dedupe_window_sec назад, новое задание не создаётся и возвращается существующее.
+    """
+    now_ts = int(time.time())
+    content_hash = _broadcast_content_hash(kind, text_value, file_id)
+    dbs = SessionLocal()
+    try:
+        _begin_write_transaction(dbs)
+        existing = (
+            dbs.query(BroadcastJob)
+            .filter(
+                BroadcastJob.content_hash == content_hash,
+                or_(BroadcastJob.status == 'running', BroadcastJob.created_at >= now_ts - int(dedupe_window_sec)),
+            )
+            .order_by(BroadcastJob.id.desc())
+            .first()
+        )
+        if existing is not None:
+            dbs.rollback()
+            return _broadcast_job_to_dict(existing), False
+        total = dbs.query(func.count(Player.user_id)).filter(func.coalesce(Player.bot_blocked_at, 0) == 0).scalar()
+        job = BroadcastJob(
+            created_by=int(created_by),
+            admin_chat_id=int(admin_chat_id),
+            kind=str(kind),
+            text=text_value,
+            file_id=file_id,
+            content_hash=content_hash,
+            status='running',
+            cursor_user_id=0,
+            total=int(total or 0),
+            created_at=now_ts,
+            updated_at=now_ts,
+        )
+        dbs.add(job)
+        dbs.commit()
+        return _broadcast_job_to_dict(job), True
+    except Exception:
+        dbs.rollback()
+        raise
+    finally:
+        dbs.close()
+
+
+def get_broadcast_job(job_id: int) -> dict | None:
+    dbs = SessionLocal()
+    try:
+        job = dbs.query(BroadcastJob).filter(BroadcastJob.id == int(job_id)).first()
+        return _broadcast_job_to_dict(job) if job else None
+    finally:
+        dbs.close()
+
+
+def get_running_broadcast_jobs() -> list[dict]:
+    """Незавершённые рассылки (для продолжения после рестарта), от старых к новым."""
+    dbs = SessionLocal()
+    try:
+        jobs = dbs.query(BroadcastJob).filter(BroadcastJob.status == 'running').order_by(BroadcastJob.id).all()
+        return [_broadcast_job_to_dict(job) for job in jobs]
+    finally:
+        dbs.close()
+
+
+def get_broadcast_recipients_page(after_user_id: int, limit: int) -> list[int]:
+    """Следующая страница получателей: user_id > after_user_id по возрастанию, без заблокировавших бота."""
+    dbs = SessionLocal()
+    try:
+        rows = (
+            dbs.query(Player.user_id)
+            .filter(Player.user_id > int(after_user_id), func.coalesce(Player.bot_blocked_at, 0) == 0)
+            .order_by(Player.user_id)
+            .limit(int(limit))
+            .all()
+        )
+        return [int(r.user_id) for r in rows]
+    finally:
+        dbs.close()
+
+
+class _UnreachableUsers:
+    """user_id игроков с bot_blocked_at > 0 в памяти процесса.
+
+    Проверка «не снял ли игрок блокировку» идёт на каждом личном апдейте,
+    поэтому она не должна ходить в БД: набор читается один раз, дальше его
+    обновляют пометка рассылкой и mark_user_reachable.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids: set[int] = set()
+        self._loaded = False
+
+    def load(self) -> int:
+        dbs = SessionLocal()
+        try:
+            ids = {int(uid) for (uid,) in dbs.query(Player.user_id).filter(Player.bot_blocked_at > 0)}
+        finally:
+            dbs.close()
+        with self._lock:
+            self._ids = ids
+            self._loaded = True
+        return len(ids)
+
+    def contains(self, user_id: int) -> bool:
+        if not self._loaded:
+            self.load()
+        with self._lock:
+            return int(user_id) in self._ids
+
+    def add_many(self, user_ids) -> None:
+        with self._lock:
+            self._ids.update(int(uid) for uid in user_ids)
+
+    def discard(self, user_id: int) -> None:
+        with self._lock:
+            self._ids.discard(int(user_id))
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._ids = set()
+            self._loaded = False
+
+
+_unreachable_users = _UnreachableUsers()
+
+
+def load_unreachable_users() -> int:
+    """Загружает в память игроков, заблокировавших бота (вызывается при старте бота)."""
+    return _unreachable_users.load()
+
+
+def invalidate_unreachable_users() -> None:
+    _unreachable_users.invalidate()
+
+
+def is_user_marked_unreachable(user_id: int) -> bool:
+    """True, если рассылка пометила игрока как заблокировавшего бота (проверка в памяти)."""
+    return _unreachable_users.contains(user_id)
+
+
+def mark_user_reachable(user_id: int) -> bool:
+    """Снимает пометку bot_blocked_at: игрок сам написал боту, рассылки снова его включают.
+
+    Вызывать только для апдейтов от самого игрока в личке с ботом — не для
+    чужих профилей и не для участников групп.
+    """
+    if not _unreachable_users.contains(user_id):
+        return False
+    dbs = SessionLocal()
+    try:
+        dbs.execute(text("UPDATE players SET bot_blocked_at = 0 WHERE user_id = :uid"), {"uid": int(user_id)})
+        dbs.commit()
+    except Exception:
+        dbs.rollback()
+        raise
+    finally:
+        dbs.close()
+    _unreachable_users.discard(user_id)
+    return True
+
+
+def _mark_users_bot_blocked(dbs, user_ids, ts: int) -> None:
+    dbs.execute(
+        text("UPDATE players SET bot_blocked_at = :ts WHERE user_id = :uid"),
+        [{"uid": int(uid), "ts": int(ts)} for uid in user_ids],
+    )
+    _unreachable_users.add_many(user_ids)
+
+
+def mark_users_bot_blocked(user_ids, ts: int | None = None) -> int:
+    """Помечает игроков, заблокировавших бота: рассылки их больше не трогают."""
+    user_ids = list(user_ids or ())
+    if not user_ids:
+        return 0
+    dbs = SessionLocal()
+    try:
+        _mark_users_bot_blocked(dbs, user_ids, int(ts or time.time()))
+        dbs.commit()
+        return len(user_ids)
+    except Exception:
+        dbs.rollback()
+        raise
+    finally:
+        dbs.close()
+
+
+def checkpoint_broadcast_job(job_id: int, cursor_user_id: int, sent: int = 0, failed: int = 0,
+                             blocked_user_ids=(), status: str | None = None) -> dict | None:
+    """
+    Фиксирует обработанную страницу рассылки одной транзакцией: сдвигает курсор,
+    прибавляет счётчики, помечает заблокировавших бота и, если передан status,
+    завершает задание. Отменённое задание остаётся отменённым.
+    """
+    now_ts = int(time.time())
+    blocked_user_ids = list(blocked_user_ids or ())
+    dbs = SessionLocal()
+    try:
+        _begin_write_transaction(dbs)
+        job = dbs.query(BroadcastJob).filter(BroadcastJob.id == int(job_id)).first()
+        if job is None:
+            dbs.rollback()
+            return None
+        if blocked_user_ids:
+            _mark_users_bot_blocked(dbs, blocked_user_ids, now_ts)
+        job.cursor_user_id = max(int(job.cursor_user_id or 0), int(cursor_user_id or 0))
+        job.sent = int(job.sent or 0) + int(sent)
+        job.failed = int(job.failed or 0) + int(failed)
+        job.blocked = int(job.blocked or 0) + len(blocked_user_ids)
+        job.updated_at = now_ts
+        if status and job.status == 'running':
+            job.status = status
+            job.finished_at = now_ts
+        dbs.commit()
+        return _broadcast_job_to_dict(job)
+    except Exception:
+        dbs.rollback()
+        raise
+    finally:
+        dbs.close()
+
+
+def set_broadcast_progress_message(job_id: int, message_id: int) -> None:
+    dbs = SessionLocal()
+    try:
+        dbs.query(BroadcastJob).filter(BroadcastJob.id == int(job_id)).update(
+            {BroadcastJob.progress_message_id: int(message_id)}
+        )
+        dbs.commit()
+    finally:
+        dbs.close()
+
+
+def cancel_broadcast_job(job_id: int) -> bool:
+    """Останавливает идущую рассылку; движок замечает это на следующей странице."""
+    now_ts = int(time.time())
+    dbs = SessionLocal()
+    try:
+        updated = (
+            dbs.query(BroadcastJob)
+            .filter(BroadcastJob.id == int(job_id), BroadcastJob.status == 'running')
+            .update({BroadcastJob.status: 'cancelled', BroadcastJob.finished_at: now_ts, BroadcastJob.updated_at: now_ts})
+        )
+        dbs.commit()
+        return bool(updated)
+    finally:
+        dbs.close()
+
+
 def wipe_all_except_drinks() -> bool:
     dbs = SessionLocal()
     try:
@@ -10786,8 +12914,10 @@ def wipe_all_except_drinks() -> bool:
         dbs.query(ModerationLog).delete()
         dbs.query(UserWarning).delete()
         dbs.query(UserBan).delete()
+        _action_log_buffer.clear()
         dbs.query(ActionLog).delete()
         dbs.query(PromoUsage).delete()
+        dbs.query(PromoUserUsage).delete()
         dbs.query(Promo).delete()
         dbs.query(BotSetting).delete()
         dbs.query(TgPremiumStock).delete()
@@ -10815,6 +12945,13 @@ def wipe_all_except_drinks() -> bool:
         dbs.query(AdminUser).delete()
         dbs.query(Player).delete()
         dbs.commit()
+        _drink_discovery_buffer.clear()
+        invalidate_drink_catalog()
+        invalidate_ban_index()
+        invalidate_unreachable_users()
+        invalidate_settings_cache()
+        invalidate_promo_index()
+        invalidate_group_settings()
         return True
     except Exception:
         try:
@@ -10933,27 +13070,160 @@ def get_stock_info() -> dict:
 
 # --- Функции для работы с логами ---
 
+class _ActionLogBuffer:
+    """Кольцевой буфер записей журнала действий с пакетной записью в action_logs.
+
+    log_action только добавляет запись в буфер — без сессии и коммита на пути
+    запроса. flush() забирает накопленное и пишет одним executemany. Если БД
+    недоступна (OperationalError: блокировка, диск), записи возвращаются в начало
+    буфера. Любая другая ошибка пачки — это плохая строка: тогда записи пишутся
+    по одной, а не записавшиеся сами по себе отбрасываются (dropped), чтобы одна
+    строка не останавливала весь журнал. Буфер ограничен maxsize записями: при
+    переполнении отбрасываются самые старые (счётчик dropped). Когда в буфере
+    набирается flush_size записей, вызывается триггер — фоновый писатель
+    сбрасывает буфер, не дожидаясь своего интервала.
+    """
+
+    def __init__(self, maxsize: int, flush_size: int):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._rows: deque[dict] = deque(maxlen=max(1, int(maxsize)))
+        self.flush_size = max(1, int(flush_size))
+        self._trigger = None
+        self.flushed = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+
+    def add(self, row: dict) -> None:
+        with self._lock:
+            if len(self._rows) == self._rows.maxlen:
+                self.dropped += 1
+            self._rows.append(row)
+            trigger = self._trigger if len(self._rows) == self.flush_size else None
+        if trigger is not None:
+            try:
+                trigger()
+            except Exception as e:
+                logger.debug(f"[ACTION_LOG] Flush trigger failed: {e}")
+
+    def set_trigger(self, callback) -> None:
+        with self._lock:
+            self._trigger = callback
+
+    def flush(self) -> int:
+        """Пишет накопленные записи одним executemany. Возвращает число записанных."""
+        with self._flush_lock:
+            with self._lock:
+                rows = list(self._rows)
+                self._rows.clear()
+            if not rows:
+                return 0
+            dbs = SessionLocal()
+            try:
+                dbs.execute(ActionLog.__table__.insert(), rows)
+                dbs.commit()
+                written = len(rows)
+            except Exception as e:
+                try:
+                    dbs.rollback()
+                except Exception:
+                    pass
+                if isinstance(e, OperationalError):
+                    self._requeue(rows)
+                    logger.warning(f"[ACTION_LOG] Failed to flush {len(rows)} action log rows, will retry: {e}")
+                    return 0
+                written = self._insert_each(dbs, rows)
+            finally:
+                dbs.close()
+            with self._lock:
+                self.flushed += written
+                self.flushes += 1
+            return written
+
+    def _insert_each(self, dbs, rows: list[dict]) -> int:
+        """Пишет пачку по одной записи после ошибки executemany. Возвращает число записанных."""
+        written = 0
+        for n, row in enumerate(rows):
+            try:
+                dbs.execute(ActionLog.__table__.insert(), [row])
+                dbs.commit()
+                written += 1
+            except OperationalError as e:
+                dbs.rollback()
+                self._requeue(rows[n:])
+                logger.warning(f"[ACTION_LOG] Failed to flush {len(rows) - n} action log rows, will retry: {e}")
+                break
+            except Exception as e:
+                dbs.rollback()
+                with self._lock:
+                    self.dropped += 1
+                logger.warning(f"[ACTION_LOG] Dropped unwritable action log row {row.get('action_type')!r}: {e}")
+        return written
+
+    def _requeue(self, rows: list[dict]) -> None:
+        with self._lock:
+            self.failed_flushes += 1
+            combined = rows + list(self._rows)
+            overflow = len(combined) - self._rows.maxlen
+            if overflow > 0:
+                self.dropped += overflow
+                combined = combined[overflow:]
+            self._rows = deque(combined, maxlen=self._rows.maxlen)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'pending': len(self._rows),
+                'flushed': self.flushed,
+                'dropped': self.dropped,
+                'flushes': self.flushes,
+                'failed_flushes': self.failed_flushes,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._rows.clear()
+
+
+_action_log_buffer = _ActionLogBuffer(ACTION_LOG_BUFFER_SIZE, ACTION_LOG_FLUSH_SIZE)
+
+
 def log_action(user_id: int, username: str | None, action_type: str, action_details: str | None = None, amount: int | None = None, success: bool = True):
-    """Записывает действие в лог."""
-    db = SessionLocal()
+    """Записывает действие в лог (через буфер: в action_logs попадёт при следующем flush_action_log).
+
+    Поля приводятся к типам колонок сразу: ошибка достаётся вызову, а не всей пачке в flush.
+    """
     try:
-        log_entry = ActionLog(
-            user_id=user_id,
-            username=username,
-            action_type=action_type,
-            action_details=action_details,
-            amount=amount,
-            success=success
-        )
-        db.add(log_entry)
-        db.commit()
-        return True
-    except Exception as e:
-        print(f"[DB] Error logging action: {e}")
-        db.rollback()
+        row = {
+            'timestamp': int(time.time()),
+            'user_id': int(user_id) if user_id is not None else None,
+            'username': str(username) if username is not None else None,
+            'action_type': str(action_type),
+            'action_details': str(action_details) if action_details is not None else None,
+            'amount': int(amount) if amount is not None else None,
+            'success': bool(success),
+        }
+    except (TypeError, ValueError) as e:
+        logger.warning(f"[ACTION_LOG] Invalid action log entry {action_type!r} for user {user_id!r}: {e}")
         return False
-    finally:
-        db.close()
+    _action_log_buffer.add(row)
+    return True
+
+
+def flush_action_log() -> int:
+    """Сбрасывает буфер журнала действий в action_logs. Вызывается фоновым писателем и при остановке бота."""
+    return _action_log_buffer.flush()
+
+
+def set_action_log_flush_trigger(callback) -> None:
+    """Назначает callback(), который вызывается, когда в буфере журнала набралось ACTION_LOG_FLUSH_SIZE записей."""
+    _action_log_buffer.set_trigger(callback)
+
+
+def get_action_log_stats() -> dict:
+    """Метрики буфера журнала: pending, flushed, dropped, flushes, failed_flushes."""
+    return _action_log_buffer.stats()
 
 
 def get_recent_logs(limit: int = 50):
@@ -11162,6 +13432,7 @@ def admin_add_drink(name: str, description: str, is_special: bool = False, image
         drink = EnergyDrink(name=name, description=description, is_special=is_special, image_path=image_path)
         db.add(drink)
         db.commit()
+        invalidate_drink_catalog()
         return True
     except Exception as e:
         print(f"[DB] Error adding drink: {e}")
@@ -11187,6 +13458,7 @@ def admin_update_drink(drink_id: int, name: str | None = None, description: str
             drink.is_special = is_special
         
         db.commit()
+        invalidate_drink_catalog()
         return True
     except Exception as e:
         print(f"[DB] Error updating drink: {e}")
@@ -11204,6 +13476,7 @@ def admin_update_drink_image(drink_id: int, image_path: str) -> bool:
             return False
         drink.image_path = image_path
         db.commit()
+        invalidate_drink_catalog()
         return True
     except Exception as e:
         print(f"[DB] Error updating drink image: {e}")
@@ -11227,6 +13500,7 @@ def admin_delete_drink(drink_id: int) -> bool:
         # Удаляем напиток
         db.delete(drink)
         db.commit()
+        invalidate_drink_catalog()
         return True
     except Exception as e:
         print(f"[DB] Error deleting drink: {e}")
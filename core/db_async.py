@@ -0,0 +1,163 @@
+# file: db_async.py
+"""
+Асинхронный шлюз к core.database.
+
+Функции core.database синхронные и работают с SQLite напрямую, поэтому вызов
+из async-хендлера блокирует весь event loop до конца запроса. Шлюз выполняет
+их в выделенном ограниченном пуле потоков, а хендлер только ждёт результат.
+
+Путь миграции хендлеров:
+    import core.db_async as adb
+
+    player = await adb.get_or_create_player(user.id, username)  # горячие функции
+    result = await adb.sell_all_inventory(user.id)             # любая функция core.database
+    value = await adb.call(some_sync_helper, arg)              # произвольный синхронный код с БД
+
+Функция ищется в core.database в момент вызова, поэтому подмены (тесты,
+кэши поверх БД) подхватываются автоматически.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import functools
+import logging
+import threading
+import types
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+import core.database as db
+from core.constants import DB_EXECUTOR_WORKERS
+
+logger = logging.getLogger(__name__)
+
+_executor: ThreadPoolExecutor | None = None
+_write_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+# Тяжёлые записи идут в отдельную очередь из одного потока: SQLite всё равно
+# допускает одного писателя, а так они не занимают потоки быстрых чтений
+# и не крутятся в busy-ожидании блокировки друг против друга.
+WRITE_FUNCTIONS = frozenset({
+    'apply_energy_search_outcome_atomic',
+    'apply_auto_search_batch',
+    'set_auto_search_due_many',
+    'set_plantation_reminders_many',
+    'create_broadcast_job',
+    'checkpoint_broadcast_job',
+    'mark_user_reachable',
+    'sync_leaderboards',
+    'sell_inventory_item',
+    'sell_all_but_one',
+    'sell_absolutely_all_but_one',
+    'sell_all_drinks_of_rarity',
+    'sell_all_inventory',
+    'sell_receiver_player_item',
+    'flush_drink_discovery_buffer',
+    'flush_action_log',
+    'transfer_gift_bundle_atomic',
+    'redeem_promo',
+    'save_scheduled_auto_delete',
+    'delete_scheduled_auto_deletes',
+})
+
+# Функции, которые вызываются на каждом апдейте или в каждом поиске.
+# Для них создаются явные обёртки, остальные доступны через __getattr__.
+HOT_FUNCTIONS = (
+    'get_or_create_player',
+    'get_player',
+    'get_active_ban',
+    'get_access_profile',
+    'get_setting_int',
+    'get_setting_float',
+    'get_setting_bool',
+    'get_setting_str',
+    'count_search_drinks',
+    'flush_drink_discovery_buffer',
+    'get_player_favorite_drink_ids',
+    'apply_energy_search_outcome_atomic',
+    'get_auto_search_daily_limit',
+    'update_player',
+    'get_player_inventory_with_details',
+    'sell_inventory_item',
+    'sell_all_but_one',
+    'sell_absolutely_all_but_one',
+    'sell_all_drinks_of_rarity',
+    'sell_all_inventory',
+    'sell_receiver_player_item',
+    'log_action',
+)
+
+
+def get_executor(write: bool = False) -> ThreadPoolExecutor:
+    """Возвращает (лениво создаёт) пул потоков для чтений или очередь записей."""
+    global _executor, _write_executor
+    with _executor_lock:
+        if write:
+            if _write_executor is None:
+                _write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='reload-db-write')
+            return _write_executor
+        if _executor is None:
+            workers = max(1, int(DB_EXECUTOR_WORKERS))
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='reload-db')
+            logger.info("[DB] Async gateway executor started (workers=%s)", workers)
+        return _executor
+
+
+def shutdown(wait: bool = True) -> None:
+    """Останавливает пулы потоков. Следующий вызов создаст новые."""
+    global _executor, _write_executor
+    with _executor_lock:
+        executors = (_executor, _write_executor)
+        _executor = None
+        _write_executor = None
+    for executor in executors:
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+async def call(func: Callable[..., Any], /, *args, **kwargs) -> Any:
+    """Выполняет синхронную функцию в пуле БД и возвращает её результат.
+
+    contextvars копируются в поток так же, как это делает asyncio.to_thread.
+    """
+    return await _submit(get_executor(), func, args, kwargs)
+
+
+async def call_write(func: Callable[..., Any], /, *args, **kwargs) -> Any:
+    """То же, что call(), но через однопоточную очередь записей."""
+    return await _submit(get_executor(write=True), func, args, kwargs)
+
+
+async def _submit(executor: ThreadPoolExecutor, func: Callable[..., Any], args: tuple, kwargs: dict) -> Any:
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    bound = functools.partial(ctx.run, func, *args, **kwargs)
+    return await loop.run_in_executor(executor, bound)
+
+
+def _make_proxy(name: str) -> Callable[..., Any]:
+    runner = call_write if name in WRITE_FUNCTIONS else call
+
+    async def _proxy(*args, **kwargs):
+        return await runner(getattr(db, name), *args, **kwargs)
+
+    _proxy.__name__ = name
+    _proxy.__qualname__ = name
+    _proxy.__doc__ = f"Awaitable-версия core.database.{name}."
+    return _proxy
+
+
+for _name in HOT_FUNCTIONS:
+    globals()[_name] = _make_proxy(_name)
+del _name
+
+
+def __getattr__(name: str) -> Callable[..., Any]:
+    if not name.startswith('_') and isinstance(getattr(db, name, None), types.FunctionType):
+        proxy = _make_proxy(name)
+        globals()[name] = proxy
+        return proxy
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
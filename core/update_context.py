@@ -0,0 +1,200 @@
+# file: update_context.py
+"""
+Контекст одного апдейта Telegram: игрок, профиль доступа и уровень админа
+загружаются один раз и переиспользуются всеми хелперами обработки апдейта.
+
+Контекст создаётся в begin_update() (TypeHandler с самой ранней группой),
+хранится в context.update_ctx и в contextvar, поэтому виден и из синхронных
+хелперов, и из потоков core.db_async. Любая пишущая SQL-команда во время
+апдейта сбрасывает закэшированные объекты, так что после записи хелперы
+снова читают свежие данные из БД.
+
+Заодно контекст считает SQL-запросы, выполненные при обработке апдейта.
+
+Использование:
+    import core.update_context as uctx
+
+    player = uctx.get_or_create_player(user.id, user.username)
+    access = uctx.get_access_profile(user.id, username=user.username, player=player)
+"""
+
+from __future__ import annotations
+
+import contextvars
+import logging
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import core.database as db
+from core.constants import ADMIN_USERNAMES
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_ATTR = 'update_ctx'
+
+_READ_PREFIXES = ('SELECT', 'PRAGMA', 'WITH', 'EXPLAIN')
+
+_current: contextvars.ContextVar['UpdateContext | None'] = contextvars.ContextVar('reload_update_ctx', default=None)
+
+_stats_lock = threading.Lock()
+_stats = {'updates': 0, 'queries': 0, 'writes': 0, 'max_queries': 0}
+
+
+class UpdateContext:
+    """Кэш данных игрока и счётчик запросов в пределах одного апдейта."""
+
+    __slots__ = ('user_id', 'queries', 'writes', 'started_at', 'closed',
+                 '_players', '_access', '_admin_levels')
+
+    def __init__(self, user_id: int | None = None):
+        self.user_id = user_id
+        self.queries = 0
+        self.writes = 0
+        self.started_at = time.monotonic()
+        self.closed = False
+        self._players: dict[int, object] = {}
+        self._access: dict[int, dict] = {}
+        self._admin_levels: dict[int, int] = {}
+
+    def note_statement(self, statement: str) -> None:
+        self.queries += 1
+        head = statement.lstrip()[:7].upper()
+        if not head.startswith(_READ_PREFIXES):
+            self.writes += 1
+            self.reset_cache()
+
+    def reset_cache(self) -> None:
+        self._players.clear()
+        self._access.clear()
+        self._admin_levels.clear()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    ctx = _current.get()
+    if ctx is not None and not ctx.closed:
+        ctx.note_statement(statement)
+
+
+def begin_update(update, context=None) -> UpdateContext:
+    """Создаёт контекст для нового апдейта и делает его текущим."""
+    user = getattr(update, 'effective_user', None)
+    ctx = UpdateContext(int(user.id) if user is not None else None)
+    _current.set(ctx)
+    if context is not None:
+        try:
+            setattr(context, CONTEXT_ATTR, ctx)
+        except Exception:
+            pass
+    return ctx
+
+
+def finish_update(ctx: UpdateContext | None = None) -> UpdateContext | None:
+    """Закрывает контекст апдейта и добавляет его счётчики в общую статистику."""
+    if ctx is None:
+        ctx = _current.get()
+    if ctx is None or ctx.closed:
+        return ctx
+    ctx.closed = True
+    ctx.reset_cache()
+    with _stats_lock:
+        _stats['updates'] += 1
+        _stats['queries'] += ctx.queries
+        _stats['writes'] += ctx.writes
+        _stats['max_queries'] = max(_stats['max_queries'], ctx.queries)
+    logger.debug("[UPDATE_CTX] user=%s queries=%s writes=%s elapsed=%.1fms",
+                 ctx.user_id, ctx.queries, ctx.writes, (time.monotonic() - ctx.started_at) * 1000.0)
+    return ctx
+
+
+def current(context=None) -> UpdateContext | None:
+    """Текущий открытый контекст апдейта (из context или contextvar)."""
+    ctx = getattr(context, CONTEXT_ATTR, None) if context is not None else None
+    if ctx is None:
+        ctx = _current.get()
+    if ctx is None or ctx.closed:
+        return None
+    return ctx
+
+
+def get_query_stats() -> dict:
+    """Сводка по закрытым апдейтам: число апдейтов, запросов, записей, среднее и максимум."""
+    with _stats_lock:
+        out = dict(_stats)
+    out['avg_queries'] = (out['queries'] / out['updates']) if out['updates'] else 0.0
+    return out
+
+
+def reset_query_stats() -> None:
+    with _stats_lock:
+        for key in _stats:
+            _stats[key] = 0
+
+
+def get_or_create_player(user_id, username=None, display_name=None):
+    """db.get_or_create_player с повторным использованием игрока в пределах апдейта."""
+    ctx = current()
+    if ctx is None:
+        return db.get_or_create_player(user_id, username, display_name)
+    uid = int(user_id)
+    player = ctx._players.get(uid)
+    if player is not None and db.player_names_up_to_date(player, username, display_name):
+        return player
+    player = db.get_or_create_player(user_id, username, display_name)
+    if player is not None and not ctx.closed:
+        ctx._players[uid] = player
+    return player
+
+
+def get_effective_admin_level(user_id: int, username: str | None = None, player=None) -> int:
+    ctx = current()
+    if ctx is None:
+        return db.get_effective_admin_level(user_id, username=username, player=player)
+    try:
+        effective_username = username or getattr(player, 'username', None)
+    except Exception:
+        effective_username = username
+    if effective_username and str(effective_username) in ADMIN_USERNAMES:
+        return 99
+    uid = int(user_id)
+    level = ctx._admin_levels.get(uid)
+    if level is None:
+        level = db.get_admin_level(uid)
+        if not ctx.closed:
+            ctx._admin_levels[uid] = level
+    return level
+
+
+def get_access_profile(user_id: int, username: str | None = None, player=None) -> dict:
+    """db.get_access_profile с кэшем профиля и уровня админа на время апдейта."""
+    ctx = current()
+    if ctx is None:
+        return db.get_access_profile(user_id, username=username, player=player)
+    uid = int(user_id)
+    profile = ctx._access.get(uid)
+    if profile is not None:
+        return profile
+    if player is None:
+        player = ctx._players.get(uid)
+    if player is None:
+        player = db.get_player(uid)
+        if player is not None and not ctx.closed:
+            ctx._players[uid] = player
+    admin_level = get_effective_admin_level(uid, username=username, player=player)
+    profile = db.get_access_profile(uid, username=username, player=player, admin_level=admin_level)
+    # Профиль без игрока в БД не кэшируем: игрок может быть создан дальше в апдейте
+    if player is not None and not ctx.closed:
+        ctx._access[uid] = profile
+    return profile
+
+
+def is_vip(user_id: int) -> bool:
+    """True, если у игрока активен VIP или VIP+ (без учёта админских прав)."""
+    return bool(get_access_profile(user_id).get('vip_active_timed'))
+
+
+def is_vip_plus(user_id: int) -> bool:
+    return bool(get_access_profile(user_id).get('vip_plus_active_timed'))
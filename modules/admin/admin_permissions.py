@@ -2,12 +2,12 @@
 
 from __future__ import annotations
 
-import core.database as db
+import core.update_context as uctx
 
 
 def get_effective_admin_level(user_id: int, username: str | None) -> int:
     """Return effective level: Creator=99, admin=1..3, regular user=0."""
-    return db.get_effective_admin_level(user_id, username=username)
+    return uctx.get_effective_admin_level(user_id, username=username)
 
 
 def has_admin_level(user_id: int, username: str | None, min_level: int) -> bool:
@@ -70,6 +70,7 @@ ADMIN_CALLBACK_PREFIX_LEVELS: list[tuple[str, int]] = [
     ("admin_settings_", 3),
     ("admin_econ_", 3),
     ("admin_event_", 3),
+    ("admin_broadcast_", 3),
     ("swaga_admin_", 2),
     ("promo_wiz_", 3),
     ("promo_deact:", 3),
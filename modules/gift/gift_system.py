@@ -10,6 +10,7 @@ from telegram.error import BadRequest, Forbidden
 from telegram.ext import CallbackQueryHandler, CommandHandler, ContextTypes
 
 import core.database as db
+import core.db_async as adb
 
 
 class GiftFeature:
@@ -779,20 +780,22 @@ class GiftFeature:
                     )
                     return
 
-            # CRIT-1: Атомарная передача — списание и начисление в одной DB-транзакции
+            # CRIT-1: Атомарная передача — списание, начисление и история в одной DB-транзакции
+            # (BEGIN IMMEDIATE в очереди записей, event loop не ждёт блокировку SQLite)
             giver_lock = self.get_lock(f"gift-transfer:{offer['giver_id']}")
             async with giver_lock:
-                result = db.transfer_gift_bundle_atomic(
+                result = await adb.call_write(
+                    db.transfer_gift_bundle_atomic,
                     giver_id=offer["giver_id"],
                     recipient_id=recipient_id,
                     items=offer["items"],
+                    log_status="accepted",
                 )
                 if not result["ok"]:
                     await query.edit_message_text("Не удалось передать подарок: часть напитков уже исчезла из инвентаря.")
                     self.gift_offers.pop(gift_id, None)
                     return
 
-            db.log_gift_bundle(offer["giver_id"], recipient_id, offer["items"], "accepted")
             self.logger.info(
                 "[GIFT] %s -> %s: %s",
                 offer["giver_name"],
@@ -2,6 +2,8 @@ import sys
 
 from telegram.ext import CallbackQueryHandler, ConversationHandler, MessageHandler, filters
 
+from core.constants import PLANTATION_REMINDER_TICK_SEC
+
 
 def _bot():
     main_mod = sys.modules.get("__main__")
@@ -13,41 +15,44 @@ def _bot():
     return Bot_new
 
 
+CALLBACK_EXACT = frozenset({
+    "settings_plantation_reminder",
+    "market_plantation",
+    "plantation_my_beds",
+    "plantation_shop",
+    "plantation_fertilizers_shop",
+    "plantation_fertilizers_inv",
+    "plantation_harvest",
+    "plantation_harvest_all",
+    "plantation_water",
+    "plantation_stats",
+    "plantation_bed_prices",
+    "plantation_buy_bed",
+    "plantation_join_project",
+    "plantation_my_contribution",
+    "plantation_water_all",
+    "plantation_leaderboard",
+})
+
+CALLBACK_PREFIXES = (
+    "snooze_remind_",
+    "plantation_buy_",
+    "fert_filter_",
+    "fert_buy_",
+    "fert_apply_pick_",
+    "fert_apply_mode_",
+    "fert_apply_do_",
+    "fert_apply_max_",
+    "fert_pick_for_bed_",
+    "plantation_choose_",
+    "plantation_plant_",
+    "plantation_water_",
+    "plantation_harvest_bed_",
+)
+
+
 def can_handle_callback(data: str) -> bool:
-    exact = {
-        "settings_plantation_reminder",
-        "market_plantation",
-        "plantation_my_beds",
-        "plantation_shop",
-        "plantation_fertilizers_shop",
-        "plantation_fertilizers_inv",
-        "plantation_harvest",
-        "plantation_harvest_all",
-        "plantation_water",
-        "plantation_stats",
-        "plantation_bed_prices",
-        "plantation_buy_bed",
-        "plantation_join_project",
-        "plantation_my_contribution",
-        "plantation_water_all",
-        "plantation_leaderboard",
-    }
-    prefixes = (
-        "snooze_remind_",
-        "plantation_buy_",
-        "fert_filter_",
-        "fert_buy_",
-        "fert_apply_pick_",
-        "fert_apply_mode_",
-        "fert_apply_do_",
-        "fert_apply_max_",
-        "fert_pick_for_bed_",
-        "plantation_choose_",
-        "plantation_plant_",
-        "plantation_water_",
-        "plantation_harvest_bed_",
-    )
-    return data in exact or data.startswith(prefixes)
+    return data in CALLBACK_EXACT or data.startswith(CALLBACK_PREFIXES)
 
 
 async def handle_callback(update, context, data: str):
@@ -163,8 +168,5 @@ def schedule_jobs(application):
     application.job_queue.run_repeating(bot.global_farmer_fertilize_job, interval=5 * 60, first=75)
     application.job_queue.run_repeating(bot.global_negative_effects_job, interval=60, first=90)
     application.job_queue.run_repeating(bot.farmer_summary_job, interval=5 * 60, first=90)
-
-    async def restore_plantation_reminders_on_startup(context):
-        await bot.restore_plantation_reminders(context.application)
-
-    application.job_queue.run_once(restore_plantation_reminders_on_startup, when=5)
+    # Первый тик восстанавливает сроки напоминаний о поливе из БД
+    application.job_queue.run_repeating(bot.plantation_reminder_tick_job, interval=PLANTATION_REMINDER_TICK_SEC, first=5)
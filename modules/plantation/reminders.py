@@ -0,0 +1,192 @@
+# file: reminders.py
+"""
+Сервис напоминаний о поливе грядок.
+
+Вместо JobQueue-задачи на каждую растущую грядку (и поиска её по имени через
+get_jobs_by_name перед каждым переносом) держим одну кучу (min-heap) сроков
+с ключом (user_id, bed_index) и индексом ключ -> срок. Перенос — запись в индекс
+и push в кучу, отмена — удаление из индекса за O(1): устаревшие записи кучи
+отбрасываются лениво при извлечении. Один повторяющийся тик забирает пачку
+созревших напоминаний и передаёт её исполнителю.
+
+Сроки хранятся в plantation_beds.water_remind_at. Изменения копятся в памяти
+и сохраняются одним executemany в конце тика, а восстановление после рестарта —
+один запрос get_plantation_reminders_due() и heapify, без перебора задач.
+
+Использование:
+    from modules.plantation.reminders import plantation_reminders
+
+    plantation_reminders.schedule_in(user_id, bed_index, delay)   # (пере)запланировать
+    plantation_reminders.cancel(user_id, bed_index)               # снять с расписания
+    plantation_reminders.cancel_user(user_id)                     # все грядки игрока
+    await plantation_reminders.tick(run_batch)                    # из повторяющейся задачи
+"""
+
+from __future__ import annotations
+
+import heapq
+import logging
+import threading
+import time
+from typing import Awaitable, Callable
+
+import core.database as db
+import core.db_async as adb
+from core.constants import PLANTATION_REMINDER_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+BedKey = tuple[int, int]
+BatchRunner = Callable[[list[BedKey]], Awaitable[object]]
+
+
+class PlantationReminders:
+    """Куча (срок, user_id, bed_index) с ленивым удалением и отложенной записью сроков в БД."""
+
+    def __init__(self, *, batch_size: int = PLANTATION_REMINDER_BATCH_SIZE):
+        self.batch_size = max(1, int(batch_size))
+        self._heap: list[tuple[float, int, int]] = []
+        self._due: dict[BedKey, float] = {}
+        self._beds_by_user: dict[int, set[int]] = {}
+        self._dirty: dict[BedKey, int | None] = {}
+        self._restored = False
+        self._ticking = False
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def __contains__(self, key: BedKey) -> bool:
+        return (int(key[0]), int(key[1])) in self._due
+
+    def due_at(self, user_id: int, bed_index: int) -> float | None:
+        return self._due.get((int(user_id), int(bed_index)))
+
+    def _put(self, key: BedKey, due_ts: float) -> None:
+        self._due[key] = due_ts
+        self._beds_by_user.setdefault(key[0], set()).add(key[1])
+        heapq.heappush(self._heap, (due_ts, key[0], key[1]))
+
+    def _drop(self, key: BedKey) -> None:
+        self._due.pop(key, None)
+        beds = self._beds_by_user.get(key[0])
+        if beds is not None:
+            beds.discard(key[1])
+            if not beds:
+                del self._beds_by_user[key[0]]
+
+    def schedule(self, user_id: int, bed_index: int, due_ts: float) -> None:
+        """Назначает (или переносит) напоминание для грядки на due_ts."""
+        key = (int(user_id), int(bed_index))
+        due_ts = float(due_ts)
+        with self._lock:
+            self._put(key, due_ts)
+            self._dirty[key] = int(due_ts)
+
+    def schedule_in(self, user_id: int, bed_index: int, delay: float, now: float | None = None) -> None:
+        now = time.time() if now is None else now
+        self.schedule(user_id, bed_index, now + max(1.0, float(delay)))
+
+    def cancel(self, user_id: int, bed_index: int) -> None:
+        """Снимает напоминание грядки; запись в куче удалится лениво."""
+        key = (int(user_id), int(bed_index))
+        with self._lock:
+            self._drop(key)
+            self._dirty[key] = None
+
+    def cancel_user(self, user_id: int) -> int:
+        """Снимает напоминания всех грядок игрока. Возвращает их число."""
+        uid = int(user_id)
+        with self._lock:
+            beds = self._beds_by_user.pop(uid, set())
+            for bed in beds:
+                self._due.pop((uid, bed), None)
+                self._dirty[(uid, bed)] = None
+        return len(beds)
+
+    def pop_due(self, now: float | None = None, limit: int | None = None) -> list[BedKey]:
+        """Забирает до limit грядок со сроком <= now в порядке сроков."""
+        now = time.time() if now is None else now
+        limit = self.batch_size if limit is None else int(limit)
+        batch: list[BedKey] = []
+        with self._lock:
+            heap = self._heap
+            while heap and len(batch) < limit and heap[0][0] <= now:
+                due_ts, uid, bed = heapq.heappop(heap)
+                key = (uid, bed)
+                if self._due.get(key) != due_ts:
+                    continue  # устаревшая запись после переноса или отмены
+                self._drop(key)
+                batch.append(key)
+            # Куча без живых записей не должна расти от ленивого удаления
+            if len(heap) > 2 * len(self._due) + 64:
+                self._heap = [(ts, uid, bed) for (uid, bed), ts in self._due.items()]
+                heapq.heapify(self._heap)
+        return batch
+
+    def restore(self, user_id: int | None = None) -> int:
+        """Загружает сохранённые сроки из БД одним запросом (все грядки или грядки одного игрока).
+
+        Уже запланированные в памяти грядки не перезаписываются.
+        """
+        rows = db.get_plantation_reminders_due(user_id)
+        added = 0
+        with self._lock:
+            for uid, bed, due_ts in rows:
+                key = (uid, bed)
+                if key in self._due:
+                    continue
+                self._due[key] = float(due_ts)
+                self._beds_by_user.setdefault(uid, set()).add(bed)
+                self._heap.append((float(due_ts), uid, bed))
+                added += 1
+            heapq.heapify(self._heap)
+            if user_id is None:
+                self._restored = True
+        return added
+
+    def flush(self) -> int:
+        """Сохраняет накопленные сроки в БД одной пачкой."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        if not dirty:
+            return 0
+        try:
+            return db.set_plantation_reminders_many(dirty)
+        except Exception:
+            with self._lock:
+                for key, ts in dirty.items():
+                    self._dirty.setdefault(key, ts)
+            raise
+
+    async def tick(self, runner: BatchRunner, now: float | None = None) -> int:
+        """Один проход: восстановление при первом запуске, пачка созревших напоминаний, запись сроков."""
+        if self._ticking:
+            return 0
+        self._ticking = True
+        try:
+            if not self._restored:
+                restored = await adb.call(self.restore)
+                logger.info("[PLANTATION] Restored %s watering reminders", restored)
+            batch = self.pop_due(now)
+            if batch:
+                await runner(batch)
+            return len(batch)
+        finally:
+            self._ticking = False
+            try:
+                await adb.call_write(self.flush)
+            except Exception:
+                logger.exception("[PLANTATION] Не удалось сохранить сроки напоминаний о поливе")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._heap.clear()
+            self._due.clear()
+            self._beds_by_user.clear()
+            self._dirty.clear()
+            self._restored = False
+            self._ticking = False
+
+
+plantation_reminders = PlantationReminders()
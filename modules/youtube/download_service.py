@@ -0,0 +1,387 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import re
+import shutil
+import time
+import uuid
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Callable, Optional
+from urllib.parse import parse_qs, urlparse
+
+from modules.youtube.youtube_downloader import (
+    DownloadedAudio,
+    UnsupportedYoutubeUrlError,
+    YoutubeAudioDownloadError,
+    YoutubeDownloaderError,
+    download_youtube_audio,
+    is_supported_youtube_url,
+)
+
+
+_VIDEO_ID_RE = re.compile(r"^[A-Za-z0-9_-]{11}$")
+_VIDEO_ID_PATH_PREFIXES = {"shorts", "embed", "live", "v"}
+
+Extractor = Callable[[str, Path], DownloadedAudio]
+
+
+class YoutubeDownloadBusyError(YoutubeDownloaderError):
+    """Raised when the download queue is full and a new video cannot be scheduled."""
+
+
+def extract_video_id(url: str) -> Optional[str]:
+    """Return the 11-char YouTube video id of ``url`` or None if it has none."""
+    try:
+        parsed = urlparse((url or "").strip())
+    except Exception:
+        return None
+    host = (parsed.netloc or "").lower()
+    parts = [part for part in (parsed.path or "").split("/") if part]
+    candidate = None
+    if host == "youtu.be":
+        candidate = parts[0] if parts else None
+    else:
+        values = parse_qs(parsed.query).get("v")
+        if values:
+            candidate = values[0]
+        elif len(parts) >= 2 and parts[0] in _VIDEO_ID_PATH_PREFIXES:
+            candidate = parts[1]
+    if candidate and _VIDEO_ID_RE.match(candidate):
+        return candidate
+    return None
+
+
+def cache_key_for_url(url: str) -> str:
+    """Cache key of ``url``: its video id, so all link forms of a video share one entry."""
+    video_id = extract_video_id(url)
+    if video_id:
+        return video_id
+    return "url-" + hashlib.sha1((url or "").strip().encode("utf-8")).hexdigest()[:20]
+
+
+@dataclass
+class CachedAudio:
+    """Cache entry. Media paths are None once evicted; Telegram file ids outlive the media."""
+
+    key: str
+    title: str
+    uploader: str
+    duration: Optional[int]
+    source_url: str
+    audio_path: Optional[Path] = None
+    thumbnail_path: Optional[Path] = None
+    audio_file_id: Optional[str] = None
+    photo_file_id: Optional[str] = None
+    size: int = 0
+    last_used: float = 0.0
+
+    @property
+    def has_media(self) -> bool:
+        return self.audio_path is not None and self.audio_path.exists()
+
+    @property
+    def is_usable(self) -> bool:
+        return bool(self.audio_file_id) or self.has_media
+
+
+class AudioCache:
+    """On-disk cache ``<root>/<video id>/`` with LRU eviction of media by total size.
+
+    Evicting an entry deletes its files but keeps ``meta.json`` while it still holds
+    Telegram file ids: resending by file id needs no local copy. Metadata-only entries
+    are capped by ``max_entries``. Not thread-safe; owned by the event loop thread.
+    """
+
+    META_NAME = "meta.json"
+    STAGING_NAME = ".staging"
+
+    def __init__(self, root: Path | str, max_bytes: int, max_entries: int = 10000):
+        self.root = Path(root)
+        self.max_bytes = max(0, int(max_bytes))
+        self.max_entries = max(1, int(max_entries))
+        self.total_bytes = 0
+        self._entries: dict[str, CachedAudio] = {}
+        self._pins: dict[str, int] = {}
+        self._load()
+
+    def _load(self) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        shutil.rmtree(self.root / self.STAGING_NAME, ignore_errors=True)
+        for entry_dir in self.root.iterdir():
+            if not entry_dir.is_dir() or entry_dir.name == self.STAGING_NAME:
+                continue
+            try:
+                meta = json.loads((entry_dir / self.META_NAME).read_text(encoding="utf-8"))
+                entry = CachedAudio(
+                    key=entry_dir.name,
+                    title=str(meta.get("title") or ""),
+                    uploader=str(meta.get("uploader") or ""),
+                    duration=meta.get("duration"),
+                    source_url=str(meta.get("source_url") or ""),
+                    audio_file_id=meta.get("audio_file_id"),
+                    photo_file_id=meta.get("photo_file_id"),
+                    last_used=float(meta.get("last_used") or 0.0),
+                )
+                for attr, name in (("audio_path", meta.get("audio_name")), ("thumbnail_path", meta.get("thumbnail_name"))):
+                    path = entry_dir / name if name else None
+                    if path is not None and path.exists():
+                        setattr(entry, attr, path)
+                        entry.size += path.stat().st_size
+            except Exception:
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                continue
+            if not entry.is_usable:
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                continue
+            self._entries[entry.key] = entry
+            self.total_bytes += entry.size
+        self.evict()
+
+    def _write_meta(self, entry: CachedAudio) -> None:
+        meta = {
+            "title": entry.title,
+            "uploader": entry.uploader,
+            "duration": entry.duration,
+            "source_url": entry.source_url,
+            "audio_file_id": entry.audio_file_id,
+            "photo_file_id": entry.photo_file_id,
+            "audio_name": entry.audio_path.name if entry.audio_path else None,
+            "thumbnail_name": entry.thumbnail_path.name if entry.thumbnail_path else None,
+            "last_used": entry.last_used,
+        }
+        path = self.root / entry.key / self.META_NAME
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(path)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def peek(self, key: str) -> Optional[CachedAudio]:
+        """Entry without touching its LRU position."""
+        entry = self._entries.get(key)
+        return entry if entry is not None and entry.is_usable else None
+
+    def get(self, key: str) -> Optional[CachedAudio]:
+        entry = self.peek(key)
+        if entry is not None:
+            entry.last_used = time.time()
+            self._write_meta(entry)
+        return entry
+
+    def staging_dir(self) -> Path:
+        """Fresh working dir on the cache filesystem, so ``store`` is a rename, not a copy."""
+        path = self.root / self.STAGING_NAME / uuid.uuid4().hex
+        path.mkdir(parents=True)
+        return path
+
+    def store(self, key: str, downloaded: DownloadedAudio) -> CachedAudio:
+        """Move a finished download into the cache and evict older media over budget."""
+        self._drop(key)
+        entry_dir = self.root / key
+        entry_dir.mkdir(parents=True)
+        audio_path = entry_dir / ("audio" + downloaded.audio_path.suffix.lower())
+        shutil.move(str(downloaded.audio_path), audio_path)
+        thumbnail_path = None
+        if downloaded.thumbnail_path and Path(downloaded.thumbnail_path).exists():
+            thumbnail_path = entry_dir / ("cover" + Path(downloaded.thumbnail_path).suffix.lower())
+            shutil.move(str(downloaded.thumbnail_path), thumbnail_path)
+        entry = CachedAudio(
+            key=key,
+            title=downloaded.title,
+            uploader=downloaded.uploader,
+            duration=downloaded.duration,
+            source_url=downloaded.source_url,
+            audio_path=audio_path,
+            thumbnail_path=thumbnail_path,
+            last_used=time.time(),
+        )
+        entry.size = audio_path.stat().st_size + (thumbnail_path.stat().st_size if thumbnail_path else 0)
+        self._write_meta(entry)
+        self._entries[key] = entry
+        self.total_bytes += entry.size
+        self.evict(keep=key)
+        return entry
+
+    def remember_file_ids(self, key: str, *, audio_file_id: Optional[str] = None,
+                          photo_file_id: Optional[str] = None) -> None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        if audio_file_id:
+            entry.audio_file_id = audio_file_id
+        if photo_file_id:
+            entry.photo_file_id = photo_file_id
+        self._write_meta(entry)
+
+    def forget_file_ids(self, key: str) -> None:
+        """Drop file ids Telegram no longer accepts; a media-less entry is removed entirely."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        entry.audio_file_id = None
+        entry.photo_file_id = None
+        if entry.has_media:
+            self._write_meta(entry)
+        else:
+            self._drop(key)
+
+    def pin(self, key: str) -> None:
+        self._pins[key] = self._pins.get(key, 0) + 1
+
+    def unpin(self, key: str) -> None:
+        left = self._pins.get(key, 0) - 1
+        if left > 0:
+            self._pins[key] = left
+        else:
+            self._pins.pop(key, None)
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry.size
+        shutil.rmtree(self.root / key, ignore_errors=True)
+
+    def _drop_media(self, entry: CachedAudio) -> None:
+        for path in (entry.audio_path, entry.thumbnail_path):
+            if path is not None:
+                path.unlink(missing_ok=True)
+        self.total_bytes -= entry.size
+        entry.size = 0
+        entry.audio_path = None
+        entry.thumbnail_path = None
+        self._write_meta(entry)
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        """Free least recently used media until under ``max_bytes``; pinned entries are skipped."""
+        if self.total_bytes > self.max_bytes:
+            candidates = sorted(
+                (e for e in self._entries.values() if e.size and e.key != keep and e.key not in self._pins),
+                key=lambda e: e.last_used,
+            )
+            for entry in candidates:
+                if self.total_bytes <= self.max_bytes:
+                    break
+                if entry.audio_file_id:
+                    self._drop_media(entry)
+                else:
+                    self._drop(entry.key)
+        if len(self._entries) > self.max_entries:
+            stale = sorted(
+                (e for e in self._entries.values() if not e.size and e.key not in self._pins),
+                key=lambda e: e.last_used,
+            )
+            for entry in stale[:len(self._entries) - self.max_entries]:
+                self._drop(entry.key)
+
+
+class YoutubeDownloadService:
+    """Deduplicated, cached YouTube audio downloads on a bounded worker pool.
+
+    ``extractor(url, working_dir)`` runs in ``executor``; by default a lazily created
+    spawn-based process pool of ``max_workers``, so yt-dlp and ffmpeg never compete with
+    the bot's event loop for the GIL. Concurrent requests for one video share a single
+    download, and at most ``max_pending`` distinct videos are queued at once.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path | str,
+        *,
+        max_workers: int = 2,
+        max_pending: int = 16,
+        max_cache_bytes: int = 1024 * 1024 * 1024,
+        extractor: Extractor = download_youtube_audio,
+        executor: Optional[Executor] = None,
+    ):
+        self.cache = AudioCache(cache_dir, max_cache_bytes)
+        self.max_workers = max(1, int(max_workers))
+        self.max_pending = max(1, int(max_pending))
+        self._extractor = extractor
+        self._executor = executor
+        self._owns_executor = executor is None
+        self._inflight: dict[str, asyncio.Future] = {}
+        self.downloads = 0
+        self.cache_hits = 0
+        self.joined = 0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    def is_cached(self, url: str) -> bool:
+        return self.cache.peek(cache_key_for_url(url)) is not None
+
+    async def fetch(self, url: str) -> CachedAudio:
+        """Cached entry for ``url``, downloading it (or joining a running download) on a miss."""
+        if not is_supported_youtube_url(url):
+            raise UnsupportedYoutubeUrlError("Only YouTube and YouTube Music links are supported.")
+        key = cache_key_for_url(url)
+        entry = self.cache.get(key)
+        if entry is not None:
+            self.cache_hits += 1
+            return entry
+        task = self._inflight.get(key)
+        if task is None:
+            if len(self._inflight) >= self.max_pending:
+                raise YoutubeDownloadBusyError("Too many downloads in progress.")
+            task = asyncio.ensure_future(self._download(key, url))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done, k=key: self._finish(k, done))
+        else:
+            self.joined += 1
+        # shield: a requester that gives up must not cancel the download for the others
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Future) -> None:
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # mark retrieved even if every requester has gone
+
+    async def _download(self, key: str, url: str) -> CachedAudio:
+        staging = self.cache.staging_dir()
+        try:
+            loop = asyncio.get_running_loop()
+            try:
+                result = await loop.run_in_executor(self._get_executor(), self._extractor, url, staging)
+            except BrokenProcessPool as exc:
+                if self._owns_executor:
+                    self._executor = None
+                raise YoutubeAudioDownloadError("download worker crashed") from exc
+            self.downloads += 1
+            return self.cache.store(key, result)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    @asynccontextmanager
+    async def audio(self, url: str) -> AsyncIterator[CachedAudio]:
+        """``fetch`` that pins the entry so its files survive eviction while being sent."""
+        for _ in range(3):
+            entry = await self.fetch(url)
+            if entry.is_usable:
+                break
+        else:
+            raise YoutubeAudioDownloadError("cached audio was evicted before it could be sent.")
+        self.cache.pin(entry.key)
+        try:
+            yield entry
+        finally:
+            self.cache.unpin(entry.key)
+
+    def shutdown(self, wait: bool = False) -> None:
+        if self._owns_executor and self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
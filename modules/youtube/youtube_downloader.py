@@ -101,14 +101,22 @@ def _resolve_ffmpeg_dir() -> Optional[Path]:
     return None
 
 
-def download_youtube_audio(url: str) -> DownloadedAudio:
+def download_youtube_audio(url: str, working_dir: Optional[Path] = None) -> DownloadedAudio:
+    """Download ``url`` as mp3 (plus jpg cover) into ``working_dir`` or a fresh temp dir.
+
+    Must stay a picklable top-level function: the download service runs it in worker processes.
+    """
     if not is_supported_youtube_url(url):
         raise UnsupportedYoutubeUrlError("Only YouTube and YouTube Music links are supported.")
     ffmpeg_dir = _resolve_ffmpeg_dir()
     if ffmpeg_dir is None:
         raise FfmpegNotFoundError("ffmpeg is required to convert audio to mp3.")
 
-    working_dir = Path(tempfile.mkdtemp(prefix="yt_audio_"))
+    if working_dir is None:
+        working_dir = Path(tempfile.mkdtemp(prefix="yt_audio_"))
+    else:
+        working_dir = Path(working_dir)
+        working_dir.mkdir(parents=True, exist_ok=True)
     output_template = str(working_dir / "%(title).180B [%(id)s].%(ext)s")
 
     ydl_opts = {
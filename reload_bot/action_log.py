@@ -0,0 +1,93 @@
+"""
+Фоновый писатель журнала действий.
+
+log_action (core.database) только кладёт запись в кольцевой буфер в памяти,
+поэтому журнал не добавляет синхронный коммит к ответу пользователю. Писатель —
+одна asyncio-задача: раз в ACTION_LOG_FLUSH_SEC, либо сразу, как только буфер
+наберёт ACTION_LOG_FLUSH_SIZE записей (триггер буфера будит задачу из любого
+потока), она сбрасывает буфер в action_logs одним executemany через очередь
+записей core.db_async. stop() снимает задачу и дописывает остаток буфера.
+
+Использование:
+    from reload_bot.action_log import action_log_writer
+
+    action_log_writer.start()        # внутри запущенного event loop (post_init)
+    await action_log_writer.stop()   # при остановке бота
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+
+import core.database as db
+import core.db_async as adb
+from core.constants import ACTION_LOG_FLUSH_SEC
+
+logger = logging.getLogger(__name__)
+
+
+class ActionLogWriter:
+    """Asyncio-задача, которая сбрасывает буфер журнала по интервалу и по заполнению."""
+
+    def __init__(self, *, interval: float = ACTION_LOG_FLUSH_SEC):
+        self.interval = max(0.05, float(interval))
+        self._task: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wake: asyncio.Event | None = None
+        self._dropped_seen = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        db.set_action_log_flush_trigger(self.notify)
+        self._task = self._loop.create_task(self._run(), name="action_log_writer")
+
+    def notify(self) -> None:
+        """Будит писателя. Безопасно вызывать из любого потока (в т.ч. из пула БД)."""
+        loop, wake = self._loop, self._wake
+        if loop is None or wake is None or loop.is_closed():
+            return
+        with contextlib.suppress(RuntimeError):
+            loop.call_soon_threadsafe(wake.set)
+
+    async def _run(self) -> None:
+        while True:
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            self._wake.clear()
+            await self.flush()
+
+    async def flush(self) -> int:
+        try:
+            written = await adb.call_write(db.flush_action_log)
+        except Exception:
+            logger.exception("[ACTION_LOG] Не удалось записать журнал действий")
+            return 0
+        dropped = db.get_action_log_stats()['dropped']
+        if dropped > self._dropped_seen:
+            logger.warning("[ACTION_LOG] Буфер журнала переполнен, отброшено записей: %s", dropped - self._dropped_seen)
+            self._dropped_seen = dropped
+        return written
+
+    async def stop(self) -> int:
+        """Останавливает задачу и дописывает всё, что осталось в буфере."""
+        db.set_action_log_flush_trigger(None)
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        self._loop = None
+        self._wake = None
+        return await self.flush()
+
+
+action_log_writer = ActionLogWriter()
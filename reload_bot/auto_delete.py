@@ -0,0 +1,142 @@
+"""
+Чистильщик автоудаления сообщений в группах.
+
+Вместо JobQueue-задачи на каждое сообщение (и словаря AUTO_DELETE_MESSAGES с
+повторным чтением настроек группы в каждой задаче) задачи лежат только в
+scheduled_auto_deletes. Один повторяющийся проход забирает созревшие строки
+пачками по индексу delete_at, проверяет настройки всех чатов пачки через кэш
+(промахи — одним запросом), удаляет сообщения несколькими параллельными
+исполнителями и убирает обработанные строки одним DELETE.
+
+Если у бота есть deleteMessages (PTB 20.8+), сообщения одного чата удаляются
+пачками до DELETE_MESSAGES_LIMIT за запрос, иначе — по одному через deleteMessage.
+RetryAfter останавливает проход: необработанные строки остаются в БД и
+достаются следующему проходу после паузы. Восстанавливать после рестарта
+нечего — просроченные строки просто попадут в первый же проход.
+
+Использование:
+    from reload_bot.auto_delete import auto_delete_sweeper
+
+    await auto_delete_sweeper.sweep(context.bot)   # из повторяющейся задачи
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import defaultdict
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+import core.database as db
+import core.db_async as adb
+from core.constants import AUTO_DELETE_BATCH_SIZE, AUTO_DELETE_CONCURRENCY
+from reload_bot.broadcast import retry_after_seconds
+
+logger = logging.getLogger(__name__)
+
+# Ограничение Telegram на число message_ids в одном deleteMessages
+DELETE_MESSAGES_LIMIT = 100
+
+
+class AutoDeleteSweeper:
+    """Проход по созревшим задачам автоудаления с ограниченным параллелизмом."""
+
+    def __init__(
+        self,
+        *,
+        batch_size: int = AUTO_DELETE_BATCH_SIZE,
+        concurrency: int = AUTO_DELETE_CONCURRENCY,
+        max_batches: int = 20,
+    ):
+        self.batch_size = max(1, int(batch_size))
+        self.concurrency = max(1, int(concurrency))
+        self.max_batches = max(1, int(max_batches))
+        self._paused_until = 0.0
+        self._sweeping = False
+
+    async def sweep(self, bot, now: int | None = None) -> dict:
+        """Один проход: до max_batches пачек созревших задач. Возвращает счётчики прохода."""
+        stats = {'deleted': 0, 'skipped': 0, 'failed': 0, 'kept': 0}
+        if self._sweeping or time.monotonic() < self._paused_until:
+            return stats
+        self._sweeping = True
+        try:
+            now_ts = int(time.time()) if now is None else int(now)
+            for _ in range(self.max_batches):
+                rows = await adb.call(db.get_due_auto_deletes, now_ts, self.batch_size)
+                if not rows:
+                    break
+                done_ids = await self._process_batch(bot, rows, stats)
+                await adb.call_write(db.delete_scheduled_auto_deletes, done_ids)
+                # Пауза после RetryAfter или строки, оставленные до следующего прохода
+                if len(done_ids) < len(rows) or len(rows) < self.batch_size:
+                    break
+            return stats
+        finally:
+            self._sweeping = False
+
+    async def _process_batch(self, bot, rows: list[tuple[int, int, int]], stats: dict) -> list[int]:
+        settings = await adb.call(db.get_group_settings_many, {chat_id for _, chat_id, _ in rows})
+        done_ids: list[int] = []
+        by_chat: dict[int, list[tuple[int, int]]] = defaultdict(list)
+        for row_id, chat_id, message_id in rows:
+            if settings.get(chat_id, {}).get('auto_delete_enabled'):
+                by_chat[chat_id].append((row_id, message_id))
+            else:
+                # Автоудаление в группе выключили — задача просто снимается
+                done_ids.append(row_id)
+                stats['skipped'] += 1
+
+        bulk = getattr(bot, 'delete_messages', None)
+        step = DELETE_MESSAGES_LIMIT if bulk is not None else 1
+        units = iter([
+            (chat_id, items[i:i + step])
+            for chat_id, items in by_chat.items()
+            for i in range(0, len(items), step)
+        ])
+
+        async def worker():
+            # Общий итератор: каждый исполнитель берёт следующий свободный запрос удаления
+            for chat_id, items in units:
+                if time.monotonic() < self._paused_until:
+                    stats['kept'] += len(items)
+                    continue
+                status = await self._delete(bot, chat_id, [mid for _, mid in items])
+                if status == 'kept':
+                    stats['kept'] += len(items)
+                    continue
+                stats[status] += len(items)
+                done_ids.extend(row_id for row_id, _ in items)
+
+        workers = min(self.concurrency, sum(len(v) for v in by_chat.values()))
+        if workers:
+            await asyncio.gather(*(worker() for _ in range(workers)))
+        return done_ids
+
+    async def _delete(self, bot, chat_id: int, message_ids: list[int]) -> str:
+        try:
+            if getattr(bot, 'delete_messages', None) is None:
+                await bot.delete_message(chat_id=chat_id, message_id=message_ids[0])
+            else:
+                await bot.delete_messages(chat_id=chat_id, message_ids=message_ids)
+            return 'deleted'
+        except RetryAfter as e:
+            wait = retry_after_seconds(e) + 1
+            logger.warning("[AUTO_DELETE] FloodWait: пауза автоудаления на %ss", wait)
+            self._paused_until = max(self._paused_until, time.monotonic() + wait)
+            return 'kept'
+        except (BadRequest, Forbidden) as e:
+            # Сообщение уже удалено, слишком старое или у бота нет прав — повтор не поможет
+            logger.debug("[AUTO_DELETE] Не удалось удалить %s в чате %s: %s", message_ids, chat_id, e)
+            return 'failed'
+        except NetworkError as e:
+            logger.debug("[AUTO_DELETE] Сетевая ошибка для чата %s, повтор в следующем проходе: %s", chat_id, e)
+            return 'kept'
+        except Exception as e:
+            logger.warning("[AUTO_DELETE] Ошибка удаления %s в чате %s: %s", message_ids, chat_id, e)
+            return 'failed'
+
+
+auto_delete_sweeper = AutoDeleteSweeper()
@@ -0,0 +1,34 @@
+"""
+Глобальная проверка бана для всех апдейтов.
+
+Guard стоит в группе -100, между открытием контекста апдейта (группа -1000) и
+его закрытием (группа 1000). ApplicationHandlerStop останавливает все
+последующие группы, в том числе закрывающую, поэтому guard сам закрывает
+контекст апдейта перед остановкой.
+
+Использование:
+    global_ban_guard = make_ban_guard(abort_if_banned)
+    application.add_handler(TypeHandler(Update, global_ban_guard), group=-100)
+"""
+
+from __future__ import annotations
+
+from typing import Any, Awaitable, Callable
+
+from telegram.ext import ApplicationHandlerStop
+
+import core.update_context as uctx
+
+AbortIfBanned = Callable[[Any, Any], Awaitable[bool]]
+
+
+def make_ban_guard(abort_if_banned: AbortIfBanned) -> Callable[[Any, Any], Awaitable[None]]:
+    """Возвращает TypeHandler-колбэк, который останавливает апдейты забаненных пользователей."""
+
+    async def global_ban_guard(update, context) -> None:
+        """Stop every update from users with an active bot ban."""
+        if await abort_if_banned(update, context):
+            uctx.finish_update(uctx.current(context))
+            raise ApplicationHandlerStop
+
+    return global_ban_guard
@@ -0,0 +1,260 @@
+"""
+Движок рассылок.
+
+Задание рассылки хранится в БД (core.database.BroadcastJob): курсор по user_id
+и счётчики сохраняются после каждой страницы получателей, поэтому после рестарта
+рассылка продолжается с места остановки (повторно может уйти не больше одной
+страницы). Внутри страницы сообщения отправляют несколько параллельных
+отправителей, а общий TokenBucket держит суммарную скорость в пределах лимита
+Telegram. RetryAfter от любого отправителя ставит на паузу всех.
+
+Использование:
+    bucket = TokenBucket(BROADCAST_RATE_PER_SEC)
+    engine = BroadcastEngine(context.bot, bucket=bucket)
+    job = await engine.run(job_id, on_progress=edit_admin_message)
+
+    tasks = BroadcastTasks()
+    tasks.launch(job_id, lambda: engine.run(job_id))
+    await tasks.cancel_all()   # при остановке бота; курсор уже в БД
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Coroutine
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+import core.database as db
+import core.db_async as adb
+from core.constants import (
+    BROADCAST_CONCURRENCY,
+    BROADCAST_PAGE_SIZE,
+    BROADCAST_PROGRESS_INTERVAL_SEC,
+)
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[[dict], Awaitable[Any]]
+
+
+def retry_after_seconds(exc: RetryAfter) -> float:
+    value = getattr(exc, "retry_after", 1)
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return float(value if value is not None else 1)
+
+
+class TokenBucket:
+    """Ограничитель скорости: rate токенов в секунду, не больше capacity про запас.
+
+    pause(seconds) останавливает выдачу токенов всем ожидающим — так соблюдается
+    RetryAfter, который Telegram присылает одному отправителю, но имеет в виду всего бота.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0, *, clock: Callable[[], float] = time.monotonic):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(capacity))
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def paused_for(self) -> float:
+        return max(0.0, self._paused_until - self._clock())
+
+    def pause(self, seconds: float) -> None:
+        until = self._clock() + max(0.0, float(seconds))
+        if until > self._paused_until:
+            self._paused_until = until
+            self._tokens = 0.0
+            self._updated = until
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    def try_acquire(self) -> bool:
+        """Неблокирующий acquire: берёт токен, только если он доступен прямо сейчас."""
+        now = self._clock()
+        if now < self._paused_until:
+            return False
+        self._refill(now)
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return True
+        return False
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = self._clock()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self._tokens) / self.rate)
+
+
+class BroadcastEngine:
+    """Отправляет одно задание рассылки постранично с параллельными отправителями."""
+
+    def __init__(
+        self,
+        bot,
+        *,
+        bucket: TokenBucket,
+        concurrency: int = BROADCAST_CONCURRENCY,
+        page_size: int = BROADCAST_PAGE_SIZE,
+        progress_interval: float = BROADCAST_PROGRESS_INTERVAL_SEC,
+        max_attempts: int = 5,
+    ):
+        self.bot = bot
+        self.bucket = bucket
+        self.concurrency = max(1, int(concurrency))
+        self.page_size = max(1, int(page_size))
+        self.progress_interval = float(progress_interval)
+        self.max_attempts = max(1, int(max_attempts))
+
+    async def run(self, job_id: int, on_progress: ProgressCallback | None = None) -> dict | None:
+        """Досылает задание до конца (или до отмены) и возвращает его итоговое состояние."""
+        job = await adb.call(db.get_broadcast_job, job_id)
+        if not job or job['status'] != 'running':
+            return job
+        cursor = job['cursor_user_id']
+        last_progress = time.monotonic()
+        while True:
+            page = await adb.call(db.get_broadcast_recipients_page, cursor, self.page_size)
+            if not page:
+                job = await adb.call_write(db.checkpoint_broadcast_job, job_id, cursor, status='done')
+                break
+            sent, failed, blocked = await self._send_page(job, page)
+            cursor = page[-1]
+            job = await adb.call_write(
+                db.checkpoint_broadcast_job, job_id, cursor,
+                sent=sent, failed=failed, blocked_user_ids=blocked,
+            )
+            if job is None or job['status'] != 'running':
+                break
+            if on_progress and time.monotonic() - last_progress >= self.progress_interval:
+                last_progress = time.monotonic()
+                await self._notify(on_progress, job)
+        if on_progress and job:
+            await self._notify(on_progress, job)
+        return job
+
+    async def _send_page(self, job: dict, page: list[int]) -> tuple[int, int, list[int]]:
+        recipients = iter(page)
+        counts = {'sent': 0, 'failed': 0}
+        blocked: list[int] = []
+
+        async def sender():
+            # Общий итератор: каждый отправитель берёт следующего свободного получателя
+            for user_id in recipients:
+                status = await self._send_one(job, user_id)
+                if status == 'blocked':
+                    blocked.append(user_id)
+                else:
+                    counts[status] += 1
+
+        await asyncio.gather(*(sender() for _ in range(min(self.concurrency, len(page)))))
+        return counts['sent'], counts['failed'], blocked
+
+    async def _send_one(self, job: dict, user_id: int) -> str:
+        for attempt in range(self.max_attempts):
+            await self.bucket.acquire()
+            try:
+                await self._deliver(job, user_id)
+                return 'sent'
+            except RetryAfter as e:
+                wait = retry_after_seconds(e) + 1
+                logger.warning("[BROADCAST] FloodWait: пауза всех отправителей на %ss", wait)
+                self.bucket.pause(wait)
+            except Forbidden:
+                return 'blocked'
+            except BadRequest as e:
+                if 'chat not found' in str(e).lower():
+                    return 'blocked'
+                logger.warning("[BROADCAST] Не удалось отправить %s: %s", user_id, e)
+                return 'failed'
+            except NetworkError as e:
+                logger.debug("[BROADCAST] Сетевая ошибка для %s (попытка %s): %s", user_id, attempt + 1, e)
+                await asyncio.sleep(min(2 ** attempt, 5))
+            except Exception as e:
+                logger.warning("[BROADCAST] Не удалось отправить %s: %s", user_id, e)
+                return 'failed'
+        return 'failed'
+
+    async def _deliver(self, job: dict, user_id: int) -> None:
+        if job['kind'] == 'audio':
+            caption = job.get('text') or None
+            await self.bot.send_audio(
+                chat_id=user_id,
+                audio=job['file_id'],
+                caption=caption,
+                parse_mode='HTML' if caption else None,
+            )
+        else:
+            await self.bot.send_message(chat_id=user_id, text=job['text'], parse_mode='HTML')
+
+    @staticmethod
+    async def _notify(on_progress: ProgressCallback, job: dict) -> None:
+        try:
+            await on_progress(job)
+        except Exception as e:
+            logger.debug("[BROADCAST] Не удалось обновить прогресс задания %s: %s", job.get('id'), e)
+
+
+class BroadcastTasks:
+    """Фоновые задачи рассылок процесса: не больше одной на задание.
+
+    Задачи создаются в event loop напрямую, а не через Application.create_task:
+    PTB при остановке ждёт все такие задачи, и рестарт бота висел бы до конца
+    рассылки. Вместо этого cancel_all() снимает их при остановке — курсор
+    сохранён после каждой страницы, и resume_broadcasts_on_startup продолжит
+    задание (повторно уйдёт не больше текущей страницы).
+    """
+
+    def __init__(self):
+        self._tasks: dict[int, asyncio.Task] = {}
+
+    def __contains__(self, job_id: int) -> bool:
+        task = self._tasks.get(job_id)
+        return task is not None and not task.done()
+
+    def __len__(self) -> int:
+        return sum(1 for task in self._tasks.values() if not task.done())
+
+    def launch(self, job_id: int, factory: Callable[[], Coroutine[Any, Any, Any]]) -> bool:
+        """Запускает factory() в фоне, если задание ещё не выполняется."""
+        if job_id in self:
+            return False
+        task = asyncio.get_running_loop().create_task(factory(), name=f"broadcast#{job_id}")
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda t, jid=job_id: self._forget(jid, t))
+        return True
+
+    def _forget(self, job_id: int, task: asyncio.Task) -> None:
+        if self._tasks.get(job_id) is task:
+            del self._tasks[job_id]
+
+    async def cancel_all(self) -> int:
+        """Отменяет все выполняющиеся рассылки и дожидается их. Возвращает число отменённых."""
+        tasks = [task for task in self._tasks.values() if not task.done()]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return len(tasks)
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Iterable, Mapping
+
+
+RouteHandler = Callable[..., Awaitable[Any]]
+
+
+@dataclass(slots=True, frozen=True)
+class CallbackRoute:
+    """Обработчик callback_data: handler(update, context[, data])."""
+
+    name: str
+    handler: RouteHandler
+    pass_data: bool = False
+
+    async def __call__(self, update, context, data: str):
+        if self.pass_data:
+            return await self.handler(update, context, data)
+        return await self.handler(update, context)
+
+
+class _TrieNode:
+    __slots__ = ("children", "route", "level")
+
+    def __init__(self):
+        self.children: dict[str, _TrieNode] = {}
+        self.route: CallbackRoute | None = None
+        self.level: int | None = None
+
+
+class CallbackRouter:
+    """Маршрутизатор callback_data: точные ключи в dict, параметризованные — в префиксном дереве.
+
+    Семантика совпадает с цепочкой if/elif в порядке регистрации: выигрывает
+    маршрут, зарегистрированный раньше. Маршрут, который целиком перекрыт
+    более ранним, не добавляется и попадает в `shadowed`.
+
+    Вместе с маршрутом resolve() возвращает требуемый уровень доступа из
+    матрицы прав (exact_levels, prefix_levels) — за тот же проход по строке.
+    """
+
+    def __init__(
+        self,
+        exact_levels: Mapping[str, int] | None = None,
+        prefix_levels: Iterable[tuple[str, int]] = (),
+    ):
+        self._exact: dict[str, tuple[CallbackRoute | None, int | None]] = {}
+        self._exact_levels: dict[str, int] = dict(exact_levels or {})
+        self._root = _TrieNode()
+        self._registered: list[tuple[str, str, CallbackRoute]] = []
+        self.shadowed: list[tuple[str, str]] = []
+        for prefix, level in prefix_levels:
+            node = self._node(prefix)
+            if node.level is None:
+                node.level = int(level)
+
+    def _node(self, prefix: str) -> _TrieNode:
+        node = self._root
+        for ch in prefix:
+            nxt = node.children.get(ch)
+            if nxt is None:
+                nxt = node.children[ch] = _TrieNode()
+            node = nxt
+        return node
+
+    def _walk(self, data: str) -> tuple[CallbackRoute | None, int | None]:
+        node = self._root
+        route = None
+        level = None
+        for ch in data:
+            node = node.children.get(ch)
+            if node is None:
+                break
+            if node.route is not None:
+                route = node.route
+            if node.level is not None:
+                level = node.level
+        return route, level
+
+    def _level_for(self, data: str) -> int | None:
+        level = self._exact_levels.get(data)
+        if level is not None:
+            return level
+        return self._walk(data)[1]
+
+    def _prefix_route_for(self, data: str) -> CallbackRoute | None:
+        return self._walk(data)[0]
+
+    def exact(self, keys: str | Iterable[str], handler: RouteHandler, *, pass_data: bool = False,
+              name: str | None = None) -> CallbackRoute:
+        keys = (keys,) if isinstance(keys, str) else tuple(keys)
+        route = CallbackRoute(name or getattr(handler, "__name__", "route"), handler, pass_data)
+        for key in keys:
+            if key in self._exact or self._prefix_route_for(key) is not None:
+                self.shadowed.append((route.name, key))
+                continue
+            self._exact[key] = (route, self._level_for(key))
+            self._registered.append(("exact", key, route))
+        return route
+
+    def prefix(self, prefixes: str | Iterable[str], handler: RouteHandler, *, pass_data: bool = True,
+               name: str | None = None) -> CallbackRoute:
+        prefixes = (prefixes,) if isinstance(prefixes, str) else tuple(prefixes)
+        route = CallbackRoute(name or getattr(handler, "__name__", "route"), handler, pass_data)
+        for prefix in prefixes:
+            if not prefix or self._prefix_route_for(prefix) is not None:
+                self.shadowed.append((route.name, prefix))
+                continue
+            # Более длинные префиксы, зарегистрированные раньше, остаются за своими маршрутами
+            self._node(prefix).route = route
+            self._registered.append(("prefix", prefix, route))
+        return route
+
+    def module(self, module: Any, handler: RouteHandler, *, name: str | None = None) -> CallbackRoute:
+        """Регистрирует модуль reload_bot по его CALLBACK_EXACT / CALLBACK_PREFIXES."""
+        name = name or getattr(module, "__name__", "module").rsplit(".", 1)[-1]
+        route = self.exact(getattr(module, "CALLBACK_EXACT", ()), handler, pass_data=True, name=name)
+        self.prefix(getattr(module, "CALLBACK_PREFIXES", ()), handler, name=name)
+        return route
+
+    def resolve(self, data: str | None) -> tuple[CallbackRoute | None, int | None]:
+        """Возвращает (маршрут или None, требуемый уровень доступа или None)."""
+        if not data:
+            return None, None
+        hit = self._exact.get(data)
+        if hit is not None:
+            return hit
+        route, level = self._walk(data)
+        exact_level = self._exact_levels.get(data)
+        return route, (exact_level if exact_level is not None else level)
+
+    def registered_callbacks(self) -> list[str]:
+        """Все зарегистрированные точные ключи и префиксы (для тестов и бенчмарков)."""
+        return [key for _, key, _ in self._registered]
+
+    def routes(self) -> list[tuple[str, str, CallbackRoute]]:
+        """(kind, ключ, маршрут) в порядке регистрации, kind — 'exact' или 'prefix'."""
+        return list(self._registered)
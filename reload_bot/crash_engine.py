@@ -0,0 +1,242 @@
+"""
+Движок игры «Краш».
+
+Все активные игры процесса продвигает один тикер. Исход игры задаётся не числом
+тиков, а временем: множитель — непрерывная функция от времени с начала раунда,
+момент краша вычисляется заранее из crash_point, а cashout сравнивает своё время
+с моментом краша. Поэтому пропущенные или задержанные кадры анимации не меняют
+выплату.
+
+Кадры анимации — правки сообщений. Тикер не шлёт кадр, пока не завершилась
+предыдущая правка того же сообщения, пропускает кадры без изменений, а общий
+TokenBucket ограничивает суммарную скорость правок. Если токенов не хватает или
+Telegram отвечает RetryAfter, интервал между кадрами растёт (до max_frame_interval),
+а без перегрузки плавно возвращается к базовому.
+
+Использование:
+    engine = CrashEngine(render=crash_frame, on_crash=finish_crash)
+    engine.start(context.bot, CrashGame(user_id, username, bet, crash_point, chat_id, message_id))
+    game = engine.cash_out(user_id)   # status: 'cashed_out' или 'crashed'
+    await engine.settle(game)         # дождаться последнего кадра перед итоговым экраном
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional
+
+from telegram.error import BadRequest, RetryAfter
+
+from core.constants import (
+    CRASH_COMPOUND_RATE,
+    CRASH_EDIT_RATE_PER_SEC,
+    CRASH_GROWTH_RATE,
+    CRASH_MAX_FRAME_INTERVAL,
+    CRASH_MAX_MULTIPLIER,
+    CRASH_TICK_SEC,
+    CRASH_UPDATE_INTERVAL,
+)
+from reload_bot.broadcast import TokenBucket, retry_after_seconds
+
+logger = logging.getLogger(__name__)
+
+
+def crash_multiplier_at(elapsed: float) -> float:
+    """Множитель через elapsed секунд после старта, с округлением вниз до сотых.
+
+    Непрерывная форма прежнего шага m -> m * (1 + CRASH_COMPOUND_RATE) + CRASH_GROWTH_RATE
+    раз в CRASH_UPDATE_INTERVAL: на границах шагов значения совпадают.
+    """
+    offset = CRASH_GROWTH_RATE / CRASH_COMPOUND_RATE
+    steps = max(0.0, float(elapsed)) / CRASH_UPDATE_INTERVAL
+    value = (1.0 + offset) * (1.0 + CRASH_COMPOUND_RATE) ** steps - offset
+    return min(math.floor(value * 100 + 1e-6) / 100, CRASH_MAX_MULTIPLIER)
+
+
+def crash_elapsed_for(multiplier: float) -> float:
+    """Через сколько секунд после старта множитель достигает multiplier (обратная функция)."""
+    if multiplier <= 1.0:
+        return 0.0
+    offset = CRASH_GROWTH_RATE / CRASH_COMPOUND_RATE
+    steps = math.log((multiplier + offset) / (1.0 + offset)) / math.log(1.0 + CRASH_COMPOUND_RATE)
+    return steps * CRASH_UPDATE_INTERVAL
+
+
+@dataclass
+class CrashGame:
+    """Одна игра. started_at/crash_at — по часам движка; status: playing, cashed_out, crashed."""
+
+    user_id: int
+    username: str
+    bet: int
+    crash_point: float
+    chat_id: int
+    message_id: Optional[int] = None
+    started_at: float = 0.0
+    crash_at: float = 0.0
+    status: str = 'playing'
+    cashout_multiplier: Optional[float] = None
+    last_frame: Optional[str] = None
+    next_frame_at: float = 0.0
+    edit_task: Optional[asyncio.Task] = field(default=None, repr=False)
+
+    def multiplier_at(self, now: float) -> float:
+        return min(crash_multiplier_at(now - self.started_at), self.crash_point)
+
+
+FrameRenderer = Callable[[CrashGame, float], tuple[str, Any]]
+CrashCallback = Callable[[Any, CrashGame], Awaitable[Any]]
+
+
+class CrashEngine:
+    """Общий тикер всех игр «Краш» процесса."""
+
+    def __init__(
+        self,
+        *,
+        render: FrameRenderer,
+        on_crash: CrashCallback,
+        bucket: TokenBucket | None = None,
+        tick_interval: float = CRASH_TICK_SEC,
+        frame_interval: float = CRASH_UPDATE_INTERVAL,
+        max_frame_interval: float = CRASH_MAX_FRAME_INTERVAL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._render = render
+        self._on_crash = on_crash
+        self._clock = clock
+        self.bucket = bucket or TokenBucket(CRASH_EDIT_RATE_PER_SEC, capacity=CRASH_EDIT_RATE_PER_SEC, clock=clock)
+        self.tick_interval = float(tick_interval)
+        self.base_frame_interval = float(frame_interval)
+        self.max_frame_interval = max(float(max_frame_interval), self.base_frame_interval)
+        self.frame_interval = self.base_frame_interval
+        self.games: dict[int, CrashGame] = {}
+        self.bot = None
+        self._task: asyncio.Task | None = None
+        self._background: set[asyncio.Task] = set()
+        self._throttled = False
+        self.edits = 0
+        self.skipped = 0
+
+    def get(self, user_id: int) -> CrashGame | None:
+        return self.games.get(user_id)
+
+    def start(self, bot, game: CrashGame) -> CrashGame:
+        """Регистрирует игру: время старта и момент краша фиксируются сразу."""
+        self.bot = bot
+        game.started_at = self._clock()
+        game.crash_at = game.started_at + crash_elapsed_for(game.crash_point)
+        game.next_frame_at = game.started_at + self.frame_interval
+        game.status = 'playing'
+        self.games[game.user_id] = game
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return game
+
+    def cash_out(self, user_id: int, now: float | None = None) -> CrashGame | None:
+        """Снимает игру по времени нажатия: до crash_at — выигрыш по множителю на этот момент, иначе краш.
+
+        Возвращает игру с итоговым status или None, если активной игры нет.
+        """
+        game = self.games.get(user_id)
+        if game is None or game.status != 'playing':
+            return None
+        now = self._clock() if now is None else now
+        del self.games[user_id]
+        if now < game.crash_at:
+            game.status = 'cashed_out'
+            game.cashout_multiplier = game.multiplier_at(now)
+        else:
+            game.status = 'crashed'
+        return game
+
+    async def settle(self, game: CrashGame) -> None:
+        """Ждёт незавершённую правку кадра, чтобы она не перезаписала итоговый экран."""
+        task = game.edit_task
+        if task is not None and not task.done():
+            await asyncio.gather(task, return_exceptions=True)
+
+    def tick(self) -> None:
+        """Один шаг: завершает упавшие игры и рассылает кадры тем, кому они положены."""
+        now = self._clock()
+        for game in [g for g in self.games.values() if now >= g.crash_at]:
+            del self.games[game.user_id]
+            game.status = 'crashed'
+            self._spawn(self._finish_crashed(game))
+
+        starved = False
+        due = sorted(
+            (g for g in self.games.values()
+             if g.message_id and now >= g.next_frame_at and (g.edit_task is None or g.edit_task.done())),
+            key=lambda g: g.next_frame_at,
+        )
+        for game in due:
+            text, reply_markup = self._render(game, game.multiplier_at(now))
+            if text == game.last_frame:
+                self.skipped += 1
+                game.next_frame_at = now + self.frame_interval
+                continue
+            if not self.bucket.try_acquire():
+                # Остальные кадры откладываются: дойдёт самый свежий, промежуточные не нужны
+                starved = True
+                break
+            game.last_frame = text
+            game.next_frame_at = now + self.frame_interval
+            game.edit_task = asyncio.create_task(self._edit(game, text, reply_markup))
+        self._adapt(starved)
+
+    def _adapt(self, starved: bool) -> None:
+        if starved or self._throttled:
+            self.frame_interval = min(self.max_frame_interval, self.frame_interval * 1.5)
+        else:
+            self.frame_interval = max(self.base_frame_interval, self.frame_interval * 0.9)
+        self._throttled = False
+
+    async def _edit(self, game: CrashGame, text: str, reply_markup) -> None:
+        try:
+            await self.bot.edit_message_text(
+                chat_id=game.chat_id,
+                message_id=game.message_id,
+                text=text,
+                reply_markup=reply_markup,
+                parse_mode='HTML',
+            )
+            self.edits += 1
+        except RetryAfter as e:
+            delay = retry_after_seconds(e)
+            self.bucket.pause(delay)
+            self._throttled = True
+            game.last_frame = None
+            game.next_frame_at = max(game.next_frame_at, self._clock() + delay)
+        except BadRequest:
+            # «message is not modified» или сообщение удалено — следующий кадр попробует снова
+            pass
+        except Exception as e:
+            logger.debug(f"[CRASH] Frame edit failed for {game.user_id}: {e}")
+
+    async def _finish_crashed(self, game: CrashGame) -> None:
+        await self.settle(game)
+        try:
+            await self._on_crash(self.bot, game)
+        except Exception:
+            logger.exception(f"[CRASH] Failed to finish crashed game of {game.user_id}")
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _run(self) -> None:
+        try:
+            while self.games:
+                await asyncio.sleep(self.tick_interval)
+                try:
+                    self.tick()
+                except Exception:
+                    logger.exception("[CRASH] Ticker step failed")
+        finally:
+            self._task = None
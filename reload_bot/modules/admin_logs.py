@@ -6,6 +6,7 @@ from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.error import BadRequest
 from telegram.ext import CallbackQueryHandler, ContextTypes
 
+import core.db_async as adb
 from reload_bot.runtime import BotRuntime
 
 
@@ -16,6 +17,14 @@ def can_handle_text_action(action: str | None) -> bool:
     return bool(action in TEXT_ACTIONS)
 
 
+async def _flush_pending_logs(runtime: BotRuntime) -> None:
+    """Дописывает буфер журнала через очередь записей, чтобы выборка показала свежие действия."""
+    try:
+        await adb.flush_action_log()
+    except Exception as e:
+        runtime.logger.warning(f"[ADMIN_LOGS] Failed to flush action log buffer: {e}")
+
+
 def _back_kb() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup([[InlineKeyboardButton("📝 Логи системы", callback_data="admin_logs_menu")]])
 
@@ -87,6 +96,7 @@ async def show_admin_logs_recent(update: Update, context: ContextTypes.DEFAULT_T
         await query.answer("⚠ Доступ запрещён!", show_alert=True)
         return
 
+    await _flush_pending_logs(runtime)
     logs = runtime.db.get_recent_logs(limit=20)
     text = "📊 <b>Последние действия</b>\n\n"
     if logs:
@@ -123,6 +133,7 @@ async def show_admin_logs_transactions(update: Update, context: ContextTypes.DEF
         await query.answer("⚠ Доступ запрещён!", show_alert=True)
         return
 
+    await _flush_pending_logs(runtime)
     logs = runtime.db.get_logs_by_type("transaction", limit=20)
     text = "💰 <b>Транзакции</b>\n\n"
     if logs:
@@ -159,6 +170,7 @@ async def show_admin_logs_casino(update: Update, context: ContextTypes.DEFAULT_T
         await query.answer("⚠ Доступ запрещён!", show_alert=True)
         return
 
+    await _flush_pending_logs(runtime)
     logs = runtime.db.get_logs_by_type("casino", limit=20)
     text = "🎰 <b>Игры в казино</b>\n\n"
     if logs:
@@ -195,6 +207,7 @@ async def show_admin_logs_purchases(update: Update, context: ContextTypes.DEFAUL
         await query.answer("⚠ Доступ запрещён!", show_alert=True)
         return
 
+    await _flush_pending_logs(runtime)
     logs = runtime.db.get_logs_by_type("purchase", limit=20)
     text = "🛒 <b>Покупки</b>\n\n"
     if logs:
@@ -252,6 +265,7 @@ async def show_admin_logs_errors(update: Update, context: ContextTypes.DEFAULT_T
         await query.answer("⚠ Доступ запрещён!", show_alert=True)
         return
 
+    await _flush_pending_logs(runtime)
     logs = runtime.db.get_error_logs(limit=20)
     text = "⚠️ <b>Ошибки системы</b>\n\n"
     if logs:
@@ -292,13 +306,14 @@ async def handle_text_action(
     else:
         try:
             user_id = int(str(text_input).strip().lstrip("@"))
-            player = runtime.db.get_or_create_player(user_id, f"User{user_id}")
+            player = runtime.players.get_or_create_player(user_id, f"User{user_id}")
         except Exception:
             player = None
 
     if not player:
         response = f"❌ Пользователь {text_input} не найден!"
     else:
+        await _flush_pending_logs(runtime)
         logs = runtime.db.get_user_logs(player.user_id, limit=15)
         response = f"👤 <b>Логи игрока @{player.username or player.user_id}</b>\n\n"
         if logs:
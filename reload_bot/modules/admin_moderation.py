@@ -363,8 +363,8 @@ async def handle_text_action(update: Update, context: ContextTypes.DEFAULT_TYPE,
         banned = runtime.db.is_user_banned(uid)
         gift_restriction = runtime.db.get_gift_restriction_info(uid)
         warns = runtime.db.get_warnings(uid, limit=50)
-        vip = runtime.db.is_vip(uid)
-        vip_plus = runtime.db.is_vip_plus(uid)
+        vip = runtime.players.is_vip(uid)
+        vip_plus = runtime.players.is_vip_plus(uid)
         username = getattr(player, "username", None) if player else None
         gift_status = "✅ Активен"
         if gift_restriction:
@@ -86,7 +86,7 @@ async def handle_callback(
             game_type, choice = parse_casino_game_choice(payload, CASINO_GAMES)
             if not game_type or choice is None:
                 raise ValueError("bad casino_choice payload")
-            player = runtime.db.get_or_create_player(
+            player = runtime.players.get_or_create_player(
                 query.from_user.id,
                 query.from_user.username or query.from_user.first_name,
             )
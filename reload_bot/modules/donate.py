@@ -14,7 +14,7 @@ async def show_donate_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, r
         return
     await query.answer()
     user = query.from_user
-    player = runtime.db.get_or_create_player(
+    player = runtime.players.get_or_create_player(
         user.id,
         username=getattr(user, "username", None),
         display_name=(getattr(user, "full_name", None) or getattr(user, "first_name", None)),
@@ -49,7 +49,7 @@ async def donate_send_invoice(update: Update, context: ContextTypes.DEFAULT_TYPE
         return
 
     user = query.from_user
-    player = runtime.db.get_or_create_player(
+    player = runtime.players.get_or_create_player(
         user.id,
         username=getattr(user, "username", None),
         display_name=(getattr(user, "full_name", None) or getattr(user, "first_name", None)),
@@ -98,7 +98,7 @@ async def donate_successful_payment(update: Update, context: ContextTypes.DEFAUL
     charge_id = str(payment.telegram_payment_charge_id or "")
     runtime.logger.info("[DONATE] user_id=%s donated %s stars (charge_id=%s)", user.id, amount, charge_id)
 
-    player = runtime.db.get_or_create_player(
+    player = runtime.players.get_or_create_player(
         user.id,
         username=getattr(user, "username", None),
         display_name=(getattr(user, "full_name", None) or getattr(user, "first_name", None)),
@@ -38,3 +38,9 @@ class BotRuntime:
     plantation_neg_event_duration_sec_default: int
     handlers: dict[str, AsyncHandler] = field(default_factory=dict)
     helpers: dict[str, SyncHelper] = field(default_factory=dict)
+    # Чтения игрока и доступа в рамках апдейта (core.update_context); без него — напрямую db
+    update_context: Any = None
+
+    @property
+    def players(self) -> Any:
+        return self.update_context if self.update_context is not None else self.db
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк журнала действий: --records вызовов log_action из --threads потоков
+(как из пула БД и хендлеров), файловая SQLite.
+
+Сравниваются:
+  * legacy   — прежний log_action: своя сессия и коммит на каждую запись;
+  * buffered — log_action кладёт запись в буфер, отдельный поток раз в --flush-ms
+               сбрасывает его одним executemany (как фоновый писатель ActionLogWriter).
+
+Пример запуска:
+    python scripts/bench_action_log.py --records 20000 --threads 8
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.bench_utils import format_latency_row, use_temp_database
+
+import core.database as db
+from core.database import ActionLog
+
+
+def legacy_log_action(user_id, username, action_type, action_details=None, amount=None, success=True):
+    dbs = db.SessionLocal()
+    try:
+        dbs.add(ActionLog(user_id=user_id, username=username, action_type=action_type,
+                          action_details=action_details, amount=amount, success=success))
+        dbs.commit()
+        return True
+    except Exception:
+        dbs.rollback()
+        return False
+    finally:
+        dbs.close()
+
+
+def burst(fn, records: int, threads: int) -> tuple[list[float], float]:
+    def one(n):
+        t0 = time.perf_counter()
+        fn(n % 5000, f"user{n % 5000}", "casino", f"bet:{n % 100}", amount=-(n % 100))
+        return time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = list(pool.map(one, range(records)))
+    return latencies, time.perf_counter() - t0
+
+
+def count_rows() -> int:
+    dbs = db.SessionLocal()
+    try:
+        return dbs.query(ActionLog).count()
+    finally:
+        dbs.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--flush-ms', type=float, default=200.0)
+    args = parser.parse_args()
+
+    path = use_temp_database()
+    try:
+        legacy_lat, legacy_wall = burst(legacy_log_action, args.records, args.threads)
+        legacy_rows = count_rows()
+
+        stop = threading.Event()
+
+        def writer():
+            while not stop.wait(args.flush_ms / 1000.0):
+                db.flush_action_log()
+
+        flusher = threading.Thread(target=writer, daemon=True)
+        flusher.start()
+        buffered_lat, buffered_wall = burst(db.log_action, args.records, args.threads)
+        stop.set()
+        flusher.join()
+        t0 = time.perf_counter()
+        db.flush_action_log()
+        drain_sec = time.perf_counter() - t0
+        buffered_rows = count_rows() - legacy_rows
+        stats = db.get_action_log_stats()
+    finally:
+        db.engine.dispose()
+        for suffix in ('', '-wal', '-shm'):
+            try:
+                os.remove(path + suffix)
+            except FileNotFoundError:
+                pass
+
+    print(f"records={args.records} threads={args.threads} flush_ms={args.flush_ms}")
+    print(f"{format_latency_row('legacy', legacy_lat)} wall={legacy_wall:.2f}s rows={legacy_rows}")
+    print(f"{format_latency_row('buffered', buffered_lat)} wall={buffered_wall:.2f}s rows={buffered_rows}")
+    print(f"final drain {drain_sec * 1000:.1f}ms; flushes={stats['flushes']} "
+          f"flushed={stats['flushed']} dropped={stats['dropped']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк задержки обработки апдейтов: синхронные вызовы БД в event loop
+против асинхронного шлюза core.db_async.
+
+Моделируется N одновременных пользователей. Каждый «апдейт» — это проверка бана
+и get_or_create_player, как в начале button_handler. Часть пользователей
+периодически запускает тяжёлую массовую продажу (sell_absolutely_all_but_one
+по большому инвентарю). Апдейты приходят по расписанию (open-loop), задержка
+считается от момента прихода до завершения обработки.
+
+Пример запуска:
+    python scripts/bench_async_db.py --users 200 --updates 5 --heavy-every 25 --rate 150
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.bench_utils import format_latency_row, use_temp_database
+
+import core.database as db
+import core.db_async as adb
+from core.database import EnergyDrink, InventoryItem, Player
+
+HEAVY_USER_BASE = 10_000_000
+
+
+def seed(users: int, heavy_users: int, heavy_rows: int) -> None:
+    dbs = db.SessionLocal()
+    try:
+        dbs.add_all([EnergyDrink(id=i, name=f"Drink {i}", description="bench") for i in range(1, heavy_rows + 1)])
+        dbs.add_all([Player(user_id=uid, username=f"user{uid}", coins=0) for uid in range(1, users + 1)])
+        for h in range(heavy_users):
+            uid = HEAVY_USER_BASE + h
+            dbs.add(Player(user_id=uid, username=f"heavy{h}", coins=0))
+            dbs.add_all([
+                InventoryItem(player_id=uid, drink_id=i, rarity='Basic', quantity=5)
+                for i in range(1, heavy_rows + 1)
+            ])
+        dbs.commit()
+    finally:
+        dbs.close()
+
+
+async def _light_update_sync(user_id: int) -> None:
+    db.get_active_ban(user_id)
+    db.get_or_create_player(user_id, username=f"user{user_id}")
+
+
+async def _light_update_async(user_id: int) -> None:
+    await adb.get_active_ban(user_id)
+    await adb.get_or_create_player(user_id, username=f"user{user_id}")
+
+
+async def _heavy_update_sync(heavy_id: int) -> None:
+    db.sell_absolutely_all_but_one(heavy_id)
+
+
+async def _heavy_update_async(heavy_id: int) -> None:
+    await adb.sell_absolutely_all_but_one(heavy_id)
+
+
+async def run_mode(mode: str, users: int, updates: int, heavy_every: int, rate: float, rng_seed: int) -> list[float]:
+    rng = random.Random(rng_seed)
+    light = _light_update_async if mode == 'gateway' else _light_update_sync
+    heavy = _heavy_update_async if mode == 'gateway' else _heavy_update_sync
+    schedule: list[tuple[float, str, int]] = []
+    total = users * updates
+    heavy_idx = 0
+    for n in range(total):
+        at = n / rate + rng.random() * 0.001
+        if heavy_every and n % heavy_every == heavy_every - 1:
+            schedule.append((at, 'heavy', HEAVY_USER_BASE + heavy_idx))
+            heavy_idx += 1
+        else:
+            schedule.append((at, 'light', rng.randint(1, users)))
+
+    latencies: list[float] = []
+    start = time.perf_counter()
+
+    async def _one(at: float, kind: str, target: int) -> None:
+        delay = at - (time.perf_counter() - start)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        arrived = start + at
+        if kind == 'heavy':
+            await heavy(target)
+        else:
+            await light(target)
+            latencies.append(time.perf_counter() - arrived)
+
+    await asyncio.gather(*(_one(*item) for item in schedule))
+    return latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--updates', type=int, default=5, help='апдейтов на пользователя')
+    parser.add_argument('--heavy-every', type=int, default=25, help='каждый N-й апдейт — массовая продажа')
+    parser.add_argument('--heavy-rows', type=int, default=1500, help='строк инвентаря у «тяжёлого» игрока')
+    parser.add_argument('--rate', type=float, default=150.0, help='апдейтов в секунду')
+    args = parser.parse_args()
+
+    heavy_needed = (args.users * args.updates) // max(1, args.heavy_every) + 1
+    results = {}
+    for mode in ('sync', 'gateway'):
+        path = use_temp_database()
+        try:
+            seed(args.users, heavy_needed, args.heavy_rows)
+            results[mode] = asyncio.run(run_mode(mode, args.users, args.updates, args.heavy_every, args.rate, 42))
+        finally:
+            adb.shutdown()
+            db.engine.dispose()
+            os.remove(path)
+
+    print(f"users={args.users} updates/user={args.updates} heavy_every={args.heavy_every} "
+          f"heavy_rows={args.heavy_rows} rate={args.rate}/s workers={adb.DB_EXECUTOR_WORKERS}")
+    print(format_latency_row('sync (in event loop)', results['sync']))
+    print(format_latency_row('gateway (db_async)', results['gateway']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк автоудаления: --messages созревших задач в --groups группах, задержка
+ответа Telegram --api-ms на запрос.
+
+Сравниваются:
+  * legacy — прежний auto_delete_message_job: на каждое сообщение своя задача, которая
+             читает get_group_settings из БД, вызывает deleteMessage и удаляет свою
+             строку scheduled_auto_deletes отдельным коммитом;
+  * single — AutoDeleteSweeper без deleteMessages (PTB 20.7): пачки по delete_at,
+             настройки групп из кэша, --concurrency параллельных deleteMessage, один DELETE;
+  * bulk   — то же с deleteMessages: до 100 сообщений чата за запрос.
+
+Пример запуска:
+    python scripts/bench_auto_delete.py --messages 20000 --groups 200
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.bench_utils import use_temp_database
+
+import core.database as db
+from core.database import GroupChat, ScheduledAutoDelete
+from reload_bot.auto_delete import AutoDeleteSweeper
+
+
+class _SingleBot:
+    def __init__(self, api_sec: float):
+        self.api_sec = api_sec
+        self.requests = 0
+
+    async def delete_message(self, chat_id, message_id):
+        self.requests += 1
+        await asyncio.sleep(self.api_sec)
+        return True
+
+
+class _BulkBot(_SingleBot):
+    async def delete_messages(self, chat_id, message_ids):
+        self.requests += 1
+        await asyncio.sleep(self.api_sec)
+        return True
+
+
+def seed(messages: int, groups: int) -> None:
+    rng = random.Random(1)
+    dbs = db.SessionLocal()
+    try:
+        if not dbs.query(GroupChat).count():
+            dbs.bulk_insert_mappings(GroupChat, [
+                {'chat_id': -1000 - g, 'title': f"group{g}", 'is_enabled': True,
+                 'auto_delete_enabled': g % 10 != 0, 'auto_delete_delay_minutes': 5}
+                for g in range(groups)
+            ])
+        dbs.bulk_insert_mappings(ScheduledAutoDelete, [
+            {'chat_id': -1000 - rng.randrange(groups), 'message_id': n + 1, 'delete_at': 1000 + rng.randint(0, 600)}
+            for n in range(messages)
+        ])
+        dbs.commit()
+    finally:
+        dbs.close()
+    db.invalidate_group_settings()
+
+
+def _uncached_group_settings(chat_id: int) -> dict:
+    dbs = db.SessionLocal()
+    try:
+        return db._group_settings_snapshot(dbs.query(GroupChat).filter(GroupChat.chat_id == chat_id).first())
+    finally:
+        dbs.close()
+
+
+async def legacy_run(bot: _SingleBot, concurrency: int) -> None:
+    rows = db.get_all_scheduled_auto_deletes()
+    queue = iter(rows)
+
+    async def job_runner():
+        # JobQueue выполняет созревшие задачи параллельно; каждая задача — полный цикл
+        for scheduled_id, chat_id, message_id, _ in queue:
+            settings = _uncached_group_settings(chat_id)
+            if settings.get('auto_delete_enabled'):
+                await bot.delete_message(chat_id=chat_id, message_id=message_id)
+            db.delete_scheduled_auto_delete(scheduled_id)
+
+    await asyncio.gather(*(job_runner() for _ in range(concurrency)))
+
+
+async def sweeper_run(bot, batch: int, concurrency: int) -> None:
+    sweeper = AutoDeleteSweeper(batch_size=batch, concurrency=concurrency, max_batches=10 ** 6)
+    await sweeper.sweep(bot, now=10 ** 6)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--groups', type=int, default=200)
+    parser.add_argument('--api-ms', type=float, default=5.0)
+    parser.add_argument('--batch', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+    api_sec = args.api_ms / 1000.0
+
+    path = use_temp_database()
+    rows = []
+    try:
+        for name, bot, run in (
+            ('legacy', _SingleBot(api_sec), lambda b: legacy_run(b, args.concurrency)),
+            ('single', _SingleBot(api_sec), lambda b: sweeper_run(b, args.batch, args.concurrency)),
+            ('bulk', _BulkBot(api_sec), lambda b: sweeper_run(b, args.batch, args.concurrency)),
+        ):
+            seed(args.messages, args.groups)
+            t0 = time.perf_counter()
+            asyncio.run(run(bot))
+            wall = time.perf_counter() - t0
+            left = db.SessionLocal()
+            try:
+                pending = left.query(ScheduledAutoDelete).count()
+            finally:
+                left.close()
+            rows.append((name, wall, bot.requests, pending))
+    finally:
+        db.engine.dispose()
+        for suffix in ('', '-wal', '-shm'):
+            try:
+                os.remove(path + suffix)
+            except FileNotFoundError:
+                pass
+
+    print(f"messages={args.messages} groups={args.groups} api_ms={args.api_ms} "
+          f"batch={args.batch} concurrency={args.concurrency}")
+    for name, wall, requests, pending in rows:
+        print(f"{name:<8} wall={wall:.2f}s api_requests={requests} rows_left={pending}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк пропускной способности автопоиска VIP (автопоисков в секунду).
+
+Синтетическая БД: --vips игроков с активным VIP и включённым автопоиском,
+каталог из --drinks энергетиков. Сравниваются:
+  * legacy  — прежний путь auto_search_job на каждого пользователя:
+              get_or_create_player, get_access_profile, get_auto_search_daily_limit
+              и apply_energy_search_outcome_atomic (своя транзакция на поиск);
+  * batch   — AutoSearchEngine: одно чтение состояния пачки, расчёт в памяти
+              и одна пишущая транзакция на пачку (--batch пользователей).
+Telegram не участвует: замеряется только расчёт и запись в БД.
+
+Пример запуска:
+    python scripts/bench_auto_search.py --vips 10000 --batch 200
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.bench_utils import format_latency_row, use_temp_database
+
+import core.database as db
+from core.auto_search_engine import AutoSearchEngine
+from core.constants import RARITIES, SEARCH_COOLDOWN
+from core.database import EnergyDrink, Player
+
+
+def seed(vips: int, drinks: int) -> None:
+    now_ts = int(time.time())
+    dbs = db.SessionLocal()
+    try:
+        dbs.add_all([EnergyDrink(name=f"Bench drink {i}", description="") for i in range(drinks)])
+        dbs.add_all([
+            Player(user_id=uid, username=f"vip{uid}", vip_until=now_ts + 86400,
+                   auto_search_enabled=True, auto_search_reset_ts=now_ts + 86400)
+            for uid in range(1, vips + 1)
+        ])
+        dbs.commit()
+    finally:
+        dbs.close()
+    db.invalidate_drink_catalog()
+
+
+def reset_last_search() -> None:
+    dbs = db.SessionLocal()
+    try:
+        dbs.query(Player).update({Player.last_search: 0, Player.auto_search_count: 0})
+        dbs.commit()
+    finally:
+        dbs.close()
+
+
+def legacy_search(user_id: int, rng: random.Random) -> bool:
+    """Один автопоиск в том виде, как его делал auto_search_job (без Telegram)."""
+    player = db.get_or_create_player(user_id, f"vip{user_id}")
+    access = db.get_access_profile(user_id, username=player.username, player=player)
+    daily_limit = db.get_auto_search_daily_limit(user_id, username=player.username)
+    cooldown = float(db.get_setting_int('search_cooldown', SEARCH_COOLDOWN)) * float(access['search_cooldown_mult'])
+    drink = db.pick_search_drink(set(), 1.0, rng=rng)
+    rarity = rng.choices(list(RARITIES), weights=list(RARITIES.values()), k=1)[0]
+    res = db.apply_energy_search_outcome_atomic(
+        user_id=user_id,
+        username=player.username,
+        search_ts=int(time.time()),
+        effective_cooldown=cooldown,
+        base_reward_coins=rng.randint(5, 10) * 2,
+        drops=[{"drink_id": int(drink.id), "rarity": rarity}],
+        auto_search_mode=True,
+        auto_search_daily_limit=daily_limit,
+    )
+    return bool(res.get('ok'))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--vips', type=int, default=10000)
+    parser.add_argument('--drinks', type=int, default=300)
+    parser.add_argument('--batch', type=int, default=200)
+    args = parser.parse_args()
+
+    path = use_temp_database()
+    try:
+        seed(args.vips, args.drinks)
+        user_ids = list(range(1, args.vips + 1))
+
+        rng = random.Random(1)
+        per_user = []
+        ok_legacy = 0
+        t0 = time.perf_counter()
+        for uid in user_ids:
+            t1 = time.perf_counter()
+            ok_legacy += legacy_search(uid, rng)
+            per_user.append(time.perf_counter() - t1)
+        legacy_total = time.perf_counter() - t0
+
+        reset_last_search()
+        engine = AutoSearchEngine(rng=random.Random(1))
+        per_batch = []
+        ok_batch = 0
+        t0 = time.perf_counter()
+        for i in range(0, len(user_ids), args.batch):
+            t1 = time.perf_counter()
+            results = engine.run(user_ids[i:i + args.batch])
+            per_batch.append(time.perf_counter() - t1)
+            ok_batch += sum(1 for r in results.values() if r['status'] == 'ok')
+        batch_total = time.perf_counter() - t0
+    finally:
+        db.engine.dispose()
+        os.remove(path)
+
+    print(f"vips={args.vips} drinks={args.drinks} batch={args.batch}")
+    print(format_latency_row('legacy per user', per_user) + f" ok={ok_legacy}")
+    print(format_latency_row(f'batch of {args.batch}', per_batch) + f" ok={ok_batch}")
+    print(f"throughput: legacy={ok_legacy / legacy_total:.0f}/s batch={ok_batch / batch_total:.0f}/s "
+          f"speedup x{(ok_batch / batch_total) / max(ok_legacy / legacy_total, 1e-9):.1f}")
+
+
+if __name__ == '__main__':
+    main()
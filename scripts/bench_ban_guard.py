@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Микро-бенчмарк пути глобального ban guard: проверка бана на каждом апдейте.
+
+Сравниваются прежняя проверка (сессия SQLite + is_protected_user + выборка
+UserBan на каждый вызов) и индекс банов в памяти core.database.get_active_ban.
+Поток апдейтов смешанный: доля --banned-share приходит от забаненных,
+часть банов временные и истекают по ходу замера.
+
+Пример запуска:
+    python scripts/bench_ban_guard.py --players 5000 --bans 500 --calls 20000
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.bench_utils import format_latency_row, use_temp_database
+
+import core.database as db
+from core.database import Player, UserBan
+
+
+def legacy_get_active_ban(user_id: int) -> dict | None:
+    """Проверка бана в том виде, в каком она была до индекса."""
+    dbs = db.SessionLocal()
+    try:
+        if db.is_protected_user(int(user_id)):
+            return None
+        now_ts = int(time.time())
+        rec = dbs.query(UserBan).filter(UserBan.user_id == int(user_id)).first()
+        if not rec:
+            return None
+        until = rec.banned_until
+        if until is None or int(until) > now_ts:
+            return db._ban_row_to_dict(rec)
+        return None
+    finally:
+        dbs.close()
+
+
+def seed(players: int, bans: int) -> list[int]:
+    now_ts = int(time.time())
+    dbs = db.SessionLocal()
+    try:
+        dbs.add_all([Player(user_id=uid, username=f"user{uid}", coins=0) for uid in range(1, players + 1)])
+        banned = random.Random(7).sample(range(1, players + 1), bans)
+        for n, uid in enumerate(banned):
+            # Каждый третий бан временный, часть из них истекает во время замера
+            until = now_ts + (n % 5) if n % 3 == 0 else None
+            dbs.add(UserBan(user_id=uid, reason="bench", banned_at=now_ts, banned_until=until))
+        dbs.commit()
+        return banned
+    finally:
+        dbs.close()
+
+
+def run(check, stream: list[int]) -> tuple[list[float], int]:
+    latencies = []
+    hits = 0
+    for uid in stream:
+        t0 = time.perf_counter()
+        if check(uid):
+            hits += 1
+        latencies.append(time.perf_counter() - t0)
+    return latencies, hits
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--players', type=int, default=5000)
+    parser.add_argument('--bans', type=int, default=500)
+    parser.add_argument('--calls', type=int, default=20000)
+    parser.add_argument('--banned-share', type=float, default=0.05, help='доля апдейтов от забаненных')
+    args = parser.parse_args()
+
+    path = use_temp_database()
+    try:
+        banned = seed(args.players, args.bans)
+        rng = random.Random(42)
+        stream = [
+            rng.choice(banned) if rng.random() < args.banned_share else rng.randint(1, args.players)
+            for _ in range(args.calls)
+        ]
+        legacy, legacy_hits = run(legacy_get_active_ban, stream)
+        t0 = time.perf_counter()
+        loaded = db.load_ban_index()
+        load_ms = (time.perf_counter() - t0) * 1000.0
+        indexed, indexed_hits = run(db.get_active_ban, stream)
+    finally:
+        db.engine.dispose()
+        os.remove(path)
+
+    print(f"players={args.players} bans={args.bans} calls={args.calls} banned_share={args.banned_share}")
+    print(f"index load: {loaded} active bans in {load_ms:.2f}ms")
+    print(format_latency_row('legacy (SQLite)', legacy) + f" hits={legacy_hits}")
+    print(format_latency_row('ban index', indexed) + f" hits={indexed_hits}")
+    print(f"total: legacy={sum(legacy):.3f}s index={sum(indexed):.3f}s "
+          f"speedup x{sum(legacy) / max(sum(indexed), 1e-9):.1f}")
+
+
+if __name__ == '__main__':
+    main()
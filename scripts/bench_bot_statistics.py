@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк открытия экрана аналитики админ-панели.
+
+Синтетическая БД: --players игроков, у каждого --items позиций инвентаря.
+Сравниваются:
+  * legacy — прежний show_admin_analytics: get_bot_statistics (десяток COUNT/SUM),
+             get_boost_statistics и жадно вычисляемые «запасные» get_total_*/get_active_*;
+  * cold   — снимок get_bot_statistics(max_age=0): два агрегирующих прохода и топы;
+  * warm   — повторное открытие в пределах TTL (чтение снимка из памяти).
+
+Пример запуска:
+    python scripts/bench_bot_statistics.py --players 100000 --items 5
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.bench_utils import format_latency_row, use_temp_database
+
+import core.database as db
+from core.database import EnergyDrink, InventoryItem, Player, PurchaseReceipt
+from sqlalchemy import func
+
+
+def seed(players: int, items: int) -> None:
+    rng = random.Random(1)
+    now_ts = int(time.time())
+    dbs = db.SessionLocal()
+    try:
+        dbs.add_all([EnergyDrink(id=i, name=f"Drink {i}", description="") for i in range(1, 101)])
+        dbs.bulk_insert_mappings(Player, [
+            {'user_id': uid, 'username': f"user{uid}", 'coins': rng.randint(0, 100000),
+             'last_search': now_ts - rng.randint(0, 30 * 86400), 'vip_until': now_ts + rng.choice((-1, 1)) * 3600}
+            for uid in range(1, players + 1)
+        ])
+        dbs.bulk_insert_mappings(InventoryItem, [
+            {'player_id': uid, 'drink_id': d, 'rarity': 'Basic', 'quantity': rng.randint(1, 20)}
+            for uid in range(1, players + 1) for d in range(1, items + 1)
+        ])
+        dbs.bulk_insert_mappings(PurchaseReceipt, [
+            {'user_id': rng.randint(1, players), 'kind': 'bench', 'purchased_at': now_ts - rng.randint(0, 7 * 86400)}
+            for _ in range(players // 10)
+        ])
+        dbs.commit()
+    finally:
+        dbs.close()
+
+
+def legacy_statistics() -> dict:
+    """Прежний get_bot_statistics: отдельный COUNT/SUM на каждый счётчик."""
+    dbs = db.SessionLocal()
+    try:
+        now_ts = int(time.time())
+        day_ago, week_ago = now_ts - 86400, now_ts - 604800
+        stats = {
+            'total_users': dbs.query(Player).count(),
+            'total_drinks': dbs.query(EnergyDrink).count(),
+            'total_inventory_items': dbs.query(func.sum(InventoryItem.quantity)).scalar() or 0,
+            'total_coins': dbs.query(func.sum(Player.coins)).scalar() or 0,
+            'active_vip': dbs.query(Player).filter(Player.vip_until > now_ts).count(),
+            'active_vip_plus': dbs.query(Player).filter(Player.vip_plus_until > now_ts).count(),
+            'active_today': dbs.query(Player).filter(Player.last_search > day_ago).count(),
+            'active_week': dbs.query(Player).filter(Player.last_search > week_ago).count(),
+            'total_purchases': dbs.query(PurchaseReceipt).count(),
+            'purchases_today': dbs.query(PurchaseReceipt).filter(PurchaseReceipt.purchased_at > day_ago).count(),
+        }
+        dbs.query(Player).order_by(Player.coins.desc()).limit(10).all()
+        (
+            dbs.query(Player.user_id, Player.username, func.sum(InventoryItem.quantity))
+            .join(InventoryItem, Player.user_id == InventoryItem.player_id)
+            .group_by(Player.user_id, Player.username)
+            .order_by(func.sum(InventoryItem.quantity).desc())
+            .limit(10)
+            .all()
+        )
+        return stats
+    finally:
+        dbs.close()
+
+
+def legacy_analytics_screen() -> None:
+    legacy_statistics()
+    db.get_boost_statistics()
+    # Значения по умолчанию в stats.get(...) вычислялись всегда
+    db.get_total_users_count()
+    db.get_total_drinks_count()
+    db.get_total_inventory_items()
+    db.get_total_coins_in_system()
+    db.get_active_vip_count()
+    db.get_active_vip_plus_count()
+    db.get_active_users_today()
+    db.get_active_users_week()
+    db.get_active_promo_count()
+    db.get_banned_users_count()
+
+
+def measure(fn, runs: int) -> list[float]:
+    out = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        out.append(time.perf_counter() - t0)
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--players', type=int, default=100000)
+    parser.add_argument('--items', type=int, default=5)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    path = use_temp_database()
+    try:
+        seed(args.players, args.items)
+        legacy = measure(legacy_analytics_screen, args.runs)
+        cold = measure(lambda: db.get_bot_statistics(max_age=0), args.runs)
+        warm = measure(db.get_bot_statistics, args.runs * 100)
+    finally:
+        db.engine.dispose()
+        for suffix in ('', '-wal', '-shm'):
+            try:
+                os.remove(path + suffix)
+            except FileNotFoundError:
+                pass
+
+    print(f"players={args.players} inventory_rows={args.players * args.items}")
+    print(format_latency_row('legacy screen', legacy))
+    print(format_latency_row('snapshot cold', cold))
+    print(format_latency_row('snapshot warm', warm))
+
+
+if __name__ == '__main__':
+    main()
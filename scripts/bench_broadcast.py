@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк рассылки на локальном фейковом Bot (сообщений в секунду).
+
+Фейковый Bot отвечает с задержкой --latency (сетевой RTT до Bot API) и, как
+Telegram, ограничивает скорость: больше --limit сообщений за скользящую
+секунду — RetryAfter. Сравниваются:
+  * legacy  — прежний цикл handle_admin_broadcast: по одному сообщению
+              и asyncio.sleep(0.05) после каждого (на --legacy-users получателях);
+  * engine  — BroadcastEngine: задание в БД, общий TokenBucket на --rate сообщений/сек
+              и --concurrency параллельных отправителей.
+Печатаются устойчивая скорость, число RetryAfter и задержки отправки.
+
+Пример запуска:
+    python scripts/bench_broadcast.py --users 2000 --latency 0.05 --limit 30 --rate 28
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import collections
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.bench_utils import format_latency_row, use_temp_database
+
+from telegram.error import RetryAfter
+
+import core.database as db
+import core.db_async as adb
+from core.database import Player
+from reload_bot.broadcast import BroadcastEngine, TokenBucket
+
+
+class FakeBot:
+    """Bot API с задержкой ответа и лимитом сообщений за скользящую секунду."""
+
+    def __init__(self, latency: float, limit: int):
+        self.latency = latency
+        self.limit = limit
+        self.window = collections.deque()
+        self.latencies: list[float] = []
+        self.delivered = 0
+        self.flood_errors = 0
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        t0 = time.perf_counter()
+        await asyncio.sleep(self.latency)
+        now = time.monotonic()
+        while self.window and now - self.window[0] > 1.0:
+            self.window.popleft()
+        if len(self.window) >= self.limit:
+            self.flood_errors += 1
+            raise RetryAfter(1)
+        self.window.append(now)
+        self.delivered += 1
+        self.latencies.append(time.perf_counter() - t0)
+
+
+def seed(users: int) -> None:
+    dbs = db.SessionLocal()
+    try:
+        dbs.add_all([Player(user_id=uid, username=f"user{uid}") for uid in range(1, users + 1)])
+        dbs.commit()
+    finally:
+        dbs.close()
+
+
+async def run_legacy(bot: FakeBot, users: int) -> float:
+    recipients = db.get_all_users_for_broadcast(limit=users)
+    t0 = time.perf_counter()
+    for uid in recipients:
+        try:
+            await bot.send_message(chat_id=uid, text="bench", parse_mode='HTML')
+        except Exception:
+            pass
+        await asyncio.sleep(0.05)
+    return time.perf_counter() - t0
+
+
+async def run_engine(bot: FakeBot, rate: float, concurrency: int, page_size: int) -> tuple[float, dict]:
+    job, _ = db.create_broadcast_job(1, 1, 'text', "bench")
+    engine = BroadcastEngine(bot, bucket=TokenBucket(rate), concurrency=concurrency, page_size=page_size)
+    t0 = time.perf_counter()
+    final = await engine.run(job['id'])
+    return time.perf_counter() - t0, final
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--legacy-users', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05, help='задержка ответа Bot API, сек')
+    parser.add_argument('--limit', type=int, default=30, help='лимит фейкового Telegram, сообщений/сек')
+    parser.add_argument('--rate', type=float, default=28)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--page-size', type=int, default=200)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    path = use_temp_database()
+    try:
+        seed(args.users)
+        legacy_bot = FakeBot(args.latency, args.limit)
+        legacy_total = asyncio.run(run_legacy(legacy_bot, args.legacy_users))
+        engine_bot = FakeBot(args.latency, args.limit)
+        engine_total, final = asyncio.run(run_engine(engine_bot, args.rate, args.concurrency, args.page_size))
+    finally:
+        adb.shutdown()
+        db.engine.dispose()
+        for suffix in ('', '-wal', '-shm'):
+            try:
+                os.remove(path + suffix)
+            except FileNotFoundError:
+                pass
+
+    print(f"users={args.users} latency={args.latency}s limit={args.limit}/s rate={args.rate}/s "
+          f"concurrency={args.concurrency}")
+    print(format_latency_row('legacy send', legacy_bot.latencies)
+          + f" sent={legacy_bot.delivered} flood={legacy_bot.flood_errors} "
+          f"throughput={legacy_bot.delivered / legacy_total:.1f}/s")
+    print(format_latency_row('engine send', engine_bot.latencies)
+          + f" sent={final['sent']} flood={engine_bot.flood_errors} "
+          f"throughput={final['sent'] / engine_total:.1f}/s")
+    print(f"100k users: legacy ~{100000 / max(legacy_bot.delivered / legacy_total, 1e-9) / 60:.0f} min, "
+          f"engine ~{100000 / max(final['sent'] / engine_total, 1e-9) / 60:.0f} min")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк диспетчеризации inline-кнопок button_handler.
+
+Сравнивает прежнюю схему (последовательные data == ... / data.startswith(...)
+в порядке цепочки if/elif плюс get_required_level_for_callback на каждый клик)
+и CallbackRouter (dict точных ключей + префиксное дерево, уровень доступа
+за тот же проход). Прогоняются все зарегистрированные callback-строки;
+для префиксов добавляется параметр, как в реальных кнопках.
+
+Нужен рабочий core/config.py (Bot_new импортируется целиком, бот не запускается).
+
+Пример запуска:
+    python scripts/bench_callback_router.py --rounds 200
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.bench_utils import percentile
+
+import Bot_new
+from modules.admin.admin_permissions import get_required_level_for_callback
+
+
+def build_linear_dispatch(router):
+    """Эквивалент старой цепочки: проверки по одной в порядке регистрации."""
+    checks = [(kind == "prefix", key, route) for kind, key, route in router.routes()]
+
+    def dispatch(data: str):
+        level = get_required_level_for_callback(data)
+        for is_prefix, key, route in checks:
+            if (data.startswith(key) if is_prefix else data == key):
+                return route, level
+        return None, level
+
+    return dispatch
+
+
+def sample_callbacks(router) -> list[str]:
+    out = []
+    for kind, key, _ in router.routes():
+        out.append(key + "123" if kind == "prefix" else key)
+    return out
+
+
+def measure(fn, samples: list[str], rounds: int) -> list[float]:
+    per_call = []
+    for data in samples:
+        t0 = time.perf_counter()
+        for _ in range(rounds):
+            fn(data)
+        per_call.append((time.perf_counter() - t0) / rounds)
+    return per_call
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=200, help='повторов на каждую callback-строку')
+    args = parser.parse_args()
+
+    router = Bot_new.build_callback_router()
+    samples = sample_callbacks(router)
+    linear = build_linear_dispatch(router)
+    for data in samples:
+        assert linear(data)[0] is router.resolve(data)[0], data
+
+    results = {
+        'if/elif chain': measure(linear, samples, args.rounds),
+        'CallbackRouter': measure(router.resolve, samples, args.rounds),
+    }
+    print(f"callbacks={len(samples)} rounds={args.rounds}")
+    for label, values in results.items():
+        us = [v * 1e6 for v in values]
+        print(f"{label:<16} mean={sum(us) / len(us):7.2f}us p50={percentile(us, 50):7.2f}us "
+              f"p99={percentile(us, 99):7.2f}us max={max(us):7.2f}us")
+
+
+if __name__ == '__main__':
+    main()
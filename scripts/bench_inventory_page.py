@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк перелистывания инвентаря коллекционера (--rows позиций, --per-page на странице).
+
+Сравниваются:
+  * legacy — прежний show_inventory: get_player_inventory_with_details (все InventoryItem
+             с joinedload напитка), сортировка в Python по RARITY_ORDER и названию, срез страницы;
+  * cold   — get_inventory_page без кэша: COUNT + ORDER BY/LIMIT/OFFSET в SQL;
+  * warm   — повторное открытие недавно просмотренных страниц (проверка версии + кэш в памяти;
+             на игрока держится до _InventoryPages.MAX_PAGES_PER_USER страниц).
+
+Пример запуска:
+    python scripts/bench_inventory_page.py --rows 3000
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.bench_utils import format_latency_row, use_temp_database
+
+import core.database as db
+from core.constants import RARITY_ORDER
+from core.database import EnergyDrink, InventoryItem, Player
+
+
+def seed(rows: int) -> None:
+    rng = random.Random(1)
+    dbs = db.SessionLocal()
+    try:
+        dbs.add(Player(user_id=1, username="collector"))
+        drinks = max(1, rows // len(RARITY_ORDER) + 1)
+        dbs.bulk_insert_mappings(EnergyDrink, [
+            {'id': i, 'name': f"{rng.choice(('Энерго', 'Burn', 'Адреналин', 'Monster'))} {i}", 'description': ""}
+            for i in range(1, drinks + 1)
+        ])
+        dbs.bulk_insert_mappings(InventoryItem, [
+            {'player_id': 1, 'drink_id': 1 + n // len(RARITY_ORDER), 'rarity': RARITY_ORDER[n % len(RARITY_ORDER)],
+             'quantity': rng.randint(1, 30)}
+            for n in range(rows)
+        ])
+        dbs.commit()
+    finally:
+        dbs.close()
+
+
+def legacy_page(page: int, per_page: int) -> list:
+    items = db.get_player_inventory_with_details(1)
+    ordered = sorted(
+        items,
+        key=lambda i: (
+            RARITY_ORDER.index(i.rarity) if i.rarity in RARITY_ORDER else len(RARITY_ORDER),
+            i.drink.name.lower(),
+        ),
+    )
+    return ordered[(page - 1) * per_page: page * per_page]
+
+
+def measure(fn, pages: list[int]) -> list[float]:
+    out = []
+    for page in pages:
+        t0 = time.perf_counter()
+        fn(page)
+        out.append(time.perf_counter() - t0)
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=3000)
+    parser.add_argument('--per-page', type=int, default=10)
+    parser.add_argument('--runs', type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(2)
+    path = use_temp_database()
+    try:
+        seed(args.rows)
+        total_pages = (args.rows + args.per_page - 1) // args.per_page
+        pages = [rng.randint(1, total_pages) for _ in range(args.runs)]
+
+        def cold(page):
+            db.invalidate_inventory_pages()
+            db.get_inventory_page(1, page, args.per_page)
+
+        rows = [
+            ('legacy', measure(lambda page: legacy_page(page, args.per_page), pages)),
+            ('cold', measure(cold, pages)),
+        ]
+        recent = pages[:db._InventoryPages.MAX_PAGES_PER_USER // 2]
+        for page in recent:
+            db.get_inventory_page(1, page, args.per_page)
+        warm_pages = [rng.choice(recent) for _ in range(args.runs)]
+        rows.append(('warm', measure(lambda page: db.get_inventory_page(1, page, args.per_page), warm_pages)))
+    finally:
+        db.engine.dispose()
+        for suffix in ('', '-wal', '-shm'):
+            try:
+                os.remove(path + suffix)
+            except FileNotFoundError:
+                pass
+
+    print(f"inventory_rows={args.rows} per_page={args.per_page}")
+    for name, lat in rows:
+        print(format_latency_row(name, lat))
+
+
+if __name__ == '__main__':
+    main()
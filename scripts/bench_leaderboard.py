@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк лидербордов на большой БД (по умолчанию 100k игроков × 5 = 500k строк инвентаря).
+
+Сравниваются:
+  * legacy top   — прежний get_leaderboard: JOIN players × inventory_items, SUM по игроку,
+                   анти-JOIN user_bans на каждый вызов /leaderboard;
+  * legacy rank  — «моё место» тем же способом: сколько игроков с суммой больше моей;
+  * top / rank   — лидерборды в памяти (после одной полной загрузки);
+  * write+sync   — изменение монет и инвентаря одного игрока и применение журнала
+                   leaderboard_changes перед следующим запросом.
+
+Пример запуска:
+    python scripts/bench_leaderboard.py --players 100000 --items 5
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.bench_utils import format_latency_row, use_temp_database
+
+from sqlalchemy import and_, func, or_
+
+import core.database as db
+from core.database import EnergyDrink, InventoryItem, Player, UserBan
+
+
+def seed(players: int, items: int) -> None:
+    rng = random.Random(1)
+    dbs = db.SessionLocal()
+    try:
+        dbs.add_all([EnergyDrink(id=i, name=f"Drink {i}", description="") for i in range(1, items + 1)])
+        dbs.bulk_insert_mappings(Player, [
+            {'user_id': uid, 'username': f"user{uid}", 'coins': rng.randint(0, 10 ** 6)}
+            for uid in range(1, players + 1)
+        ])
+        dbs.bulk_insert_mappings(InventoryItem, [
+            {'player_id': uid, 'drink_id': d, 'rarity': 'Basic', 'quantity': rng.randint(1, 50)}
+            for uid in range(1, players + 1) for d in range(1, items + 1)
+        ])
+        dbs.commit()
+        # Журнал от начального наполнения не нужен: лидерборды загрузятся целиком
+        dbs.query(db.LeaderboardChange).delete()
+        dbs.commit()
+    finally:
+        dbs.close()
+
+
+def _legacy_totals_query(dbs, now_ts):
+    return (
+        dbs.query(Player.user_id, func.sum(InventoryItem.quantity).label('total'))
+        .join(InventoryItem, Player.user_id == InventoryItem.player_id)
+        .outerjoin(UserBan, and_(UserBan.user_id == Player.user_id,
+                                 or_(UserBan.banned_until == None, UserBan.banned_until > now_ts)))  # noqa: E711
+        .filter(UserBan.user_id == None)  # noqa: E711
+        .group_by(Player.user_id)
+    )
+
+
+def legacy_top() -> list:
+    dbs = db.SessionLocal()
+    try:
+        q = _legacy_totals_query(dbs, int(time.time()))
+        return q.order_by(func.sum(InventoryItem.quantity).desc()).limit(10).all()
+    finally:
+        dbs.close()
+
+
+def legacy_rank(user_id: int) -> int:
+    dbs = db.SessionLocal()
+    try:
+        mine = dbs.query(func.sum(InventoryItem.quantity)).filter(InventoryItem.player_id == user_id).scalar() or 0
+        sub = _legacy_totals_query(dbs, int(time.time())).subquery()
+        return int(dbs.query(func.count()).select_from(sub).filter(sub.c.total > mine).scalar() or 0) + 1
+    finally:
+        dbs.close()
+
+
+def measure(fn, runs: int) -> list[float]:
+    out = []
+    for i in range(runs):
+        t0 = time.perf_counter()
+        fn(i)
+        out.append(time.perf_counter() - t0)
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--players', type=int, default=100000)
+    parser.add_argument('--items', type=int, default=5)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(2)
+    path = use_temp_database()
+    try:
+        seed(args.players, args.items)
+        rows = [
+            ('legacy top', measure(lambda i: legacy_top(), args.runs)),
+            ('legacy rank', measure(lambda i: legacy_rank(rng.randint(1, args.players)), args.runs)),
+        ]
+        t0 = time.perf_counter()
+        db.sync_leaderboards()
+        print(f"full load: {(time.perf_counter() - t0) * 1000:.0f}ms")
+        rows.append(('top', measure(lambda i: db.get_leaderboard(), args.runs * 100)))
+        rows.append(('rank', measure(lambda i: db.get_leaderboard_rank(rng.randint(1, args.players)), args.runs * 100)))
+
+        def write_and_sync(i):
+            uid = rng.randint(1, args.players)
+            db.update_player(uid, coins=rng.randint(0, 10 ** 6))
+            dbs = db.SessionLocal()
+            try:
+                dbs.query(InventoryItem).filter(InventoryItem.player_id == uid, InventoryItem.drink_id == 1).update(
+                    {InventoryItem.quantity: InventoryItem.quantity + 1}
+                )
+                dbs.commit()
+            finally:
+                dbs.close()
+            db.get_leaderboard_rank(uid)
+
+        rows.append(('write+sync', measure(write_and_sync, args.runs * 20)))
+    finally:
+        db.engine.dispose()
+        for suffix in ('', '-wal', '-shm'):
+            try:
+                os.remove(path + suffix)
+            except FileNotFoundError:
+                pass
+
+    print(f"players={args.players} inventory_rows={args.players * args.items}")
+    for name, lat in rows:
+        print(format_latency_row(name, lat))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк восстановления напоминаний о поливе после рестарта: --beds растущих грядок.
+
+Сравниваются:
+  * legacy  — прежний restore_plantation_reminders: get_all_active_beds_for_reminders и
+              для каждой грядки get_jobs_by_name (перебор всех задач JobQueue) + run_once.
+              JobQueue здесь — список задач с тем же линейным поиском по имени, что
+              у JobQueue.get_jobs_by_name; восстановление квадратично, поэтому замеряется
+              на первых --legacy-beds грядках;
+  * service — PlantationReminders.restore(): один запрос get_plantation_reminders_due и heapify;
+  * fire    — pop_due пачками по --batch и перенос каждой грядки на следующий полив.
+
+Пример запуска:
+    python scripts/bench_plantation_reminders.py --beds 100000
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.bench_utils import format_latency_row, use_temp_database
+
+import core.database as db
+from core.database import PlantationBed, Player, SeedType
+from modules.plantation.reminders import PlantationReminders
+
+
+class _NamedJob:
+    __slots__ = ('name', 'when', 'removed')
+
+    def __init__(self, name: str, when: float):
+        self.name = name
+        self.when = when
+        self.removed = False
+
+    def schedule_removal(self) -> None:
+        self.removed = True
+
+
+class _ListJobQueue:
+    """Минимальная модель JobQueue: run_once добавляет задачу, get_jobs_by_name перебирает все."""
+
+    def __init__(self):
+        self._jobs: list[_NamedJob] = []
+
+    def get_jobs_by_name(self, name: str) -> tuple:
+        return tuple(job for job in self._jobs if not job.removed and job.name == name)
+
+    def run_once(self, callback, when: float, chat_id: int, data: dict, name: str) -> _NamedJob:
+        job = _NamedJob(name, when)
+        self._jobs.append(job)
+        return job
+
+
+def seed(beds: int, per_player: int) -> None:
+    rng = random.Random(1)
+    now_ts = int(time.time())
+    players = (beds + per_player - 1) // per_player
+    dbs = db.SessionLocal()
+    try:
+        dbs.add(SeedType(id=1, name="Bench seed", water_interval_sec=1800))
+        dbs.bulk_insert_mappings(Player, [
+            {'user_id': uid, 'username': f"farmer{uid}", 'remind_plantation': True}
+            for uid in range(1, players + 1)
+        ])
+        dbs.bulk_insert_mappings(PlantationBed, [
+            {'owner_id': 1 + n // per_player, 'bed_index': 1 + n % per_player, 'state': 'growing',
+             'seed_type_id': 1, 'planted_at': now_ts - 3600, 'last_watered_at': now_ts - rng.randint(0, 3600)}
+            for n in range(beds)
+        ])
+        dbs.commit()
+    finally:
+        dbs.close()
+
+
+def legacy_restore(limit: int) -> int:
+    jq = _ListJobQueue()
+    now_ts = int(time.time())
+    for bed in db.get_all_active_beds_for_reminders()[:limit]:
+        name = f"plantation_water_reminder_{bed['user_id']}_{bed['bed_index']}"
+        for job in jq.get_jobs_by_name(name):
+            job.schedule_removal()
+        jq.run_once(None, when=max(1, bed['next_water_ts'] - now_ts), chat_id=bed['user_id'],
+                    data={'bed_index': bed['bed_index']}, name=name)
+    return len(jq._jobs)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--beds', type=int, default=100000)
+    parser.add_argument('--per-player', type=int, default=5)
+    parser.add_argument('--legacy-beds', type=int, default=10000)
+    parser.add_argument('--batch', type=int, default=40)
+    args = parser.parse_args()
+
+    path = use_temp_database()
+    try:
+        seed(args.beds, args.per_player)
+
+        legacy_n = min(args.legacy_beds, args.beds)
+        t0 = time.perf_counter()
+        legacy_restore(legacy_n)
+        legacy_sec = time.perf_counter() - t0
+
+        timers = PlantationReminders(batch_size=args.batch)
+        t0 = time.perf_counter()
+        restored = timers.restore()
+        restore_sec = time.perf_counter() - t0
+
+        # Все сроки в пределах часа: «прокручиваем» время и отправляем всё пачками
+        fire = []
+        now = time.time() + 3600
+        while True:
+            t1 = time.perf_counter()
+            batch = timers.pop_due(now)
+            for user_id, bed_index in batch:
+                timers.schedule_in(user_id, bed_index, 1800, now=now)
+            if not batch:
+                break
+            fire.append(time.perf_counter() - t1)
+        t0 = time.perf_counter()
+        flushed = timers.flush()
+        flush_sec = time.perf_counter() - t0
+    finally:
+        db.engine.dispose()
+        for suffix in ('', '-wal', '-shm'):
+            try:
+                os.remove(path + suffix)
+            except FileNotFoundError:
+                pass
+
+    print(f"beds={args.beds} per_player={args.per_player} batch={args.batch}")
+    print(f"legacy restore of {legacy_n} beds: {legacy_sec:.2f}s "
+          f"(~{legacy_sec * (args.beds / legacy_n) ** 2:.0f}s extrapolated to {args.beds}, quadratic)")
+    print(f"service restore of {restored} beds: {restore_sec:.2f}s")
+    print(format_latency_row(f'fire batch of {args.batch}', fire))
+    print(f"flush of {flushed} due times: {flush_sec:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
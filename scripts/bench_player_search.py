@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк поиска игроков (админ-поиск, поиск друзей, получатель подарка) на --players игроках.
+
+Сравниваются:
+  * legacy exact   — func.lower(Player.username) == ... (полное сканирование players);
+  * legacy partial — func.lower(Player.username).contains(...) с COUNT и страницей;
+  * exact          — find_player_by_identifier по индексу ix_players_username_lower;
+  * partial        — search_players_by_username через FTS5 trigram (player_search);
+  * legacy display — прежний путь find_player_by_identifier для части display_name
+                     (три сканирования: точное имя, ник, имя);
+  * display        — то же через FTS5: по редкой части имени и по частой («ван »),
+                     совпадающей с ~1/8 игроков.
+
+Пример запуска:
+    python scripts/bench_player_search.py --players 1000000
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.bench_utils import format_latency_row, use_temp_database
+
+from sqlalchemy import func
+
+import core.database as db
+from core.database import Player
+
+FIRST_NAMES = ("Иван", "Мария", "Alex", "Kate", "Дмитрий", "Olga", "Sam", "Анна")
+
+
+def seed(players: int) -> tuple[list[str], list[str]]:
+    rng = random.Random(1)
+    names, displays = [], []
+    dbs = db.SessionLocal()
+    try:
+        batch = []
+        for uid in range(1, players + 1):
+            uname = ''.join(rng.choices(string.ascii_letters + string.digits + '_', k=rng.randint(6, 14)))
+            display = f"{rng.choice(FIRST_NAMES)} {''.join(rng.choices(string.ascii_lowercase, k=6))}"
+            names.append(uname)
+            displays.append(display)
+            # Как в реальной базе: примерно у трети игроков нет @username
+            batch.append({'user_id': uid, 'username': uname if uid % 3 else None, 'display_name': display})
+            if len(batch) >= 50000:
+                dbs.bulk_insert_mappings(Player, batch)
+                batch = []
+        if batch:
+            dbs.bulk_insert_mappings(Player, batch)
+        dbs.commit()
+    finally:
+        dbs.close()
+    return names, displays
+
+
+def legacy_exact(uname: str):
+    dbs = db.SessionLocal()
+    try:
+        return dbs.query(Player).filter(func.lower(Player.username) == uname.lower()).first()
+    finally:
+        dbs.close()
+
+
+def legacy_partial(needle: str):
+    dbs = db.SessionLocal()
+    try:
+        base = dbs.query(Player).filter(Player.username.isnot(None)).filter(func.lower(Player.username).contains(needle.lower()))
+        base.count()
+        return base.order_by(func.lower(Player.username).asc(), Player.user_id.asc()).limit(5).all()
+    finally:
+        dbs.close()
+
+
+def legacy_display(needle: str):
+    dbs = db.SessionLocal()
+    try:
+        low = needle.lower()
+        dbs.query(Player).filter(Player.display_name.isnot(None)).filter(func.lower(Player.display_name) == low).first()
+        dbs.query(Player).filter(Player.username.isnot(None)).filter(func.lower(Player.username).contains(low)).limit(6).all()
+        return (
+            dbs.query(Player).filter(Player.display_name.isnot(None))
+            .filter(func.lower(Player.display_name).contains(low))
+            .order_by(Player.user_id.asc()).limit(6).all()
+        )
+    finally:
+        dbs.close()
+
+
+def measure(fn, args: list) -> list[float]:
+    out = []
+    for arg in args:
+        t0 = time.perf_counter()
+        fn(arg)
+        out.append(time.perf_counter() - t0)
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--players', type=int, default=1000000)
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(2)
+    path = use_temp_database()
+    try:
+        t0 = time.perf_counter()
+        names, displays = seed(args.players)
+        print(f"seed (с триггерами индекса): {time.perf_counter() - t0:.1f}s")
+        with_username = [n for uid, n in enumerate(names, 1) if uid % 3]
+        exact = [rng.choice(with_username).upper() for _ in range(args.runs)]
+        partial = [n[1:5] for n in (rng.choice(with_username) for _ in range(args.runs))]
+        rare_display = [rng.choice(displays)[-5:] for _ in range(args.runs)]
+        popular_display = [rng.choice(("ван ", "ria ", "Dmit", "Kat")) for _ in range(args.runs)]
+        legacy_runs = max(3, args.runs // 4)
+        rows = [
+            ('legacy exact', measure(legacy_exact, exact[:legacy_runs])),
+            ('legacy partial', measure(legacy_partial, partial[:legacy_runs])),
+            ('exact', measure(db.find_player_by_identifier, exact)),
+            ('partial', measure(db.search_players_by_username, partial)),
+            ('legacy display', measure(legacy_display, rare_display[:legacy_runs])),
+            ('display rare', measure(db.find_player_by_identifier, rare_display)),
+            ('display popular', measure(db.find_player_by_identifier, popular_display)),
+        ]
+    finally:
+        db.engine.dispose()
+        for suffix in ('', '-wal', '-shm'):
+            try:
+                os.remove(path + suffix)
+            except FileNotFoundError:
+                pass
+
+    print(f"players={args.players}")
+    for name, lat in rows:
+        print(format_latency_row(name, lat))
+
+
+if __name__ == '__main__':
+    main()
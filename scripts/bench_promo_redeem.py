@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк массовой активации одного промокода: --attempts попыток из --threads потоков,
+лимит --max-uses активаций, в базе --promos промокодов и --history старых активаций.
+
+Сравниваются:
+  * legacy — прежний redeem_promo: поиск func.lower(Promo.code) (при вводе кириллицей —
+             промах и нормализация всех промокодов в Python), два COUNT(*) по promo_usages
+             и начисление без блокировки записи (лимит может быть превышен);
+  * engine — redeem_promo: индекс кодов в памяти и условные UPDATE счётчиков
+             used_total / promo_user_usages в одной транзакции BEGIN IMMEDIATE.
+
+Пример запуска:
+    python scripts/bench_promo_redeem.py --attempts 10000 --max-uses 1000
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.bench_utils import format_latency_row, use_temp_database
+
+from sqlalchemy import func
+
+import core.database as db
+from core.database import Player, Promo, PromoUsage
+
+
+def seed(promos: int, history: int) -> None:
+    rng = random.Random(1)
+    for n in range(promos):
+        db.create_promo(f"OLD{n:05d}", "coins", 1, max_uses=0, per_user_limit=1, expires_at=None)
+    dbs = db.SessionLocal()
+    try:
+        dbs.bulk_insert_mappings(PromoUsage, [
+            {'promo_id': rng.randint(1, promos), 'user_id': rng.randint(1, 10 ** 6)} for _ in range(history)
+        ])
+        dbs.commit()
+    finally:
+        dbs.close()
+
+
+def legacy_redeem(user_id: int, code: str) -> dict:
+    dbs = db.SessionLocal()
+    try:
+        code_norm = db.normalize_promo_code(code)
+        row = dbs.query(Promo).filter(func.lower(Promo.code) == code.strip().lower()).first()
+        if not row:
+            for r in dbs.query(Promo).all():
+                if db.normalize_promo_code(r.code) == code_norm:
+                    row = r
+                    break
+        if not row or not row.active:
+            return {"ok": False, "reason": "not_found_or_inactive"}
+        used_total = dbs.query(func.count(PromoUsage.id)).filter(PromoUsage.promo_id == row.id).scalar() or 0
+        if row.max_uses and used_total >= row.max_uses:
+            return {"ok": False, "reason": "max_uses_reached"}
+        used_by_user = (
+            dbs.query(func.count(PromoUsage.id))
+            .filter(PromoUsage.promo_id == row.id, PromoUsage.user_id == user_id)
+            .scalar() or 0
+        )
+        if row.per_user_limit and used_by_user >= row.per_user_limit:
+            return {"ok": False, "reason": "per_user_limit_reached"}
+        player = dbs.query(Player).filter(Player.user_id == user_id).first()
+        if not player:
+            player = Player(user_id=user_id, username=None)
+            dbs.add(player)
+            dbs.commit()
+        player.coins = int(player.coins or 0) + int(row.value or 0)
+        dbs.add(PromoUsage(promo_id=int(row.id), user_id=user_id))
+        dbs.commit()
+        return {"ok": True}
+    except Exception:
+        dbs.rollback()
+        return {"ok": False, "reason": "exception"}
+    finally:
+        dbs.close()
+
+
+def burst(fn, code: str, users: list[int], threads: int) -> tuple[list[float], int, float]:
+    def one(uid):
+        t0 = time.perf_counter()
+        ok = fn(uid, code).get('ok')
+        return time.perf_counter() - t0, ok
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(one, users))
+    wall = time.perf_counter() - t0
+    return [lat for lat, _ in results], sum(1 for _, ok in results if ok), wall
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--attempts', type=int, default=10000)
+    parser.add_argument('--max-uses', type=int, default=1000)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--promos', type=int, default=500)
+    parser.add_argument('--history', type=int, default=50000)
+    args = parser.parse_args()
+
+    rng = random.Random(2)
+    users = [rng.randint(1, args.attempts) for _ in range(args.attempts)]
+    path = use_temp_database()
+    try:
+        seed(args.promos, args.history)
+        db.create_promo("BLASTA", "coins", 25, max_uses=args.max_uses, per_user_limit=1, expires_at=None)
+        db.create_promo("BLASTB", "coins", 25, max_uses=args.max_uses, per_user_limit=1, expires_at=None)
+        # Ввод кириллицей, как его набирают с телефона: «ВLАSТ...» совпадает только после нормализации
+        rows = [
+            ('legacy', *burst(legacy_redeem, "ВLАSТA", users, args.threads)),
+            ('engine', *burst(db.redeem_promo, "ВLАSТB", users, args.threads)),
+        ]
+    finally:
+        db.engine.dispose()
+        for suffix in ('', '-wal', '-shm'):
+            try:
+                os.remove(path + suffix)
+            except FileNotFoundError:
+                pass
+
+    print(f"attempts={args.attempts} max_uses={args.max_uses} threads={args.threads} "
+          f"promos={args.promos} history={args.history}")
+    for name, lat, granted, wall in rows:
+        print(f"{format_latency_row(name, lat)} granted={granted} wall={wall:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
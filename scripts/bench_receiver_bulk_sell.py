@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк массовой продажи через Приёмник: длительность всего вызова и время
+удержания блокировки записи SQLite (от первого пишущего statement'а до COMMIT).
+
+У коллекционера --rows позиций инвентаря разных редкостей. Сравниваются:
+  * legacy — прежний sell_all_inventory: загрузка всех InventoryItem, расчёт выплаты
+             в цикле (ротация Приёмника на каждую позицию) и dbs.delete() по одной;
+  * bulk   — _bulk_sell: один агрегат по редкостям + один DELETE;
+  * dry    — предпросмотр preview_receiver_bulk_sell (без блокировки записи).
+
+Пример запуска:
+    python scripts/bench_receiver_bulk_sell.py --rows 5000
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.bench_utils import format_latency_row, use_temp_database
+
+from sqlalchemy import event
+
+import core.database as db
+from core.database import EnergyDrink, InventoryItem, Player
+
+RARITIES = ('Basic', 'Medium', 'Elite', 'Absolute', 'Majestic', 'Special', 'Plant')
+WRITE_PREFIXES = ('BEGIN IMMEDIATE', 'INSERT', 'UPDATE', 'DELETE')
+
+
+class LockTimer:
+    """Время от первого пишущего statement'а до COMMIT в пределах одного вызова."""
+
+    def __init__(self):
+        self.started = None
+        self.held: list[float] = []
+
+    def on_execute(self, conn, cursor, statement, *args):
+        if self.started is None and statement.lstrip().upper().startswith(WRITE_PREFIXES):
+            self.started = time.perf_counter()
+
+    def on_commit(self, conn):
+        if self.started is not None:
+            self.held.append(time.perf_counter() - self.started)
+            self.started = None
+
+
+def seed_player() -> None:
+    dbs = db.SessionLocal()
+    try:
+        dbs.add(Player(user_id=1, username="collector", coins=0, rating=300))
+        dbs.commit()
+    finally:
+        dbs.close()
+
+
+def seed_inventory(rows: int) -> None:
+    dbs = db.SessionLocal()
+    try:
+        if not dbs.query(EnergyDrink).first():
+            dbs.bulk_insert_mappings(EnergyDrink, [
+                {'id': i, 'name': f"Drink {i}", 'description': ""} for i in range(1, rows + 1)
+            ])
+        dbs.bulk_insert_mappings(InventoryItem, [
+            {'player_id': 1, 'drink_id': i, 'rarity': RARITIES[i % len(RARITIES)], 'quantity': 1 + i % 7}
+            for i in range(1, rows + 1)
+        ])
+        dbs.commit()
+    finally:
+        dbs.close()
+
+
+def legacy_sell_all_inventory(user_id: int) -> dict:
+    """Прежняя реализация: ORM-цикл по всем позициям и удаление по одной."""
+    dbs = db.SessionLocal()
+    try:
+        items = dbs.query(InventoryItem).filter(InventoryItem.player_id == user_id).all()
+        player = dbs.query(Player).filter(Player.user_id == user_id).first()
+        rating_value = int(getattr(player, 'rating', 0) or 0)
+        total = 0
+        for item in items:
+            unit = db.get_receiver_unit_payout_with_rating(item.rarity, rating_value)
+            if unit <= 0 or int(item.quantity or 0) <= 0:
+                continue
+            total += unit * int(item.quantity)
+            dbs.delete(item)
+        player.coins = int(player.coins or 0) + total
+        dbs.commit()
+        return {"ok": True, "total_earned": total}
+    finally:
+        dbs.close()
+
+
+def measure(fn, rows: int, runs: int, timer: LockTimer) -> tuple[list[float], list[float]]:
+    total, held = [], []
+    for _ in range(runs):
+        seed_inventory(rows)
+        timer.started = None
+        timer.held = []
+        t0 = time.perf_counter()
+        fn()
+        total.append(time.perf_counter() - t0)
+        held.extend(timer.held)
+        # Оставшиеся позиции (после dry-run) убираем вне замера
+        dbs = db.SessionLocal()
+        try:
+            dbs.query(InventoryItem).delete(synchronize_session=False)
+            dbs.commit()
+        finally:
+            dbs.close()
+    return total, held
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    path = use_temp_database()
+    timer = LockTimer()
+    results = []
+    try:
+        seed_player()
+        event.listen(db.engine, "before_cursor_execute", timer.on_execute)
+        event.listen(db.engine, "commit", timer.on_commit)
+        for name, fn in (
+            ('legacy', lambda: legacy_sell_all_inventory(1)),
+            ('bulk', lambda: db.sell_all_inventory(1)),
+            ('dry', lambda: db.preview_receiver_bulk_sell(1)),
+        ):
+            results.append((name, *measure(fn, args.rows, args.runs, timer)))
+    finally:
+        db.engine.dispose()
+        for suffix in ('', '-wal', '-shm'):
+            try:
+                os.remove(path + suffix)
+            except FileNotFoundError:
+                pass
+
+    print(f"inventory_rows={args.rows} runs={args.runs}")
+    for name, total, held in results:
+        print(format_latency_row(f"{name} call", total))
+        if held:
+            print(format_latency_row(f"{name} lock", held))
+        else:
+            print(f"{name} lock: не берётся")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк шага миграции схемы: время старта и задержка активации промокода.
+
+Старт (по --boots раз):
+  * legacy boot   — прежний main(): ensure_schema() целиком на каждом запуске;
+  * first boot    — migrate_schema() на базе без отпечатка (полная миграция + штамп);
+  * gated boot    — migrate_schema() после рестарта: одно чтение PRAGMA user_version.
+
+Запрос (по --runs активаций, каждый раз новый игрок):
+  * legacy redeem — прежний redeem_promo: create_all + три PRAGMA table_info перед активацией;
+  * redeem        — redeem_promo без проверок DDL.
+
+Пример запуска:
+    python scripts/bench_schema_gate.py --boots 10 --runs 500
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.bench_utils import format_latency_row, use_temp_database
+
+from sqlalchemy import text
+
+import core.database as db
+from core.database import Player
+
+
+def legacy_redeem(user_id: int, code: str) -> dict:
+    """Прежний путь: DDL-проверки схемы перед каждой активацией."""
+    db.Base.metadata.create_all(bind=db.engine)
+    with db.engine.connect() as conn:
+        for table in ("promos", "players", "players"):
+            conn.execute(text(f"PRAGMA table_info({table})")).fetchall()
+    return db.redeem_promo(user_id, code)
+
+
+def reset_fingerprint() -> None:
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql("PRAGMA user_version = 0")
+
+
+def measure_boot(fn, boots: int, before=None) -> list[float]:
+    out = []
+    for _ in range(boots):
+        if before:
+            before()
+        db._schema_verified = False
+        t0 = time.perf_counter()
+        fn()
+        out.append(time.perf_counter() - t0)
+    return out
+
+
+def measure_redeem(fn, user_ids: list[int], code: str) -> list[float]:
+    out = []
+    for uid in user_ids:
+        t0 = time.perf_counter()
+        result = fn(uid, code)
+        out.append(time.perf_counter() - t0)
+        assert result.get("ok"), result
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--boots', type=int, default=10)
+    parser.add_argument('--runs', type=int, default=500)
+    args = parser.parse_args()
+
+    path = use_temp_database()
+    try:
+        rows = [
+            ('legacy boot', measure_boot(db.ensure_schema, args.boots)),
+            ('first boot', measure_boot(db.migrate_schema, args.boots, before=reset_fingerprint)),
+            ('gated boot', measure_boot(db.migrate_schema, args.boots)),
+        ]
+
+        dbs = db.SessionLocal()
+        try:
+            dbs.bulk_insert_mappings(Player, [
+                {'user_id': uid, 'username': f"u{uid}", 'coins': 0} for uid in range(1, 2 * args.runs + 1)
+            ])
+            dbs.commit()
+        finally:
+            dbs.close()
+        db.create_promo("BENCH", "coins", 10, max_uses=10 * args.runs, per_user_limit=1, expires_at=None)
+        rows.append(('legacy redeem', measure_redeem(legacy_redeem, list(range(1, args.runs + 1)), "BENCH")))
+        rows.append(('redeem', measure_redeem(db.redeem_promo, list(range(args.runs + 1, 2 * args.runs + 1)), "BENCH")))
+    finally:
+        db.engine.dispose()
+        for suffix in ('', '-wal', '-shm'):
+            try:
+                os.remove(path + suffix)
+            except FileNotFoundError:
+                pass
+
+    print(f"boots={args.boots} redeems={args.runs}")
+    for name, lat in rows:
+        print(format_latency_row(name, lat))
+
+
+if __name__ == '__main__':
+    main()
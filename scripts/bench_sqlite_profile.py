@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк конкурентного доступа к SQLite: профиль движка 'legacy' против 'production'.
+
+Для каждого профиля создаётся временная БД, после чего на --seconds запускаются
+потоки, как в боевом пуле core.db_async:
+  * search  — apply_energy_search_outcome_atomic (BEGIN IMMEDIATE, как ручной поиск);
+  * sell    — sell_inventory_item по одной штуке;
+  * gift    — transfer_gift_bundle_atomic между двумя игроками;
+  * read    — get_player (чтение, которое в rollback-журнале ждёт писателя).
+Считаются операции в секунду, задержки и отказы (в т.ч. "database is locked").
+
+Пример запуска:
+    python scripts/bench_sqlite_profile.py --seconds 5 --writers 3 --readers 4
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.bench_utils import format_latency_row, use_temp_database
+
+import core.database as db
+from core.database import EnergyDrink, InventoryItem, Player
+
+PLAYERS = 500
+DRINKS = 50
+
+
+def seed() -> None:
+    dbs = db.SessionLocal()
+    try:
+        dbs.add_all([EnergyDrink(id=i, name=f"Drink {i}", description="bench") for i in range(1, DRINKS + 1)])
+        dbs.add_all([Player(user_id=uid, username=f"user{uid}", coins=0) for uid in range(1, PLAYERS + 1)])
+        dbs.add_all([
+            InventoryItem(player_id=uid, drink_id=d, rarity='Basic', quantity=1000)
+            for uid in range(1, PLAYERS + 1) for d in range(1, 6)
+        ])
+        dbs.commit()
+    finally:
+        dbs.close()
+
+
+def _item_id(dbs_cache: dict, user_id: int) -> int | None:
+    item_id = dbs_cache.get(user_id)
+    if item_id is None:
+        dbs = db.SessionLocal()
+        try:
+            row = dbs.query(InventoryItem.id).filter(InventoryItem.player_id == user_id).first()
+            item_id = dbs_cache[user_id] = int(row.id) if row else 0
+        finally:
+            dbs.close()
+    return item_id or None
+
+
+def op_search(rng: random.Random, cache: dict) -> bool:
+    res = db.apply_energy_search_outcome_atomic(
+        user_id=rng.randint(1, PLAYERS),
+        search_ts=int(time.time()),
+        effective_cooldown=0,
+        base_reward_coins=10,
+        drops=[{"drink_id": rng.randint(1, DRINKS), "rarity": "Basic"}],
+    )
+    return bool(res.get('ok'))
+
+
+def op_sell(rng: random.Random, cache: dict) -> bool:
+    uid = rng.randint(1, PLAYERS)
+    item_id = _item_id(cache, uid)
+    if item_id is None:
+        return False
+    return bool(db.sell_inventory_item(uid, item_id, 1).get('ok'))
+
+
+def op_gift(rng: random.Random, cache: dict) -> bool:
+    giver = rng.randint(1, PLAYERS)
+    item_id = _item_id(cache, giver)
+    if item_id is None:
+        return False
+    dbs = db.SessionLocal()
+    try:
+        item = dbs.query(InventoryItem).filter(InventoryItem.id == item_id).first()
+        if item is None:
+            return False
+        bundle = [{"item_id": item.id, "drink_id": item.drink_id, "rarity": item.rarity, "quantity": 1}]
+    finally:
+        dbs.close()
+    recipient = giver % PLAYERS + 1
+    return bool(db.transfer_gift_bundle_atomic(giver, recipient, bundle).get('ok'))
+
+
+def op_read(rng: random.Random, cache: dict) -> bool:
+    try:
+        return db.get_player(rng.randint(1, PLAYERS)) is not None
+    except Exception:
+        return False
+
+
+def run_profile(profile: str, seconds: float, writers: int, readers: int) -> dict:
+    path = use_temp_database(profile=profile)
+    try:
+        seed()
+        kinds = [('search', op_search), ('sell', op_sell), ('gift', op_gift)] * writers
+        kinds += [('read', op_read)] * readers
+        stats = {name: {'lat': [], 'ok': 0, 'fail': 0} for name, _ in kinds}
+        lock = threading.Lock()
+        stop_at = time.perf_counter() + seconds
+
+        def worker(name, fn, seed_value):
+            rng = random.Random(seed_value)
+            cache: dict = {}
+            lat, ok, fail = [], 0, 0
+            while time.perf_counter() < stop_at:
+                t0 = time.perf_counter()
+                try:
+                    success = fn(rng, cache)
+                except Exception:
+                    success = False
+                lat.append(time.perf_counter() - t0)
+                if success:
+                    ok += 1
+                else:
+                    fail += 1
+            with lock:
+                stats[name]['lat'].extend(lat)
+                stats[name]['ok'] += ok
+                stats[name]['fail'] += fail
+
+        threads = [threading.Thread(target=worker, args=(name, fn, i)) for i, (name, fn) in enumerate(kinds)]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        return stats
+    finally:
+        db.engine.dispose()
+        for suffix in ('', '-wal', '-shm'):
+            try:
+                os.remove(path + suffix)
+            except FileNotFoundError:
+                pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--writers', type=int, default=2, help='потоков на каждый тип записи')
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--profiles', default='legacy,production')
+    args = parser.parse_args()
+
+    # Функции core.database логируют каждую ошибку блокировки — в отчёте они видны как fail
+    logging.disable(logging.CRITICAL)
+    print(f"seconds={args.seconds} writers/type={args.writers} readers={args.readers}")
+    for profile in args.profiles.split(','):
+        stats = run_profile(profile.strip(), args.seconds, args.writers, args.readers)
+        total_ok = sum(s['ok'] for s in stats.values())
+        total_fail = sum(s['fail'] for s in stats.values())
+        print(f"\n[{profile}] ops/s={total_ok / args.seconds:.0f} failed={total_fail}")
+        for name, s in stats.items():
+            print(format_latency_row(name, s['lat']) + f" ok={s['ok']} fail={s['fail']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Общие помощники для бенчмарков из scripts/bench_*.py.
+
+Бенчмарки никогда не трогают боевую data/bot_data.db: core.database
+перенаправляется на временный SQLite-файл так же, как это делает tests/conftest.py.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.orm import sessionmaker
+
+import core.database as db
+
+
+def use_temp_database(path: str | None = None, engine=None, profile: str | None = None):
+    """Переключает core.database на временную БД и создаёт схему.
+
+    Возвращает путь к файлу БД. Если передан engine, используется он, иначе
+    движок создаётся с профилем profile (по умолчанию — RELOAD_DB_PROFILE).
+    """
+    if engine is None:
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix="reload_bench_", suffix=".db")
+            os.close(fd)
+        engine = db.create_sqlite_engine(path, profile)
+    db.engine = engine
+    db.SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+    db.Base.metadata.create_all(bind=engine)
+    return path
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Перцентиль по ближайшему рангу (values не обязаны быть отсортированы)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[idx]
+
+
+def format_latency_row(label: str, values_sec: list[float]) -> str:
+    """Строка отчёта p50/p95/p99/max в миллисекундах."""
+    ms = [v * 1000.0 for v in values_sec]
+    return (
+        f"{label:<24} n={len(ms):<6} p50={percentile(ms, 50):8.2f}ms "
+        f"p95={percentile(ms, 95):8.2f}ms p99={percentile(ms, 99):8.2f}ms max={max(ms or [0.0]):8.2f}ms"
+    )
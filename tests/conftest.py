@@ -64,3 +64,16 @@ def clean_database_tables():
     connection.execute(text("PRAGMA foreign_keys = ON;"))
     transaction.commit()
     connection.close()
+
+    # Сбрасываем кэши и буферы процесса, построенные поверх таблиц
+    db._drink_discovery_buffer.clear()
+    db._action_log_buffer.clear()
+    db.invalidate_drink_catalog()
+    db.invalidate_ban_index()
+    db.invalidate_unreachable_users()
+    db.invalidate_settings_cache()
+    db.invalidate_bot_statistics()
+    db.invalidate_leaderboards()
+    db.invalidate_inventory_pages()
+    db.invalidate_promo_index()
+    db.invalidate_group_settings()
@@ -0,0 +1,129 @@
+# file: test_action_log_buffer.py
+"""
+Тесты буферизованного журнала действий: log_action не пишет в БД до сброса,
+сброс — одна пачка с исходными временами записей, политика переполнения
+(отбрасываются самые старые) и метрики, возврат записей в буфер при
+недоступной БД, отбрасывание только плохой строки из пачки, фоновый писатель
+со сбросом по заполнению и при остановке.
+"""
+
+import asyncio
+import os
+import sys
+
+from sqlalchemy.exc import OperationalError
+
+# Добавляем корень проекта в пути поиска модулей
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.database as db
+from core.database import ActionLog
+from reload_bot.action_log import ActionLogWriter
+
+
+def _stored():
+    dbs = db.SessionLocal()
+    try:
+        return [
+            (int(uid), action_type, details)
+            for uid, action_type, details in dbs.query(ActionLog.user_id, ActionLog.action_type, ActionLog.action_details).order_by(ActionLog.id)
+        ]
+    finally:
+        dbs.close()
+
+
+def test_log_action_is_buffered_until_flush(monkeypatch):
+    monkeypatch.setattr(db.time, "time", lambda: 1000.0)
+    assert db.log_action(1, "alice", "casino", "bet:50", amount=-50) is True
+    assert db.log_action(2, None, "purchase", "vip", success=False) is True
+    assert _stored() == []
+    assert db.get_action_log_stats()['pending'] == 2
+
+    assert db.flush_action_log() == 2
+    assert db.flush_action_log() == 0
+    assert _stored() == [(1, "casino", "bet:50"), (2, "purchase", "vip")]
+    logs = db.get_error_logs()
+    assert len(logs) == 1 and logs[0]['timestamp'] == 1000 and logs[0]['username'] == 'Unknown'
+
+    # Чтение журнала в БД не пишет: буфер дописывают админ-хендлеры через очередь записей
+    db.log_action(3, "bob", "admin_action", "ban")
+    assert db.get_user_logs(3) == []
+    assert db.flush_action_log() == 1
+    assert [log['action_type'] for log in db.get_user_logs(3)] == ["admin_action"]
+    stats = db.get_action_log_stats()
+    assert stats['flushed'] == 3 and stats['flushes'] == 2 and stats['pending'] == 0
+
+
+def test_overflow_drops_oldest_and_failed_flush_requeues(monkeypatch):
+    buffer = db._ActionLogBuffer(maxsize=3, flush_size=2)
+    triggered = []
+    buffer.set_trigger(lambda: triggered.append(True))
+    for n in range(5):
+        buffer.add({'user_id': n, 'action_type': 'casino'})
+    assert triggered == [True]
+    assert buffer.stats()['dropped'] == 2 and buffer.stats()['pending'] == 3
+
+    class _BrokenSession:
+        def execute(self, *args, **kwargs):
+            raise OperationalError("INSERT", {}, Exception("disk I/O error"))
+
+        def rollback(self):
+            pass
+
+        def close(self):
+            pass
+
+    with monkeypatch.context() as m:
+        m.setattr(db, "SessionLocal", _BrokenSession)
+        assert buffer.flush() == 0
+    buffer.add({'user_id': 5, 'action_type': 'casino'})
+    # Неудачная пачка вернулась в начало буфера; переполнение снова съело самую старую запись
+    assert buffer.stats() == {'pending': 3, 'flushed': 0, 'dropped': 3, 'flushes': 0, 'failed_flushes': 1}
+    assert buffer.flush() == 3
+    assert [uid for uid, _, _ in _stored()] == [3, 4, 5]
+
+
+def test_bad_row_is_dropped_without_blocking_the_batch():
+    assert db.log_action(1, "alice", "casino", {"bet": 50}, amount="25") is True
+    assert db.log_action("x", None, "casino") is False
+
+    buffer = db._ActionLogBuffer(maxsize=10, flush_size=10)
+    buffer.add({'user_id': 2, 'action_type': 'casino', 'action_details': "ok"})
+    # Строка в обход log_action: такой параметр SQLite привязать не может
+    buffer.add({'user_id': 3, 'action_type': 'casino', 'action_details': {"bad": 1}})
+    buffer.add({'user_id': 4, 'action_type': 'casino', 'action_details': "ok"})
+    assert buffer.flush() == 2
+    assert buffer.stats() == {'pending': 0, 'flushed': 2, 'dropped': 1, 'flushes': 1, 'failed_flushes': 0}
+
+    assert db.flush_action_log() == 1
+    assert _stored() == [(2, "casino", "ok"), (4, "casino", "ok"), (1, "casino", "{'bet': 50}")]
+    assert db.get_user_logs(1)[0]['amount'] == 25
+
+    # Следующие сбросы не застревают на плохой строке
+    db.log_action(5, None, "transfer")
+    assert db.flush_action_log() == 1
+
+
+def test_writer_flushes_on_size_and_on_stop(monkeypatch):
+    monkeypatch.setattr(db._action_log_buffer, "flush_size", 3)
+
+    async def scenario():
+        writer = ActionLogWriter(interval=60)
+        writer.start()
+        try:
+            for n in range(3):
+                db.log_action(n, None, "transfer")
+            for _ in range(100):
+                if db.get_action_log_stats()['pending'] == 0:
+                    break
+                await asyncio.sleep(0.01)
+            assert len(_stored()) == 3
+
+            db.log_action(9, None, "transfer")
+        finally:
+            await writer.stop()
+        assert not writer.running
+
+    asyncio.run(scenario())
+    assert len(_stored()) == 4
+    assert db.get_action_log_stats()['pending'] == 0
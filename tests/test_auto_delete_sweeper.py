@@ -0,0 +1,110 @@
+# file: test_auto_delete_sweeper.py
+"""
+Тесты автоудаления: кэш настроек групп со сбросом при изменении, единый
+проход по созревшим задачам scheduled_auto_deletes (по одному сообщению и
+пачками deleteMessages), снятие задач выключенных групп и сохранение строк
+до следующего прохода при RetryAfter.
+"""
+
+import asyncio
+import os
+import sys
+
+from telegram.error import BadRequest, RetryAfter
+
+# Добавляем корень проекта в пути поиска модулей
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.database as db
+from core.database import ScheduledAutoDelete
+from reload_bot.auto_delete import AutoDeleteSweeper
+
+
+class _SingleDeleteBot:
+    """Бот без deleteMessages (как PTB 20.7): только delete_message."""
+
+    def __init__(self, fail: dict | None = None):
+        self.deleted: list[tuple[int, int]] = []
+        self.fail = fail or {}
+
+    async def delete_message(self, chat_id, message_id):
+        exc = self.fail.pop((chat_id, message_id), None)
+        if exc is not None:
+            raise exc
+        self.deleted.append((chat_id, message_id))
+        return True
+
+
+class _BulkDeleteBot:
+    def __init__(self):
+        self.calls: list[tuple[int, list[int]]] = []
+
+    async def delete_messages(self, chat_id, message_ids):
+        self.calls.append((chat_id, list(message_ids)))
+        return True
+
+
+def _schedule(chat_id, message_ids, delete_at):
+    for message_id in message_ids:
+        db.save_scheduled_auto_delete(chat_id, message_id, delete_at)
+
+
+def _pending():
+    dbs = db.SessionLocal()
+    try:
+        return sorted((int(c), int(m)) for c, m in dbs.query(ScheduledAutoDelete.chat_id, ScheduledAutoDelete.message_id))
+    finally:
+        dbs.close()
+
+
+def test_group_settings_cache_invalidated_on_change():
+    db.set_group_settings(-100, title="Чат", auto_delete_enabled=False)
+    loads = db._group_settings_cache.loads
+    assert db.get_group_settings(-100)['auto_delete_enabled'] is False
+    assert db.get_group_settings(-100)['exists'] is True
+    assert db.get_group_settings(-999)['exists'] is False
+    assert db._group_settings_cache.loads == loads + 2
+
+    # Повторное чтение — из кэша, пачка с уже известными чатами тоже
+    db.get_group_settings_many([-100, -999])
+    assert db._group_settings_cache.loads == loads + 2
+
+    assert db.update_group_settings(-100, auto_delete_enabled=True)
+    assert db.get_group_settings(-100)['auto_delete_enabled'] is True
+    db.upsert_group_chat(-999, "Новая группа")
+    assert db.get_group_settings(-999)['title'] == "Новая группа"
+
+
+def test_sweep_deletes_due_messages_and_skips_disabled_groups():
+    db.set_group_settings(-1, auto_delete_enabled=True)
+    db.set_group_settings(-2, auto_delete_enabled=False)
+    _schedule(-1, [10, 11, 12], 1000)
+    _schedule(-1, [13], 5000)  # срок ещё не подошёл
+    _schedule(-2, [20, 21], 1000)
+
+    bot = _SingleDeleteBot(fail={(-1, 11): BadRequest("Message to delete not found")})
+    sweeper = AutoDeleteSweeper(batch_size=2, concurrency=3)
+    stats = asyncio.run(sweeper.sweep(bot, now=2000))
+
+    assert sorted(bot.deleted) == [(-1, 10), (-1, 12)]
+    assert stats == {'deleted': 2, 'skipped': 2, 'failed': 1, 'kept': 0}
+    assert _pending() == [(-1, 13)]
+
+
+def test_sweep_uses_bulk_delete_and_keeps_rows_on_retry_after():
+    db.set_group_settings(-1, auto_delete_enabled=True)
+    db.set_group_settings(-2, auto_delete_enabled=True)
+    _schedule(-1, range(1, 251), 1000)
+    bot = _BulkDeleteBot()
+    stats = asyncio.run(AutoDeleteSweeper(batch_size=500).sweep(bot, now=2000))
+    assert [len(ids) for _, ids in bot.calls] == [100, 100, 50]
+    assert stats['deleted'] == 250 and _pending() == []
+
+    _schedule(-2, [1, 2, 3], 1000)
+    flood = _SingleDeleteBot(fail={(-2, 1): RetryAfter(30)})
+    sweeper = AutoDeleteSweeper(batch_size=10, concurrency=1)
+    stats = asyncio.run(sweeper.sweep(flood, now=2000))
+    # После FloodWait оставшиеся сообщения не трогаются, строки ждут следующего прохода
+    assert flood.deleted == [] and stats['kept'] == 3
+    assert _pending() == [(-2, 1), (-2, 2), (-2, 3)]
+    assert asyncio.run(sweeper.sweep(flood, now=2000))['kept'] == 0  # проход на паузе
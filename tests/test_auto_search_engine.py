@@ -0,0 +1,102 @@
+# file: test_auto_search_engine.py
+"""
+Тесты пакетного автопоиска: одно чтение состояния пачки, расчёт в памяти
+и одна пишущая транзакция на всю пачку.
+"""
+
+import os
+import random
+import sys
+import time
+
+from sqlalchemy import event
+
+# Добавляем корень проекта в пути поиска модулей
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.database as db
+from core.auto_search_engine import AutoSearchEngine
+from core.database import AdminUser, EnergyDrink, InventoryItem, Player
+
+
+def _seed(now):
+    dbs = db.SessionLocal()
+    dbs.add(EnergyDrink(id=1, name="Drink A", description="", is_special=False))
+    dbs.add(EnergyDrink(id=2, name="Drink B", description="", is_special=False))
+    base = dict(auto_search_enabled=True, auto_search_reset_ts=now + 3600, last_search=0)
+    dbs.add(Player(user_id=1, username="vip", vip_until=now + 3600, **base))
+    dbs.add(Player(user_id=2, username="silent", vip_until=now + 3600, auto_search_silent=True, **base))
+    dbs.add(Player(user_id=3, username="expired", vip_until=now - 10, **base))
+    dbs.add(Player(user_id=4, username="cooldown", vip_until=now + 3600,
+                   **{**base, 'last_search': now - 5}))
+    dbs.add(Player(user_id=5, username="last_one", vip_until=now + 3600, auto_search_count=9,
+                   **base))
+    dbs.add(Player(user_id=6, username="moderator", **base))
+    dbs.add(AdminUser(user_id=6, username="moderator", level=1))
+    dbs.commit()
+    dbs.close()
+    db.invalidate_drink_catalog()
+
+
+def _player(user_id):
+    dbs = db.SessionLocal()
+    try:
+        return dbs.query(Player).filter(Player.user_id == user_id).first()
+    finally:
+        dbs.close()
+
+
+def test_batch_outcomes_and_single_write_transaction(monkeypatch):
+    now = int(time.time())
+    _seed(now)
+    monkeypatch.setattr(db, "get_setting_int", lambda key, default=0: 10 if key == "auto_search_daily_limit_base" else default)
+
+    statements = []
+    listener = lambda conn, cursor, stmt, *a: statements.append(stmt.lstrip().split(None, 1)[0].upper())
+    event.listen(db.engine, "before_cursor_execute", listener)
+    try:
+        engine = AutoSearchEngine(rng=random.Random(7), swaga_weights={"Обычная": 1})
+        results = engine.run([1, 2, 3, 4, 5, 6, 404], now_ts=now)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", listener)
+
+    assert results[1]["status"] == "ok" and results[2]["status"] == "ok" and results[6]["status"] == "ok"
+    assert results[3]["status"] == "vip_expired"
+    assert results[4]["status"] == "cooldown" and results[4]["time_left"] > 0
+    assert results[5]["status"] == "ok" and results[5]["limit_reached"] is True
+    assert results[404]["status"] == "missing"
+    # Админ получает фиксированную награду, VIP — удвоенную случайную
+    assert results[6]["septims_reward"] == 100
+    assert 10 <= results[1]["septims_reward"] <= 20
+
+    # Одна транзакция записи на всю пачку
+    assert statements.count("BEGIN") == 1
+
+    p1 = _player(1)
+    assert p1.last_search == now and p1.auto_search_count == 1 and p1.rating == 1
+    assert p1.coins == results[1]["coins_after"] == results[1]["septims_reward"]
+    assert _player(3).auto_search_enabled is False
+    assert _player(5).auto_search_enabled is False and _player(5).auto_search_count == 10
+    assert '"total_found"' in _player(2).auto_search_session_stats
+
+    dbs = db.SessionLocal()
+    try:
+        qty = sum(int(i.quantity) for i in dbs.query(InventoryItem).filter(InventoryItem.player_id == 1))
+    finally:
+        dbs.close()
+    assert qty == results[1]["found_count"]
+
+
+def test_concurrent_manual_search_is_rechecked_in_transaction():
+    now = int(time.time())
+    _seed(now)
+    engine = AutoSearchEngine(rng=random.Random(1))
+    states = db.load_auto_search_states([1])
+    results, outcomes = engine.plan([1], states, now)
+    assert results[1]["status"] == "ok"
+
+    # Между чтением и записью игрок успел искать вручную
+    db.update_player(1, last_search=now)
+    applied = db.apply_auto_search_batch(outcomes, now)
+    assert applied[1]["ok"] is False and applied[1]["reason"] == "cooldown"
+    assert _player(1).coins == 0
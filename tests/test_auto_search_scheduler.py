@@ -0,0 +1,113 @@
+# file: test_auto_search_scheduler.py
+"""
+Тесты единого планировщика автопоиска: куча сроков, пачки, сохранение
+сроков в БД и восстановление только «созревших» игроков диапазоном по индексу.
+"""
+
+import asyncio
+import os
+import sys
+
+# Добавляем корень проекта в пути поиска модулей
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.orm import sessionmaker
+
+import core.database as db
+from core.auto_search_scheduler import AutoSearchScheduler
+from core.database import Player
+
+
+def _seed(rows):
+    dbs = db.SessionLocal()
+    for user_id, enabled, next_ts in rows:
+        dbs.add(Player(user_id=user_id, username=f"u{user_id}",
+                       auto_search_enabled=enabled, auto_search_next_ts=next_ts))
+    dbs.commit()
+    dbs.close()
+
+
+def _next_ts(user_id):
+    dbs = db.SessionLocal()
+    try:
+        return dbs.query(Player.auto_search_next_ts).filter(Player.user_id == user_id).scalar()
+    finally:
+        dbs.close()
+
+
+def test_pop_due_in_order_with_batch_limit_and_reschedule():
+    sched = AutoSearchScheduler(batch_size=2)
+    sched.schedule(1, 130)
+    sched.schedule(2, 110)
+    sched.schedule(3, 120)
+    sched.schedule(4, 500)
+    sched.schedule(3, 105)  # перенос: старая запись в куче становится устаревшей
+    sched.cancel(4)
+
+    assert sched.pop_due(now=200) == [3, 2]
+    assert sched.pop_due(now=200) == [1]
+    assert sched.pop_due(now=1000) == []
+    assert len(sched) == 0
+
+
+def test_refill_loads_only_due_enabled_players():
+    _seed([(1, True, 0), (2, True, 1000), (3, True, 1100), (4, False, 0), (5, True, 99999)])
+    sched = AutoSearchScheduler(refill_sec=60, horizon_sec=120)
+
+    assert sched.refill(now=1000) == 3
+    assert 5 not in sched and 4 not in sched
+    assert sched.pop_due(now=1000) == [1, 2]
+
+    # Выполняющиеся и уже запланированные игроки не дублируются
+    assert sched.refill(now=1000) == 0
+    sched.done([1, 2])
+    assert sched.refill(now=1000) == 2
+
+
+def test_tick_runs_batch_and_persists_due_times():
+    _seed([(10, True, 0), (11, True, 0), (12, True, 5000)])
+    sched = AutoSearchScheduler(batch_size=10)
+    seen = []
+
+    async def runner(user_ids):
+        seen.extend(user_ids)
+        for uid in user_ids:
+            sched.schedule_in(uid, 600, now=1000)
+
+    assert asyncio.run(sched.tick(runner, now=1000)) == 2
+    assert sorted(seen) == [10, 11]
+    assert _next_ts(10) == 1600 and _next_ts(11) == 1600 and _next_ts(12) == 5000
+
+    # Новый экземпляр (рестарт) видит сохранённые сроки
+    restarted = AutoSearchScheduler(horizon_sec=60)
+    assert restarted.refill(now=1000) == 0
+    assert restarted.refill(now=1600) == 2
+
+
+def test_due_query_is_index_range_after_null_backfill(monkeypatch, tmp_path):
+    engine = db.create_sqlite_engine(str(tmp_path / "due.db"), "production")
+    monkeypatch.setattr(db, "engine", engine)
+    monkeypatch.setattr(db, "SessionLocal", sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine))
+    db.Base.metadata.create_all(bind=engine)
+    try:
+        # Старая база: колонка без NOT NULL/DEFAULT и игроки с NULL-сроком
+        with engine.begin() as conn:
+            conn.exec_driver_sql("DROP INDEX idx_players_auto_search_due")
+            conn.exec_driver_sql("ALTER TABLE players DROP COLUMN auto_search_next_ts")
+            conn.exec_driver_sql("ALTER TABLE players ADD COLUMN auto_search_next_ts INTEGER")
+            conn.exec_driver_sql(
+                "INSERT INTO players (user_id, username, auto_search_enabled, auto_search_next_ts) "
+                "VALUES (1, 'a', 1, NULL), (2, 'b', 1, 900), (3, 'c', 1, 5000), (4, 'd', 0, NULL)"
+            )
+        db.ensure_schema()
+
+        assert db.get_due_auto_search_players(1000) == [(1, 0), (2, 900)]
+        with engine.connect() as conn:
+            plan = " ".join(str(row[-1]) for row in conn.exec_driver_sql(
+                "EXPLAIN QUERY PLAN SELECT user_id, auto_search_next_ts FROM players "
+                "WHERE auto_search_enabled = 1 AND auto_search_next_ts <= 1000 ORDER BY auto_search_next_ts"
+            ))
+        assert "idx_players_auto_search_due (auto_search_enabled=? AND auto_search_next_ts<?)" in plan
+        assert "TEMP B-TREE" not in plan
+    finally:
+        engine.dispose()
@@ -0,0 +1,146 @@
+# file: test_ban_index.py
+"""
+Тесты индекса активных банов в памяти (проверка бана в глобальном guard).
+"""
+
+import os
+import sys
+import time
+
+from sqlalchemy import event
+
+# Добавляем корень проекта в пути поиска модулей
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.database as db
+from core.database import AdminUser, UserBan
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, *args, **kwargs):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+
+
+def test_ban_and_unban_update_index_without_queries():
+    assert db.ban_user(101, banned_by=1, reason="spam")
+    db.load_ban_index()
+
+    with QueryCounter(db.engine) as counter:
+        ban = db.get_active_ban(101)
+        assert db.get_active_ban(102) is None
+        assert not db.is_user_banned(103)
+    assert ban is not None and ban['reason'] == "spam" and ban['banned_until'] is None
+    # Непустой результат проверяет защищённость пользователя, остальные — только память
+    assert counter.count == 2
+
+    assert db.unban_user(101)
+    with QueryCounter(db.engine) as counter:
+        assert db.get_active_ban(101) is None
+    assert counter.count == 0
+
+
+def test_index_loaded_from_db_skips_expired():
+    now_ts = int(time.time())
+    dbs = db.SessionLocal()
+    dbs.add_all([
+        UserBan(user_id=201, reason="forever", banned_at=now_ts),
+        UserBan(user_id=202, reason="old", banned_at=now_ts - 100, banned_until=now_ts - 10),
+    ])
+    dbs.commit()
+    dbs.close()
+
+    assert db.load_ban_index() == 1
+    assert db.get_active_ban(201)['reason'] == "forever"
+    assert db.get_active_ban(202) is None
+    assert db.get_banned_users_count() == 1
+
+
+def test_temporary_ban_expires_via_heap(monkeypatch):
+    assert db.ban_user(301, reason="tmp", duration_seconds=60)
+    assert db.ban_user(302, reason="long", duration_seconds=3600)
+    assert db.get_active_ban(301) is not None
+
+    real_time = time.time
+    monkeypatch.setattr(db.time, "time", lambda: real_time() + 120)
+    with QueryCounter(db.engine) as counter:
+        assert db.get_active_ban(301) is None
+    assert counter.count == 0
+    assert db.get_active_ban(302) is not None
+
+
+def test_reban_with_new_term_ignores_stale_heap_entry(monkeypatch):
+    assert db.ban_user(401, reason="short", duration_seconds=60)
+    assert db.ban_user(401, reason="longer", duration_seconds=3600)
+
+    real_time = time.time
+    monkeypatch.setattr(db.time, "time", lambda: real_time() + 120)
+    ban = db.get_active_ban(401)
+    assert ban is not None and ban['reason'] == "longer"
+
+
+def test_protected_user_ban_is_dropped():
+    now_ts = int(time.time())
+    dbs = db.SessionLocal()
+    dbs.add(UserBan(user_id=501, reason="x", banned_at=now_ts))
+    dbs.commit()
+    dbs.close()
+    db.load_ban_index()
+
+    dbs = db.SessionLocal()
+    dbs.add(AdminUser(user_id=501, username="adm", level=1))
+    dbs.commit()
+    dbs.close()
+
+    assert db.get_active_ban(501) is None
+    dbs = db.SessionLocal()
+    try:
+        assert dbs.query(UserBan).filter(UserBan.user_id == 501).first() is None
+    finally:
+        dbs.close()
+
+
+def test_stale_index_served_until_background_refresh(monkeypatch):
+    assert db.ban_user(601, reason="old")
+    db.load_ban_index()
+
+    dbs = db.SessionLocal()
+    dbs.add(UserBan(user_id=602, reason="other process", banned_at=int(time.time())))
+    dbs.commit()
+    dbs.close()
+
+    real_monotonic = time.monotonic
+    monkeypatch.setattr(db.time, "monotonic", lambda: real_monotonic() + db.BAN_INDEX_RESYNC_SEC + 1)
+    # Истёкший TTL не перечитывает индекс на пути проверки — отдаётся прежний снимок
+    with QueryCounter(db.engine) as counter:
+        assert db.get_active_ban(602) is None
+    assert counter.count == 0
+
+    assert db.refresh_ban_index() == 2
+    assert db.get_active_ban(602)['reason'] == "other process"
+    assert db.refresh_ban_index() is None
+
+
+def test_ban_during_reload_survives_snapshot_swap(monkeypatch):
+    db.load_ban_index()
+    real_session = db.SessionLocal
+
+    def session_with_concurrent_ban():
+        # Бан прилетает, пока перечитка ждёт ответа БД
+        db._ban_index.put({'user_id': 701, 'reason': "late", 'banned_at': 1, 'banned_until': None, 'banned_by': None})
+        return real_session()
+
+    monkeypatch.setattr(db, "SessionLocal", session_with_concurrent_ban)
+    db.load_ban_index()
+    monkeypatch.setattr(db, "SessionLocal", real_session)
+    assert db._ban_index.get(701)['reason'] == "late"
@@ -0,0 +1,115 @@
+# file: test_bot_statistics.py
+"""
+Тесты снимка статистики админ-панели: два агрегирующих прохода вместо
+десятка COUNT/SUM, кэш на TTL и инкрементальные счётчики от путей записи.
+"""
+
+import os
+import sys
+import time
+
+from sqlalchemy import event
+
+# Добавляем корень проекта в пути поиска модулей
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.database as db
+from core.database import EnergyDrink, InventoryItem, Player, Promo, PurchaseReceipt, UserBan
+
+
+def _seed(now):
+    dbs = db.SessionLocal()
+    dbs.add_all([EnergyDrink(id=1, name="A", description=""), EnergyDrink(id=2, name="B", description="")])
+    dbs.add_all([
+        Player(user_id=1, username="rich", coins=500, vip_until=now + 100, last_search=now - 10),
+        Player(user_id=2, username="vipplus", coins=100, vip_plus_until=now + 100, last_search=now - 3 * 86400,
+               auto_search_boost_count=4, auto_search_boost_until=now + 100),
+        Player(user_id=3, username="old", coins=0, last_search=now - 30 * 86400,
+               auto_search_boost_count=2, auto_search_boost_until=now - 100),
+    ])
+    dbs.add_all([
+        InventoryItem(player_id=1, drink_id=1, rarity='Basic', quantity=3),
+        InventoryItem(player_id=3, drink_id=2, rarity='Basic', quantity=7),
+    ])
+    dbs.add_all([
+        PurchaseReceipt(user_id=1, kind='x', purchased_at=now - 10),
+        PurchaseReceipt(user_id=1, kind='x', purchased_at=now - 2 * 86400),
+    ])
+    dbs.add(Promo(code="P1", kind="coins", value=1, active=True, expires_at=None))
+    dbs.add(UserBan(user_id=3, banned_at=now, banned_until=None))
+    dbs.commit()
+    dbs.close()
+
+
+def test_snapshot_values_in_two_aggregate_passes():
+    now = int(time.time())
+    _seed(now)
+
+    db.sync_leaderboards()
+    statements = []
+    listener = lambda conn, cursor, stmt, *a: statements.append(stmt)
+    event.listen(db.engine, "before_cursor_execute", listener)
+    try:
+        stats = db.get_bot_statistics()
+    finally:
+        event.remove(db.engine, "before_cursor_execute", listener)
+
+    assert stats['total_users'] == 3 and stats['total_coins'] == 600
+    assert stats['active_vip'] == 1 and stats['active_vip_plus'] == 1
+    assert stats['active_today'] == 1 and stats['active_week'] == 2
+    assert stats['total_drinks'] == 2 and stats['total_inventory_items'] == 10
+    assert stats['total_purchases'] == 2 and stats['purchases_today'] == 1
+    assert stats['active_boosts'] == 1 and stats['expired_boosts'] == 1 and stats['average_boost_count'] == 4.0
+    assert stats['active_promo'] == 1 and stats['banned_users'] == 1
+    assert stats['top_coins'][0] == (1, "rich", 500)
+    assert stats['top_drinks'][0] == (3, "old", 7)
+    # Счётчики — ровно два агрегирующих запроса, топы берутся из лидербордов без GROUP BY
+    assert len([st for st in statements if 'COUNT(' in st.upper()]) == 2
+    assert not any('GROUP BY' in st.upper() for st in statements)
+
+
+def test_snapshot_is_cached_and_bumped_by_writes():
+    now = int(time.time())
+    _seed(now)
+    first = db.get_bot_statistics()
+    computes = db._bot_stats_snapshot.computes
+
+    db.get_or_create_player(99, "newbie")
+    assert db.purchase_generic_bonus(1, 10, 'test_bonus')['ok']
+    cached = db.get_bot_statistics()
+    assert db._bot_stats_snapshot.computes == computes
+    assert cached['total_users'] == first['total_users'] + 1
+    assert cached['total_purchases'] == first['total_purchases'] + 1
+
+    fresh = db.get_bot_statistics(max_age=0)
+    assert db._bot_stats_snapshot.computes == computes + 1
+    assert fresh['total_users'] == 4
+
+
+def test_recompute_does_not_block_bump_and_is_single_flight():
+    now = int(time.time())
+    _seed(now)
+    snapshot = db._bot_stats_snapshot
+    db.get_bot_statistics()
+    computes = snapshot.computes
+    lock_free = []
+
+    def on_execute(*args, **kwargs):
+        # Пока идут агрегирующие запросы, путь покупки может сдвинуть счётчик
+        acquired = snapshot._lock.acquire(blocking=False)
+        lock_free.append(acquired)
+        if acquired:
+            snapshot._lock.release()
+
+    event.listen(db.engine, "before_cursor_execute", on_execute)
+    try:
+        db.get_bot_statistics(max_age=0)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", on_execute)
+    assert lock_free and all(lock_free)
+    assert snapshot.computes == computes + 1
+
+    # Запрос, пришедший до конца чужого пересчёта, берёт его результат даже при max_age=0
+    requested_at = time.monotonic() - 60
+    assert snapshot._fresh(0, requested_at) is not None
+    assert snapshot._fresh(0, float('inf')) is None
@@ -0,0 +1,195 @@
+# file: test_broadcast.py
+"""
+Тесты движка рассылок: общий лимит скорости с паузой по RetryAfter,
+курсор задания в БД (продолжение после рестарта), пометка заблокировавших бота,
+снятие фоновых рассылок при остановке бота.
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+from telegram.error import Forbidden, RetryAfter
+
+# Добавляем корень проекта в пути поиска модулей
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.database as db
+from core.database import Player
+from reload_bot.broadcast import BroadcastEngine, BroadcastTasks, TokenBucket
+
+
+class FakeBot:
+    def __init__(self, blocked=(), flood_once=(), on_send=None):
+        self.blocked = set(blocked)
+        self.flood_once = set(flood_once)
+        self.on_send = on_send
+        self.delivered = []
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        if chat_id in self.flood_once:
+            self.flood_once.discard(chat_id)
+            raise RetryAfter(0)
+        if chat_id in self.blocked:
+            raise Forbidden("Forbidden: bot was blocked by the user")
+        self.delivered.append(chat_id)
+        if self.on_send:
+            self.on_send(chat_id)
+
+
+def _seed(count, blocked_before=()):
+    dbs = db.SessionLocal()
+    dbs.add_all([
+        Player(user_id=uid, username=f"user{uid}", bot_blocked_at=100 if uid in blocked_before else 0)
+        for uid in range(1, count + 1)
+    ])
+    dbs.commit()
+    dbs.close()
+
+
+def _blocked_ids():
+    dbs = db.SessionLocal()
+    try:
+        return {r.user_id for r in dbs.query(Player.user_id).filter(Player.bot_blocked_at > 0)}
+    finally:
+        dbs.close()
+
+
+def test_token_bucket_rate_and_global_pause():
+    async def scenario():
+        bucket = TokenBucket(rate=200)
+        t0 = time.perf_counter()
+        await asyncio.gather(*(bucket.acquire() for _ in range(21)))
+        spent = time.perf_counter() - t0
+
+        bucket.pause(0.2)
+        t1 = time.perf_counter()
+        await asyncio.gather(bucket.acquire(), bucket.acquire())
+        return spent, time.perf_counter() - t1
+
+    spent, paused = asyncio.run(scenario())
+    # Первый токен есть сразу, остальные 20 — по 5 мс
+    assert spent >= 0.09
+    assert paused >= 0.2
+
+
+def test_broadcast_marks_blocked_and_respects_retry_after():
+    _seed(30, blocked_before={3})
+    job, created = db.create_broadcast_job(1, 1, 'text', "<b>Новости</b>")
+    assert created and job['total'] == 29
+    # Та же рассылка повторно не создаётся
+    again, created_again = db.create_broadcast_job(1, 1, 'text', "<b>Новости</b>")
+    assert not created_again and again['id'] == job['id']
+
+    bot = FakeBot(blocked={5, 17}, flood_once={7})
+    progress = []
+
+    async def on_progress(j):
+        progress.append(j['status'])
+
+    engine = BroadcastEngine(bot, bucket=TokenBucket(rate=1000), concurrency=4, page_size=10, progress_interval=0)
+    final = asyncio.run(engine.run(job['id'], on_progress=on_progress))
+
+    assert final['status'] == 'done' and final['finished_at']
+    assert final['sent'] == 27 and final['blocked'] == 2 and final['failed'] == 0
+    assert final['cursor_user_id'] == 30
+    assert sorted(bot.delivered) == [uid for uid in range(1, 31) if uid not in (3, 5, 17)]
+    assert _blocked_ids() == {3, 5, 17}
+    assert progress[-1] == 'done'
+    assert db.get_all_users_for_broadcast().count(5) == 0
+
+
+def test_broadcast_resumes_from_cursor():
+    _seed(25)
+    job, _ = db.create_broadcast_job(1, 1, 'text', "Привет")
+    # Процесс упал после первой страницы: курсор и счётчики уже в БД
+    db.checkpoint_broadcast_job(job['id'], 10, sent=10)
+    assert [j['id'] for j in db.get_running_broadcast_jobs()] == [job['id']]
+
+    bot = FakeBot()
+    engine = BroadcastEngine(bot, bucket=TokenBucket(rate=1000), concurrency=3, page_size=5)
+    final = asyncio.run(engine.run(job['id']))
+    assert sorted(bot.delivered) == list(range(11, 26))
+    assert final['sent'] == 25 and final['status'] == 'done'
+    assert db.get_running_broadcast_jobs() == []
+
+
+def test_broadcast_stops_on_cancel_during_run():
+    _seed(25)
+    job, _ = db.create_broadcast_job(1, 1, 'text', "Другой текст")
+
+    def cancel_mid_page(uid):
+        # Админ отменяет рассылку, пока движок отправляет первую страницу
+        if uid == 3:
+            assert db.cancel_broadcast_job(job['id'])
+
+    bot = FakeBot(on_send=cancel_mid_page)
+    engine = BroadcastEngine(bot, bucket=TokenBucket(rate=1000), concurrency=1, page_size=5)
+    stopped = asyncio.run(engine.run(job['id']))
+
+    # Текущая страница досылается, следующая уже не начинается
+    assert bot.delivered == [1, 2, 3, 4, 5]
+    assert stopped['status'] == 'cancelled' and stopped['finished_at']
+    # Чекпоинт страницы сохранил курсор и счётчики, отмена не перезаписана на 'done'
+    stored = db.get_broadcast_job(job['id'])
+    assert stored['status'] == 'cancelled'
+    assert stored['cursor_user_id'] == 5 and stored['sent'] == 5
+    assert db.get_running_broadcast_jobs() == []
+
+    # Повторный запуск отменённого задания ничего не отправляет
+    again = asyncio.run(BroadcastEngine(bot, bucket=TokenBucket(rate=1000), page_size=5).run(job['id']))
+    assert again['status'] == 'cancelled' and bot.delivered == [1, 2, 3, 4, 5]
+
+
+def test_cancel_all_returns_while_broadcast_is_running():
+    _seed(12)
+    job, _ = db.create_broadcast_job(1, 1, 'text', "Долгая рассылка")
+
+    async def scenario():
+        stuck = asyncio.Event()
+
+        class StuckBot(FakeBot):
+            async def send_message(self, chat_id, text, parse_mode=None):
+                if chat_id > 5:
+                    await stuck.wait()  # Telegram «завис» на второй странице
+                await super().send_message(chat_id, text, parse_mode)
+
+        bot = StuckBot()
+        engine = BroadcastEngine(bot, bucket=TokenBucket(rate=1000), concurrency=1, page_size=5)
+        tasks = BroadcastTasks()
+        assert tasks.launch(job['id'], lambda: engine.run(job['id']))
+        assert not tasks.launch(job['id'], lambda: engine.run(job['id']))
+        for _ in range(200):
+            if bot.delivered == [1, 2, 3, 4, 5] and db.get_broadcast_job(job['id'])['cursor_user_id'] == 5:
+                break
+            await asyncio.sleep(0.01)
+        assert job['id'] in tasks
+
+        # Остановка бота не ждёт конца рассылки
+        assert await asyncio.wait_for(tasks.cancel_all(), timeout=1) == 1
+        assert job['id'] not in tasks and len(tasks) == 0
+
+    asyncio.run(scenario())
+    # Задание осталось незавершённым с курсором первой страницы — его подхватит рестарт
+    stored = db.get_broadcast_job(job['id'])
+    assert stored['status'] == 'running' and stored['cursor_user_id'] == 5
+    assert [j['id'] for j in db.get_running_broadcast_jobs()] == [job['id']]
+
+
+def test_blocked_flag_cleared_only_by_users_own_update():
+    _seed(3, blocked_before={2})
+    assert db.is_user_marked_unreachable(2) and not db.is_user_marked_unreachable(1)
+
+    # Админ смотрит чужой профиль, группа трогает участника — пометка остаётся
+    db.get_or_create_player(2, "someone_else_looked")
+    assert _blocked_ids() == {2}
+
+    assert db.mark_user_reachable(1) is False
+    assert db.mark_user_reachable(2) is True
+    assert _blocked_ids() == set() and not db.is_user_marked_unreachable(2)
+
+    # Новая пометка рассылкой сразу видна проверке в памяти
+    db.mark_users_bot_blocked([3])
+    assert db.is_user_marked_unreachable(3)
+    assert db.get_all_users_for_broadcast() == [1, 2]
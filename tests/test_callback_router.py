@@ -0,0 +1,79 @@
+import os
+import sys
+# Добавляем корень проекта в пути поиска модулей
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+from types import SimpleNamespace
+
+from modules.admin.admin_permissions import (
+    ADMIN_CALLBACK_LEVELS,
+    ADMIN_CALLBACK_PREFIX_LEVELS,
+    get_required_level_for_callback,
+)
+from modules.plantation import ordinary_plantation
+from reload_bot.callback_router import CallbackRouter
+from reload_bot.modules import casino, premium_shop
+
+
+async def _noop(*args):
+    return args
+
+
+def test_exact_and_longest_prefix_resolution():
+    router = CallbackRouter()
+    router.exact("fav_menu", _noop, name="menu")
+    router.prefix("fav_pick_page_", _noop, name="pick_page")
+    router.prefix("fav_pick_", _noop, name="pick")
+    router.exact(("a", "b"), _noop, name="ab")
+
+    assert router.resolve("fav_menu")[0].name == "menu"
+    assert router.resolve("fav_pick_page_3")[0].name == "pick_page"
+    assert router.resolve("fav_pick_7")[0].name == "pick"
+    assert router.resolve("b")[0].name == "ab"
+    assert router.resolve("fav_")[0] is None
+    assert router.resolve("")[0] is None and router.resolve(None)[0] is None
+
+
+def test_earlier_routes_win_like_if_elif_chain():
+    router = CallbackRouter()
+    router.prefix("silk_", _noop, name="silk")
+    router.exact("silk_market", _noop, name="market")
+    router.prefix("silk_plant_", _noop, name="plant")
+    router.exact("menu", _noop, name="menu")
+    router.exact("menu", _noop, name="menu2")
+
+    assert router.resolve("silk_market")[0].name == "silk"
+    assert router.resolve("silk_plant_1")[0].name == "silk"
+    assert router.resolve("menu")[0].name == "menu"
+    assert router.shadowed == [("market", "silk_market"), ("plant", "silk_plant_"), ("menu2", "menu")]
+
+
+def test_levels_match_permission_matrix():
+    router = CallbackRouter(ADMIN_CALLBACK_LEVELS, ADMIN_CALLBACK_PREFIX_LEVELS)
+    router.exact(list(ADMIN_CALLBACK_LEVELS), _noop)
+    router.prefix("admin_player_details:", _noop)
+    router.exact("menu", _noop)
+
+    samples = list(ADMIN_CALLBACK_LEVELS) + [p + "42" for p, _ in ADMIN_CALLBACK_PREFIX_LEVELS]
+    samples += ["admin_player_details:5", "admin_players_list:2", "menu", "promo_deact_do:1", "unknown"]
+    for data in samples:
+        assert router.resolve(data)[1] == get_required_level_for_callback(data), data
+
+
+def test_module_routes_and_call_signature():
+    router = CallbackRouter()
+    router.module(ordinary_plantation, _noop)
+    router.module(casino, _noop)
+    router.module(premium_shop, _noop)
+    router.exact("menu", _noop)
+
+    for data in ("plantation_shop", "fert_buy_3", "city_casino", "casino_choice_coin_flip:heads"):
+        route, _ = router.resolve(data)
+        assert route is not None and route.pass_data
+        assert asyncio.run(route("u", "c", data)) == ("u", "c", data)
+    for data in premium_shop.CALLBACK_EXACT:
+        assert router.resolve(data)[0].name == "premium_shop"
+
+    update = SimpleNamespace()
+    assert asyncio.run(router.resolve("menu")[0](update, "ctx", "menu")) == (update, "ctx")
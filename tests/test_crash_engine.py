@@ -0,0 +1,158 @@
+# file: test_crash_engine.py
+"""
+Тесты движка «Краш»: множитель и исход считаются по времени (совпадают с прежним
+пошаговым ростом и не зависят от отправленных кадров), один тикер ведёт все игры,
+пропускает неизменные кадры и замедляет анимацию при нехватке лимита Telegram.
+"""
+
+import asyncio
+import os
+import sys
+
+from telegram.error import RetryAfter
+
+# Добавляем корень проекта в пути поиска модулей
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.constants import CRASH_GROWTH_RATE, CRASH_UPDATE_INTERVAL
+from reload_bot.broadcast import TokenBucket
+from reload_bot.crash_engine import CrashEngine, CrashGame, crash_elapsed_for, crash_multiplier_at
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeBot:
+    def __init__(self, flood_once=False):
+        self.edits = []
+        self.flood_once = flood_once
+
+    async def edit_message_text(self, chat_id, message_id, text, reply_markup=None, parse_mode=None):
+        if self.flood_once:
+            self.flood_once = False
+            raise RetryAfter(3)
+        self.edits.append((chat_id, text))
+
+
+def _frame(game, multiplier):
+    return f"x{multiplier:.2f}", None
+
+
+def _engine(clock, crashed, rate=100.0, render=_frame):
+    async def on_crash(bot, game):
+        crashed.append(game.user_id)
+
+    return CrashEngine(
+        render=render,
+        on_crash=on_crash,
+        bucket=TokenBucket(rate, capacity=rate, clock=clock),
+        tick_interval=3600,  # фоновый тикер не вмешивается: шаги делает сам тест
+        clock=clock,
+    )
+
+
+def _game(user_id, crash_point):
+    return CrashGame(user_id, f"u{user_id}", 100, crash_point, chat_id=user_id, message_id=1)
+
+
+def test_multiplier_curve_matches_old_steps():
+    value = 1.0
+    for step in range(1, 40):
+        value = value + CRASH_GROWTH_RATE + value * 0.05
+        assert abs(crash_multiplier_at(step * CRASH_UPDATE_INTERVAL) - value) < 0.011
+    for point in (1.01, 1.5, 2.37, 10.0, 55.5):
+        assert crash_multiplier_at(crash_elapsed_for(point) + 1e-9) == point
+        assert crash_multiplier_at(crash_elapsed_for(point) - 0.01) < point
+
+
+def test_cashout_is_resolved_by_timestamp():
+    clock = FakeClock()
+    crashed = []
+
+    async def scenario():
+        engine = _engine(clock, crashed)
+        bot = FakeBot()
+        early = engine.start(bot, _game(1, 2.0))
+        late = engine.start(bot, _game(2, 2.0))
+        # Тикер не успел ни одного кадра, но выплата точная на момент нажатия
+        clock.now += crash_elapsed_for(1.5)
+        won = engine.cash_out(1)
+        clock.now = late.crash_at + 0.05
+        lost = engine.cash_out(2)
+        assert engine.cash_out(2) is None and not engine.games
+        await asyncio.sleep(0)
+        return early, won, lost
+
+    early, won, lost = asyncio.run(scenario())
+    assert won is early and won.status == 'cashed_out' and won.cashout_multiplier == 1.5
+    assert lost.status == 'crashed' and lost.cashout_multiplier is None
+    assert crashed == []  # исход отдан обработчику cashout, тикер его не повторяет
+
+
+def test_ticker_coalesces_and_adapts_frame_rate():
+    clock = FakeClock()
+    crashed = []
+
+    async def scenario():
+        engine = _engine(clock, crashed, rate=2.0)
+        bot = FakeBot()
+        for uid in range(1, 5):
+            engine.start(bot, _game(uid, 50.0))
+        engine.start(bot, _game(9, 1.5))
+
+        clock.now += CRASH_UPDATE_INTERVAL
+        engine.tick()
+        await asyncio.sleep(0)
+        # Токенов хватило на два кадра, остальные отложены, интервал кадров вырос
+        first = list(bot.edits)
+        slowed = engine.frame_interval
+        engine.tick()  # то же время: кадры не положены
+        await asyncio.sleep(0)
+        same_tick = len(bot.edits)
+
+        clock.now += crash_elapsed_for(1.5)
+        engine.tick()
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        return engine, first, slowed, same_tick
+
+    engine, first, slowed, same_tick = asyncio.run(scenario())
+    assert len(first) == 2 and slowed > CRASH_UPDATE_INTERVAL
+    assert same_tick == 2
+    assert crashed == [9] and sorted(engine.games) == [1, 2, 3, 4]
+
+
+def test_unchanged_frames_and_retry_after():
+    clock = FakeClock()
+    crashed = []
+
+    async def scenario():
+        engine = _engine(clock, crashed, render=lambda game, m: ("static", None))
+        bot = FakeBot(flood_once=True)
+        game = engine.start(bot, _game(1, 50.0))
+        clock.now += CRASH_UPDATE_INTERVAL
+        engine.tick()
+        await engine.settle(game)
+        paused = engine.bucket.paused_for
+        retry_at = game.next_frame_at
+        engine.tick()
+        throttled = engine.frame_interval
+
+        clock.now = retry_at + 0.1
+        engine.tick()
+        await engine.settle(game)
+        clock.now = game.next_frame_at
+        engine.tick()  # кадр не изменился — правки нет
+        await engine.settle(game)
+        engine.games.clear()
+        return engine, bot, paused, throttled
+
+    engine, bot, paused, throttled = asyncio.run(scenario())
+    assert paused == 3 and throttled > CRASH_UPDATE_INTERVAL
+    assert bot.edits == [(1, "static")]
+    assert engine.skipped == 1
@@ -0,0 +1,74 @@
+# file: test_db_async.py
+"""
+Тесты асинхронного шлюза core.db_async.
+"""
+
+import os
+import sys
+import asyncio
+import contextvars
+import threading
+
+import pytest
+
+# Добавляем корень проекта в пути поиска модулей
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.database as db
+import core.db_async as adb
+from core.database import Player
+
+
+def test_hot_function_runs_off_event_loop_thread():
+    loop_thread = threading.get_ident()
+
+    async def _run():
+        player = await adb.get_or_create_player(4242, "async_user")
+        worker_thread = await adb.call(threading.get_ident)
+        return player, worker_thread
+
+    player, worker_thread = asyncio.run(_run())
+
+    assert int(player.user_id) == 4242
+    assert player.username == "async_user"
+    assert worker_thread != loop_thread
+
+
+def test_proxy_resolves_database_function_at_call_time(monkeypatch):
+    monkeypatch.setattr(db, "get_player", lambda user_id: ("patched", user_id))
+
+    assert asyncio.run(adb.get_player(7)) == ("patched", 7)
+
+
+def test_generic_proxy_and_write_lane():
+    dbs = db.SessionLocal()
+    dbs.add(Player(user_id=555, username="seller", coins=10))
+    dbs.commit()
+    dbs.close()
+
+    async def _run():
+        coins = await adb.increment_coins(555, 5)
+        lane = await adb.call_write(lambda: threading.current_thread().name)
+        return coins, lane
+
+    coins, lane = asyncio.run(_run())
+
+    assert coins == 15
+    assert lane.startswith("reload-db-write")
+
+
+def test_contextvars_are_visible_in_worker():
+    marker = contextvars.ContextVar("marker", default=None)
+
+    async def _run():
+        marker.set("update-1")
+        return await adb.call(marker.get)
+
+    assert asyncio.run(_run()) == "update-1"
+
+
+def test_unknown_and_non_function_attributes_are_rejected():
+    with pytest.raises(AttributeError):
+        adb.Player
+    with pytest.raises(AttributeError):
+        adb.no_such_function
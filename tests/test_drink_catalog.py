@@ -0,0 +1,212 @@
+# file: test_drink_catalog.py
+"""
+Тесты кэша каталога энергетиков и взвешенной выборки для поиска.
+"""
+
+import os
+import sys
+import time
+import random
+from collections import Counter
+
+from sqlalchemy import event
+
+# Добавляем корень проекта в пути поиска модулей
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.database as db
+from core.database import DrinkDiscoveryStats, EnergyDrink
+
+
+def setup_drinks():
+    now_ts = int(time.time())
+    dbs = db.SessionLocal()
+    dbs.add_all([
+        EnergyDrink(id=1, name="Cold One", description="-"),
+        EnergyDrink(id=2, name="Neutral One", description="-"),
+        EnergyDrink(id=3, name="Hot One", description="-"),
+        EnergyDrink(id=4, name="Plant One", description="-", is_plantation=True),
+    ])
+    dbs.add_all([
+        DrinkDiscoveryStats(drink_id=1, total_discoveries=5, last_discovered_at=now_ts - 60),
+        DrinkDiscoveryStats(drink_id=2, total_discoveries=3, last_discovered_at=now_ts - 24 * 3600),
+    ])
+    dbs.commit()
+    dbs.close()
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, *args, **kwargs):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+
+
+def test_temperatures_and_plantation_exclusion():
+    setup_drinks()
+
+    assert db.get_drink_temperature(1) == 'cold'
+    assert db.get_drink_temperature(2) == 'neutral'
+    assert db.get_drink_temperature(3) == 'hot'
+    assert db.count_search_drinks() == 3
+    assert {d.id for d in db.get_weighted_drinks_list()} == {1, 2, 3}
+
+
+def test_sampling_is_weighted_and_reads_no_database_when_warm():
+    setup_drinks()
+    db.count_search_drinks()
+
+    rng = random.Random(7)
+    with QueryCounter(db.engine) as counter:
+        picks = Counter(db.pick_search_drink(rng=rng).id for _ in range(35000))
+        db.get_drink_temperature(2)
+
+    assert counter.count == 0
+    # Веса 0.5 : 1 : 2 -> доли 1/7, 2/7, 4/7
+    assert abs(picks[1] / 35000 - 1 / 7) < 0.01
+    assert abs(picks[2] / 35000 - 2 / 7) < 0.01
+    assert abs(picks[3] / 35000 - 4 / 7) < 0.01
+
+
+def test_favorite_multiplier_matches_scaled_weight():
+    setup_drinks()
+    rng = random.Random(11)
+
+    picks = Counter(db.pick_search_drink({1}, 3, rng=rng).id for _ in range(35000))
+
+    # Избранный холодный: 0.5 * 3 = 1.5 -> доли 1.5/4.5, 1/4.5, 2/4.5
+    assert abs(picks[1] / 35000 - 1.5 / 4.5) < 0.01
+    assert abs(picks[3] / 35000 - 2 / 4.5) < 0.01
+
+
+def test_sampler_rebuilds_only_when_buckets_change():
+    setup_drinks()
+    db.count_search_drinks()
+    rebuilds = db._drink_catalog.sampler_rebuilds
+
+    # Холодный напиток нашли ещё раз: распределение не меняется
+    db.record_drink_discovery(1)
+    db.pick_search_drink()
+    assert db._drink_catalog.sampler_rebuilds == rebuilds
+
+    # Горячий напиток нашли: он становится холодным
+    db.record_drink_discovery(3)
+    assert db.get_drink_temperature(3) == 'cold'
+    assert db._drink_catalog.sampler_rebuilds == rebuilds + 1
+
+
+def test_admin_paths_invalidate_catalog():
+    setup_drinks()
+    assert db.count_search_drinks() == 3
+
+    assert db.admin_add_drink("Fresh Drink", "new") is True
+    assert db.count_search_drinks() == 4
+
+    assert db.admin_delete_drink(3) is True
+    assert db.count_search_drinks() == 3
+    assert 3 not in {d.id for d in db.get_weighted_drinks_list()}
+
+
+def _stats_row(drink_id):
+    dbs = db.SessionLocal()
+    try:
+        return dbs.query(DrinkDiscoveryStats).filter_by(drink_id=drink_id).first()
+    finally:
+        dbs.close()
+
+
+def test_discoveries_are_buffered_and_flushed_in_one_upsert():
+    setup_drinks()
+    before = _stats_row(1)
+
+    for _ in range(4):
+        db.record_drink_discovery(1)
+    db.record_drink_discovery(3)
+
+    # До flush БД не тронута, но температура уже учитывает находку
+    assert _stats_row(3) is None
+    assert db.get_drink_temperature(3) == 'cold'
+
+    with QueryCounter(db.engine) as counter:
+        assert db.flush_drink_discovery_buffer() == 2
+    assert counter.count == 1  # один executemany-UPSERT (commit не считается запросом)
+
+    row1 = _stats_row(1)
+    row3 = _stats_row(3)
+    assert row1.total_discoveries == before.total_discoveries + 4
+    assert row1.last_discovered_at >= before.last_discovered_at
+    assert row3.total_discoveries == 1
+    assert row3.global_discoveries_today == 1
+    assert db.flush_drink_discovery_buffer() == 0
+
+
+def test_flush_resets_daily_counter_on_new_day():
+    setup_drinks()
+    today = int(time.time()) // 86400
+    dbs = db.SessionLocal()
+    row = dbs.query(DrinkDiscoveryStats).filter_by(drink_id=2).first()
+    row.global_discoveries_today = 9
+    row.last_reset_date = today - 1
+    dbs.commit()
+    dbs.close()
+
+    db.record_drink_discovery(2)
+    db.record_drink_discovery(2)
+    db.flush_drink_discovery_buffer()
+
+    row = _stats_row(2)
+    assert row.global_discoveries_today == 2
+    assert row.last_reset_date == today
+    assert row.total_discoveries == 5
+
+
+def test_catalog_reload_overlays_unflushed_discoveries():
+    setup_drinks()
+    db.record_drink_discovery(3)
+    db.invalidate_drink_catalog()
+
+    assert db.get_drink_temperature(3) == 'cold'
+    assert db._drink_catalog.stats(3)[0] == 1
+
+
+def test_flush_writes_outside_buffer_lock_and_drops_bad_rows():
+    setup_drinks()
+    buffer = db._drink_discovery_buffer
+    db.record_drink_discovery(1)
+    db.record_drink_discovery(3)
+    # Строка, которую SQLite не может привязать: не должна стопорить остальные
+    buffer._pending[object()] = [1, int(time.time()), int(time.time()) // 86400, 1]
+
+    lock_free = []
+
+    def on_execute(*args, **kwargs):
+        # Пока идёт запись, поиск может добавить находку без ожидания
+        acquired = buffer._lock.acquire(blocking=False)
+        lock_free.append(acquired)
+        if acquired:
+            buffer._lock.release()
+        buffer.add(2, int(time.time()))
+
+    event.listen(db.engine, "before_cursor_execute", on_execute)
+    try:
+        assert db.flush_drink_discovery_buffer() == 2
+    finally:
+        event.remove(db.engine, "before_cursor_execute", on_execute)
+
+    assert lock_free and all(lock_free)
+    assert buffer.dropped_rows == 1
+    assert _stats_row(3).total_discoveries == 1
+    assert _stats_row(1).total_discoveries == 6
+    # Плохая строка не вернулась в буфер; находки, сделанные во время записи, ждут следующего сброса
+    assert set(buffer.pending_view()) == {2}
+    assert db.flush_drink_discovery_buffer() == 1
+    assert db.flush_drink_discovery_buffer() == 0
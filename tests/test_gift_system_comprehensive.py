@@ -284,7 +284,8 @@ def test_gift_offer_and_acceptance():
     assert recip_item is not None
     assert recip_item.quantity == 2
     
-    # Проверим лог действий (ActionLog)
+    # Проверим лог действий (ActionLog): журнал пишется через буфер
+    db.flush_action_log()
     action = dbs.query(ActionLog).filter(ActionLog.user_id == giver_id, ActionLog.action_type == "gift_accepted").first()
     assert action is not None
     assert action.amount == 2
@@ -0,0 +1,129 @@
+# file: test_gift_transfer_concurrency.py
+"""
+Стресс-тест передачи подарков на файловой SQLite: много параллельных
+transfer_gift_bundle_atomic из разных потоков не создают и не теряют напитки,
+а одна позиция не может быть подарена дважды.
+"""
+
+import os
+import random
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import sessionmaker
+
+# Добавляем корень проекта в пути поиска модулей
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.database as db
+from core.database import EnergyDrink, GiftHistory, InventoryItem, Player
+
+PLAYERS = list(range(1, 7))
+DRINKS = list(range(1, 6))
+RARITIES = ("Basic", "Elite")
+
+
+def _use_file_database(monkeypatch, tmp_path):
+    engine = db.create_sqlite_engine(str(tmp_path / "gifts.db"), "production")
+    monkeypatch.setattr(db, "engine", engine)
+    monkeypatch.setattr(db, "SessionLocal", sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine))
+    db.Base.metadata.create_all(bind=engine)
+    return engine
+
+
+def _seed():
+    dbs = db.SessionLocal()
+    dbs.add_all([Player(user_id=uid, username=f"p{uid}") for uid in PLAYERS])
+    dbs.add_all([EnergyDrink(id=drink_id, name=f"Drink {drink_id}", description="") for drink_id in DRINKS])
+    dbs.add_all([
+        InventoryItem(player_id=uid, drink_id=drink_id, rarity=rarity, quantity=4)
+        for uid in PLAYERS for drink_id in DRINKS for rarity in RARITIES
+    ])
+    dbs.commit()
+    dbs.close()
+
+
+def _totals():
+    dbs = db.SessionLocal()
+    try:
+        return {
+            (row.drink_id, row.rarity): int(row.total)
+            for row in dbs.query(InventoryItem.drink_id, InventoryItem.rarity, func.sum(InventoryItem.quantity).label("total"))
+            .group_by(InventoryItem.drink_id, InventoryItem.rarity)
+        }
+    finally:
+        dbs.close()
+
+
+def _random_bundle(rng, giver):
+    """Бандл из текущего (возможно, уже устаревшего к моменту передачи) инвентаря гивера."""
+    dbs = db.SessionLocal()
+    try:
+        owned = dbs.query(InventoryItem).filter(InventoryItem.player_id == giver).all()
+    finally:
+        dbs.close()
+    picked = rng.sample(owned, min(len(owned), rng.randint(1, 3)))
+    return [
+        {"item_id": item.id, "drink_id": item.drink_id, "rarity": item.rarity, "quantity": rng.randint(1, item.quantity)}
+        for item in picked
+    ]
+
+
+def test_parallel_gifts_conserve_items(monkeypatch, tmp_path):
+    engine = _use_file_database(monkeypatch, tmp_path)
+    try:
+        _seed()
+        before = _totals()
+
+        def gift(seed):
+            rng = random.Random(seed)
+            giver, recipient = rng.sample(PLAYERS, 2)
+            bundle = _random_bundle(rng, giver)
+            result = db.transfer_gift_bundle_atomic(giver, recipient, bundle, log_status="accepted")
+            return result, sum(item["quantity"] for item in bundle)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(gift, range(400)))
+
+        reasons = {result["reason"] for result, _ in results if not result["ok"]}
+        accepted_units = sum(units for result, units in results if result["ok"])
+        assert "exception" not in reasons  # BEGIN IMMEDIATE ждёт блокировку, а не падает с database is locked
+        assert sum(1 for result, _ in results if result["ok"]) > 100
+        assert _totals() == before
+
+        dbs = db.SessionLocal()
+        try:
+            assert dbs.query(InventoryItem).filter(InventoryItem.quantity <= 0).count() == 0
+            assert dbs.query(GiftHistory).filter(GiftHistory.status == "accepted").count() == accepted_units
+        finally:
+            dbs.close()
+    finally:
+        engine.dispose()
+
+
+def test_same_item_cannot_be_gifted_twice(monkeypatch, tmp_path):
+    engine = _use_file_database(monkeypatch, tmp_path)
+    try:
+        _seed()
+        before = _totals()
+        dbs = db.SessionLocal()
+        item = dbs.query(InventoryItem).filter_by(player_id=1, drink_id=1, rarity="Basic").one()
+        dbs.close()
+        bundle = [{"item_id": item.id, "drink_id": 1, "rarity": "Basic", "quantity": 3}]
+
+        statements = []
+        listener = lambda conn, cursor, stmt, *a: statements.append(stmt)
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            with ThreadPoolExecutor(max_workers=6) as pool:
+                results = list(pool.map(lambda r: db.transfer_gift_bundle_atomic(1, r, bundle), range(2, 7)))
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+
+        assert sum(r["ok"] for r in results) == 1
+        assert {r.get("reason") for r in results if not r["ok"]} == {"insufficient_quantity"}
+        assert statements.count("BEGIN IMMEDIATE") == 5
+        assert _totals() == before
+    finally:
+        engine.dispose()
@@ -0,0 +1,86 @@
+# file: test_inventory_page.py
+"""
+Тесты слоя чтения инвентаря: сортировка, фильтры и пагинация в SQL совпадают
+с прежней сортировкой в Python, а кэш страниц сбрасывается любой записью в инвентарь.
+"""
+
+import os
+import random
+import sys
+
+from sqlalchemy import text
+
+# Добавляем корень проекта в пути поиска модулей
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.database as db
+from core.constants import RARITY_ORDER
+from core.database import EnergyDrink, InventoryItem, Player
+
+NAMES = ["Адреналин", "адреналин Раш", "Burn", "burn zero", "Монстр", "Red Bull", "Ягуар", "Flash", "Бочкарёв"]
+
+
+def _seed():
+    rng = random.Random(5)
+    dbs = db.SessionLocal()
+    dbs.add(Player(user_id=1, username="owner"))
+    dbs.add_all([EnergyDrink(id=i, name=name, description="") for i, name in enumerate(NAMES, 1)])
+    items = []
+    for drink_id in range(1, len(NAMES) + 1):
+        for rarity in rng.sample(RARITY_ORDER + ['Unknown'], 3):
+            items.append(InventoryItem(player_id=1, drink_id=drink_id, rarity=rarity, quantity=rng.randint(1, 9)))
+    dbs.add_all(items)
+    dbs.commit()
+    dbs.close()
+
+
+def _legacy_sorted():
+    items = db.get_player_inventory_with_details(1)
+    return sorted(
+        items,
+        key=lambda i: (
+            RARITY_ORDER.index(i.rarity) if i.rarity in RARITY_ORDER else len(RARITY_ORDER),
+            i.drink.name.lower(),
+        ),
+    )
+
+
+def test_pages_match_python_sort_and_filters():
+    _seed()
+    expected = [item.id for item in _legacy_sorted()]
+    pages = [db.get_inventory_page(1, page, 4) for page in range(1, 9)]
+    assert pages[0]['total'] == len(expected) and pages[0]['total_pages'] == 7
+    assert [row.id for p in pages[:7] for row in p['items']] == expected
+    # Страница за пределами диапазона приводится к последней
+    assert pages[7]['page'] == 7 and pages[7]['items'] == pages[6]['items']
+
+    by_qty = db.get_inventory_page(1, 1, 100, order='quantity')['items']
+    legacy_qty = sorted(db.get_player_inventory_with_details(1), key=lambda i: (-i.quantity, i.drink.name.lower()))
+    assert [row.id for row in by_qty] == [item.id for item in legacy_qty]
+
+    found = db.get_inventory_page(1, 1, 100, name_query="АДРЕНАЛИН")
+    assert {row.name for row in found['items']} == {"Адреналин", "адреналин Раш"}
+    assert found['total'] == 6
+    elite = db.get_inventory_page(1, 1, 100, rarity='Elite')['items']
+    assert elite and all(row.rarity == 'Elite' for row in elite)
+
+
+def test_page_cache_is_dropped_by_inventory_writes():
+    _seed()
+    first = db.get_inventory_page(1, 1, 5)
+    hits = db._inventory_pages.hits
+    assert db.get_inventory_page(1, 1, 5) is first
+    assert db._inventory_pages.hits == hits + 1
+
+    # Сырой SQL мимо ORM тоже меняет версию инвентаря
+    dbs = db.SessionLocal()
+    dbs.execute(text("UPDATE inventory_items SET quantity = 99 WHERE id = :id"), {"id": first['items'][0].id})
+    dbs.commit()
+    dbs.close()
+    fresh = db.get_inventory_page(1, 1, 5)
+    assert fresh is not first and fresh['items'][0].quantity == 99
+    assert db.get_inventory_page(1, 1, 100, order='quantity')['max_quantity'] == 99
+
+    assert db.sell_all_inventory(1)['ok']
+    left = db.get_inventory_page(1, 1, 100)
+    assert left['total'] and {row.rarity for row in left['items']} == {'Unknown'}  # редкость без цены не продаётся
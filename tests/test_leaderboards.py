@@ -0,0 +1,108 @@
+# file: test_leaderboards.py
+"""
+Тесты лидербордов в памяти: место игрока за O(log n), инкрементальные
+обновления через журнал leaderboard_changes (триггеры SQLite) и исключение забаненных.
+"""
+
+import os
+import random
+import sys
+
+# Добавляем корень проекта в пути поиска модулей
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.database as db
+from core.database import InventoryItem, LeaderboardChange, Player
+
+
+def test_ranked_scores_match_sorted_order():
+    rng = random.Random(3)
+    scores = db._RankedScores()
+    scores.BLOCK_SIZE = 8  # много блоков, чтобы проверить разбиение и дерево Фенвика
+    expected = {}
+    scores.load({uid: rng.randint(1, 50) for uid in range(1, 40)})
+    expected.update({uid: scores.get(uid) for uid in range(1, 40)})
+    for _ in range(500):
+        uid = rng.randint(1, 120)
+        score = rng.choice((0, rng.randint(1, 60)))
+        scores.set(uid, score)
+        if score > 0:
+            expected[uid] = score
+        else:
+            expected.pop(uid, None)
+
+    order = sorted(expected, key=lambda u: (-expected[u], u))
+    assert len(scores) == len(expected)
+    assert [uid for uid, _ in scores.top(len(order))] == order
+    for place, uid in enumerate(order, 1):
+        assert scores.rank(uid) == place
+    assert scores.rank(999) is None
+
+
+def test_leaderboards_follow_writes_and_skip_banned():
+    dbs = db.SessionLocal()
+    dbs.add_all([
+        Player(user_id=1, username="a", coins=100),
+        Player(user_id=2, username="b", coins=300),
+        Player(user_id=3, username="c", coins=200),
+    ])
+    dbs.add_all([
+        InventoryItem(player_id=1, drink_id=1, rarity='Basic', quantity=5),
+        InventoryItem(player_id=2, drink_id=1, rarity='Basic', quantity=1),
+    ])
+    dbs.commit()
+    dbs.close()
+
+    assert [row[0] for row in db.get_leaderboard()] == [1, 2]
+    assert [row['user_id'] for row in db.get_money_leaderboard()] == [2, 3, 1]
+    assert db.get_leaderboard_rank(1, 'coins') == {'rank': 3, 'score': 100, 'total': 3}
+    loads = db._leaderboards.full_loads
+
+    # Изменения любыми путями записи доходят через журнал, без полной перечитки.
+    # Чтения журнал не трогают: его применяет только периодическая sync_leaderboards
+    db.update_player(1, coins=1000)
+    dbs = db.SessionLocal()
+    dbs.add(InventoryItem(player_id=3, drink_id=2, rarity='Elite', quantity=9))
+    dbs.commit()
+    dbs.close()
+    assert [row['user_id'] for row in db.get_money_leaderboard()] == [2, 3, 1]
+    dbs = db.SessionLocal()
+    try:
+        assert dbs.query(LeaderboardChange).count() > 0
+    finally:
+        dbs.close()
+    # Журнал применяется целиком, включая строки, записанные до первой загрузки
+    assert db.sync_leaderboards() == 3
+    assert [row['user_id'] for row in db.get_money_leaderboard()] == [1, 2, 3]
+    assert db.get_leaderboard()[0][:3] == (3, "c", 9)
+    assert db._leaderboards.full_loads == loads
+
+    # Журнал вычищается после применения
+    dbs = db.SessionLocal()
+    try:
+        assert dbs.query(LeaderboardChange).count() == 0
+    finally:
+        dbs.close()
+
+    db.ban_user(1, reason="test")
+    assert [row['user_id'] for row in db.get_money_leaderboard()] == [2, 3]
+    assert db.get_leaderboard_rank(3, 'coins')['rank'] == 2
+    assert db.get_leaderboard_rank(1, 'coins')['rank'] is None
+
+
+def test_sync_keeps_applying_changes_after_journal_is_drained():
+    # seq без AUTOINCREMENT: после очистки журнала номера начинаются заново
+    db.get_or_create_player(11, "first")
+    db.get_or_create_player(12, "second")
+    db.update_player(11, coins=50)
+    db.update_player(12, coins=10)
+    assert db.get_leaderboard_rank(11, 'coins')['score'] == 50
+    db.sync_leaderboards()
+
+    db.update_player(12, coins=500)
+    assert db.sync_leaderboards() == 1
+    assert [row['user_id'] for row in db.get_money_leaderboard()][:2] == [12, 11]
+
+    db.update_player(11, coins=900)
+    assert db.sync_leaderboards() == 1
+    assert db.get_leaderboard_rank(11, 'coins') == {'rank': 1, 'score': 900, 'total': 2}
@@ -0,0 +1,98 @@
+# file: test_plantation_reminders.py
+"""
+Тесты сервиса напоминаний о поливе: куча сроков с ключом (игрок, грядка),
+перенос и отмена, пачки созревших напоминаний, сохранение сроков в
+plantation_beds.water_remind_at и восстановление одним запросом.
+"""
+
+import asyncio
+import os
+import sys
+
+# Добавляем корень проекта в пути поиска модулей
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.database as db
+from core.database import PlantationBed, Player, SeedType
+from modules.plantation.reminders import PlantationReminders
+
+
+def _seed():
+    dbs = db.SessionLocal()
+    dbs.add_all([
+        Player(user_id=1, username="farmer", remind_plantation=True),
+        Player(user_id=2, username="quiet", remind_plantation=False),
+        SeedType(id=1, name="Семя", water_interval_sec=600),
+        PlantationBed(owner_id=1, bed_index=1, state='growing', seed_type_id=1, planted_at=1000, last_watered_at=0),
+        PlantationBed(owner_id=1, bed_index=2, state='growing', seed_type_id=1, planted_at=1000, last_watered_at=1500),
+        PlantationBed(owner_id=1, bed_index=3, state='ready', seed_type_id=1, planted_at=1000, last_watered_at=1500),
+        PlantationBed(owner_id=2, bed_index=1, state='growing', seed_type_id=1, planted_at=1000, last_watered_at=0),
+    ])
+    dbs.commit()
+    dbs.close()
+
+
+def _remind_at():
+    dbs = db.SessionLocal()
+    try:
+        return {
+            (int(uid), int(bed)): ts
+            for uid, bed, ts in dbs.query(PlantationBed.owner_id, PlantationBed.bed_index, PlantationBed.water_remind_at)
+        }
+    finally:
+        dbs.close()
+
+
+def test_pop_due_in_order_with_reschedule_and_cancel():
+    timers = PlantationReminders(batch_size=2)
+    timers.schedule(1, 1, 130)
+    timers.schedule(1, 2, 110)
+    timers.schedule(2, 1, 120)
+    timers.schedule(3, 1, 500)
+    timers.schedule(3, 2, 510)
+    timers.schedule(2, 1, 105)  # перенос: старая запись в куче становится устаревшей
+    timers.cancel(1, 2)
+    assert timers.cancel_user(3) == 2
+
+    assert timers.pop_due(now=200) == [(2, 1), (1, 1)]
+    assert timers.pop_due(now=1000) == []
+    assert len(timers) == 0
+
+
+def test_restore_uses_saved_due_times_and_flush_persists_changes():
+    _seed()
+    timers = PlantationReminders()
+    # Без сохранённого срока — последний полив (или посадка) плюс интервал полива
+    assert timers.restore() == 2
+    assert timers.due_at(1, 1) == 1600 and timers.due_at(1, 2) == 2100
+    assert (2, 1) not in timers
+
+    timers.schedule(1, 1, 5000)
+    timers.cancel(1, 2)
+    assert timers.flush() == 2
+    assert _remind_at()[(1, 1)] == 5000 and _remind_at()[(1, 2)] is None
+
+    # После рестарта берётся сохранённый срок (например, отложенное напоминание)
+    restarted = PlantationReminders()
+    assert restarted.restore() == 2
+    assert restarted.due_at(1, 1) == 5000
+
+
+def test_tick_restores_once_and_fires_batches():
+    _seed()
+    timers = PlantationReminders(batch_size=1)
+    fired = []
+
+    async def runner(beds):
+        fired.extend(beds)
+        for user_id, bed_index in beds:
+            timers.schedule_in(user_id, bed_index, 600, now=3000)
+
+    async def scenario():
+        assert await timers.tick(runner, now=2500) == 1
+        assert await timers.tick(runner, now=2500) == 1
+        assert await timers.tick(runner, now=2500) == 0
+
+    asyncio.run(scenario())
+    assert fired == [(1, 1), (1, 2)]
+    assert _remind_at()[(1, 1)] == 3600 and _remind_at()[(1, 2)] == 3600
@@ -0,0 +1,71 @@
+# file: test_player_identity.py
+"""
+Тесты синхронизации имён в get_or_create_player (условный UPSERT, без лишних записей).
+"""
+
+import os
+import sys
+
+from sqlalchemy import event
+
+# Добавляем корень проекта в пути поиска модулей
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.database as db
+
+
+class StatementLog:
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def _on_execute(self, conn, cursor, statement, *args):
+        self.statements.append(statement.lstrip().split(None, 1)[0].upper())
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+
+    @property
+    def writes(self):
+        return [s for s in self.statements if s != "SELECT"]
+
+
+def test_new_player_gets_column_defaults():
+    with StatementLog(db.engine) as log:
+        player = db.get_or_create_player(1, "new_user", "New User")
+    assert log.writes == ["INSERT"]
+    assert player.username == "new_user" and player.display_name == "New User"
+    assert player.coins == 0 and player.rating == 0
+
+
+def test_unchanged_identity_issues_no_writes():
+    db.get_or_create_player(2, "same_user", "Same")
+    with StatementLog(db.engine) as log:
+        for _ in range(5):
+            player = db.get_or_create_player(2, "same_user", "Same")
+            db.get_or_create_player(2, "same_user")
+            db.get_or_create_player(2)
+    assert log.writes == []
+    assert player.username == "same_user"
+
+
+def test_changed_names_written_in_one_statement():
+    db.get_or_create_player(3, "old_name", "Old")
+    with StatementLog(db.engine) as log:
+        player = db.get_or_create_player(3, "new_name", "New")
+    assert log.writes == ["INSERT"]
+    assert (player.username, player.display_name) == ("new_name", "New")
+
+    # Невалидный username уходит в display_name и не затирает сохранённый username
+    player = db.get_or_create_player(3, "Иван Петров")
+    assert (player.username, player.display_name) == ("new_name", "Иван Петров")
+
+
+def test_names_normalized_without_cache():
+    assert db.normalize_player_names("@alpha") == ("alpha", None)
+    assert db.normalize_player_names("no", "Display ") == (None, "Display")
+    assert db.normalize_player_names("Иван Петров") == (None, "Иван Петров")
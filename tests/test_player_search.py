@@ -0,0 +1,70 @@
+# file: test_player_search.py
+"""
+Тесты поискового индекса игроков: колонка username_lower и FTS5-таблица player_search
+ведутся триггерами (в том числе через get_or_create_player), а поиск по нику
+и display_name идёт по индексу без сканирования players.
+"""
+
+import os
+import sys
+
+from sqlalchemy import event, text
+
+# Добавляем корень проекта в пути поиска модулей
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.database as db
+from core.database import Player
+
+
+def _seed():
+    db.get_or_create_player(101, "Cool_Guy")
+    db.get_or_create_player(102, "coolguy")
+    db.get_or_create_player(103, None, "Иван Петров")
+    db.get_or_create_player(104, "Zed")
+
+
+def test_index_follows_get_or_create_player():
+    _seed()
+    assert db.get_player(101).username_lower == "cool_guy"
+
+    # Смена ника через get_or_create_player обновляет и колонку, и FTS
+    db.get_or_create_player(101, "Hot_Guy")
+    dbs = db.SessionLocal()
+    try:
+        assert dbs.query(Player.username_lower).filter(Player.user_id == 101).scalar() == "hot_guy"
+        rows = dbs.execute(text("SELECT rowid FROM player_search WHERE player_search MATCH 'username : \"t_gu\"'")).all()
+        assert [r[0] for r in rows] == [101]
+    finally:
+        dbs.close()
+
+    db.get_or_create_player(101, "Cool_Guy")
+    assert db.find_player_by_identifier("@COOL_GUY")["player"].user_id == 101
+    assert db.get_player_by_username("coolGuy").user_id == 102
+
+
+def test_partial_search_uses_index():
+    _seed()
+    statements = []
+    listener = lambda conn, cursor, stmt, *a: statements.append(stmt)
+    event.listen(db.engine, "before_cursor_execute", listener)
+    try:
+        res = db.search_players_by_username("OOLG")
+        multiple = db.find_player_by_identifier("ool")
+        cyrillic = db.find_player_by_identifier("иван")
+    finally:
+        event.remove(db.engine, "before_cursor_execute", listener)
+
+    assert res["total"] == 1 and res["items"][0]["user_id"] == 102
+    assert multiple["reason"] == "multiple"
+    assert [c["user_id"] for c in multiple["candidates"]] == [101, 102]
+    assert cyrillic["ok"] and cyrillic["player"].user_id == 103
+    assert any("player_search MATCH" in st for st in statements)
+    assert not any("LIKE" in st for st in statements)
+
+
+def test_short_query_falls_back_to_scan():
+    _seed()
+    res = db.search_players_by_username("ze")
+    assert [item["user_id"] for item in res["items"]] == [104]
+    assert db.search_players_by_username("_")["total"] == 1
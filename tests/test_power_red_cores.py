@@ -161,6 +161,7 @@ def test_red_core_luck_exchange_spends_exact_cores_and_logs():
     dbs = db.SessionLocal()
     try:
         player = dbs.query(Player).filter(Player.user_id == user_id).first()
+        db.flush_action_log()
         action = dbs.query(ActionLog).filter(ActionLog.user_id == user_id, ActionLog.action_type == "power_red_cores").first()
         assert player.red_cores == 0
         assert player.luck_coupon_charges == 1
@@ -237,8 +238,8 @@ def test_red_core_bot_source_has_active_menu_routing_and_group_privacy():
     assert "ЛОКАЦИЯ В РАЗРАБОТКЕ" not in red_core_section
     assert "power_red_cores_mine:warm" in red_core_section
     assert "power_red_cores_exchange:luck" in red_core_section
-    assert "elif data.startswith('power_red_cores_mine:')" in source
-    assert "elif data.startswith('power_red_cores_exchange:')" in source
+    assert "router.prefix('power_red_cores_mine:', handle_power_red_cores_mine" in source
+    assert "router.prefix('power_red_cores_exchange:', handle_power_red_cores_exchange" in source
     assert "'power_'" in source
     assert "'sematori_ans:'" in source
 
@@ -0,0 +1,131 @@
+# file: test_promo_redeem.py
+"""
+Тесты активации промокодов: поиск по нормализованному коду через индекс в памяти,
+счётчики used_total и promo_user_usages, откат счётчиков при отказе, перенос
+старых активаций в счётчики и нагрузочный тест — 10 000 одновременных активаций
+одного кода на файловой SQLite без превышения лимитов.
+"""
+
+import os
+import random
+import sys
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import func, text
+from sqlalchemy.orm import sessionmaker
+
+# Добавляем корень проекта в пути поиска модулей
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.database as db
+from core.database import Player, Promo, PromoUsage, PromoUserUsage
+
+
+def _use_file_database(monkeypatch, tmp_path):
+    engine = db.create_sqlite_engine(str(tmp_path / "promo.db"), "production")
+    monkeypatch.setattr(db, "engine", engine)
+    monkeypatch.setattr(db, "SessionLocal", sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine))
+    db.Base.metadata.create_all(bind=engine)
+    return engine
+
+
+def _counters(promo_id):
+    dbs = db.SessionLocal()
+    try:
+        used_total = dbs.query(Promo.used_total).filter(Promo.id == promo_id).scalar()
+        usages = dbs.query(func.count(PromoUsage.id)).filter(PromoUsage.promo_id == promo_id).scalar()
+        per_user = dict(dbs.query(PromoUserUsage.user_id, PromoUserUsage.used).filter(PromoUserUsage.promo_id == promo_id))
+        return int(used_total), int(usages), per_user
+    finally:
+        dbs.close()
+
+
+def test_redeem_limits_and_counters():
+    # Код сохранён латиницей, пользователь вводит кириллицей и с пробелами
+    created = db.create_promo("PMT-2024", "coins", 50, max_uses=3, per_user_limit=2, expires_at=None)
+    assert created["ok"]
+    assert db.create_promo("рмт2024", "coins", 1, max_uses=0, per_user_limit=0, expires_at=None)["reason"] == "exists"
+    promo_id = created["id"]
+
+    assert db.redeem_promo(1, " рмт 2024 ")["coins_total"] == 50
+    assert db.redeem_promo(1, "pmt2024")["coins_total"] == 100
+    assert db.redeem_promo(1, "PMT2024")["reason"] == "per_user_limit_reached"
+    assert db.redeem_promo(2, "PMT2024")["ok"]
+    assert db.redeem_promo(3, "PMT2024")["reason"] == "max_uses_reached"
+    assert db.redeem_promo(4, "NOPE")["reason"] == "not_found_or_inactive"
+    assert _counters(promo_id) == (3, 3, {1: 2, 2: 1})
+    assert db.list_promos()[0]["used"] == 3
+
+    # Неверный приз: отказ откатывает и счётчики
+    broken = db.create_promo("BROKEN", "drink", 404, max_uses=5, per_user_limit=1, expires_at=None)["id"]
+    assert db.redeem_promo(1, "broken")["reason"] == "invalid_drink"
+    assert _counters(broken) == (0, 0, {})
+
+    # Деактивация сразу видна активации, хотя код уже лежит в индексе
+    assert db.create_promo("LATER", "coins", 10, max_uses=0, per_user_limit=0, expires_at=None)["ok"]
+    assert db.redeem_promo(5, "later")["ok"]
+    assert db.deactivate_promo_by_code("ЛАТЕР") is False
+    assert db.deactivate_promo_by_code("later") is True
+    assert db.redeem_promo(5, "later")["reason"] == "not_found_or_inactive"
+
+
+def test_schema_backfills_code_norm_and_counters(monkeypatch, tmp_path):
+    engine = _use_file_database(monkeypatch, tmp_path)
+    try:
+        with engine.begin() as conn:
+            conn.exec_driver_sql("DROP INDEX ix_promos_code_norm")
+            conn.exec_driver_sql("ALTER TABLE promos DROP COLUMN code_norm")
+            conn.exec_driver_sql("ALTER TABLE promos DROP COLUMN used_total")
+            conn.exec_driver_sql(
+                "INSERT INTO promos (id, code, kind, value, max_uses, per_user_limit, active) "
+                "VALUES (1, 'РМТ', 'coins', 5, 5, 3, 1)"
+            )
+            conn.exec_driver_sql("INSERT INTO promo_usages (promo_id, user_id) VALUES (1, 7), (1, 7), (1, 8)")
+        db.ensure_schema()
+
+        assert _counters(1) == (3, 3, {7: 2, 8: 1})
+        assert db.redeem_promo(7, "pmt")["ok"]
+        assert db.redeem_promo(7, "pmt")["reason"] == "per_user_limit_reached"
+        assert db.redeem_promo(9, "pmt")["ok"]
+        assert db.redeem_promo(10, "pmt")["reason"] == "max_uses_reached"
+        assert _counters(1) == (5, 5, {7: 3, 8: 1, 9: 1})
+        with engine.connect() as conn:
+            plan = " ".join(str(row[-1]) for row in conn.execute(
+                text("EXPLAIN QUERY PLAN SELECT id FROM promos WHERE code_norm = 'PMT'")
+            ))
+        assert "ix_promos_code_norm" in plan
+    finally:
+        engine.dispose()
+
+
+def test_concurrent_redemptions_never_exceed_limits(monkeypatch, tmp_path):
+    # 16 сырых потоков (в боте записи идут одной очередью db_async) спорят за BEGIN IMMEDIATE;
+    # обработчик занятости SQLite не справедлив, поэтому ждём блокировку дольше 5 с по умолчанию
+    monkeypatch.setitem(db.SQLITE_ENGINE_PROFILES['production']['pragmas'], 'busy_timeout', 60000)
+    engine = _use_file_database(monkeypatch, tmp_path)
+    try:
+        promo_id = db.create_promo("BLAST", "coins", 25, max_uses=1000, per_user_limit=1, expires_at=None)["id"]
+        rng = random.Random(7)
+        # 10 000 попыток от 8 000 пользователей: часть жмёт дважды
+        attempts = [rng.randint(1, 8000) for _ in range(10000)]
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            results = list(pool.map(lambda uid: db.redeem_promo(uid, "blast"), attempts))
+
+        reasons = Counter(r.get("reason", "ok") for r in results)
+        assert set(reasons) <= {"ok", "max_uses_reached", "per_user_limit_reached"}
+        assert reasons["ok"] == 1000
+
+        used_total, usages, per_user = _counters(promo_id)
+        assert used_total == usages == 1000
+        assert len(per_user) == 1000 and set(per_user.values()) == {1}
+        winners = {uid for uid, r in zip(attempts, results) if r.get("ok")}
+        assert winners == set(per_user)
+
+        dbs = db.SessionLocal()
+        try:
+            assert dbs.query(func.sum(Player.coins)).scalar() == 1000 * 25
+        finally:
+            dbs.close()
+    finally:
+        engine.dispose()
@@ -0,0 +1,88 @@
+# file: test_receiver_bulk_sell.py
+"""
+Тесты массовой продажи через Приёмник: выплаты из таблицы по рейтингу совпадают
+с поштучным расчётом, продажа выполняется одним DELETE/UPDATE, dry_run ничего не меняет.
+"""
+
+import os
+import sys
+
+from sqlalchemy import event
+
+# Добавляем корень проекта в пути поиска модулей
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.database as db
+from core.database import InventoryItem, Player
+
+
+def _seed():
+    dbs = db.SessionLocal()
+    dbs.add(Player(user_id=1, username="collector", coins=100, rating=300))
+    dbs.add_all([
+        InventoryItem(player_id=1, drink_id=1, rarity='Basic', quantity=5),
+        InventoryItem(player_id=1, drink_id=2, rarity='Basic', quantity=1),
+        InventoryItem(player_id=1, drink_id=3, rarity='Elite', quantity=3),
+        InventoryItem(player_id=1, drink_id=4, rarity='Unknown', quantity=2),
+    ])
+    dbs.commit()
+    dbs.close()
+
+
+def _inventory():
+    dbs = db.SessionLocal()
+    try:
+        return {row.drink_id: row.quantity for row in dbs.query(InventoryItem).filter(InventoryItem.player_id == 1)}
+    finally:
+        dbs.close()
+
+
+def test_payout_table_matches_unit_payout():
+    for rating in (0, 75, 300, 2000):
+        table = db._receiver_payout_table(rating)
+        for rarity in db.RECEIVER_PRICES:
+            assert table.get(rarity, 0) == db.get_receiver_unit_payout_with_rating(rarity, rating)
+
+
+def test_dry_run_preview_then_bulk_sell_all():
+    _seed()
+    basic = db.get_receiver_unit_payout_with_rating('Basic', 300)
+    elite = db.get_receiver_unit_payout_with_rating('Elite', 300)
+
+    preview = db.preview_receiver_bulk_sell(1)
+    assert preview['ok'] and preview['dry_run']
+    assert preview['total_items_sold'] == 9 and preview['skipped_items'] == 1
+    assert preview['total_earned'] == basic * 6 + elite * 3
+    assert preview['by_rarity']['Basic'] == {"quantity": 6, "items": 2, "unit_payout": basic, "total_payout": basic * 6}
+    assert len(_inventory()) == 4 and db.get_player(1).coins == 100
+
+    statements = []
+    listener = lambda conn, cursor, stmt, *a: statements.append(stmt)
+    event.listen(db.engine, "before_cursor_execute", listener)
+    try:
+        result = db.sell_all_inventory(1)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", listener)
+
+    assert result['ok'] and not result['dry_run']
+    assert result['total_earned'] == preview['total_earned'] and result['items_processed'] == 3
+    assert result['coins_after'] == 100 + preview['total_earned'] == db.get_player(1).coins
+    assert _inventory() == {4: 2}
+    assert len([st for st in statements if st.lstrip().upper().startswith('DELETE')]) == 1
+    assert db.sell_all_inventory(1)['reason'] == 'nothing_to_sell'
+
+
+def test_keep_one_and_single_rarity():
+    _seed()
+    elite = db.get_receiver_unit_payout_with_rating('Elite', 300)
+
+    assert db.sell_all_drinks_of_rarity(1, 'Unknown')['reason'] == 'unsupported_rarity'
+    assert db.sell_all_drinks_of_rarity(1, 'Majestic')['reason'] == 'no_items'
+    result = db.sell_all_drinks_of_rarity(1, 'Elite')
+    assert result['ok'] and result['unit_payout'] == elite and result['total_earned'] == elite * 3
+    assert 3 not in _inventory()
+
+    result = db.sell_absolutely_all_but_one(1)
+    assert result['ok'] and result['total_items_sold'] == 4 and result['items_processed'] == 1
+    assert _inventory() == {1: 1, 2: 1, 4: 2}
+    assert db.sell_absolutely_all_but_one(1)['reason'] == 'nothing_to_sell'
@@ -318,3 +318,12 @@ def test_text_action_routing_smoke():
 
     assert admin_logs.can_handle_text_action("logs_player")
     assert not admin_logs.can_handle_text_action("mod_check")
+
+
+def test_runtime_players_use_update_context_when_injected():
+    runtime = build_runtime()
+    assert runtime.players is runtime.db
+
+    update_context = SimpleNamespace(get_or_create_player=lambda user_id, *args, **kwargs: ("ctx", user_id))
+    runtime.update_context = update_context
+    assert runtime.players.get_or_create_player(7, "tester") == ("ctx", 7)
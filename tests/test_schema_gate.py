@@ -0,0 +1,89 @@
+# file: test_schema_gate.py
+"""
+Тесты шага миграции схемы: migrate_schema() один раз доводит старую базу до текущей
+схемы и штампует её (PRAGMA user_version + alembic_version), повторный старт сводится
+к одному чтению PRAGMA, а обработчики запросов (промокоды) не выполняют проверок DDL.
+"""
+
+import os
+import sys
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import sessionmaker
+
+# Добавляем корень проекта в пути поиска модулей
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.database as db
+from core.database import Player
+
+DDL_MARKERS = ("PRAGMA table_info", "CREATE ", "ALTER TABLE")
+
+
+class StatementLog:
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def _on_execute(self, conn, cursor, statement, *args):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+        return self.statements
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+
+
+def _columns(engine, table):
+    with engine.connect() as conn:
+        return {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")}
+
+
+def test_migrate_once_then_gate(monkeypatch, tmp_path):
+    engine = db.create_sqlite_engine(str(tmp_path / "legacy.db"), "production")
+    monkeypatch.setattr(db, "engine", engine)
+    monkeypatch.setattr(db, "SessionLocal", sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine))
+    monkeypatch.setattr(db, "_schema_verified", False)
+    try:
+        # База старой версии: без колонок, которые раньше добавлялись прямо из обработчиков
+        db.Base.metadata.create_all(bind=engine)
+        with engine.begin() as conn:
+            for table, column in (("promos", "rarity"), ("players", "casino_wins"), ("players", "selyuk_fragments")):
+                conn.exec_driver_sql(f"ALTER TABLE {table} DROP COLUMN {column}")
+        assert not db.is_schema_current()
+
+        assert db.migrate_schema() is True
+        assert {"casino_wins", "selyuk_fragments"} <= _columns(engine, "players")
+        assert "rarity" in _columns(engine, "promos")
+        with engine.connect() as conn:
+            assert conn.exec_driver_sql("PRAGMA user_version").scalar() == db.schema_fingerprint()
+            assert conn.execute(text("SELECT version_num FROM alembic_version")).scalar() == db.ALEMBIC_BASELINE_REVISION
+
+        # В том же процессе — флаг, после рестарта — одно чтение PRAGMA user_version
+        with StatementLog(engine) as statements:
+            assert db.migrate_schema() is False
+        assert statements == []
+        monkeypatch.setattr(db, "_schema_verified", False)
+        with StatementLog(engine) as statements:
+            assert db.migrate_schema() is False
+        assert statements == ["PRAGMA user_version"]
+    finally:
+        engine.dispose()
+
+
+def test_promo_redeem_runs_no_ddl():
+    dbs = db.SessionLocal()
+    dbs.add(Player(user_id=5, username="promo_user", coins=0))
+    dbs.commit()
+    dbs.close()
+    assert db.create_promo("SPRING", "coins", 150, max_uses=10, per_user_limit=1, expires_at=None)["ok"]
+
+    with StatementLog(db.engine) as statements:
+        result = db.redeem_promo(5, "spring")
+        db.get_or_create_player(5, "promo_user")
+        db.get_player_beds(5)
+    assert result["ok"]
+    assert db.get_player(5).coins == 150
+    assert not [st for st in statements if st.lstrip().upper().startswith(tuple(m.upper() for m in DDL_MARKERS))]
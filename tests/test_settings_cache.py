@@ -0,0 +1,91 @@
+# file: test_settings_cache.py
+"""
+Тесты кэша настроек bot_settings (чтение из памяти, write-through, TTL).
+"""
+
+import os
+import sys
+
+from sqlalchemy import event
+
+# Добавляем корень проекта в пути поиска модулей
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.database as db
+from core.database import BotSetting
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, *args, **kwargs):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+
+
+def _write_raw(key, value):
+    dbs = db.SessionLocal()
+    try:
+        row = dbs.query(BotSetting).filter(BotSetting.key == key).first()
+        if row:
+            row.value = value
+        else:
+            dbs.add(BotSetting(key=key, value=value))
+        dbs.commit()
+    finally:
+        dbs.close()
+
+
+def test_typed_reads_hit_memory_after_first_load():
+    _write_raw("casino_win_prob", "0.35")
+    _write_raw("neg_interval", "900")
+    _write_raw("feature_on", "yes")
+
+    assert db.get_setting_float("casino_win_prob", 0.5) == 0.35
+    with QueryCounter(db.engine) as counter:
+        for _ in range(100):
+            assert db.get_setting_int("neg_interval", 60) == 900
+            assert db.get_setting_bool("feature_on", False) is True
+            assert db.get_setting_str("missing", "dflt") == "dflt"
+            assert db.get_setting_int("casino_win_prob", 7) == 7
+    assert counter.count == 0
+
+
+def test_set_setting_writes_through_and_notifies():
+    seen = []
+    listener = lambda key, value: seen.append((key, value))
+    db.add_setting_listener(listener)
+    try:
+        assert db.get_setting_int("search_cooldown", 300) == 300
+        assert db.set_setting_int("search_cooldown", 120)
+        with QueryCounter(db.engine) as counter:
+            assert db.get_setting_int("search_cooldown", 300) == 120
+        assert counter.count == 0
+        assert db.set_setting_bool("flag", False)
+        assert db.get_setting_bool("flag", True) is False
+    finally:
+        db.remove_setting_listener(listener)
+    assert seen == [("search_cooldown", "120"), ("flag", "0")]
+
+    db.invalidate_settings_cache()
+    assert db.get_setting_int("search_cooldown", 300) == 120
+
+
+def test_ttl_refresh_picks_up_external_writes(monkeypatch):
+    assert db.get_setting_str("shared", None) is None
+    _write_raw("shared", "from-other-process")
+    # Без TTL снимок живёт до явной инвалидации
+    assert db.get_setting_str("shared", None) is None
+
+    monkeypatch.setattr(db, "SETTINGS_CACHE_TTL_SEC", 0.01)
+    real_monotonic = db.time.monotonic
+    monkeypatch.setattr(db.time, "monotonic", lambda: real_monotonic() + 1.0)
+    assert db.get_setting_str("shared", None) == "from-other-process"
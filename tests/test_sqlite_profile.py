@@ -0,0 +1,48 @@
+# file: test_sqlite_profile.py
+"""
+Тесты профилей движка SQLite: PRAGMA применяются к каждому соединению пула.
+"""
+
+import os
+import sys
+
+import pytest
+from sqlalchemy import text
+
+# Добавляем корень проекта в пути поиска модулей
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.database as db
+
+
+def _pragmas(engine):
+    with engine.connect() as conn:
+        return {
+            name: conn.execute(text(f"PRAGMA {name}")).scalar()
+            for name in ("journal_mode", "synchronous", "busy_timeout", "temp_store", "cache_size")
+        }
+
+
+def test_production_profile_applies_pragmas_and_pool(tmp_path):
+    engine = db.create_sqlite_engine(str(tmp_path / "prod.db"), "production")
+    try:
+        pragmas = _pragmas(engine)
+        assert pragmas["journal_mode"] == "wal"
+        assert pragmas["synchronous"] == 1  # NORMAL
+        assert pragmas["busy_timeout"] == db.DB_BUSY_TIMEOUT_MS
+        assert pragmas["temp_store"] == 2  # MEMORY
+        assert pragmas["cache_size"] == -64000
+        assert engine.pool.size() == db.DB_EXECUTOR_WORKERS + 2
+    finally:
+        engine.dispose()
+
+
+def test_legacy_profile_keeps_rollback_journal(tmp_path):
+    engine = db.create_sqlite_engine(str(tmp_path / "legacy.db"), "legacy")
+    try:
+        assert _pragmas(engine)["journal_mode"] == "delete"
+    finally:
+        engine.dispose()
+
+    with pytest.raises(ValueError):
+        db.create_sqlite_engine(str(tmp_path / "x.db"), "turbo")
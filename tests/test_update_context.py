@@ -0,0 +1,148 @@
+# file: test_update_context.py
+"""
+Тесты контекста апдейта: игрок и профиль доступа читаются один раз,
+запись в БД сбрасывает кэш, запросы считаются на апдейт; guard бана
+закрывает контекст сам, прежде чем остановить апдейт.
+"""
+
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+from telegram.ext import ApplicationHandlerStop
+
+# Добавляем корень проекта в пути поиска модулей
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.database as db
+import core.update_context as uctx
+from core.database import AdminUser, Player
+from reload_bot.ban_guard import make_ban_guard
+
+
+def _update(user_id):
+    return SimpleNamespace(effective_user=SimpleNamespace(id=user_id, username="tester"))
+
+
+def _callback_flow(api, user_id):
+    """Типичный callback: button_handler, конкретный хендлер, проверки доступа."""
+    api.get_or_create_player(user_id, username="tester", display_name="Test User")
+    player = api.get_or_create_player(user_id, "tester")
+    api.get_access_profile(user_id, username="tester", player=player)
+    api.get_effective_admin_level(user_id, "tester")
+    api.is_vip(user_id)
+    api.is_vip_plus(user_id)
+    return player
+
+
+def _seed(user_id):
+    dbs = db.SessionLocal()
+    dbs.add(Player(user_id=user_id, username="tester", display_name="Test User",
+                   vip_until=int(time.time()) + 3600))
+    dbs.commit()
+    dbs.close()
+
+
+def test_flow_queries_reduced_inside_update():
+    _seed(10)
+    uctx.reset_query_stats()
+
+    # Прежний путь через core.database: контекст только считает запросы
+    baseline = uctx.UpdateContext()
+    token = uctx._current.set(baseline)
+    try:
+        _callback_flow(db, 10)
+    finally:
+        uctx._current.reset(token)
+    assert baseline.queries >= 6
+
+    context = SimpleNamespace()
+    ctx = uctx.begin_update(_update(10), context)
+    assert uctx.current(context) is ctx
+    player = _callback_flow(uctx, 10)
+    assert uctx.is_vip(10) is True and uctx.is_vip_plus(10) is False
+    uctx.finish_update(ctx)
+
+    # Игрок и уровень админа — по одному запросу на весь апдейт
+    assert ctx.queries == 2
+    assert ctx.writes == 0
+    assert player.user_id == 10
+    stats = uctx.get_query_stats()
+    assert stats['updates'] == 1 and stats['max_queries'] == 2
+
+
+def test_write_during_update_drops_cached_player():
+    _seed(20)
+    ctx = uctx.begin_update(_update(20))
+    try:
+        player = uctx.get_or_create_player(20, "tester")
+        assert int(player.coins or 0) == 0
+        db.update_player(20, coins=500)
+        assert ctx.writes >= 1
+        assert uctx.get_or_create_player(20, "tester").coins == 500
+    finally:
+        uctx.finish_update(ctx)
+
+
+def test_name_change_bypasses_cache_and_admin_level_cached():
+    _seed(30)
+    dbs = db.SessionLocal()
+    dbs.add(AdminUser(user_id=30, username="tester", level=2))
+    dbs.commit()
+    dbs.close()
+
+    ctx = uctx.begin_update(_update(30))
+    try:
+        uctx.get_or_create_player(30, "tester")
+        assert uctx.get_or_create_player(30, "renamed_user").username == "renamed_user"
+        queries = ctx.queries
+        assert uctx.get_effective_admin_level(30, "renamed_user") == 2
+        assert uctx.get_effective_admin_level(30, "renamed_user") == 2
+        assert ctx.queries == queries + 1
+    finally:
+        uctx.finish_update(ctx)
+
+
+def test_closed_context_is_not_reused():
+    _seed(40)
+    ctx = uctx.begin_update(_update(40))
+    uctx.get_or_create_player(40, "tester")
+    uctx.finish_update(ctx)
+
+    assert uctx.current() is None
+    db.update_player(40, coins=77)
+    assert uctx.get_or_create_player(40, "tester").coins == 77
+    assert ctx.queries == 1
+
+
+
+def test_ban_guard_closes_context_before_stopping_update():
+    assert db.ban_user(50, reason="spam")
+    context = SimpleNamespace()
+
+    async def abort_if_banned(update, ctx):
+        return db.get_active_ban(update.effective_user.id) is not None
+
+    guard = make_ban_guard(abort_if_banned)
+
+    async def run(user_id):
+        ctx = uctx.begin_update(_update(user_id), context)
+        try:
+            await guard(_update(user_id), context)
+        except ApplicationHandlerStop:
+            return ctx, True
+        return ctx, False
+
+    updates = uctx.get_query_stats()['updates']
+    ctx, stopped = asyncio.run(run(50))
+    # Группа finish_update_context уже не запустится — контекст закрыт самим guard
+    assert stopped and ctx.closed
+    assert uctx.current(context) is None and uctx.current() is None
+    assert uctx.get_query_stats()['updates'] == updates + 1
+
+    ctx, stopped = asyncio.run(run(51))
+    assert not stopped and not ctx.closed
+    assert uctx.current(context) is ctx
+    uctx.finish_update(ctx)
@@ -0,0 +1,143 @@
+# file: test_youtube_download_service.py
+"""
+Тесты сервиса скачивания YouTube с подменённым экстрактором: одна загрузка на ролик
+при параллельных запросах, LRU-вытеснение кэша по объёму и повторная отправка по file_id.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Добавляем корень проекта в пути поиска модулей
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.youtube.download_service import AudioCache, YoutubeDownloadService, extract_video_id
+from modules.youtube.youtube_downloader import DownloadedAudio, YoutubeAudioDownloadError
+
+VIDEO_A = "dQw4w9WgXcQ"
+VIDEO_B = "9bZkp7q19f0"
+VIDEO_C = "kJQP7kiw5Fk"
+
+
+class StubExtractor:
+    """Пишет «mp3» на 90 байт и обложку на 10 байт; может ждать сигнала или падать."""
+
+    def __init__(self, gate=None, fail=False):
+        self.calls = []
+        self.gate = gate
+        self.fail = fail
+
+    def __call__(self, url, working_dir):
+        self.calls.append(url)
+        if self.gate is not None:
+            self.gate.wait(5)
+        if self.fail:
+            raise YoutubeAudioDownloadError("stub failure")
+        working_dir = Path(working_dir)
+        audio = working_dir / "Track [id].mp3"
+        audio.write_bytes(b"a" * 90)
+        thumb = working_dir / "Track [id].jpg"
+        thumb.write_bytes(b"t" * 10)
+        return DownloadedAudio(audio, thumb, "Track", "Uploader", 212, url, working_dir)
+
+
+def _service(tmp_path, extractor, max_cache_bytes=10_000):
+    return YoutubeDownloadService(
+        tmp_path / "cache",
+        max_cache_bytes=max_cache_bytes,
+        extractor=extractor,
+        executor=ThreadPoolExecutor(max_workers=2),
+    )
+
+
+def test_concurrent_requests_share_one_download(tmp_path):
+    gate = threading.Event()
+    extractor = StubExtractor(gate=gate)
+    service = _service(tmp_path, extractor)
+    links = [
+        f"https://www.youtube.com/watch?v={VIDEO_A}",
+        f"https://youtu.be/{VIDEO_A}?si=share",
+        f"https://music.youtube.com/watch?v={VIDEO_A}&list=RD",
+    ]
+    assert {extract_video_id(link) for link in links} == {VIDEO_A}
+
+    async def scenario():
+        tasks = [asyncio.ensure_future(service.fetch(link)) for link in links]
+        await asyncio.sleep(0.05)
+        gate.set()
+        entries = await asyncio.gather(*tasks)
+        again = await service.fetch(links[0])
+        return entries, again
+
+    entries, again = asyncio.run(scenario())
+    assert len(extractor.calls) == 1 and service.joined == 2
+    assert {e.key for e in entries} == {VIDEO_A} and again is entries[0]
+    assert service.cache_hits == 1
+    assert entries[0].audio_path.read_bytes() == b"a" * 90
+    assert not any((tmp_path / "cache" / ".staging").iterdir())
+
+    failing = _service(tmp_path / "other", StubExtractor(fail=True))
+
+    async def failing_scenario():
+        results = await asyncio.gather(
+            *(failing.fetch(f"https://youtu.be/{VIDEO_B}") for _ in range(2)), return_exceptions=True
+        )
+        return results, dict(failing._inflight)
+
+    results, inflight = asyncio.run(failing_scenario())
+    assert all(isinstance(r, YoutubeAudioDownloadError) for r in results)
+    assert inflight == {} and not failing.is_cached(f"https://youtu.be/{VIDEO_B}")
+
+
+def test_lru_eviction_by_total_size(tmp_path):
+    extractor = StubExtractor()
+    service = _service(tmp_path, extractor, max_cache_bytes=250)
+
+    async def scenario():
+        await service.fetch(f"https://youtu.be/{VIDEO_A}")
+        await service.fetch(f"https://youtu.be/{VIDEO_B}")
+        await service.fetch(f"https://youtu.be/{VIDEO_A}")  # A снова свежий
+        await service.fetch(f"https://youtu.be/{VIDEO_C}")
+
+    asyncio.run(scenario())
+    cache = service.cache
+    assert cache.total_bytes == 200
+    assert cache.peek(VIDEO_B) is None and not (tmp_path / "cache" / VIDEO_B).exists()
+    assert cache.peek(VIDEO_A).has_media and cache.peek(VIDEO_C).has_media
+
+    # Закреплённая (отправляемая) запись не вытесняется
+    cache.pin(VIDEO_A)
+    asyncio.run(service.fetch(f"https://youtu.be/{VIDEO_B}"))
+    assert cache.peek(VIDEO_A).has_media and cache.peek(VIDEO_C) is None
+    cache.unpin(VIDEO_A)
+    assert len(extractor.calls) == 4
+
+
+def test_file_id_survives_media_eviction_and_restart(tmp_path):
+    extractor = StubExtractor()
+    service = _service(tmp_path, extractor, max_cache_bytes=150)
+
+    async def scenario():
+        async with service.audio(f"https://www.youtube.com/shorts/{VIDEO_A}") as entry:
+            assert entry.audio_file_id is None and entry.has_media
+            service.cache.remember_file_ids(entry.key, audio_file_id="AUDIO_A", photo_file_id="PHOTO_A")
+        await service.fetch(f"https://youtu.be/{VIDEO_B}")
+        async with service.audio(f"https://youtu.be/{VIDEO_A}") as entry:
+            return entry
+
+    entry = asyncio.run(scenario())
+    # Файлы A вытеснены, но повторная отправка идёт по file_id без новой загрузки
+    assert len(extractor.calls) == 2
+    assert entry.audio_file_id == "AUDIO_A" and entry.audio_path is None
+    assert service.cache.total_bytes == 100
+
+    reloaded = AudioCache(tmp_path / "cache", max_bytes=150)
+    assert reloaded.peek(VIDEO_A).photo_file_id == "PHOTO_A"
+    assert reloaded.peek(VIDEO_B).has_media and reloaded.total_bytes == 100
+
+    # Отвергнутый Telegram file_id без локальных файлов удаляет запись целиком
+    reloaded.forget_file_ids(VIDEO_A)
+    assert reloaded.peek(VIDEO_A) is None and not (tmp_path / "cache" / VIDEO_A).exists()